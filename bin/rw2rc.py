@@ -3,7 +3,9 @@
 import os
 import sys
 import argparse
-import shutil
+
+from rhessyscalibrator.project_import import importProject, verifyProject, \
+    IMPORT_MODES, IMPORT_COPY, DEFAULT_JOBS
 
 if __name__ == "__main__":
     # Handle command line options
@@ -12,6 +14,13 @@ if __name__ == "__main__":
                         help='The RHESSysWorkflows project directory to convert to RHESSysCalibrator project')
     parser.add_argument('-b', '--baseDir', dest='baseDir', required=True,
                         help='RHESSysCalibrator base directory to which RHESSysWorkflow project to be copied')
+    parser.add_argument('-m', '--mode', dest='mode', choices=IMPORT_MODES, default=IMPORT_COPY,
+                        help='How to import model inputs (binary, climate, defs, flow table, TEC file, template and worldfile). ' +
+                             'hardlink and reflink (copy-on-write, where the filesystem supports it) do not use more storage, ' +
+                             'symlink links to the inputs in the RHESSysWorkflows project.  Inputs that cannot be linked are copied. ' +
+                             'Linked inputs must not be modified in place.  Source code is always copied.  Defaults to %s.' % (IMPORT_COPY,) )
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=DEFAULT_JOBS,
+                        help='Number of files to import at the same time.  Defaults to %d.' % (DEFAULT_JOBS,) )
     args = parser.parse_args()
 
     if not os.access(args.projectDir, os.R_OK):
@@ -22,62 +31,24 @@ if __name__ == "__main__":
         sys.exit("Unable to write to RHESSysCalibrator project directory {0}".format(args.baseDir))
     dest = os.path.abspath(args.baseDir)
 
-    # Copy RHESSys binary
-    print('Copying RHESSys binary')
-    srcBin = os.path.join(src, 'rhessys/bin/rhessys5.18.r2')
-    destBinDir = os.path.join(dest, 'rhessys/bin')
-    shutil.copy(srcBin, destBinDir)
-
-    # Copy climate data
-    print('Copying climate data')
-    srcClimDir = os.path.join(src, 'rhessys/clim')
-    destClimDir = os.path.join(dest, 'rhessys/clim')
-    srcClimFiles = os.listdir(srcClimDir)
-    for f in srcClimFiles:
-        srcClimFile = os.path.join(srcClimDir, f)
-        shutil.copy(srcClimFile, destClimDir)
-
-    # Copy parameter definitions
-    print('Copying parameter definitions')
-    srcDefDir = os.path.join(src, 'rhessys/defs')
-    destDefDir = os.path.join(dest, 'rhessys/defs')
-    srcDefFiles = os.listdir(srcDefDir)
-    for f in srcDefFiles:
-        srcDefFile = os.path.join(srcDefDir, f)
-        shutil.copy(srcDefFile, destDefDir)
-
-    # Copy flow table
-    print('Copying flow table')
-    srcFlow = os.path.join(src, 'rhessys/flow/world.flow')
-    destFlowDir = os.path.join(dest, 'rhessys/flow/world_flow_table.dat')
-    shutil.copy(srcFlow, destFlowDir)
-
-    # Copy src code
-    print('Copying source code')
-    srcSrcDir = os.path.join(src, 'rhessys/src')
-    destSrcDir = os.path.join(dest, 'rhessys/src')
-    shutil.rmtree(destSrcDir)
-    shutil.copytree(srcSrcDir, destSrcDir)
-
-    # Copy tecfile
-    print('Copying TEC file')
-    srcTecFile = os.path.join(src, 'rhessys/tecfiles/tec_daily.txt')
-    destTecDir = os.path.join(dest, 'rhessys/tecfiles/active')
-    shutil.copy(srcTecFile, destTecDir)
-
-    # Copy template
-    print('Copying worldfile template')
-    srcTemplateFile = os.path.join(src, 'rhessys/templates/template')
-    destTemplateDir = os.path.join(dest, 'rhessys/templates')
-    shutil.copy(srcTemplateFile, destTemplateDir)
-
-    # Copy worldfile
-    print('Copying worldfile')
-    destWorldfileDir = os.path.join(dest, 'rhessys/worldfiles/active')
-    srcWorldfileHdrFile = os.path.join(src, 'rhessys/worldfiles/world.hdr')
-    shutil.copy(srcWorldfileHdrFile, destWorldfileDir)
-    srcWorldfileFile = os.path.join(src, 'rhessys/worldfiles/world')
-    shutil.copy(srcWorldfileFile, destWorldfileDir)
+    if args.jobs < 1:
+        sys.exit("Number of jobs must be greater than 0")
+
+    # Import model inputs and source code
+    print('Importing RHESSys binary, climate data, parameter definitions, flow table, TEC file, worldfile template, worldfile and source code')
+    try:
+        (files, counts) = importProject(src, dest, args.mode, args.jobs)
+    except Exception as e:
+        sys.exit(str(e))
+    for mode in sorted(counts.keys()):
+        print("Imported %d files using %s" % (counts[mode], mode))
+
+    # Check that the calibrator will find its inputs
+    print('Verifying RHESSysCalibrator project')
+    problems = verifyProject(dest, files)
+    if len(problems) > 0:
+        for problem in problems:
+            print(problem)
+        sys.exit("RHESSysCalibrator project {0} is incomplete".format(dest))
 
     print('Done!')
-
@@ -122,6 +122,10 @@ class RHESSysCalibratorBehavioral(RHESSysCalibrator):
                             type=int, dest="wall_time",
                             help="For PBS- and SLURM-based parallel mode: Specify wall time in hours that jobs should take.")
 
+        parser.add_argument("--output_layout", action="store",
+                            dest="output_layout", default=calibrator.OUTPUT_LAYOUT_FLAT, choices=calibrator.OUTPUT_LAYOUTS,
+                            help="Layout of run output directories, see rhessys_calibrator --output_layout")
+
         parser.add_argument("-l", "--loglevel", action="store",
                           dest="loglevel", default="OFF", choices=['OFF', 'DEBUG', 'CRITICAL'], required=False,
                           help="Set logging level")
@@ -234,12 +238,9 @@ class RHESSysCalibratorBehavioral(RHESSysCalibrator):
             
             if readCmdProtoFromRun:
                 # Rewrite cmd_proto to use dates from command line
-                cmd_proto = re.sub("-st (\d{4} \d{1,2} \d{1,2} \d{1,2})",
-                                   "-st %s" % (startDateStr,),
-                                   calibSession.cmd_proto)
-                cmd_proto = re.sub("-ed (\d{4} \d{1,2} \d{1,2} \d{1,2})",
-                                   "-ed %s" % (endDateStr,),
-                                   cmd_proto)
+                cmd_proto = self.setSimulationPeriodInCmdProto(calibSession.cmd_proto,
+                                                               startDateStr,
+                                                               endDateStr)
                 self.logger.debug("Original cmd.proto: %s" % (calibSession.cmd_proto,) )
                 self.logger.debug("Behavioral cmd.proto: %s" % (cmd_proto,) )
             else:
@@ -268,6 +269,10 @@ class RHESSysCalibratorBehavioral(RHESSysCalibrator):
                                                          self.basedir,
                                                          notes,
                                                          cmd_proto_noparam)
+            self.outputLayout = options.output_layout
+            self.calibratorDB.setSessionOptions(self.session.id,
+                                                {calibrator.SESSION_OPT_OUTPUT_LAYOUT: self.outputLayout})
+            
             # Create postprocess session
             behave_postproc_id = self.calibratorDB.insertPostProcess(self.session.id, postproc.obs_filename, postproc.fitness_period,
                                                                      exclude_date_ranges=postproc.exclude_date_ranges)
@@ -34,7 +34,10 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 @author Brian Miles <brian_miles@unc.edu>
 """
 import re
-from random import *
+import math
+import random
+import hashlib
+import struct
 
 
 PARAM_REGEX_TEMPLATE = lambda v: """\s+(\$""" + v + """(\[(\d+(?:\.\d+){0,1}),\s*(\d+(?:\.\d+){0,1})\])?)\s*"""
@@ -52,14 +55,61 @@ PARAM_VGSEN2_KEY = 'vgsen2'
 PARAM_VGSEN3_KEY = 'vgsen3'
 PARAM_SVALT1_KEY = 'svalt1'
 PARAM_SVALT2_KEY = 'svalt2'
+# All parameter names, in the order used when parameters are treated as a vector
+PARAM_KEYS = (PARAM_S1_KEY, PARAM_S2_KEY, PARAM_S3_KEY,
+              PARAM_SV1_KEY, PARAM_SV2_KEY,
+              PARAM_GW1_KEY, PARAM_GW2_KEY,
+              PARAM_VGSEN1_KEY, PARAM_VGSEN2_KEY, PARAM_VGSEN3_KEY,
+              PARAM_SVALT1_KEY, PARAM_SVALT2_KEY)
+
+MAX_SEED = 2**31 - 1
+
+# Ways of using behavioral parameter values from a previous session to
+#  generate parameter values for a new session
+PRIOR_METHOD_BOUNDS = 'bounds'
+PRIOR_METHOD_KERNEL = 'kernel'
+PRIOR_METHODS = (PRIOR_METHOD_BOUNDS, PRIOR_METHOD_KERNEL)
+
+
+def newSessionSeed():
+    """ Generate a seed for a new calibration session
+    
+        @return Integer in the range [0, MAX_SEED]
+    """
+    return random.SystemRandom().randint(0, MAX_SEED)
+
+def counterUniform(seed, counter, key):
+    """ Counter-based uniform random number generator.  The value returned 
+        depends only on the arguments, so the values for any run of a session 
+        can be regenerated directly, in any order, without replaying a stream 
+        of random numbers.
+    
+        @param seed Integer representing the seed of the session
+        @param counter Integer representing the counter (e.g. iteration of a run)
+        @param key String distinguishing values drawn for the same counter 
+            (e.g. parameter name)
+        
+        @return Float in the range [0, 1)
+    """
+    digest = hashlib.sha256("%d:%d:%s" % (seed, counter, key)).digest()
+    (value,) = struct.unpack('>Q', digest[:8])
+    # Use 53 bits, the precision of a double
+    return (value >> 11) / float(1 << 53)
 
 
 class CalibrationParametersProto(object):
     """ Represents whether particular calibration parameters have been
         specified using boolean values
     """    
-    def __init__(self, s_for_sv=False):
+    def __init__(self, s_for_sv=False, seed=None):
+        """
+            @param s_for_sv True to use the same m and K parameter for
+                               for horizontal as for vertical.
+            @param seed Integer representing the seed to use when generating 
+                parameter values for a particular counter (see generateParameterValues)
+        """
         self.s_for_sv = s_for_sv
+        self.seed = seed
         
         self.s1 = False
         self.s2 = False
@@ -121,74 +171,199 @@ class CalibrationParametersProto(object):
                                                                                                                     ceil))
                 self.parameterRanges[param_name] = [floor, ceil]
     
-    def generateParameterValues(self):
+    def getSampledParameterKeys(self):
+        """ Get names of parameters whose values are sampled, i.e. those specified
+            as True, excluding vertical m and K if they are set to the horizontal values.
+            
+            @return List of parameter names, in the order given by PARAM_KEYS
+        """
+        keys = []
+        for key in PARAM_KEYS:
+            if not self.__dict__[key]:
+                continue
+            if self.s_for_sv and (key == PARAM_SV1_KEY or key == PARAM_SV2_KEY):
+                continue
+            keys.append(key)
+        return keys
+    
+    def newParameterValues(self, values):
+        """ Create parameter values from values of sampled parameters (e.g. 
+            those chosen by an optimization or MCMC algorithm rather than 
+            drawn at random).  Vertical m and K are set to the horizontal
+            values if s_for_sv is True.
+            
+            @param values Dict mapping each parameter name returned by 
+                getSampledParameterKeys() to its value
+            
+            @return CalibrationParameters object
+        """
+        calibrationParameters = \
+            CalibrationParameters.newCalibrationParameters()
+        for key in self.getSampledParameterKeys():
+            calibrationParameters.__dict__[key] = values[key]
+        if self.s_for_sv:
+            if self.sv1:
+                calibrationParameters.sv1 = calibrationParameters.s1
+            if self.sv2:
+                calibrationParameters.sv2 = calibrationParameters.s2
+        return calibrationParameters
+    
+    def drawParameterValue(self, param_name, counter=None):
+        """ Draw a value for a parameter uniformly from its range
+        
+            @param param_name String representing parameter name (e.g. 's1', 'gw1', etc.)
+            @param counter Integer representing the counter (e.g. iteration) to draw the 
+                value for.  If None, or if self.seed is None, the value will be drawn 
+                from Python's (unseeded) random number generator.
+            
+            @return Float representing the parameter value
+        """
+        (floor, ceil) = self.parameterRanges[param_name]
+        if counter is None or self.seed is None:
+            return random.uniform(floor, ceil)
+        return floor + self.drawUniform(counter, param_name) * (ceil - floor)
+    
+    def drawUniform(self, counter, key):
+        """ Draw a uniform random number in the range [0, 1)
+        
+            @param counter Integer representing the counter (e.g. iteration) to draw the 
+                value for.  If None, or if self.seed is None, the value will be drawn 
+                from Python's (unseeded) random number generator.
+            @param key String distinguishing values drawn for the same counter
+            
+            @return Float in the range [0, 1)
+        """
+        if counter is None or self.seed is None:
+            return random.random()
+        return counterUniform(self.seed, counter, key)
+    
+    def narrowParameterRanges(self, values, margin=0.1):
+        """ Narrow the range of each sampled parameter to that spanned by
+            the given (e.g. behavioral) parameter values, widened by margin. 
+            Ranges are never widened beyond their current bounds.
+            
+            @param values Dict mapping each parameter name returned by 
+                getSampledParameterKeys() to a list of values
+            @param margin Float representing the fraction of the width of
+                the range spanned by the values to add to each end of the 
+                new range.
+            
+            @return Dict mapping parameter name to new [floor, ceiling]
+            
+            @raise Exception if there are no values for a parameter
+        """
+        newRanges = {}
+        for key in self.getSampledParameterKeys():
+            (floor, ceil) = self.parameterRanges[key]
+            if len(values[key]) == 0:
+                raise Exception("No values for parameter {0}".format(key))
+            lo = min(values[key])
+            hi = max(values[key])
+            width = hi - lo
+            if width == 0:
+                width = ceil - floor
+            newRanges[key] = [max(floor, lo - margin * width), 
+                              min(ceil, hi + margin * width)]
+        self.parameterRanges.update(newRanges)
+        return newRanges
+    
+    def generateParameterValues(self, counter=None):
         """ Generate random values for parameters specified as True
 
             Note: Current implementation only supports the following 
             parameters: s1, s2, s3, sv1, sv2, gw1, gw2, vgsen1, vgsen2, vgsen3, svalt1, svalt2
 
+            @param counter Integer representing the counter (e.g. iteration) to generate 
+                values for.  If self.seed is set, the same values will always be 
+                generated for a given seed and counter.
+
             @return CalibrationParameters object containing random
             values for each enabled parameter.
         """ 
         calibrationParameters = \
             CalibrationParameters.newCalibrationParameters()
 
-        if self.s1:
-            calibrationParameters.s1 = uniform(self.parameterRanges['s1'][0], 
-                                               self.parameterRanges['s1'][1])
-        if self.s2:
-            calibrationParameters.s2 = uniform(self.parameterRanges['s2'][0], 
-                                               self.parameterRanges['s2'][1])
-
-        if self.s3:
-            calibrationParameters.s3 = uniform(self.parameterRanges['s3'][0], 
-                                               self.parameterRanges['s3'][1])
-
-        if self.sv1:
-            if self.s_for_sv:
+        for key in self.getSampledParameterKeys():
+            calibrationParameters.__dict__[key] = self.drawParameterValue(key, counter)
+        
+        if self.s_for_sv:
+            if self.sv1:
                 assert(calibrationParameters.s1)
                 calibrationParameters.sv1 = calibrationParameters.s1
-            else:
-                calibrationParameters.sv1 = uniform(self.parameterRanges['sv1'][0], 
-                                                    self.parameterRanges['sv1'][1])
-
-        if self.sv2:
-            if self.s_for_sv:
+            if self.sv2:
                 assert(calibrationParameters.s2)
                 calibrationParameters.sv2 = calibrationParameters.s2
-            else:
-                calibrationParameters.sv2 = uniform(self.parameterRanges['sv2'][0], 
-                                                    self.parameterRanges['sv2'][1])
             
-        if self.gw1:
-            calibrationParameters.gw1 = uniform(self.parameterRanges['gw1'][0], 
-                                                self.parameterRanges['gw1'][1])
+        return calibrationParameters
 
-        if self.gw2:
-            calibrationParameters.gw2 = uniform(self.parameterRanges['gw2'][0], 
-                                                self.parameterRanges['gw2'][1])
-            
-        if self.vgsen1:
-            calibrationParameters.vgsen1 = uniform(self.parameterRanges['vgsen1'][0],
-                                                   self.parameterRanges['vgsen1'][1])
+
+class KernelParameterSampler(object):
+    """ Generate parameter values from a kernel density estimate fitted
+        to (e.g. behavioral) parameter values from a previous session.  
+        Each parameter set is drawn by choosing one of the parameter sets at 
+        random and perturbing each of its values with Gaussian noise, 
+        reflected at the parameter's range.  Can be used in place of 
+        CalibrationParametersProto.generateParameterValues().
+    """
+    def __init__(self, paramsProto, values):
+        """
+            @param paramsProto CalibrationParametersProto providing parameter 
+                ranges and seed
+            @param values Dict mapping each parameter name returned by 
+                paramsProto.getSampledParameterKeys() to a list of values,
+                all lists being of the same length
+        """
+        self.paramsProto = paramsProto
+        self.paramKeys = paramsProto.getSampledParameterKeys()
+        self.values = values
+        self.numSets = len(values[self.paramKeys[0]])
+        if self.numSets == 0:
+            raise Exception("No parameter sets to fit kernel density to")
+        # Scott's rule
+        factor = self.numSets ** (-1.0 / (len(self.paramKeys) + 4))
+        self.bandwidth = {}
+        for key in self.paramKeys:
+            (floor, ceil) = paramsProto.parameterRanges[key]
+            v = values[key]
+            mean = sum(v) / float(self.numSets)
+            std = math.sqrt(sum([(x - mean)**2 for x in v]) / float(self.numSets))
+            self.bandwidth[key] = max(std * factor, 1e-6 * (ceil - floor))
+    
+    @classmethod
+    def reflect(cls, value, floor, ceil):
+        """ Reflect value at the bounds of a range until it lies within the range
         
-        if self.vgsen2:
-            calibrationParameters.vgsen2 = uniform(self.parameterRanges['vgsen2'][0],
-                                                   self.parameterRanges['vgsen2'][1])
-            
-        if self.vgsen3:
-            calibrationParameters.vgsen3 = uniform(self.parameterRanges['vgsen3'][0],
-                                                   self.parameterRanges['vgsen3'][1])
-            
-        if self.svalt1:
-            calibrationParameters.svalt1 = uniform(self.parameterRanges['svalt1'][0],
-                                                   self.parameterRanges['svalt1'][1])
+            @return Float in the range [floor, ceil]
+        """
+        width = ceil - floor
+        if width == 0:
+            # Degenerate range, e.g. all behavioral runs share one value
+            return floor
+        value = (value - floor) % (2 * width)
+        if value > width:
+            value = 2 * width - value
+        return floor + value
+    
+    def generateParameterValues(self, counter=None):
+        """ Generate parameter values for a run
         
-        if self.svalt2:
-            calibrationParameters.svalt2 = uniform(self.parameterRanges['svalt2'][0],
-                                                   self.parameterRanges['svalt2'][1])
+            @param counter Integer representing the counter (e.g. iteration) to generate 
+                values for.  If paramsProto.seed is set, the same values will always be 
+                generated for a given seed and counter.
             
-        return calibrationParameters
+            @return CalibrationParameters object
+        """
+        i = int(self.paramsProto.drawUniform(counter, '_kernel') * self.numSets)
+        values = {}
+        for key in self.paramKeys:
+            # Box-Muller transform
+            u1 = self.paramsProto.drawUniform(counter, '_kernel_u1_' + key)
+            u2 = self.paramsProto.drawUniform(counter, '_kernel_u2_' + key)
+            z = math.sqrt(-2.0 * math.log(1.0 - u1)) * math.cos(2.0 * math.pi * u2)
+            (floor, ceil) = self.paramsProto.parameterRanges[key]
+            values[key] = self.reflect(self.values[key][i] + z * self.bandwidth[key],
+                                       floor, ceil)
+        return self.paramsProto.newParameterValues(values)
 
 
 class CalibrationParameters(CalibrationParametersProto):
@@ -34,7 +34,9 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 @author Brian Miles <brian_miles@unc.edu>
 """
 import os
+import sys
 import stat
+import pipes
 from subprocess import *
 import thread # _thread in Python 3
 import Queue  # queue in Python 3
@@ -44,6 +46,146 @@ import time
 from datetime import datetime
 
 from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.run_output import findOutputFile, writeColumnarOutput
+from rhessyscalibrator.integrity import readIntegrityRecords
+from rhessyscalibrator.run_log import getRunLogPath, appendRunLog, archiveRunFiles, \
+    STREAM_STDOUT, STREAM_STDERR, STREAM_SCRIPT
+
+# Outputs copied back from node-local scratch if none are specified
+DEFAULT_SCRATCH_KEEP = ['rhessys_basin.daily']
+
+class RunnerOptions(object):
+    """ Options controlling how runs are executed on compute nodes.  When
+        runs are to use node-local scratch, the command of each run is 
+        wrapped so that it is executed by rhessyscalibrator.run_wrapper 
+        on the compute node.
+    """
+    # Prefix of session options used to store runner options
+    SESSION_OPT_PREFIX = 'runner_'
+    
+    def __init__(self, scratch=False, scratch_dir=None, scratch_keep=None,
+                 stage_manifest=None, stage_dir=None, compress=None, columnar=False,
+                 log_archive=False, integrity=False):
+        """
+            @param scratch Boolean indicating that runs should write their output
+                to node-local scratch, with selected outputs copied back to the
+                output directory of the run
+            @param scratch_dir String representing the directory on compute nodes 
+                under which to create scratch directories.  If None, $TMPDIR on
+                the compute node will be used.
+            @param scratch_keep List of strings representing filename patterns
+                (e.g. 'rhessys_basin.daily', 'rhessys_hillslope.*') of outputs to 
+                copy back from scratch.  Defaults to DEFAULT_SCRATCH_KEEP.
+            @param stage_manifest String representing the path of the stage manifest
+                (see rhessyscalibrator.staging) listing inputs to stage into a 
+                node-local cache.  If None, inputs will not be staged.
+            @param stage_dir String representing the directory of the node-local 
+                input cache.  If None, a default directory will be used.
+            @param compress String representing the compression method (see 
+                rhessyscalibrator.run_output) to compress outputs of each run 
+                with once the run completes.  If None, outputs will not be compressed.
+            @param columnar Boolean indicating that basin daily output of each run should
+                be converted to a columnar file (see rhessyscalibrator.run_output) once the 
+                run is DONE
+            @param log_archive Boolean indicating that standard output and error of
+                each run, and queue system job scripts, should be stored in the run
+                log of the session (see rhessyscalibrator.run_log) rather than in 
+                the output directory of the run
+            @param integrity Boolean indicating that an integrity record of each
+                output file of a run (see rhessyscalibrator.integrity) should be 
+                computed on the compute node, and stored in the database once the 
+                run is DONE.  If scratch is True, only outputs copied back from 
+                scratch are recorded.
+        """
+        self.scratch = scratch
+        self.scratch_dir = scratch_dir
+        if scratch_keep:
+            self.scratch_keep = list(scratch_keep)
+        else:
+            self.scratch_keep = list(DEFAULT_SCRATCH_KEEP)
+        self.stage_manifest = stage_manifest
+        self.stage_dir = stage_dir
+        self.compress = compress
+        self.columnar = columnar
+        self.log_archive = log_archive
+        self.integrity = integrity
+    
+    def wrapsJobs(self):
+        """ @return True if run commands need to be wrapped by run_wrapper
+        """
+        return self.scratch or self.stage_manifest is not None or \
+            self.compress is not None or self.integrity
+    
+    def getJobCmd(self, cmd_raw):
+        """ Get the command to execute for a run
+        
+            @param cmd_raw String representing the raw RHESSys command of the run
+            
+            @return String representing cmd_raw, wrapped by run_wrapper if needed
+        """
+        if not self.wrapsJobs():
+            return cmd_raw
+        cmd = [sys.executable, '-m', 'rhessyscalibrator.run_wrapper']
+        if self.scratch:
+            cmd.append('--scratch')
+            if self.scratch_dir:
+                cmd.extend(['--scratch_dir', self.scratch_dir])
+            for pattern in self.scratch_keep:
+                cmd.extend(['--keep', pattern])
+        if self.stage_manifest:
+            cmd.extend(['--stage', self.stage_manifest])
+            if self.stage_dir:
+                cmd.extend(['--stage_dir', self.stage_dir])
+        if self.compress:
+            cmd.extend(['--compress', self.compress])
+        if self.integrity:
+            cmd.append('--integrity')
+        cmd.append('--')
+        cmd.append(cmd_raw)
+        return ' '.join([pipes.quote(c) for c in cmd])
+    
+    def toSessionOptions(self):
+        """ @return Dict<String, String> representing these options, suitable for
+            storing using ModelRunnerDB2.setSessionOptions()
+        """
+        p = self.SESSION_OPT_PREFIX
+        opts = {p + 'scratch': str(self.scratch),
+                p + 'columnar': str(self.columnar),
+                p + 'log_archive': str(self.log_archive),
+                p + 'integrity': str(self.integrity),
+                p + 'scratch_keep': ','.join(self.scratch_keep)}
+        if self.scratch_dir:
+            opts[p + 'scratch_dir'] = self.scratch_dir
+        if self.stage_manifest:
+            opts[p + 'stage_manifest'] = self.stage_manifest
+        if self.stage_dir:
+            opts[p + 'stage_dir'] = self.stage_dir
+        if self.compress:
+            opts[p + 'compress'] = self.compress
+        return opts
+    
+    @classmethod
+    def fromSessionOptions(cls, opts):
+        """ Create runner options from session options
+        
+            @param opts Dict<String, String> as returned by ModelRunnerDB2.getSessionOptions()
+            
+            @return RunnerOptions; default options if opts does not contain runner options
+        """
+        p = cls.SESSION_OPT_PREFIX
+        scratchKeep = None
+        if opts.get(p + 'scratch_keep'):
+            scratchKeep = opts[p + 'scratch_keep'].split(',')
+        return cls(scratch=(opts.get(p + 'scratch') == 'True'),
+                   scratch_dir=opts.get(p + 'scratch_dir'),
+                   scratch_keep=scratchKeep,
+                   stage_manifest=opts.get(p + 'stage_manifest'),
+                   stage_dir=opts.get(p + 'stage_dir'),
+                   compress=opts.get(p + 'compress'),
+                   columnar=(opts.get(p + 'columnar') == 'True'),
+                   log_archive=(opts.get(p + 'log_archive') == 'True'),
+                   integrity=(opts.get(p + 'integrity') == 'True'))
+
 
 class CalibrationRunner(object):
     """ Abstract super class for all consumer objects that run ModelRun  
@@ -54,7 +196,8 @@ class CalibrationRunner(object):
         self.jobCompleteCallback() if they wish to perform an action
         when a job is marked as complete.
     """
-    def __init__(self, basedir, session_id, queue, db_path, run_path, logger, restart_runs=False):
+    def __init__(self, basedir, session_id, queue, db_path, run_path, logger, restart_runs=False,
+                 runner_options=None):
         """ 
             @param basedir String representing the basedir of the calibration session
             @param session_id Integer representing the session ID of current calibration session
@@ -67,6 +210,8 @@ class CalibrationRunner(object):
             @param logger logging.Logger to use to for debug messages
             @param restart_runs Boolean indicating that runs are to be restarted 
             (i.e. do not insert new runs into DB)
+            @param runner_options RunnerOptions controlling how runs are executed.
+            If None, default options will be used.
         """
         self.basedir = basedir
         self.session_id = session_id
@@ -75,6 +220,9 @@ class CalibrationRunner(object):
         self.run_path = run_path
         self.logger = logger
         self.restart_runs = restart_runs
+        if runner_options is None:
+            runner_options = RunnerOptions()
+        self.runner_options = runner_options
 
         self.db = ModelRunnerDB2(db_path) 
         self.numActiveJobs = 0
@@ -114,6 +262,57 @@ class CalibrationRunner(object):
                                             job.run_fitness.runoff_ratio, 
                                             job.run_fitness.userfitness)        
     
+    def getJobCmd(self, job):
+        """ Get the command to execute for a job
+        
+            @param job ModelRun2 object representing the job
+            
+            @return String representing the command
+        """
+        return self.runner_options.getJobCmd(job.cmd_raw)
+    
+    def convertRunOutput(self, job):
+        """ Convert basin daily output of a DONE job to a columnar file, if
+            runner options call for it.  Failure to convert is logged, and does
+            not affect the status of the job.
+        
+            @param job ModelRun2 object representing the job
+        """
+        if not self.runner_options.columnar:
+            return
+        outputPath = findOutputFile(os.path.join(self.run_path, job.output_path, 'rhessys_basin.daily'))
+        try:
+            writeColumnarOutput(outputPath)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.warning("Unable to convert output %s to columnar format: %s" % \
+                                (outputPath, str(e)) )
+    
+    def recordOutputIntegrity(self, job):
+        """ Store integrity records of output files of a DONE job, written by 
+            run_wrapper on the compute node, in the database if runner options 
+            call for it.  Failure to record integrity is logged, and does not 
+            affect the status of the job.
+        
+            @param job ModelRun2 object representing the job
+        """
+        if not self.runner_options.integrity:
+            return
+        outputPath = os.path.join(self.run_path, job.output_path)
+        try:
+            records = readIntegrityRecords(outputPath)
+            if records is None:
+                self.logger.warning("No integrity records of outputs found in %s" % (outputPath,) )
+                return
+            self.db.setRunOutputIntegrity(job.id, records)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.warning("Unable to record integrity of outputs in %s: %s" % \
+                                (outputPath, str(e)) )
+    
+    def getRunLogPath(self):
+        """ @return String representing the path of the run log of the session
+        """
+        return getRunLogPath(self.basedir, self.session_id)
+    
     def jobCompleteCallback(self, *args, **kwargs):
         """ Called when a job is complete. 
         """
@@ -136,7 +335,8 @@ class CalibrationRunnerSubprocess(CalibrationRunner):
     JOB_STATUS_SLEEP_SECS = 60
     JOB_SUBMIT_PENDING_THRESHOLD_SLEEP_SECS = 90
 
-    def __init__(self, basedir, session_id, queue, db_path, run_path, logger, restart_runs=False):
+    def __init__(self, basedir, session_id, queue, db_path, run_path, logger, restart_runs=False,
+                 runner_options=None):
         """ 
             @param basedir String representing the basedir of the calibration session
             @param session_id Integer representing the session ID of current calibration session
@@ -149,9 +349,11 @@ class CalibrationRunnerSubprocess(CalibrationRunner):
             @param logger logging.Logger to use to for debug messages
             @param restart_runs Boolean indicating that runs are to be restarted 
             (i.e. do not insert new runs into DB)
+            @param runner_options RunnerOptions controlling how runs are executed
         """
         super(CalibrationRunnerSubprocess, self).__init__(basedir, session_id, queue, 
-                                                          db_path, run_path, logger, restart_runs)
+                                                          db_path, run_path, logger, restart_runs,
+                                                          runner_options)
 
     def runJobInSubprocess(self, job):
         """ Run a job using subprocess.  Will add job to DB.
@@ -173,11 +375,15 @@ class CalibrationRunnerSubprocess(CalibrationRunner):
             self.storeJobInDB(job)
                
         # Open model process
-        process = Popen(job.cmd_raw, shell=True, stdout=PIPE, stderr=PIPE,
+        process = Popen(self.getJobCmd(job), shell=True, stdout=PIPE, stderr=PIPE,
                         cwd=self.run_path, bufsize=1)
         
         (process_stdout, process_stderr) = process.communicate()
         
+        if self.runner_options.log_archive:
+            self.logJobInRunLog(job, process.returncode, process_stdout, process_stderr)
+            return
+        
         # Write model command to file
         fileName = "cmd.txt"
         cmdOutFile = os.path.join(self.run_path, job.output_path,
@@ -209,6 +415,8 @@ class CalibrationRunnerSubprocess(CalibrationRunner):
         if 0 == process.returncode:
             # Update run
             self.db.updateRunEndtime(job.id, datetime.utcnow(), "DONE")
+            self.convertRunOutput(job)
+            self.recordOutputIntegrity(job)
             self.logger.critical("Job %s completed, output written to %s" % 
                           (job.job_id, processOutFile))
         else:
@@ -220,6 +428,31 @@ class CalibrationRunnerSubprocess(CalibrationRunner):
             else:
                 self.logger.critical("Job %s FAILED" % (job.job_id,) )
 
+    def logJobInRunLog(self, job, returncode, process_stdout, process_stderr):
+        """ Store standard output and error of a job in the run log of the session,
+            and update the status of the job
+        
+            @param job model_runner_db.ModelRun representing the job
+            @param returncode Integer representing the exit status of the job
+            @param process_stdout String representing standard output of the job
+            @param process_stderr String representing standard error of the job
+        """
+        runLogPath = self.getRunLogPath()
+        appendRunLog(runLogPath, job.id, STREAM_STDOUT, process_stdout)
+        if '' != process_stderr:
+            appendRunLog(runLogPath, job.id, STREAM_STDERR, process_stderr)
+        
+        if 0 == returncode:
+            self.db.updateRunEndtime(job.id, datetime.utcnow(), "DONE")
+            self.convertRunOutput(job)
+            self.recordOutputIntegrity(job)
+            self.logger.critical("Job %s completed, output written to run log %s" % 
+                                 (job.job_id, runLogPath))
+        else:
+            self.db.updateRunEndtime(job.id, datetime.utcnow(), "EXIT")
+            self.logger.critical("Job %s FAILED, output written to run log %s" % 
+                                 (job.job_id, runLogPath))
+
     def run(self):
         """ Method to be run in a consumer thread/process to launch a run
             submitted by producer thread/process
@@ -276,6 +509,16 @@ class CalibrationRunnerQueue(CalibrationRunner):
             @return String representing job status command
         """
         raise NotImplementedError()
+
+    @classmethod
+    def getCancelCmd(cls, *args, **kwargs):
+        """ Get command used to cancel a job.  The job ID will be appended
+            to the command.
+        
+            @return String representing job cancel command, or None if jobs 
+            cannot be cancelled.
+        """
+        raise NotImplementedError()
     
     def getRunCmdRegex(self):
         """ Get compiled regular expression for parsing run command output
@@ -302,6 +545,32 @@ class CalibrationRunnerQueue(CalibrationRunner):
         """
         raise NotImplementedError()
     
+    def getJobFiles(self, run):
+        """ Get side files written for a job, e.g. job scripts and standard
+            output and error written by the queue system
+            
+            @param run ModelRun2 object representing the job
+            
+            @return Dict<String, String> mapping stream (one of run_log.STREAMS)
+            to the path of the file
+        """
+        return {}
+    
+    def archiveJobFiles(self, run):
+        """ Move side files of a completed job into the run log of the session, 
+            if runner options call for it.  Failure to archive is logged, and does 
+            not affect the status of the job.
+            
+            @param run ModelRun2 object representing the job
+        """
+        if not self.runner_options.log_archive:
+            return
+        try:
+            archiveRunFiles(self.getRunLogPath(), run.id, self.getJobFiles(run))
+        except (IOError, OSError) as e:
+            self.logger.warning("Unable to archive files of run %d in run log: %s" % \
+                                (run.id, str(e)) )
+    
     def mapStatusCode(self, status_code):
         """ Map between status codes of the underlying queue system
             and calibrator status codes
@@ -315,7 +584,8 @@ class CalibrationRunnerQueue(CalibrationRunner):
     
     def __init__(self, basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
-                 submit_queue, polling_delay, mem_limit, max_active_jobs):
+                 submit_queue, polling_delay, mem_limit, max_active_jobs,
+                 runner_options=None):
         """ 
             Concrete classes must use getRunCmd() and getRunStatusCmd() to 
             initialize self.run_cmd and self.run_status_cmd before the run() method
@@ -337,9 +607,10 @@ class CalibrationRunnerQueue(CalibrationRunner):
                 self.JOB_STATUS_SLEEP_SECS
             @param mem_limit Integer representing the memory limit for jobs. Units GB.
             @param max_active_jobs Integer representing the max active jobs permitted
+            @param runner_options RunnerOptions controlling how runs are executed
         """
         super(CalibrationRunnerQueue, self).__init__(basedir, session_id, queue, 
-                 db_path, run_path, logger, restart_runs)
+                 db_path, run_path, logger, restart_runs, runner_options)
         
         self.submit_queue = submit_queue
         self.JOB_STATUS_SLEEP_SECS *= polling_delay
@@ -401,6 +672,10 @@ class CalibrationRunnerQueue(CalibrationRunner):
             # Update status for run (implementation-specific)
                 if "DONE" == stat or "EXIT" == stat:
                     self.db.updateRunEndtime(run.id, datetime.utcnow(), stat)
+                    if "DONE" == stat:
+                        self.convertRunOutput(run)
+                        self.recordOutputIntegrity(run)
+                    self.archiveJobFiles(run)
                     numRetiredJobs += 1;
                     #  Job is DONE, call self.jobCompleteCallback
                     self.logger.critical("Job %s (run %s) has completed (numRetired: %d), status set to %s, calling jobCompleteCallback" % \
@@ -518,6 +793,22 @@ class CalibrationRunnerLSF(CalibrationRunnerQueue):
             return os.path.join(simulator_path, "bjobs.py") 
         else:
             return "bjobs -a"
+
+    @classmethod
+    def getCancelCmd(cls, *args, **kwargs):
+        """ Get command used to cancel a job.  The job ID will be appended
+            to the command.
+        
+            Valid keyword args:
+            @param simulator_path String representing path to LSF simulator.  Default: None. 
+                The simulator does not support cancelling jobs.
+        
+            @return String representing job cancel command, or None if jobs 
+            cannot be cancelled.
+        """
+        if kwargs.get('simulator_path', None):
+            return None
+        return "bkill"
     
     def getRunCmdRegex(self):
         """ Get compiled regular expression for parsing run command output
@@ -547,10 +838,12 @@ class CalibrationRunnerLSF(CalibrationRunnerQueue):
     def __init__(self, basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
                  submit_queue, polling_delay, mem_limit, max_active_jobs,
-                 bsub_exclusive_mode=False, simulator_path=None):
+                 bsub_exclusive_mode=False, simulator_path=None,
+                 runner_options=None):
         super(CalibrationRunnerLSF, self).__init__(basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
-                 submit_queue, polling_delay, mem_limit, max_active_jobs)
+                 submit_queue, polling_delay, mem_limit, max_active_jobs,
+                 runner_options)
         
         self.bsub_exclusive_mode = bsub_exclusive_mode
         self.simulator_path = simulator_path
@@ -560,6 +853,17 @@ class CalibrationRunnerLSF(CalibrationRunnerQueue):
                                       mem_limit=self.mem_limit)
         self.run_status_cmd = self.getRunStatusCmd(simulator_path=self.simulator_path)
         
+    def getJobFiles(self, run):
+        """ Get side files written for a job: standard output written by LSF
+            
+            @param run ModelRun2 object representing the job
+            
+            @return Dict<String, String> mapping stream (one of run_log.STREAMS)
+            to the path of the file
+        """
+        return {STREAM_STDOUT: os.path.join(self.run_path, run.output_path, 
+                                            "%s.out" % (run.job_id,) )}
+    
     def submitJob(self, job):
         """ Submit a job using LSF.  Will add job to DB.
          
@@ -571,7 +875,7 @@ class CalibrationRunnerLSF(CalibrationRunnerQueue):
         bsub_cmd = self.run_cmd
         if None != self.submit_queue:
             bsub_cmd += " -q " + self.submit_queue
-        bsub_cmd += " -o " + job.output_path + " " + job.cmd_raw
+        bsub_cmd += " -o " + job.output_path + " " + self.getJobCmd(job)
         self.logger.debug("Running bsub: %s" % bsub_cmd)
         process = Popen(bsub_cmd, shell=True, stdout=PIPE, stderr=PIPE,
                         cwd=self.run_path, bufsize=1)
@@ -626,6 +930,15 @@ class CalibrationRunnerPBS(CalibrationRunnerQueue):
             @return String representing job status command
         """
         return "qstat"
+
+    @classmethod
+    def getCancelCmd(cls, *args, **kwargs):
+        """ Get command used to cancel a job.  The job ID will be appended
+            to the command.
+        
+            @return String representing job cancel command
+        """
+        return "qdel"
     
     def getRunCmdRegex(self):
         """ Get compiled regular expression for parsing run command output
@@ -654,16 +967,31 @@ class CalibrationRunnerPBS(CalibrationRunnerQueue):
     def __init__(self, basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
                  submit_queue, polling_delay, mem_limit, max_active_jobs,
-                 wall_time):
+                 wall_time, runner_options=None):
         super(CalibrationRunnerPBS, self).__init__(basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
-                 submit_queue, polling_delay, mem_limit, max_active_jobs)
+                 submit_queue, polling_delay, mem_limit, max_active_jobs,
+                 runner_options)
         
         self.run_cmd = self.getRunCmd()
         self.run_status_cmd = self.getRunStatusCmd()
         
         self.wall_time = wall_time
         
+    def getJobFiles(self, run):
+        """ Get side files written for a job: the job script, and standard output
+            and error written by PBS
+            
+            @param run ModelRun2 object representing the job
+            
+            @return Dict<String, String> mapping stream (one of run_log.STREAMS)
+            to the path of the file
+        """
+        outputPath = os.path.join(self.run_path, run.output_path)
+        return {STREAM_SCRIPT: os.path.join(outputPath, 'pbs.script'),
+                STREAM_STDOUT: os.path.join(outputPath, 'pbs.out'),
+                STREAM_STDERR: os.path.join(outputPath, 'pbs.err')}
+    
     def submitJob(self, job):
         """ Submit a job to the underlying queue system.  
         
@@ -684,7 +1012,7 @@ class CalibrationRunnerPBS(CalibrationRunnerQueue):
         if self.wall_time:
             script.write("#PBS -l walltime={0}:00:00\n".format(self.wall_time)) # Try to get by without specifying this
         script.write('\n')
-        script.write(job.cmd_raw)
+        script.write(self.getJobCmd(job))
         script.write('\n')
         script.close()
         os.chmod(script_filename, 
@@ -760,6 +1088,15 @@ class CalibrationRunnerSLURM(CalibrationRunnerQueue):
             @return String representing job status command
         """
         return "squeue -t all"
+
+    @classmethod
+    def getCancelCmd(cls, *args, **kwargs):
+        """ Get command used to cancel a job.  The job ID will be appended
+            to the command.
+        
+            @return String representing job cancel command
+        """
+        return "scancel"
     
     def getRunCmdRegex(self):
         """ Get compiled regular expression for parsing run command output
@@ -788,16 +1125,31 @@ class CalibrationRunnerSLURM(CalibrationRunnerQueue):
     def __init__(self, basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
                  submit_queue, polling_delay, mem_limit, max_active_jobs,
-                 wall_time):
+                 wall_time, runner_options=None):
         super(CalibrationRunnerSLURM, self).__init__(basedir, session_id, queue, 
                  db_path, run_path, logger, restart_runs,
-                 submit_queue, polling_delay, mem_limit, max_active_jobs)
+                 submit_queue, polling_delay, mem_limit, max_active_jobs,
+                 runner_options)
         
         self.run_cmd = self.getRunCmd()
         self.run_status_cmd = self.getRunStatusCmd()
         
         self.wall_time = wall_time
         
+    def getJobFiles(self, run):
+        """ Get side files written for a job: the job script, and standard output
+            and error written by SLURM
+            
+            @param run ModelRun2 object representing the job
+            
+            @return Dict<String, String> mapping stream (one of run_log.STREAMS)
+            to the path of the file
+        """
+        outputPath = os.path.join(self.run_path, run.output_path)
+        return {STREAM_SCRIPT: os.path.join(outputPath, 'slurm.script'),
+                STREAM_STDOUT: os.path.join(outputPath, 'sbatch.out'),
+                STREAM_STDERR: os.path.join(outputPath, 'sbatch.err')}
+    
     def submitJob(self, job):
         """ Submit a job to the underlying queue system.  
         
@@ -821,7 +1173,7 @@ class CalibrationRunnerSLURM(CalibrationRunnerQueue):
             script.write("#SBATCH --mem-per-cpu={mem_limit}\n".format(mem_limit=(self.mem_limit*1024)))
         if self.wall_time:
             script.write("#SBATCH --time={0}:00:00\n".format(self.wall_time)) # Try to get by without specifying this
-        script.write("\nsrun {cmd}\n".format(cmd=job.cmd_raw))
+        script.write("\nsrun {cmd}\n".format(cmd=self.getJobCmd(job)))
         script.close()
         os.chmod(script_filename, 
                  stat.S_IWUSR | stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
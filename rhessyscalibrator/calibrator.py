@@ -49,6 +49,9 @@ import re
 from rhessyscalibrator.model_runner_db2 import *
 from rhessyscalibrator.calibration_runner import *
 from rhessyscalibrator.calibration_parameters import *
+from rhessyscalibrator.staging import buildStageManifest, writeStageManifest, getStageManifestPath
+from rhessyscalibrator.run_output import findOutputFile, getAvailableCompressionMethods, COMPRESSION_METHODS
+from rhessyscalibrator.disk_space import DiskSpaceMonitor, GB
 
 # Constants
 PARALLEL_MODE_LSF = 'lsf'
@@ -67,6 +70,18 @@ MAX_POLLING_DELAY_MULT = 60 * 24
 
 FILE_READ_BUFF_SIZE = 4096
 
+SIM_START_DATE_REGEX = re.compile("-st (\d{4} \d{1,2} \d{1,2} \d{1,2})")
+SIM_END_DATE_REGEX = re.compile("-ed (\d{4} \d{1,2} \d{1,2} \d{1,2})")
+OUTPUT_PATH_ITR_REGEX = re.compile("_ITR_(\d+)$")
+
+# Layouts of run output directories under $BASEDIR/rhessys/output
+OUTPUT_LAYOUT_FLAT = 'flat'
+OUTPUT_LAYOUT_SHARDED = 'sharded'
+OUTPUT_LAYOUTS = [OUTPUT_LAYOUT_FLAT, OUTPUT_LAYOUT_SHARDED]
+# Number of iterations per directory in sharded layout
+OUTPUT_SHARD_SIZE = 1000
+SESSION_OPT_OUTPUT_LAYOUT = 'output_layout'
+
 DEFAULT_FLOWTABLE_SUFFIX = '_flow_table.dat'
 SURFACE_FLOWTABLE_SUFFIX = '_surface_flow_table.dat'
 
@@ -98,6 +113,8 @@ class RHESSysCalibrator(object):
         self.__worldfileFilterRe = re.compile("^.*\.Y[0-9]{4}M[1-9][1-2]{0,1}D[1-9][0-9]{0,1}H[0-9][1-4]{0,1}$")
         # RE filter use to exclude worldfile headers
         self.__worldfileHeaderFilterRe = re.compile("^.*\.hdr$")
+        # Layout of run output directories
+        self.outputLayout = OUTPUT_LAYOUT_FLAT
 
 
     ## Define some class methods that are useful for other classes    
@@ -109,11 +126,12 @@ class RHESSysCalibrator(object):
                                              wall_time=None,
                                              restart_runs=False,
                                              bsub_exclusive_mode=False,
-                                             simulator_path=None):
+                                             simulator_path=None,
+                                             runner_options=None):
         """ Initialize a set of one or more CalibrationRunner objects
             to be used for executing calibration runs.
         
-            @param
+            @param runner_options RunnerOptions controlling how runs are executed
             
             @return Tuple: (multiprocessing.JoinableQueue, [CalibrationRunner 1, ...])
         """
@@ -142,7 +160,8 @@ class RHESSysCalibrator(object):
                                                 mem_limit,
                                                 num_processes,
                                                 bsub_exclusive_mode,
-                                                simulator_path)
+                                                simulator_path,
+                                                runner_options)
             elif PARALLEL_MODE_PBS == parallel_mode:
                 consumer = CalibrationRunnerPBS(basedir,
                                                 session_id,
@@ -155,7 +174,8 @@ class RHESSysCalibrator(object):
                                                 polling_delay,
                                                 mem_limit,
                                                 num_processes,
-                                                wall_time)
+                                                wall_time,
+                                                runner_options)
             elif PARALLEL_MODE_SLURM == parallel_mode:
                 consumer = CalibrationRunnerSLURM(basedir,
                                                 session_id,
@@ -168,7 +188,8 @@ class RHESSysCalibrator(object):
                                                 polling_delay,
                                                 mem_limit,
                                                 num_processes,
-                                                wall_time)
+                                                wall_time,
+                                                runner_options)
             elif PARALLEL_MODE_PROCESS == parallel_mode:
                 consumer = CalibrationRunnerSubprocess(basedir,
                                                        session_id,
@@ -176,7 +197,8 @@ class RHESSysCalibrator(object):
                                                        RHESSysCalibrator.getDBPath(basedir),
                                                        RHESSysCalibrator.getRhessysPath(basedir),
                                                        logger,
-                                                       restart_runs)
+                                                       restart_runs,
+                                                       runner_options)
             else:
                 consumer = None
             # Create process for consumer
@@ -254,9 +276,11 @@ class RHESSysCalibrator(object):
                                         a particular run are stored, e.g.:
                               $BASEDIR/rhessys/output/SESSION_N_worldfile_ITR_I
         
-            @return String representing the path of the run output
+            @return String representing the path of the run output.  If the output has
+            been compressed, the path of the compressed file (e.g. rhessys_basin.daily.gz)
+            will be returned; use run_output.openOutputFile() to read it.
         """
-        return os.path.join(run_output_path, "rhessys_basin.daily")
+        return findOutputFile(os.path.join(run_output_path, "rhessys_basin.daily"))
 
     def _initLogger(self, level):
         """ Setup logger.  Log to the console for now """
@@ -485,6 +509,35 @@ class RHESSysCalibrator(object):
         return template.safe_substitute(worldfile=worldfile)
 
 
+    @classmethod
+    def getSimulationPeriodFromCmdProto(cls, cmd_proto):
+        """ Get simulation start and end dates from cmd.proto
+        
+            @param cmd_proto String representing the cmd.proto
+            
+            @return Tuple (String, String) representing the start and end dates
+            (of the form "YYYY M D H") of the simulation, or (None, None) if 
+            cmd.proto does not specify both -st and -ed.
+        """
+        startMatch = SIM_START_DATE_REGEX.search(cmd_proto)
+        endMatch = SIM_END_DATE_REGEX.search(cmd_proto)
+        if startMatch is None or endMatch is None:
+            return (None, None)
+        return (startMatch.group(1), endMatch.group(1))
+
+    @classmethod
+    def setSimulationPeriodInCmdProto(cls, cmd_proto, start_date_str, end_date_str):
+        """ Replace simulation start and end dates in cmd.proto (or a raw command)
+        
+            @param cmd_proto String representing the cmd.proto
+            @param start_date_str String representing the start date, of the form "YYYY M D H"
+            @param end_date_str String representing the end date, of the form "YYYY M D H"
+            
+            @return String representing cmd.proto with -st and -ed dates replaced
+        """
+        cmd_proto = SIM_START_DATE_REGEX.sub("-st %s" % (start_date_str,), cmd_proto)
+        return SIM_END_DATE_REGEX.sub("-ed %s" % (end_date_str,), cmd_proto)
+
     def getCmdRawForRun(self, cmd_proto, output_path):
         """ Add output_path to cmd.proto to yield raw_cmd for a given
             run.
@@ -801,9 +854,38 @@ class RHESSysCalibrator(object):
         return (ret, filename, pathToFilename)
 
     
+    @classmethod
+    def getRunOutputPath(cls, session_id, worldfile, iteration, layout=OUTPUT_LAYOUT_FLAT):
+        """ Get output_path for a particular worldfile for a particular iteration.
+        
+            @param session_id Integer representing the session_id of the session associated
+                                  with a particular run
+            @param worldfile String representing the name of the worldfile (not including
+                                   path elements
+            @param iteration Integer representing the iteration number
+            @param layout String, one of OUTPUT_LAYOUTS.  In flat layout the output directories
+            of all runs are stored in the same directory.  In sharded layout, output directories
+            are stored in a directory for each session and worldfile, by range of iteration,
+            e.g. output/SESSION_1/world/001000/SESSION_1_world_ITR_1234
+            
+            @return String of the form 
+            output/SESSION_$SESSION_ID_$WORLDFILE_ITR_$ITERATION (flat layout) or 
+            output/SESSION_$SESSION_ID/$WORLDFILE/$SHARD/SESSION_$SESSION_ID_$WORLDFILE_ITR_$ITERATION
+            (sharded layout) relative to $BASEDIR/rhessys
+            
+            @raise Exception if layout is not known
+        """
+        runDir = "SESSION_%d_%s_ITR_%d" % (session_id, worldfile, iteration)
+        if OUTPUT_LAYOUT_FLAT == layout:
+            return os.path.join("output", runDir)
+        elif OUTPUT_LAYOUT_SHARDED == layout:
+            shard = "%06d" % ((iteration // OUTPUT_SHARD_SIZE) * OUTPUT_SHARD_SIZE,)
+            return os.path.join("output", "SESSION_%d" % (session_id,), worldfile, shard, runDir)
+        raise Exception("Unknown output layout %s" % (layout,) )
+    
     def createOutputPath(self, basedir, session_id, worldfile, iteration):
         """ Generate output_path for a particular worldfile for a particular
-            iteration.  Will create directory.
+            iteration, using self.outputLayout.  Will create directory.
 
             @param basedir String representing the basedir of the calibration session
             @param session_id String representing the session_id of the session associated
@@ -812,15 +894,13 @@ class RHESSysCalibrator(object):
                                    path elements
             @param iteration Integer representing the iteration number
 
-            @return String of the form 
-            output/SESSION_$SESSION_ID_$WORLDFILE_ITR_$ITERATION relative to
-            $BASEDIR/rhessys
+            @return String representing output_path relative to $BASEDIR/rhessys,
+            see getRunOutputPath()
 
             @raise OSError if there was a problem creating output_path
         """
-        output_path = os.path.join("output",
-                                   "SESSION_%d_%s_ITR_%d" %
-                                   (session_id, worldfile, iteration))
+        output_path = self.getRunOutputPath(session_id, worldfile, iteration,
+                                            self.outputLayout)
         # Get path relative to $BASEDIR/.. so that we can create output
         #  path
         full_output_path = os.path.join(basedir, "rhessys", output_path)
@@ -835,8 +915,211 @@ class RHESSysCalibrator(object):
         return output_path
                            
                            
+    @classmethod
+    def drainRunQueue(cls, runQueue):
+        """ Remove runs that have not yet been picked up by a consumer from
+            the dispatch queue, so that they will never be run.
+
+            @param runQueue multiprocessing.JoinableQueue used to dispatch runs
+            
+            @return Integer representing the number of runs removed
+        """
+        numDrained = 0
+        while True:
+            try:
+                runQueue.get_nowait()
+            except Queue.Empty:
+                break
+            runQueue.task_done()
+            numDrained += 1
+        return numDrained
+
+    def cancelPendingRuns(self, parallel_mode, simulator_path=None):
+        """ Cancel runs of the current session that have been submitted to the
+            underlying queue management system but are still pending.  Consumers
+            will see the cancelled jobs retire when next polling job status.
+            
+            @precondition self.calibratorDB point to a valid ModelRunnerDB2
+            @precondition self.session is the current session
+            
+            @param parallel_mode String representing the parallel mode of the session
+            @param simulator_path String representing path to LSF simulator, if in use.
+            
+            @return Integer representing the number of runs cancelled
+        """
+        if PARALLEL_MODE_LSF == parallel_mode:
+            cancel_cmd = CalibrationRunnerLSF.getCancelCmd(simulator_path=simulator_path)
+        elif PARALLEL_MODE_PBS == parallel_mode:
+            cancel_cmd = CalibrationRunnerPBS.getCancelCmd()
+        elif PARALLEL_MODE_SLURM == parallel_mode:
+            cancel_cmd = CalibrationRunnerSLURM.getCancelCmd()
+        else:
+            # Runs in process mode are never pending outside of the dispatch queue
+            cancel_cmd = None
+        if cancel_cmd is None:
+            return 0
+        
+        numCancelled = 0
+        runs = self.calibratorDB.getRunsInSession(self.session.id, where_clause="status='PEND'")
+        for run in runs:
+            cmd = "%s %s" % (cancel_cmd, run.job_id)
+            self.logger.debug("Cancelling run %d: %s" % (run.id, cmd))
+            process = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+            (process_stdout, process_stderr) = process.communicate()
+            if process.returncode == 0:
+                numCancelled += 1
+            else:
+                self.logger.critical("Unable to cancel run %d (job %s): %s" % \
+                                     (run.id, run.job_id, process_stderr))
+        return numCancelled
+
+    @classmethod
+    def getIterationFromOutputPath(cls, output_path):
+        """ Get the iteration of a run from its output path
+        
+            @param output_path String of the form output/SESSION_$SESSION_ID_$WORLDFILE_ITR_$ITERATION
+            
+            @return Integer representing the iteration, or None if output_path is not
+            of the expected form.
+        """
+        m = OUTPUT_PATH_ITR_REGEX.search(output_path.rstrip(os.sep))
+        if m is None:
+            return None
+        return int(m.group(1))
+
+    @classmethod
+    def applyPriorPostProcess(cls, calibratorDB, paramsProto, postprocess_id,
+                              behavioral_filter, margin=0.1,
+                              method=PRIOR_METHOD_BOUNDS):
+        """ Narrow parameter ranges to those spanned by behavioral runs of
+            a previous post-process session.
+        
+            @param calibratorDB ModelRunnerDB2 to read post-process session from
+            @param paramsProto CalibrationParametersProto whose ranges are to be narrowed
+            @param postprocess_id Integer representing the ID of the post-process session
+            @param behavioral_filter String representing SQL where clause used to select 
+                behavioral runs, e.g. 'nse>0.5 AND nse_log>0.5'
+            @param margin Float representing the fraction of the width of the behavioral
+                range of each parameter to add to each end of the new range
+            @param method String, one of PRIOR_METHODS.  If PRIOR_METHOD_KERNEL, parameter
+                values will be drawn from a kernel density fitted to the behavioral 
+                parameter sets (within the narrowed ranges).
+            
+            @return Tuple (parameter generator, number of behavioral runs), where 
+            parameter generator is paramsProto or a KernelParameterSampler.
+            
+            @raise Exception if the post-process session has no behavioral runs
+        """
+        keys = paramsProto.getSampledParameterKeys()
+        values = dict([(k, []) for k in keys])
+        numBehavioral = 0
+        runs = calibratorDB.getRunsInPostProcess(postprocess_id, where_clause=behavioral_filter)
+        for run in runs:
+            params = [getattr(run, 'param_' + k) for k in keys]
+            if None in params:
+                continue
+            for (k, v) in zip(keys, params):
+                values[k].append(v)
+            numBehavioral += 1
+        if numBehavioral == 0:
+            raise Exception("No behavioral runs found in post-process session %d using filter: %s" % \
+                            (postprocess_id, behavioral_filter))
+        
+        paramsProto.narrowParameterRanges(values, margin)
+        paramGenerator = paramsProto
+        if method == PRIOR_METHOD_KERNEL:
+            paramGenerator = KernelParameterSampler(paramsProto, values)
+        return (paramGenerator, numBehavioral)
+
+    @classmethod
+    def applySurrogatePostProcess(cls, calibratorDB, paramsProto, postprocess_id,
+                                  metric, criterion, oversample):
+        """ Train a surrogate model of fitness on the runs of a previous 
+            post-process session.
+        
+            @param calibratorDB ModelRunnerDB2 to read post-process session from
+            @param paramsProto CalibrationParametersProto used to generate candidates
+            @param postprocess_id Integer representing the ID of the post-process session
+            @param metric String, one of surrogate.SURROGATE_METRICS
+            @param criterion String, one of surrogate.SURROGATE_CRITERIA
+            @param oversample Integer representing number of candidates to generate 
+                for each run
+            
+            @return Tuple (SurrogateSampler, number of training runs)
+            
+            @raise Exception if the post-process session has too few usable runs
+        """
+        # Import here as surrogate depends on scipy
+        from rhessyscalibrator.surrogate import GaussianProcessSurrogate, SurrogateSampler, MIN_TRAINING_RUNS
+        trainingRuns = calibratorDB.getRunsInPostProcess(postprocess_id)
+        (X, y) = SurrogateSampler.getTrainingData(trainingRuns,
+                                                  paramsProto.getSampledParameterKeys(),
+                                                  paramsProto.parameterRanges,
+                                                  metric)
+        if len(y) < MIN_TRAINING_RUNS:
+            raise Exception("Post-process session %d has %d usable runs, at least %d are needed to train surrogate" % \
+                            (postprocess_id, len(y), MIN_TRAINING_RUNS))
+        surrogate = GaussianProcessSurrogate()
+        surrogate.fit(X, y)
+        sampler = SurrogateSampler(paramsProto, surrogate,
+                                   oversample=oversample,
+                                   criterion=criterion)
+        return (sampler, len(y))
+
+    def createRun(self, itr, worldfile, parameterValues, itr_cmd_proto, parallel_mode):
+        """ Create a run for a particular worldfile for a particular iteration.
+            Will create the output directory for the run.
+            
+            @precondition self.session, self.worldfiles, self.flowtablePath and
+            self.surfaceFlowtablePath have been set
+            
+            @param itr Integer representing the iteration
+            @param worldfile String representing the name of the worldfile
+            @param parameterValues calibration_parameters.CalibrationParameters for the run
+            @param itr_cmd_proto String representing the cmd.proto with parameter values 
+                substituted in to it
+            @param parallel_mode String representing the parallel mode of the session
+            
+            @return ModelRun2 representing the run
+        """
+        run = ModelRun2()
+        run.session_id = self.session.id
+        run.worldfile = worldfile
+        run.setCalibrationParameters(parameterValues)
+        
+        # Add worldfile and flowtable paths to command
+        if self.explicitRouting:
+            if self.surfaceFlowtable:
+                cmd_raw_proto = self.addWorldfileAndFlowtableToCmdProto(\
+                    itr_cmd_proto, self.worldfiles[worldfile], 
+                    self.flowtablePath[worldfile],
+                    self.surfaceFlowtablePath[worldfile])
+            else:
+                cmd_raw_proto = self.addWorldfileAndFlowtableToCmdProto(\
+                    itr_cmd_proto, self.worldfiles[worldfile], 
+                    self.flowtablePath[worldfile])
+        else:
+            cmd_raw_proto = self.addWorldfileToCmdProto(\
+                itr_cmd_proto, self.worldfiles[worldfile])
+
+        # Finally, create output_path and generate cmd_raw
+        run.output_path = self.createOutputPath(self.basedir,
+                                                self.session.id,
+                                                worldfile,
+                                                itr)
+        run.cmd_raw = self.getCmdRawForRun(cmd_raw_proto,
+                                           run.output_path)
+
+        if PARALLEL_MODE_PROCESS == parallel_mode:
+            # Set job ID if we are in process parallel mode
+            #   (in non-process mode, we will use the job number given back by the queueing system instead of itr)
+            run.job_id = str(itr)
+        
+        return run
+
     def createCalibrationSession(self, user, project, iterations,
-                                 processes, basedir, notes=None, cmd_proto=None):
+                                 processes, basedir, notes=None, cmd_proto=None,
+                                 seed=None):
         """ Create calibration session for this session in the database 
 
             @precondition self.calibratorDB point to a valid ModelRunnerDB
@@ -852,6 +1135,8 @@ class RHESSysCalibrator(object):
             @param notes String representing notes associated with the session
             @param cmd_proto String representing cmd_proto to use for runs in session.  
                      If None, cmd.proto will be read from basedir.
+            @param seed Integer representing the seed used to generate parameter values
+                     for runs in the session
 
             @return model_runner_db.ModelSession object 
             representing the session that was created in the database.
@@ -865,7 +1150,7 @@ class RHESSysCalibrator(object):
         # Create the CalibrationSession
         sessionID = self.calibratorDB.insertSession(user, project, notes,
                                                     iterations, processes,
-                                                    basedir, cmd_proto)
+                                                    basedir, cmd_proto, seed)
         assert sessionID != None
         
         # Could eliminate DB round trip if we just pack our own object,
@@ -1006,6 +1291,163 @@ obs/                       Where you will store observed data to be compared to
                           type="int", dest="wall_time",
                           help="[OPTIONAL] For PBS- and SLURM-based parallel modes: Specify wall time in hours that jobs should take.")
 
+        parser.add_option("--monitor_obs", action="store",
+                          type="string", dest="monitor_obs",
+                          help="[OPTIONAL] the name of the observed file to use for scoring runs as they complete.  Filename will be interpreted as being relative to $BASEDIR/obs.  " +
+                               "When specified, no new runs will be dispatched, and pending runs will be cancelled, once the criteria given by --stop_behavioral and/or --stop_epsilon are met.")
+
+        parser.add_option("--behavioral_nse", action="store",
+                          type="float", dest="behavioral_nse", default=0.5,
+                          help="[OPTIONAL] for --monitor_obs: minimum NSE for a run to be counted as behavioral.  Defaults to 0.5.")
+
+        parser.add_option("--behavioral_nse_log", action="store",
+                          type="float", dest="behavioral_nse_log", default=0.5,
+                          help="[OPTIONAL] for --monitor_obs: minimum NSE-log for a run to be counted as behavioral.  Defaults to 0.5.")
+
+        parser.add_option("--stop_behavioral", action="store",
+                          type="int", dest="stop_behavioral",
+                          help="[OPTIONAL] for --monitor_obs: stop the session once this many behavioral runs have been found.")
+
+        parser.add_option("--stop_epsilon", action="store",
+                          type="float", dest="stop_epsilon",
+                          help="[OPTIONAL] for --monitor_obs: stop the session once the relative change in GLUE bounds and parameter posterior quantiles is below this value for --stop_batches consecutive batches of completed runs.")
+
+        parser.add_option("--stop_batches", action="store",
+                          type="int", dest="stop_batches", default=3,
+                          help="[OPTIONAL] for --monitor_obs: number of consecutive batches over which --stop_epsilon must hold.  Defaults to 3.")
+
+        parser.add_option("--monitor_batch_size", action="store",
+                          type="int", dest="monitor_batch_size",
+                          help="[OPTIONAL] for --monitor_obs: number of completed runs in each batch.  Defaults to the number of simultaneous jobs.")
+
+        parser.add_option("--score_obs", action="store",
+                          type="string", dest="score_obs",
+                          help="[OPTIONAL] the name of the observed file to use for calculating fitness of runs as they complete.  Filename will be interpreted as being relative to $BASEDIR/obs.  " +
+                               "Fitness results are stored in a post-process session created when the session starts, as rhessys_calibrator_postprocess would, " +
+                               "so that they can be inspected while the session runs, and are complete when it ends.")
+
+        parser.add_option("--score_period", action="store",
+                          dest="score_period", choices=['daily', 'weekly', 'monthly'], default='daily',
+                          help="[OPTIONAL] for --score_obs: period over which fitness is calculated.  Defaults to daily.")
+
+        parser.add_option("--seed", action="store",
+                          type="int", dest="seed",
+                          help="[OPTIONAL] seed used to generate parameter values for runs.  Parameter values of a session can be reproduced by specifying its seed.  If not specified, a new seed will be chosen and stored with the session.")
+
+        parser.add_option("--screen_startdate", action="store",
+                          type="int", nargs=4, dest="screen_startdate",
+                          help="[OPTIONAL] run all parameter sets over a short screening period starting at this date, of the form \"YYYY M D H\", before running the best parameter sets over the full simulation period in cmd.proto.  Requires --screen_enddate, --screen_obs, and --promote_fraction and/or --promote_filter.")
+
+        parser.add_option("--screen_enddate", action="store",
+                          type="int", nargs=4, dest="screen_enddate",
+                          help="[OPTIONAL] end date of the screening period, of the form \"YYYY M D H\"")
+
+        parser.add_option("--screen_obs", action="store",
+                          type="string", dest="screen_obs",
+                          help="[OPTIONAL] the name of the observed file to use for scoring screening runs.  Filename will be interpreted as being relative to $BASEDIR/obs.")
+
+        parser.add_option("--promote_fraction", action="store",
+                          type="float", dest="promote_fraction",
+                          help="[OPTIONAL] fraction of screened runs, ranked by NSE, to promote to the full simulation period (e.g. 0.1).")
+
+        parser.add_option("--promote_filter", action="store",
+                          type="string", dest="promote_filter",
+                          help="[OPTIONAL] SQL where clause that screening fitness results must satisfy for a run to be promoted to the full simulation period.  E.g. 'nse>0.2 AND nse_log>0.2' (use quotes)")
+
+        parser.add_option("--surrogate_postprocess", action="store",
+                          type="int", dest="surrogate_postprocess",
+                          help="[OPTIONAL] ID of a post-process session whose runs and fitness results are used to train a surrogate (Gaussian process) model of fitness.  " +
+                               "When specified, each run's parameters will be chosen from --surrogate_oversample random candidates by the surrogate.")
+
+        parser.add_option("--surrogate_metric", action="store",
+                          type="choice", dest="surrogate_metric", default='min',
+                          choices=['min', 'nse', 'nse_log'],
+                          help="[OPTIONAL] for --surrogate_postprocess: fitness metric to emulate, one of: min [default] (the lesser of NSE and NSE-log), nse, nse_log")
+
+        parser.add_option("--surrogate_criterion", action="store",
+                          type="choice", dest="surrogate_criterion", default='ei',
+                          choices=['ei', 'mean'],
+                          help="[OPTIONAL] for --surrogate_postprocess: criterion used to choose among candidates, one of: ei [default] (expected improvement), mean (highest predicted fitness)")
+
+        parser.add_option("--surrogate_oversample", action="store",
+                          type="int", dest="surrogate_oversample", default=10,
+                          help="[OPTIONAL] for --surrogate_postprocess: number of candidate parameter sets to generate for each run.  Defaults to 10.")
+
+        parser.add_option("--prior_postprocess", action="store",
+                          type="int", dest="prior_postprocess",
+                          help="[OPTIONAL] ID of a post-process session whose behavioral runs are used to narrow the range of each parameter.  " +
+                               "Each range will be narrowed to that spanned by the behavioral runs, widened by --prior_margin.")
+
+        parser.add_option("--prior_filter", action="store",
+                          type="string", dest="prior_filter", default="nse>0.5 AND nse_log>0.5",
+                          help="[OPTIONAL] for --prior_postprocess: SQL where clause to use to determine which runs qualify as behavioral.  Defaults to 'nse>0.5 AND nse_log>0.5' (use quotes)")
+
+        parser.add_option("--prior_margin", action="store",
+                          type="float", dest="prior_margin", default=0.1,
+                          help="[OPTIONAL] for --prior_postprocess: fraction of the width of the behavioral range of each parameter to add to each end of the narrowed range.  Defaults to 0.1.")
+
+        parser.add_option("--prior_method", action="store",
+                          type="choice", dest="prior_method", default=PRIOR_METHOD_BOUNDS,
+                          choices=list(PRIOR_METHODS),
+                          help="[OPTIONAL] for --prior_postprocess: how to draw parameter values, one of: bounds [default] (uniformly within narrowed ranges), " +
+                               "kernel (from a kernel density fitted to the behavioral parameter sets)")
+
+        parser.add_option("--scratch", action="store_true",
+                          dest="scratch", default=False,
+                          help="[OPTIONAL] write the output of each run to node-local scratch rather than the output directory of the run.  " +
+                               "When a run completes, only outputs matching --scratch_keep will be copied back to the output directory of the run.")
+
+        parser.add_option("--scratch_dir", action="store",
+                          type="string", dest="scratch_dir",
+                          help="[OPTIONAL] for --scratch: directory on compute nodes under which to create scratch directories.  Defaults to $TMPDIR on the compute node.")
+
+        parser.add_option("--scratch_keep", action="store",
+                          type="string", dest="scratch_keep", default=','.join(DEFAULT_SCRATCH_KEEP),
+                          help="[OPTIONAL] for --scratch: comma-separated list of filename patterns of outputs to copy back from scratch, e.g. 'rhessys_basin.daily,rhessys_hillslope.daily'.  " +
+                               "Defaults to '%s'." % (','.join(DEFAULT_SCRATCH_KEEP),) )
+
+        parser.add_option("--stage_inputs", action="store_true",
+                          dest="stage_inputs", default=False,
+                          help="[OPTIONAL] stage model inputs (worldfiles and the files referenced by their headers, flowtables and tecfile) into a node-local cache on each compute node, " +
+                               "so that runs read their inputs from local storage rather than from $BASEDIR.")
+
+        parser.add_option("--stage_dir", action="store",
+                          type="string", dest="stage_dir",
+                          help="[OPTIONAL] for --stage_inputs: directory of the input cache on compute nodes.  Defaults to /tmp/rhessys_calibrator_stage_$USER.")
+
+        parser.add_option("--compress", action="store",
+                          type="choice", choices=COMPRESSION_METHODS, dest="compress",
+                          help="[OPTIONAL] compress the outputs of each run once the run completes, using one of: %s.  " % (', '.join(COMPRESSION_METHODS),) +
+                               "zstd and lz4 require the zstandard and lz4 Python modules respectively.")
+
+        parser.add_option("--output_layout", action="store",
+                          type="choice", choices=OUTPUT_LAYOUTS, dest="output_layout", default=OUTPUT_LAYOUT_FLAT,
+                          help="[OPTIONAL] layout of run output directories: %s (all in $BASEDIR/rhessys/output) " % (OUTPUT_LAYOUT_FLAT,) +
+                               "or %s (in directories by session, worldfile and range of %d iterations; recommended for sessions with many runs).  " % (OUTPUT_LAYOUT_SHARDED, OUTPUT_SHARD_SIZE) +
+                               "Defaults to %s." % (OUTPUT_LAYOUT_FLAT,) )
+
+        parser.add_option("--disk_reserve", action="store",
+                          type="float", dest="disk_reserve",
+                          help="[OPTIONAL] pause dispatch of runs while less than this many GB would remain free on the filesystem of $BASEDIR/rhessys " +
+                               "once runs in flight have written their output (estimated from the output size of the first runs to complete).  " +
+                               "Dispatch resumes once space is available.")
+
+        parser.add_option("--log_archive", action="store_true",
+                          dest="log_archive", default=False,
+                          help="[OPTIONAL] store standard output and error of each run, and queue system job scripts, in a single run log for the session " +
+                               "($BASEDIR/rhessys/run_log_SESSION_N.log) rather than as separate files in the output directory of each run.  " +
+                               "Use rhessys_calibrator_run_log to read the output of a run.")
+
+        parser.add_option("--columnar", action="store_true",
+                          dest="columnar", default=False,
+                          help="[OPTIONAL] once each run is done, convert its basin daily output to a columnar NumPy file (rhessys_basin.daily.npz), " +
+                               "which is read by postprocessing tools in preference to the text output.")
+
+        parser.add_option("--integrity", action="store_true",
+                          dest="integrity", default=False,
+                          help="[OPTIONAL] once each run is done, store the size, line count, last date and checksum of each of its output files in the database.  " +
+                               "Use rhessys_calibrator_validate to check the outputs of a session against these records before postprocessing.")
+
         (options, args) = parser.parse_args()
 
         # Enforce initial command line options rules
@@ -1086,6 +1528,73 @@ with the calibration session""")
         if not options.bsub_exclusive_mode:
             options.bsub_exclusive_mode = False;
 
+        if options.monitor_obs:
+            if options.stop_behavioral is None and options.stop_epsilon is None:
+                parser.error("Please specify --stop_behavioral and/or --stop_epsilon when using --monitor_obs")
+            if options.stop_behavioral is not None and options.stop_behavioral < 1:
+                parser.error("--stop_behavioral must be greater than 0")
+            if options.stop_epsilon is not None and options.stop_epsilon <= 0:
+                parser.error("--stop_epsilon must be greater than 0")
+            if options.stop_batches < 1:
+                parser.error("--stop_batches must be greater than 0")
+            if not options.monitor_batch_size:
+                options.monitor_batch_size = options.processes
+        elif options.stop_behavioral is not None or options.stop_epsilon is not None:
+            parser.error("--stop_behavioral and --stop_epsilon require --monitor_obs")
+
+        screening = options.screen_startdate or options.screen_enddate
+        if screening:
+            if not options.screen_startdate or not options.screen_enddate:
+                parser.error("Please specify both --screen_startdate and --screen_enddate")
+            if not options.screen_obs:
+                parser.error("Please specify --screen_obs when screening runs")
+            if options.promote_fraction is None and not options.promote_filter:
+                parser.error("Please specify --promote_fraction and/or --promote_filter when screening runs")
+            if options.promote_fraction is not None and \
+                (options.promote_fraction <= 0 or options.promote_fraction > 1):
+                parser.error("--promote_fraction must be greater than 0 and less than or equal to 1")
+            if options.monitor_obs:
+                parser.error("--monitor_obs cannot be used when screening runs")
+            if options.score_obs:
+                parser.error("--score_obs cannot be used when screening runs")
+            screenStartDate = datetime(*options.screen_startdate)
+            screenEndDate = datetime(*options.screen_enddate)
+            if screenStartDate >= screenEndDate:
+                parser.error("Screening start date %s is not before end date %s" % (str(screenStartDate), str(screenEndDate)) )
+            screenStartDateStr = ' '.join([str(d) for d in options.screen_startdate])
+            screenEndDateStr = ' '.join([str(d) for d in options.screen_enddate])
+        elif options.screen_obs or options.promote_fraction is not None or options.promote_filter:
+            parser.error("--screen_obs, --promote_fraction and --promote_filter require --screen_startdate and --screen_enddate")
+
+        if options.surrogate_oversample < 1:
+            parser.error("--surrogate_oversample must be greater than 0")
+
+        if options.disk_reserve is not None and options.disk_reserve < 0:
+            parser.error("--disk_reserve must not be negative")
+
+        runnerOptions = RunnerOptions(scratch=options.scratch,
+                                      scratch_dir=options.scratch_dir,
+                                      scratch_keep=[p.strip() for p in options.scratch_keep.split(',') if p.strip()],
+                                      stage_dir=options.stage_dir,
+                                      compress=options.compress,
+                                      columnar=options.columnar,
+                                      log_archive=options.log_archive,
+                                      integrity=options.integrity)
+        if options.compress and options.compress not in getAvailableCompressionMethods():
+            parser.error("%s compression is not supported, install the module it requires or use one of: %s" % \
+                         (options.compress, ', '.join(getAvailableCompressionMethods())) )
+
+        if options.prior_margin < 0:
+            parser.error("--prior_margin must not be negative")
+        if options.prior_postprocess and options.prior_method == PRIOR_METHOD_KERNEL \
+            and options.surrogate_postprocess:
+            parser.error("--prior_method kernel cannot be used with --surrogate_postprocess")
+
+        if options.seed is None:
+            options.seed = newSessionSeed()
+        elif options.seed < 0 or options.seed > MAX_SEED:
+            parser.error("--seed must be between 0 and %d" % (MAX_SEED,) )
+
         self.logger.critical("parallel mode: %s" % options.parallel_mode)
         self.logger.debug("basedir: %s" % self.basedir)
         self.logger.debug("user: %s" % options.user)
@@ -1130,6 +1639,18 @@ with the calibration session""")
                                                     os.path.join(rhessysExecPath, rhessysExec),
                                                     tecfilePath)
 
+            if screening:
+                # Runs will first be made over the screening period, those promoted
+                #  will later be re-run over the full simulation period.
+                (fullStartDateStr, fullEndDateStr) = \
+                    self.getSimulationPeriodFromCmdProto(cmd_proto_noparam)
+                if fullStartDateStr is None:
+                    raise Exception("cmd.proto must specify -st and -ed to screen runs")
+                cmd_proto_pre = self.setSimulationPeriodInCmdProto(cmd_proto_pre,
+                                                                   screenStartDateStr,
+                                                                   screenEndDateStr)
+                self.logger.debug("Screening cmd.proto: %s" % (cmd_proto_pre,) )
+
             # Check for explicit routing and surface flowtable in cmd_proto, get dicts of
             # flowtables from basedir
             (self.flowtablePath, self.surfaceFlowtablePath) = self.determineRouting(cmd_proto_noparam)
@@ -1146,7 +1667,95 @@ with the calibration session""")
                                                          options.iterations,
                                                          options.processes,
                                                          self.basedir,
-                                                         options.notes)
+                                                         options.notes,
+                                                         seed=options.seed)
+            paramsProto.seed = self.session.seed
+            print("Created session %d with seed %d" % (self.session.id, self.session.seed))
+            if options.stage_inputs:
+                # Checksum inputs once, runners will verify staged copies against these
+                flowtables = (self.flowtablePath or {}).values() + (self.surfaceFlowtablePath or {}).values()
+                manifest = buildStageManifest(RHESSysCalibrator.getRhessysPath(self.basedir),
+                                              self.worldfiles.values(), flowtables, [tecfilePath])
+                runnerOptions.stage_manifest = getStageManifestPath(self.basedir, self.session.id)
+                writeStageManifest(manifest, runnerOptions.stage_manifest)
+                self.logger.critical("Stage manifest of %d inputs written to %s" % \
+                                     (len(manifest['files']), runnerOptions.stage_manifest))
+            self.calibratorDB.setSessionOptions(self.session.id, runnerOptions.toSessionOptions())
+            self.outputLayout = options.output_layout
+            self.calibratorDB.setSessionOptions(self.session.id,
+                                                {SESSION_OPT_OUTPUT_LAYOUT: self.outputLayout})
+
+            if screening:
+                # Import here as screening depends on postprocess, which imports this module
+                from rhessyscalibrator.screening import RunScreener
+                screener = RunScreener(self.basedir, options.screen_obs, self.logger)
+                screenOpts = {'screen_startdate': screenStartDateStr,
+                              'screen_enddate': screenEndDateStr,
+                              'screen_obs': options.screen_obs}
+                if options.promote_fraction is not None:
+                    screenOpts['promote_fraction'] = str(options.promote_fraction)
+                if options.promote_filter:
+                    screenOpts['promote_filter'] = options.promote_filter
+                self.calibratorDB.setSessionOptions(self.session.id, screenOpts)
+
+            # Parameter values are either drawn at random, or chosen by a surrogate model
+            paramGenerator = paramsProto
+            if options.prior_postprocess:
+                (paramGenerator, numBehavioral) = \
+                    self.applyPriorPostProcess(self.calibratorDB, paramsProto,
+                                               options.prior_postprocess,
+                                               options.prior_filter,
+                                               options.prior_margin,
+                                               options.prior_method)
+                priorOpts = {'prior_postprocess': str(options.prior_postprocess),
+                             'prior_filter': options.prior_filter,
+                             'prior_margin': str(options.prior_margin),
+                             'prior_method': options.prior_method}
+                for key in paramsProto.getSampledParameterKeys():
+                    (floor, ceil) = paramsProto.parameterRanges[key]
+                    self.logger.critical("Range of %s narrowed to [%f, %f] using %d behavioral runs" % \
+                                         (key, floor, ceil, numBehavioral))
+                    priorOpts['param_range_' + key] = "%r,%r" % (floor, ceil)
+                self.calibratorDB.setSessionOptions(self.session.id, priorOpts)
+            if options.surrogate_postprocess:
+                (paramGenerator, numTraining) = \
+                    self.applySurrogatePostProcess(self.calibratorDB, paramsProto,
+                                                   options.surrogate_postprocess,
+                                                   options.surrogate_metric,
+                                                   options.surrogate_criterion,
+                                                   options.surrogate_oversample)
+                self.logger.critical("Surrogate trained on %d runs, length scale: %f" % \
+                                     (numTraining, paramGenerator.surrogate.lengthScale))
+                self.calibratorDB.setSessionOptions(self.session.id,
+                                                    {'surrogate_postprocess': str(options.surrogate_postprocess),
+                                                     'surrogate_metric': options.surrogate_metric,
+                                                     'surrogate_criterion': options.surrogate_criterion,
+                                                     'surrogate_oversample': str(options.surrogate_oversample),
+                                                     'surrogate_training_runs': str(numTraining)})
+
+            # Set up online monitoring of the session (if requested)
+            monitor = None
+            if options.monitor_obs:
+                # Import here as convergence depends on postprocess, which imports this module
+                from rhessyscalibrator.convergence import SessionMonitor
+                monitor = SessionMonitor(self.basedir, self.session.id, options.monitor_obs, self.logger,
+                                         behavioral_nse=options.behavioral_nse,
+                                         behavioral_nse_log=options.behavioral_nse_log,
+                                         stop_behavioral=options.stop_behavioral,
+                                         stop_epsilon=options.stop_epsilon,
+                                         stop_batches=options.stop_batches,
+                                         batch_size=options.monitor_batch_size,
+                                         param_ranges=paramsProto.parameterRanges)
+
+            # Set up scoring of runs as they complete (if requested)
+            scorer = None
+            if options.score_obs:
+                # Import here as live_scoring depends on postprocess, which imports this module
+                from rhessyscalibrator.live_scoring import LiveScorer
+                scorer = LiveScorer(self.basedir, self.session.id, options.score_obs, self.logger,
+                                    period=options.score_period)
+                scorePostprocID = scorer.start(self.calibratorDB)
+                print("Fitness results will be saved to post-process session: %d" % (scorePostprocID,) )
 
             # Initialize CalibrationRunner consumers for executing jobs
             (runQueue, consumers) = \
@@ -1156,66 +1765,113 @@ with the calibration session""")
                                                                        mem_limit=options.mem_limit, 
                                                                        wall_time=wall_time,
                                                                        bsub_exclusive_mode=options.bsub_exclusive_mode,
-                                                                       simulator_path=options.simulator_path)
+                                                                       simulator_path=options.simulator_path,
+                                                                       runner_options=runnerOptions)
+
+            # Pause dispatch when disk space runs low (if requested)
+            diskMonitor = None
+            if options.disk_reserve is not None:
+                diskMonitor = DiskSpaceMonitor(RHESSysCalibrator.getRhessysPath(self.basedir),
+                                               self.session.id, self.logger,
+                                               int(options.disk_reserve * GB),
+                                               options.iterations * len(self.worldfiles))
+            numDispatched = 0
 
             # Dispatch runs to consumer
             # For each iteration (from 1 to options.iterations+1)
             iterations = options.iterations + 1 # make sure we get all N
             for itr in range(1, iterations):
+                if monitor and monitor.update(self.calibratorDB):
+                    break
+                if scorer:
+                    scorer.update(self.calibratorDB)
                 # Generate parameter values to use for all worldfiles in 
                 #  this iteration
-                parameterValues = paramsProto.generateParameterValues()
+                parameterValues = paramGenerator.generateParameterValues(itr)
                 itr_cmd_proto = self.addParametersToCmdProto(cmd_proto_pre,
                                                              parameterValues)
                 # For each world file
                 for worldfile in self.worldfiles.keys():
                     self.logger.critical("Iteration %d, worldfile: %s" %
                                          (itr, worldfile))
+                    if diskMonitor:
+                        diskMonitor.waitForSpace(self.calibratorDB, numDispatched)
                     # Create new ModelRun object for this run
-                    run = ModelRun2()
-                    run.session_id = self.session.id
-                    run.worldfile = worldfile
-                    run.setCalibrationParameters(parameterValues)
-                    
-                    # Add worldfile and flowtable paths to command
-                    if self.explicitRouting:
-                        if self.surfaceFlowtable:
-                            cmd_raw_proto = self.addWorldfileAndFlowtableToCmdProto(\
-                                itr_cmd_proto, self.worldfiles[worldfile], 
-                                self.flowtablePath[worldfile],
-                                self.surfaceFlowtablePath[worldfile])
-                        else:
-                            cmd_raw_proto = self.addWorldfileAndFlowtableToCmdProto(\
-                                itr_cmd_proto, self.worldfiles[worldfile], 
-                                self.flowtablePath[worldfile])
-                    else:
-                        cmd_raw_proto = self.addWorldfileToCmdProto(\
-                            itr_cmd_proto, self.worldfiles[worldfile])
-
-                    # Finally, create output_path and generate cmd_raw
-                    run.output_path = self.createOutputPath(self.basedir,
-                                                            self.session.id,
-                                                            worldfile,
-                                                            itr)
-                    run.cmd_raw = self.getCmdRawForRun(cmd_raw_proto,
-                                                       run.output_path)
-        
-                    if PARALLEL_MODE_PROCESS == options.parallel_mode:
-                        # Set job ID if we are in process parallel mode
-                        #   (in non-process mode, we will use the job number given back by the queueing system instead of itr)
-                        run.job_id = str(itr)
+                    run = self.createRun(itr, worldfile, parameterValues,
+                                         itr_cmd_proto, options.parallel_mode)
         
                     # Dispatch to consumer
                     runQueue.put(run)
+                    numDispatched += 1
 
             time.sleep(5)
 
+            if monitor or scorer:
+                # Keep scoring runs while the remaining runs finish, stopping
+                #  early once the stopping criteria are met
+                while any([c.is_alive() for c in consumers]):
+                    if scorer:
+                        scorer.update(self.calibratorDB)
+                    if monitor and monitor.update(self.calibratorDB):
+                        break
+                    time.sleep((monitor or scorer).POLL_INTERVAL_SECS)
+                if monitor and monitor.isConverged():
+                    numDrained = RHESSysCalibrator.drainRunQueue(runQueue)
+                    numCancelled = self.cancelPendingRuns(options.parallel_mode, options.simulator_path)
+                    print("Stopping session %d: %s" % (self.session.id, monitor.stopReason))
+                    print("Removed %d queued runs, cancelled %d pending runs" % (numDrained, numCancelled))
+
             # Wait for all jobs to finish
             self.logger.critical("calling runQueue.join() ...")
             runQueue.join()
             for consumerProcess in consumers:
                 consumerProcess.join()
 
+            if scorer:
+                scorer.finish(self.calibratorDB)
+                print("Fitness results of %d runs saved to post-process session: %d" % \
+                      (scorer.numScored, scorer.postprocess_id))
+
+            if screening:
+                # Score screening runs and promote the best to the full simulation period
+                runs = self.calibratorDB.getRunsInSession(self.session.id)
+                screenPostprocID = screener.scoreRuns(self.calibratorDB, self.session.id, runs)
+                self.calibratorDB.setSessionOptions(self.session.id, 
+                                                    {'screen_postprocess_id': str(screenPostprocID)})
+                promoted = screener.promoteRuns(self.calibratorDB, self.session.id, screenPostprocID,
+                                                fraction=options.promote_fraction,
+                                                where_clause=options.promote_filter)
+                print("Screening results saved to post-process session: %d" % (screenPostprocID,) )
+                print("Promoting %d of %d screened runs to the full simulation period" % \
+                      (len(promoted), len(runs)) )
+                
+                if len(promoted) > 0:
+                    # Re-run promoted runs, reusing their run records and output paths
+                    (runQueue, consumers) = \
+                        RHESSysCalibrator.initializeCalibrationRunnerConsumers(self.basedir, self.logger,
+                                                                               self.session.id, options.parallel_mode, options.processes, options.polling_delay,
+                                                                               options.queue_name, 
+                                                                               mem_limit=options.mem_limit, 
+                                                                               wall_time=wall_time,
+                                                                               restart_runs=True,
+                                                                               bsub_exclusive_mode=options.bsub_exclusive_mode,
+                                                                               simulator_path=options.simulator_path,
+                                                                               runner_options=runnerOptions)
+                    for run in promoted:
+                        run.cmd_raw = self.setSimulationPeriodInCmdProto(run.cmd_raw,
+                                                                         fullStartDateStr,
+                                                                         fullEndDateStr)
+                        self.calibratorDB.updateRunCmdRaw(run.id, run.cmd_raw)
+                        self.calibratorDB.updateRunStatus(run.id, "PEND")
+                        runQueue.put(run)
+                    
+                    time.sleep(5)
+                    
+                    self.logger.critical("calling runQueue.join() ...")
+                    runQueue.join()
+                    for consumerProcess in consumers:
+                        consumerProcess.join()
+
             # Update session endtime and status
             self.calibratorDB.updateSessionEndtime(self.session.id,
                                                    datetime.utcnow(),
@@ -1362,12 +2018,27 @@ class RHESSysCalibratorRestart(RHESSysCalibrator):
             else:
                 self.logger.debug("Session status is: %s" % (self.session.status,))
                 
+            # Runs of MCMC sessions depend on the state of the chains after
+            #  each generation, so they cannot be regenerated here
+            if 'mcmc_chains' in calibratorDB.getSessionOptions(self.session.id):
+                raise Exception("Session %d is an MCMC session (see rhessys_calibrator_mcmc), which cannot be restarted" % \
+                                (self.session.id,) )
+            
+            # Runs are executed as they were in the original session
+            runnerOptions = RunnerOptions.fromSessionOptions(calibratorDB.getSessionOptions(self.session.id))
+            self.outputLayout = calibratorDB.getSessionOptions(self.session.id).get(SESSION_OPT_OUTPUT_LAYOUT,
+                                                                                     OUTPUT_LAYOUT_FLAT)
+            
             # Get runs in session
             runs = calibratorDB.getRunsInSession(self.session.id)
             self.numRuns = len(runs) 
             if self.numRuns == 0:
                 raise Exception("No runs found for session %d" % (self.session.id,))  
             
+            # Runs rejected during screening are not to be re-run
+            rejectedRunIds = set([r.id for r in calibratorDB.getRunsInSession(self.session.id,
+                where_clause="NOT " + ModelRunnerDB2.WHERE_NOT_SCREENED_OUT)])
+            
             numRunsDone = 0
             minDoneRunId = sys.maxint
             runsDone = []
@@ -1375,7 +2046,7 @@ class RHESSysCalibratorRestart(RHESSysCalibrator):
             existingRunIds = []
             for run in runs:
                 existingRunIds.append(run.id)
-                if "DONE" == run.status:
+                if "DONE" == run.status or run.id in rejectedRunIds:
                     if run.id < minDoneRunId:
                         minDoneRunId = run.id
                     runsDone.append(run)
@@ -1407,10 +2078,53 @@ class RHESSysCalibratorRestart(RHESSysCalibrator):
             print("Total runs in session: %s" % (self.session.iterations,) )
             print("Completed runs: %s" % (numRunsDone,) )
             print("Runs to be restarted: %s" % (numToRestart,) )
-            numNewRuns = self.session.iterations - numRunsDone - numToRestart
+            
+            missingRuns = None
+            if self.session.seed is not None:
+                # Regenerate exactly the runs the session would have made
+                #  for iterations that were never dispatched
+                paramsProto.seed = self.session.seed
+                paramGenerator = paramsProto
+                sessionOpts = calibratorDB.getSessionOptions(self.session.id)
+                if 'prior_postprocess' in sessionOpts:
+                    (paramGenerator, numBehavioral) = \
+                        self.applyPriorPostProcess(calibratorDB, paramsProto,
+                                                   int(sessionOpts['prior_postprocess']),
+                                                   sessionOpts['prior_filter'],
+                                                   float(sessionOpts['prior_margin']),
+                                                   sessionOpts['prior_method'])
+                if 'surrogate_postprocess' in sessionOpts:
+                    # The surrogate must be trained on the same runs as the original 
+                    #  session's for new runs to match those it would have made
+                    surrogatePostprocess = int(sessionOpts['surrogate_postprocess'])
+                    try:
+                        (paramGenerator, numTraining) = \
+                            self.applySurrogatePostProcess(calibratorDB, paramsProto,
+                                                           surrogatePostprocess,
+                                                           sessionOpts['surrogate_metric'],
+                                                           sessionOpts['surrogate_criterion'],
+                                                           int(sessionOpts['surrogate_oversample']))
+                    except Exception as e:
+                        sys.exit("Unable to rebuild surrogate model of session %d, new runs cannot be regenerated: %s" % \
+                                 (self.session.id, str(e)))
+                    if 'surrogate_training_runs' in sessionOpts and \
+                        int(sessionOpts['surrogate_training_runs']) != numTraining:
+                        sys.exit("Surrogate model of session %d was trained on %s runs of post-process session %d, which now has %d; new runs cannot be regenerated" % \
+                                 (self.session.id, sessionOpts['surrogate_training_runs'], 
+                                  surrogatePostprocess, numTraining))
+                if self.stripParameterRangesFromCmdProto(self.session.cmd_proto) != cmd_proto_noparam:
+                    print("WARNING: cmd.proto differs from that of session %d, new runs may not match those of the original session" % \
+                          (self.session.id,) )
+                existingRuns = set([(r.worldfile, self.getIterationFromOutputPath(r.output_path)) for r in runs])
+                missingRuns = [(itr, worldfile) for itr in range(1, self.session.iterations + 1) \
+                                for worldfile in sorted(self.worldfiles.keys()) \
+                                if (worldfile, itr) not in existingRuns]
+                numNewRuns = len(missingRuns)
+            else:
+                numNewRuns = self.session.iterations - numRunsDone - numToRestart
             print("New runs: %s" % (numNewRuns,) )
             
-            if len(freeRunIds) < numNewRuns:
+            if missingRuns is None and len(freeRunIds) < numNewRuns:
                 sys.exit("The number of free Run IDs (%d) is less than the needed number of new runs (%d)" % (len(freeRunIds), numNewRuns) )
             
             response = raw_input("Continue? [yes | no] " )
@@ -1430,7 +2144,8 @@ class RHESSysCalibratorRestart(RHESSysCalibrator):
                                                                        wall_time=wall_time,
                                                                        bsub_exclusive_mode=args.bsub_exclusive_mode,
                                                                        simulator_path=args.simulator_path,
-                                                                       restart_runs=True)
+                                                                       restart_runs=True,
+                                                                       runner_options=runnerOptions)
             for run in runsToRestart:
                 # Dispatch to consumer
                 runQueue.put(run)
@@ -1454,7 +2169,21 @@ class RHESSysCalibratorRestart(RHESSysCalibrator):
                                                                        mem_limit=args.mem_limit,
                                                                        wall_time=wall_time,
                                                                        bsub_exclusive_mode=args.bsub_exclusive_mode,
-                                                                       simulator_path=args.simulator_path)
+                                                                       simulator_path=args.simulator_path,
+                                                                       runner_options=runnerOptions)
+            
+            if missingRuns is not None:
+                for (itr, worldfile) in missingRuns:
+                    self.logger.critical("Iteration %d, worldfile: %s" %
+                                         (itr, worldfile))
+                    parameterValues = paramGenerator.generateParameterValues(itr)
+                    itr_cmd_proto = self.addParametersToCmdProto(cmd_proto_pre,
+                                                                 parameterValues)
+                    run = self.createRun(itr, worldfile, parameterValues,
+                                         itr_cmd_proto, args.parallel_mode)
+                    # Dispatch to consumer
+                    runQueue.put(run)
+                numNewRuns = 0
             
             # For each new run (from 1 to numNewRuns+1)
             iterations = numNewRuns + 1 # make sure we get all N
@@ -0,0 +1,372 @@
+"""@package rhessyscalibrator.convergence
+
+@brief Online monitoring of calibration sessions.  Scores runs as they
+complete and decides when enough behavioral runs have been found, or when
+GLUE bounds and parameter posterior quantiles have stabilized, so that
+dispatch of new runs can stop.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import errno
+import time
+
+import numpy
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.observed import readObservedData
+from rhessyscalibrator.calibration_parameters import PARAM_KEYS
+from rhessyscalibrator.run_output import BasinDailyReader, getDateWindow
+from rhessyscalibrator.metrics import calculateMetrics, METRIC_NSE, METRIC_NSE_LOG
+
+DEFAULT_QUANTILES = (0.025, 0.5, 0.975)
+
+
+def weightedQuantiles(values, weights, quantiles=DEFAULT_QUANTILES):
+    """ Calculate likelihood-weighted quantiles for each column of values
+        using the cumulative distribution of likelihood values (as is done
+        when drawing GLUE uncertainty bounds).
+
+        @param values Numpy array of dimensions [NUM_SIMULATIONS, NUM_DATA_PER_SIMULATION]
+        @param weights Numpy array of likelihood values, dimensions [NUM_SIMULATIONS]
+        @param quantiles Sequence of quantiles in the range (0, 1)
+
+        @return Numpy array of dimensions [len(quantiles), NUM_DATA_PER_SIMULATION]
+    """
+    values = numpy.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape( (len(values), 1) )
+    weights = numpy.asarray(weights, dtype=float)
+    normWeights = weights / numpy.sum(weights)
+
+    sortedIdx = numpy.argsort(values, axis=0)
+    cols = numpy.arange(values.shape[1])
+    sortedValues = values[sortedIdx, cols]
+    cumWeights = numpy.cumsum(normWeights[sortedIdx], axis=0)
+
+    result = numpy.empty( (len(quantiles), values.shape[1]) )
+    for (i, q) in enumerate(quantiles):
+        # First simulation whose cumulative likelihood reaches q
+        idx = numpy.argmax(cumWeights >= q, axis=0)
+        result[i] = sortedValues[idx, cols]
+    return result
+
+
+class AlignedRunReader(object):
+    """ Reads modeled streamflow of runs over the period it has in common with
+        observed streamflow, and scores it using rhessyscalibrator.metrics.
+        One reader should be used for all runs of a session, so that column 
+        positions, date indices and observed windows are re-used.
+    """
+    def __init__(self, rhessysPath, obs, logger, add_streamflow_and_gw=False):
+        """
+            @param rhessysPath String representing the path of the rhessys directory of the 
+                calibration session
+            @param obs ObservedData representing observed streamflow
+            @param logger logging.Logger to use to for debug messages
+            @param add_streamflow_and_gw True if streamflow and gw.Qout are to be added
+        """
+        self.rhessysPath = rhessysPath
+        self.obs = obs
+        self.logger = logger
+        self.add_streamflow_and_gw = add_streamflow_and_gw
+        columns = ['streamflow']
+        if add_streamflow_and_gw:
+            columns.append('gw.Qout')
+        self.reader = BasinDailyReader(columns)
+
+    def read(self, run):
+        """ Read modeled streamflow for a run, restricted to the period it has in 
+            common with the observed data.
+
+            @param run ModelRun2 to read output for
+
+            @return Tuple (ObservedData, numpy.ndarray) of observed data and modeled
+            streamflow over their common period, or None if the output could not 
+            be read or aligned.
+        """
+        runOutput = os.path.join(self.rhessysPath, run.output_path)
+        tmpOutfile = RHESSysCalibrator.getRunOutputFilePath(runOutput)
+        if not os.access(tmpOutfile, os.R_OK):
+            self.logger.critical("Output file %s for run %d not found or not readable, unable to score run" % \
+                                 (tmpOutfile, run.id))
+            return None
+        try:
+            (index, mod) = self.reader.read(tmpOutfile)
+        except (IOError, ValueError) as e:
+            self.logger.critical("Unable to read output file %s for run %d, run will not be scored: %s" % \
+                                 (tmpOutfile, run.id, str(e)))
+            return None
+
+        if len(index) > 0:
+            # Restrict both to their common period
+            startDate = max(self.obs.start, index[0])
+            endDate = min(self.obs.end, index[-1])
+            obs = self.obs.getWindow(startDate, endDate)
+            window = getDateWindow(index, startDate, endDate)
+        if len(index) == 0 or len(obs) < 2 or len(obs) != window.stop - window.start:
+            self.logger.critical("Unable to align modeled data for run %d with observed data, run will not be scored" % \
+                                 (run.id,))
+            return None
+        modeled = mod['streamflow'][window]
+        if self.add_streamflow_and_gw:
+            modeled = modeled + mod['gw.Qout'][window]
+        return (obs, modeled)
+
+    @classmethod
+    def calculateFitness(cls, obs, modeled):
+        """ Calculate daily fitness of modeled streamflow.  Days with missing 
+            observed or modeled values are ignored.
+
+            @param obs ObservedData, as returned by read()
+            @param modeled numpy.ndarray of modeled streamflow, as returned by read()
+
+            @return Dict<String, Float> mapping metric names (see rhessyscalibrator.metrics,
+            except METRIC_RUNOFF_RATIO) to values (NaN where a metric cannot be calculated)
+        """
+        obsTs = obs.getAggregate('daily')
+        metrics = calculateMetrics(obsTs.values, modeled, obsTs.terms)
+        return dict([(name, float(values[0])) for (name, values) in metrics.iteritems()])
+
+
+class SessionMonitor(object):
+    """ Scores completed runs of a calibration session against observed
+        streamflow and tracks the number of behavioral runs, as well as
+        the stability of GLUE bounds and parameter posterior quantiles
+        between successive batches of completed runs.
+    """
+    POLL_INTERVAL_SECS = 30
+
+    def __init__(self, basedir, session_id, obs_filename, logger,
+                 behavioral_nse=0.5, behavioral_nse_log=0.5,
+                 stop_behavioral=None, stop_epsilon=None, stop_batches=3,
+                 batch_size=1, param_ranges=None, add_streamflow_and_gw=False):
+        """
+            @param basedir String representing the basedir of the calibration session
+            @param session_id Integer representing the session to monitor
+            @param obs_filename String representing the name of the observed file, relative to
+                $BASEDIR/obs
+            @param logger logging.Logger to use to for debug messages
+            @param behavioral_nse Float representing the minimum NSE of a behavioral run
+            @param behavioral_nse_log Float representing the minimum NSE-log of a behavioral run
+            @param stop_behavioral Integer representing the number of behavioral runs after
+                which the session should stop.  If None, this criterion is not used.
+            @param stop_epsilon Float representing the relative change in quantiles below which
+                a batch is considered stable.  If None, this criterion is not used.
+            @param stop_batches Integer representing the number of consecutive stable batches
+                needed before the session should stop.
+            @param batch_size Integer representing the number of completed runs in a batch
+            @param param_ranges Dict mapping parameter name to [floor, ceiling], used to
+                normalize changes in parameter quantiles.  If None, changes will be relative
+                to the previous quantile values.
+            @param add_streamflow_and_gw True if streamflow and gw.Qout are to be added before
+                scoring
+
+            @raise IOError if the observed data file is not readable
+        """
+        self.basedir = basedir
+        self.session_id = session_id
+        self.logger = logger
+        self.behavioral_nse = behavioral_nse
+        self.behavioral_nse_log = behavioral_nse_log
+        self.stop_behavioral = stop_behavioral
+        self.stop_epsilon = stop_epsilon
+        self.stop_batches = stop_batches
+        self.batch_size = max(1, batch_size)
+        self.param_ranges = param_ranges
+        self.add_streamflow_and_gw = add_streamflow_and_gw
+
+        obsFilePath = os.path.join(RHESSysCalibrator.getObsPath(basedir), obs_filename)
+        if not os.access(obsFilePath, os.R_OK):
+            raise IOError(errno.EACCES, "The observed data file %s is  not readable" % obsFilePath)
+        self.obs = readObservedData(obsFilePath)
+        self.rhessysPath = RHESSysCalibrator.getRhessysPath(basedir)
+        self.runReader = AlignedRunReader(self.rhessysPath, self.obs, logger, 
+                                          add_streamflow_and_gw)
+
+        self.scoredRunIds = set()
+        self.numScored = 0
+        self.numBehavioral = 0
+        self.behavioralSims = []
+        self.behavioralParams = []
+        self.behavioralLikelihood = []
+        self.paramKeys = None
+
+        self.runsInBatch = 0
+        self.prevQuantiles = None
+        self.quantileChanges = []
+        self.stopReason = None
+        self._lastPoll = None
+
+    def readRunStreamflow(self, run):
+        """ Read modeled streamflow for a run, aligned with the observed data.
+
+            @param run ModelRun2 to read output for
+
+            @return Tuple (ObservedData, numpy.ndarray) of observed data and modeled
+            streamflow, or None if the output could not be read or aligned.
+        """
+        return self.runReader.read(run)
+
+    def scoreRun(self, run):
+        """ Score a completed run, recording its parameters, streamflow and
+            likelihood if the run is behavioral.
+
+            @param run ModelRun2 to score
+
+            @return Tuple (nse, nse_log), or None if the run could not be scored.
+        """
+        data = self.readRunStreamflow(run)
+        if data is None:
+            return None
+        (obs, modeled) = data
+        fitness = AlignedRunReader.calculateFitness(obs, modeled)
+        nse = fitness[METRIC_NSE]
+        nse_log = fitness[METRIC_NSE_LOG]
+        self.logger.debug("run %s, NSE: %s, NSE-log: %s" % (run.id, nse, nse_log))
+
+        if nse > self.behavioral_nse and nse_log > self.behavioral_nse_log:
+            if self.paramKeys is None:
+                self.paramKeys = [k for k in PARAM_KEYS if getattr(run, 'param_' + k) is not None]
+            if self.behavioralSims and len(modeled) != len(self.behavioralSims[0]):
+                self.logger.critical("Modeled data for run %d does not span the same period as other runs, run will not be counted as behavioral" % \
+                                     (run.id,))
+                return (nse, nse_log)
+            self.numBehavioral += 1
+            self.behavioralSims.append(numpy.asarray(modeled, dtype=float))
+            self.behavioralParams.append([getattr(run, 'param_' + k) for k in self.paramKeys])
+            self.behavioralLikelihood.append(nse)
+
+        return (nse, nse_log)
+
+    def calculateQuantiles(self):
+        """ Calculate likelihood-weighted quantiles of modeled streamflow (i.e. GLUE bounds)
+            and of each calibration parameter for behavioral runs scored so far.
+
+            @return Tuple (numpy.ndarray, numpy.ndarray) of streamflow and parameter quantiles,
+            or None if no behavioral runs have been found.
+        """
+        if self.numBehavioral == 0:
+            return None
+        likelihood = numpy.array(self.behavioralLikelihood)
+        flowQuantiles = weightedQuantiles(numpy.vstack(self.behavioralSims), likelihood)
+        paramQuantiles = weightedQuantiles(numpy.array(self.behavioralParams, dtype=float), likelihood)
+        return (flowQuantiles, paramQuantiles)
+
+    def quantileChange(self, prev, curr):
+        """ Calculate relative change in quantiles between two batches
+
+            @param prev Tuple (numpy.ndarray, numpy.ndarray) of quantiles for the previous batch
+            @param curr Tuple (numpy.ndarray, numpy.ndarray) of quantiles for the current batch
+
+            @return Float representing the larger of the relative change in streamflow
+            quantiles and in parameter quantiles.
+        """
+        (prevFlow, prevParam) = prev
+        (currFlow, currParam) = curr
+        flowScale = numpy.mean(numpy.abs(prevFlow))
+        if flowScale == 0:
+            flowScale = 1.0
+        flowChange = numpy.mean(numpy.abs(currFlow - prevFlow)) / flowScale
+
+        if self.param_ranges:
+            scale = numpy.array([self.param_ranges[k][1] - self.param_ranges[k][0] for k in self.paramKeys])
+        else:
+            scale = numpy.abs(prevParam)
+            scale[scale == 0] = 1.0
+        paramChange = numpy.max(numpy.abs(currParam - prevParam) / scale)
+
+        return max(flowChange, paramChange)
+
+    def endBatch(self):
+        """ Record quantiles at the end of a batch of completed runs and
+            determine whether they have changed since the previous batch.
+        """
+        self.runsInBatch = 0
+        quantiles = self.calculateQuantiles()
+        if quantiles is None:
+            return
+        if self.prevQuantiles is not None:
+            change = self.quantileChange(self.prevQuantiles, quantiles)
+            self.quantileChanges.append(change)
+            self.logger.critical("Relative change in GLUE bounds/posterior quantiles over last batch: %f" % (change,))
+        self.prevQuantiles = quantiles
+
+    def isConverged(self):
+        """ Determine whether stopping criteria have been met.  Sets self.stopReason
+            if criteria have been met.
+
+            @return True if criteria for stopping the session have been met.
+        """
+        if self.stopReason is not None:
+            return True
+        if self.stop_behavioral is not None and self.numBehavioral >= self.stop_behavioral:
+            self.stopReason = "%d behavioral runs found (%d runs scored)" % (self.numBehavioral, self.numScored)
+        elif self.stop_epsilon is not None and len(self.quantileChanges) >= self.stop_batches:
+            recent = self.quantileChanges[-self.stop_batches:]
+            if max(recent) < self.stop_epsilon:
+                self.stopReason = "GLUE bounds/posterior quantiles changed by less than %f over the last %d batches (%d runs scored, %d behavioral)" % \
+                    (self.stop_epsilon, self.stop_batches, self.numScored, self.numBehavioral)
+        return self.stopReason is not None
+
+    def update(self, calibratorDB, force=False):
+        """ Score runs of the session that have completed since the last update.  To
+            limit load on the DB, runs are only polled once every POLL_INTERVAL_SECS
+            seconds unless force is True.
+
+            @param calibratorDB ModelRunnerDB2 for the session
+            @param force True if the DB should be polled regardless of when it was last polled.
+
+            @return True if criteria for stopping the session have been met.
+        """
+        now = time.time()
+        if not force and self._lastPoll is not None and \
+            now - self._lastPoll < self.POLL_INTERVAL_SECS:
+            return self.isConverged()
+        self._lastPoll = now
+
+        runs = calibratorDB.getRunsInSession(self.session_id, where_clause="status='DONE'")
+        for run in runs:
+            if run.id in self.scoredRunIds:
+                continue
+            self.scoredRunIds.add(run.id)
+            if self.scoreRun(run) is None:
+                continue
+            self.numScored += 1
+            self.runsInBatch += 1
+            if self.runsInBatch >= self.batch_size:
+                self.endBatch()
+            if self.isConverged():
+                break
+
+        self.logger.critical("Runs scored: %d, behavioral runs: %d" % (self.numScored, self.numBehavioral))
+        return self.isConverged()
@@ -0,0 +1,201 @@
+"""@package rhessyscalibrator.disk_space
+
+@brief Disk-space-aware dispatch of calibration runs.  Measures the size of 
+the output of early runs of a session, projects the total output footprint of 
+the session, and pauses dispatch of new runs while the free space left once 
+runs in flight finish would fall below a reserve.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import time
+
+GB = 1024 * 1024 * 1024
+DEFAULT_SAMPLE_RUNS = 10
+
+# Session options recording whether dispatch is paused, and why
+SESSION_OPT_DISPATCH_STATUS = 'dispatch_status'
+SESSION_OPT_DISPATCH_STATUS_REASON = 'dispatch_status_reason'
+DISPATCH_STATUS_RUNNING = 'running'
+DISPATCH_STATUS_PAUSED = 'paused'
+
+
+def getFileSize(path):
+    """ @return Integer representing the disk space used by a file, in bytes,
+        or 0 if the file does not exist
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0
+    if hasattr(st, 'st_blocks'):
+        return st.st_blocks * 512
+    return st.st_size
+
+def getDirectorySize(path):
+    """ Get the disk space used by the files in a directory tree
+    
+        @param path String representing the path of the directory
+        
+        @return Integer representing the number of bytes used
+    """
+    size = 0
+    for (root, dirs, files) in os.walk(path):
+        for name in files:
+            size += getFileSize(os.path.join(root, name))
+    return size
+
+def getFreeSpace(path):
+    """ @return Integer representing the number of bytes available to 
+        unprivileged users on the filesystem containing path
+    """
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+def formatGB(numBytes):
+    return "%.2f GB" % (float(numBytes) / GB,)
+
+
+class DiskSpaceMonitor(object):
+    """ Tracks the size of run outputs of a calibration session, and decides 
+        whether there is enough free space to dispatch another run.
+    """
+    POLL_INTERVAL_SECS = 60
+    
+    def __init__(self, rhessys_path, session_id, logger, reserve_bytes, 
+                 total_runs, sample_runs=DEFAULT_SAMPLE_RUNS):
+        """
+            @param rhessys_path String representing the path of $BASEDIR/rhessys
+            @param session_id Integer representing the session to monitor
+            @param logger logging.Logger to use to for debug messages
+            @param reserve_bytes Integer representing the number of bytes that must 
+                remain free once all dispatched runs have written their output
+            @param total_runs Integer representing the number of runs in the session
+            @param sample_runs Integer representing the number of completed runs whose 
+                output is measured to estimate the output size of a run
+        """
+        self.rhessys_path = rhessys_path
+        self.session_id = session_id
+        self.logger = logger
+        self.reserve_bytes = reserve_bytes
+        self.total_runs = total_runs
+        self.sample_runs = max(1, sample_runs)
+        
+        self.runSizes = {}
+        self.paused = False
+        self.projectionReported = False
+    
+    def measureRuns(self, calibratorDB):
+        """ Measure the output size of completed runs, until sample_runs runs
+            have been measured
+        
+            @param calibratorDB ModelRunnerDB2 of the calibration project
+        """
+        if len(self.runSizes) >= self.sample_runs:
+            return
+        runs = calibratorDB.getRunsInSession(self.session_id,
+                                             where_clause="status='DONE' ORDER BY id LIMIT %d" % (self.sample_runs,) )
+        for run in runs:
+            if run.id not in self.runSizes:
+                self.runSizes[run.id] = getDirectorySize(os.path.join(self.rhessys_path, run.output_path))
+        
+        if len(self.runSizes) >= self.sample_runs and not self.projectionReported:
+            self.projectionReported = True
+            projected = self.getRunSizeEstimate() * self.total_runs
+            free = getFreeSpace(self.rhessys_path)
+            msg = "Projected output footprint of session %d: %s for %d runs (%s per run), %s free" % \
+                (self.session_id, formatGB(projected), self.total_runs, 
+                 formatGB(self.getRunSizeEstimate()), formatGB(free))
+            print(msg)
+            self.logger.critical(msg)
+            if projected > free - self.reserve_bytes:
+                print("WARNING: projected output footprint exceeds free space, dispatch of runs will pause when space runs low")
+    
+    def getRunSizeEstimate(self):
+        """ @return Integer representing the estimated output size of a run (the 
+            largest output size measured), or None if no runs have been measured
+        """
+        if len(self.runSizes) == 0:
+            return None
+        return max(self.runSizes.values())
+    
+    def hasSpace(self, calibratorDB, num_dispatched):
+        """ Decide whether there is enough free space to dispatch another run.
+            Before any run has completed, runs are always dispatched.
+        
+            @param calibratorDB ModelRunnerDB2 of the calibration project
+            @param num_dispatched Integer representing the number of runs dispatched
+            
+            @return Tuple (Boolean, Integer, Integer) representing whether another
+            run can be dispatched, the number of bytes free, and the number of bytes
+            that runs in flight, and the next run, are expected to write
+        """
+        self.measureRuns(calibratorDB)
+        runSize = self.getRunSizeEstimate()
+        if runSize is None:
+            return (True, None, None)
+        numRetired = calibratorDB.countRunsInSession(self.session_id, 
+                                                     where_clause="status IN ('DONE', 'EXIT')")
+        numInFlight = max(0, num_dispatched - numRetired)
+        needed = runSize * (numInFlight + 1)
+        free = getFreeSpace(self.rhessys_path)
+        return (free - needed >= self.reserve_bytes, free, needed)
+    
+    def waitForSpace(self, calibratorDB, num_dispatched):
+        """ Wait until there is enough free space to dispatch another run.  
+            While waiting, the dispatch status of the session (stored as a 
+            session option) is set to paused, with the reason.
+        
+            @param calibratorDB ModelRunnerDB2 of the calibration project
+            @param num_dispatched Integer representing the number of runs dispatched
+        """
+        (space, free, needed) = self.hasSpace(calibratorDB, num_dispatched)
+        while not space:
+            if not self.paused:
+                self.paused = True
+                msg = "Pausing dispatch of runs of session %d: %s free, runs in flight need %s, reserve is %s" % \
+                    (self.session_id, formatGB(free), formatGB(needed), formatGB(self.reserve_bytes))
+                calibratorDB.setSessionOptions(self.session_id, 
+                                               {SESSION_OPT_DISPATCH_STATUS: DISPATCH_STATUS_PAUSED,
+                                                SESSION_OPT_DISPATCH_STATUS_REASON: msg})
+                print(msg)
+                self.logger.critical(msg)
+            time.sleep(self.POLL_INTERVAL_SECS)
+            (space, free, needed) = self.hasSpace(calibratorDB, num_dispatched)
+        if self.paused:
+            self.paused = False
+            msg = "Resuming dispatch of runs of session %d: %s free" % (self.session_id, formatGB(free))
+            calibratorDB.setSessionOptions(self.session_id, 
+                                           {SESSION_OPT_DISPATCH_STATUS: DISPATCH_STATUS_RUNNING,
+                                            SESSION_OPT_DISPATCH_STATUS_REASON: msg})
+            print(msg)
+            self.logger.critical(msg)
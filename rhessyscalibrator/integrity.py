@@ -0,0 +1,293 @@
+"""@package rhessyscalibrator.integrity
+
+@brief Integrity records of run output files (size, line count, last date and
+checksum), recorded when runs complete, and validation of the outputs of a 
+session against these records using only stat calls and reads of the end of 
+each output file.  See rhessyscalibrator.validate for the command line tool.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import hashlib
+import json
+from collections import Counter
+
+from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.run_output import getCompressionMethod, openOutputFile, findOutputFile, \
+    COMPRESSION_SUFFIXES, BLOCK_SIZE
+
+BASIN_DAILY = 'rhessys_basin.daily'
+# Number of bytes read from the end of a file to find its last line
+TAIL_SIZE = 64 * 1024
+# Name of the file, in the output directory of a run, to which run_wrapper 
+#  writes integrity records of the outputs of the run
+INTEGRITY_RECORD_FILE = 'integrity.json'
+RECORD_FIELDS = ['filename', 'size', 'lines', 'last_date', 'checksum']
+
+
+def listRunOutputs(output_dir, prefix='rhessys'):
+    """ @param output_dir String representing the output directory of a run
+        @param prefix String representing the output prefix of the run
+        
+        @return List of strings representing the names of output files of the run
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted([name for name in os.listdir(output_dir) \
+                   if name.startswith(prefix + '_') and not name.endswith('.part') and \
+                   os.path.isfile(os.path.join(output_dir, name))])
+
+def isTextOutput(name):
+    """ @return True if name is the name of a (possibly compressed) text output file
+    """
+    method = getCompressionMethod(name)
+    if method is not None:
+        name = name[:-len(COMPRESSION_SUFFIXES[method])]
+    return name.endswith('.daily') or name.endswith('.hourly') or \
+        name.endswith('.monthly') or name.endswith('.yearly')
+
+def getLastDate(line):
+    """ Get the date of a line of RHESSys daily output, whose first columns are
+        day, month and year
+    
+        @param line String representing the line
+        
+        @return String of the form YYYY-MM-DD, or None if line does not start 
+        with a date
+    """
+    fields = line.split()
+    if len(fields) < 3:
+        return None
+    try:
+        return "%04d-%02d-%02d" % (int(fields[2]), int(fields[1]), int(fields[0]))
+    except ValueError:
+        return None
+
+def readLastLine(path):
+    """ Read the last non-empty line of an uncompressed file, reading only the 
+        end of the file
+    
+        @param path String representing the path of the file
+        
+        @return String representing the last line, or None if the file is empty
+    """
+    f = open(path, 'rb')
+    try:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - TAIL_SIZE))
+        lines = [l for l in f.read().splitlines() if l.strip()]
+    finally:
+        f.close()
+    if len(lines) == 0:
+        return None
+    return lines[-1]
+
+def getOutputIntegrity(output_dir, name, checksum=None):
+    """ Compute the integrity record of an output file
+    
+        @param output_dir String representing the output directory of a run
+        @param name String representing the name of the output file
+        @param checksum String representing the SHA-1 checksum of the file, if
+            already known (e.g. from verifying a copy of the file)
+        
+        @return RunOutputIntegrity2 (with run_id of None)
+    """
+    path = os.path.join(output_dir, name)
+    record = RunOutputIntegrity2()
+    record.filename = name
+    record.size = os.path.getsize(path)
+    
+    if checksum is None:
+        digest = hashlib.sha1()
+        f = open(path, 'rb')
+        try:
+            block = f.read(BLOCK_SIZE)
+            while block:
+                digest.update(block)
+                block = f.read(BLOCK_SIZE)
+        finally:
+            f.close()
+        checksum = digest.hexdigest()
+    record.checksum = checksum
+    
+    if isTextOutput(name):
+        lines = 0
+        lastLine = None
+        f = openOutputFile(path)
+        try:
+            for line in f:
+                lines += 1
+                if line.strip():
+                    lastLine = line
+        finally:
+            f.close()
+        record.lines = lines
+        if lastLine is not None:
+            record.last_date = getLastDate(lastLine)
+    return record
+
+def getRunOutputIntegrity(output_dir, prefix='rhessys'):
+    """ @return List of RunOutputIntegrity2 representing the integrity records of 
+        output files of a run
+    """
+    return [getOutputIntegrity(output_dir, name) for name in listRunOutputs(output_dir, prefix)]
+
+def writeIntegrityRecords(output_dir, records):
+    """ Write integrity records of outputs of a run to INTEGRITY_RECORD_FILE in
+        the output directory of the run, from where the runner stores them in 
+        the database.
+    
+        @param output_dir String representing the output directory of a run
+        @param records List of RunOutputIntegrity2
+    """
+    path = os.path.join(output_dir, INTEGRITY_RECORD_FILE)
+    tmp = path + '.part'
+    f = open(tmp, 'w')
+    try:
+        json.dump([dict([(k, getattr(r, k)) for k in RECORD_FIELDS]) for r in records],
+                  f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+def readIntegrityRecords(output_dir):
+    """ Read integrity records written by writeIntegrityRecords()
+    
+        @param output_dir String representing the output directory of a run
+        
+        @return List of RunOutputIntegrity2 (with run_id of None), or None if no
+        records were written
+        
+        @raise ValueError if the records cannot be parsed
+    """
+    path = os.path.join(output_dir, INTEGRITY_RECORD_FILE)
+    if not os.path.exists(path):
+        return None
+    f = open(path, 'r')
+    try:
+        entries = json.load(f)
+    finally:
+        f.close()
+    records = []
+    for entry in entries:
+        record = RunOutputIntegrity2()
+        for k in RECORD_FIELDS:
+            setattr(record, k, entry.get(k))
+        records.append(record)
+    return records
+
+def getMostCommon(values):
+    """ @return The most common of values that are not None, or None
+    """
+    counts = Counter([v for v in values if v is not None])
+    if len(counts) == 0:
+        return None
+    return counts.most_common(1)[0][0]
+
+def validateSession(calibratorDB, rhessys_path, session_id, verify_checksums=False):
+    """ Validate outputs of DONE runs of a session.  Outputs of runs with integrity 
+        records are checked against their records; the basin daily output of all
+        runs must exist, and its last date (and, for runs with records, its line
+        count) must match that of most runs of the session.
+    
+        @param calibratorDB ModelRunnerDB2 of the calibration project
+        @param rhessys_path String representing the path of $BASEDIR/rhessys
+        @param session_id Integer representing the session to validate
+        @param verify_checksums Boolean indicating that checksums of outputs with
+            integrity records should be verified (this requires reading each file in full)
+        
+        @return Tuple (Integer, Dict<Integer, List<String>>) representing the number
+        of runs validated, and the problems found, by run ID
+    """
+    runs = calibratorDB.getRunsInSession(session_id, 
+                                         where_clause="status='DONE' AND %s" % (ModelRunnerDB2.WHERE_NOT_PRUNED,))
+    records = calibratorDB.getOutputIntegrityForSession(session_id)
+    problems = {}
+    lastDates = {}
+    lineCounts = {}
+    
+    for run in runs:
+        outputDir = os.path.join(rhessys_path, run.output_path)
+        runProblems = []
+        runRecords = records.get(run.id, [])
+        for record in runRecords:
+            path = os.path.join(outputDir, record.filename)
+            if not os.path.exists(path):
+                runProblems.append("%s is missing" % (record.filename,) )
+                continue
+            size = os.path.getsize(path)
+            if size != record.size:
+                runProblems.append("%s size is %d, expected %d" % (record.filename, size, record.size) )
+                continue
+            if record.last_date and getCompressionMethod(record.filename) is None:
+                lastLine = readLastLine(path)
+                lastDate = getLastDate(lastLine) if lastLine else None
+                if lastDate != record.last_date:
+                    runProblems.append("%s last date is %s, expected %s" % (record.filename, lastDate, record.last_date) )
+                    continue
+            if verify_checksums and getOutputIntegrity(outputDir, record.filename).checksum != record.checksum:
+                runProblems.append("%s checksum does not match" % (record.filename,) )
+        
+        basinRecords = [r for r in runRecords if r.filename == BASIN_DAILY or \
+                        (getCompressionMethod(r.filename) and r.filename.startswith(BASIN_DAILY + '.'))]
+        if len(basinRecords) > 0:
+            lastDates[run.id] = basinRecords[0].last_date
+            lineCounts[run.id] = basinRecords[0].lines
+        else:
+            # No integrity record, check that basin output exists and read its last date
+            basinPath = findOutputFile(os.path.join(outputDir, BASIN_DAILY))
+            if not os.path.exists(basinPath):
+                runProblems.append("%s is missing" % (BASIN_DAILY,) )
+            elif os.path.getsize(basinPath) == 0:
+                runProblems.append("%s is empty" % (BASIN_DAILY,) )
+            elif getCompressionMethod(basinPath) is None:
+                lastLine = readLastLine(basinPath)
+                lastDates[run.id] = getLastDate(lastLine) if lastLine else None
+        
+        if len(runProblems) > 0:
+            problems[run.id] = runProblems
+    
+    # Runs whose basin output ends early, or is shorter, than that of most runs
+    #  are likely to have been truncated
+    commonLastDate = getMostCommon(lastDates.values())
+    for (runId, lastDate) in lastDates.items():
+        if commonLastDate and lastDate != commonLastDate:
+            problems.setdefault(runId, []).append("%s last date is %s, most runs end on %s" % \
+                                                  (BASIN_DAILY, lastDate, commonLastDate) )
+    commonLineCount = getMostCommon(lineCounts.values())
+    for (runId, lines) in lineCounts.items():
+        if commonLineCount and lines != commonLineCount:
+            problems.setdefault(runId, []).append("%s has %s lines, most runs have %d" % \
+                                                  (BASIN_DAILY, lines, commonLineCount) )
+    
+    return (len(runs), problems)
@@ -0,0 +1,207 @@
+"""@package rhessyscalibrator.live_scoring
+
+@brief Score runs of a calibration session as they complete, storing their
+fitness in a live post process session so that results are available as soon 
+as the session ends, and can be inspected while it runs.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import errno
+import time
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.postprocess import getFitnessFingerprint, \
+    POSTPROC_OPT_FINGERPRINT, POSTPROC_OPT_SCORED_TIME
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.run_output import BasinDailyReader, getDateWindow
+from rhessyscalibrator.observed import readObservedData, FITNESS_PERIODS
+from rhessyscalibrator.metrics import calculateMetrics, calculateRunoffRatio, \
+    METRIC_NSE, METRIC_NSE_LOG, METRIC_PBIAS, METRIC_RSR, METRIC_RUNOFF_RATIO, USERFITNESS_METRICS
+
+# Post process option used to identify live post process sessions, and their status
+POSTPROC_OPT_LIVE = 'live'
+LIVE_STATUS_RUNNING = 'running'
+LIVE_STATUS_COMPLETE = 'complete'
+# Session option holding the ID of the live post process session of a session
+SESSION_OPT_LIVE_POSTPROCESS = 'live_postprocess_id'
+
+
+class LiveScorer(object):
+    """ Scores completed runs of a calibration session against observed 
+        streamflow, as rhessys_calibrator_postprocess does, storing fitness
+        results in a post process session created when the session starts.
+    """
+    POLL_INTERVAL_SECS = 30
+
+    def __init__(self, basedir, session_id, obs_filename, logger, 
+                 period='daily', add_streamflow_and_gw=False):
+        """
+            @param basedir String representing the basedir of the calibration session
+            @param session_id Integer representing the session whose runs are to be scored
+            @param obs_filename String representing the name of the observed file, relative to
+                $BASEDIR/obs
+            @param logger logging.Logger to use to for debug messages
+            @param period String, one of FITNESS_PERIODS, representing the period over 
+                which fitness is calculated
+            @param add_streamflow_and_gw True if streamflow and gw.Qout are to be added before
+                scoring
+
+            @raise IOError if the observed data file is not readable
+        """
+        self.session_id = session_id
+        self.obs_filename = obs_filename
+        self.logger = logger
+        self.period = period
+        self.add_streamflow_and_gw = add_streamflow_and_gw
+
+        obsFilePath = os.path.join(RHESSysCalibrator.getObsPath(basedir), obs_filename)
+        if not os.access(obsFilePath, os.R_OK):
+            raise IOError(errno.EACCES, "The observed data file %s is  not readable" % obsFilePath)
+        self.obs = readObservedData(obsFilePath)
+        self.obsTs = self.obs.getAggregate(period)
+        self.fingerprint = getFitnessFingerprint(obsFilePath, period, 
+                                                 self.obs.start, self.obs.end,
+                                                 add_streamflow_and_gw)
+        columns = ['streamflow', 'precip']
+        if add_streamflow_and_gw:
+            columns.append('gw.Qout')
+        self.reader = BasinDailyReader(columns)
+        self.rhessysPath = RHESSysCalibrator.getRhessysPath(basedir)
+
+        self.postprocess_id = None
+        self.numScored = 0
+        self.unscoredRunIds = set()
+        self._lastPoll = None
+
+    def start(self, calibratorDB):
+        """ Create the live post process session
+
+            @param calibratorDB ModelRunnerDB2 for the session
+
+            @return Integer representing the ID of the post process session
+        """
+        self.postprocess_id = calibratorDB.insertPostProcess(self.session_id, self.obs_filename, 
+                                                             self.period,
+                                                             obs_runoff_ratio=self.obs.runoffRatio,
+                                                             options={POSTPROC_OPT_LIVE: LIVE_STATUS_RUNNING,
+                                                                      POSTPROC_OPT_FINGERPRINT: self.fingerprint})
+        calibratorDB.setSessionOptions(self.session_id, 
+                                       {SESSION_OPT_LIVE_POSTPROCESS: str(self.postprocess_id)})
+        return self.postprocess_id
+
+    def scoreRun(self, run):
+        """ Calculate fitness of a completed run
+
+            @param run ModelRun2 to score
+
+            @return Dict<String, Float> mapping metric names (see rhessyscalibrator.metrics)
+            to values, or None if the output of the run could not be read, or does not 
+            span the period of the observed data
+        """
+        runOutput = os.path.join(self.rhessysPath, run.output_path)
+        tmpOutfile = RHESSysCalibrator.getRunOutputFilePath(runOutput)
+        if not os.access(tmpOutfile, os.R_OK):
+            self.logger.critical("Output file %s for run %d not found or not readable, unable to score run" % \
+                                 (tmpOutfile, run.id))
+            return None
+        (index, mod) = self.reader.read(tmpOutfile)
+        window = getDateWindow(index, self.obs.start, self.obs.end)
+        if window.stop - window.start != len(self.obs) or len(self.obs) == 0 or \
+           index[window.start] != self.obs.start or index[window.stop - 1] != self.obs.end:
+            self.logger.critical("Modeled data for run %d do not span the period of the observed data, run will not be scored" % \
+                                 (run.id,))
+            return None
+
+        streamflow = mod['streamflow'][window]
+        if self.add_streamflow_and_gw:
+            modeled = streamflow + mod['gw.Qout'][window]
+        else:
+            modeled = streamflow
+        metrics = calculateMetrics(self.obsTs.values, self.obsTs.aggregate(modeled), self.obsTs.terms)
+        metrics[METRIC_RUNOFF_RATIO] = calculateRunoffRatio(streamflow, mod['precip'][window])
+        metrics = dict([(name, float(values[0])) for (name, values) in metrics.iteritems()])
+        self.logger.debug("run %s, NSE: %s, NSE-log: %s" % (run.id, metrics[METRIC_NSE], metrics[METRIC_NSE_LOG]))
+        return metrics
+
+    def update(self, calibratorDB, force=False):
+        """ Score runs of the session that have completed since the last update.  To
+            limit load on the DB, runs are only polled once every POLL_INTERVAL_SECS
+            seconds unless force is True.
+
+            @param calibratorDB ModelRunnerDB2 for the session
+            @param force True if the DB should be polled regardless of when it was last polled.
+
+            @return Integer representing the number of runs scored
+        """
+        now = time.time()
+        if not force and self._lastPoll is not None and \
+            now - self._lastPoll < self.POLL_INTERVAL_SECS:
+            return 0
+        self._lastPoll = now
+
+        whereClause = "status='DONE' AND %s AND %s AND id NOT IN (SELECT run_id FROM runfitness WHERE postprocess_id=%d)" % \
+            (ModelRunnerDB2.WHERE_NOT_SCREENED_OUT, ModelRunnerDB2.WHERE_NOT_PRUNED, self.postprocess_id)
+        fitnessResults = []
+        for run in calibratorDB.getRunsInSession(self.session_id, where_clause=whereClause):
+            if run.id in self.unscoredRunIds:
+                continue
+            fitness = self.scoreRun(run)
+            if fitness is None:
+                # Don't try to score this run again
+                self.unscoredRunIds.add(run.id)
+                continue
+            fitnessResults.append( (run.id, fitness[METRIC_NSE], fitness[METRIC_NSE_LOG],
+                                    fitness[METRIC_PBIAS], fitness[METRIC_RSR],
+                                    fitness[METRIC_RUNOFF_RATIO],
+                                    dict([(m, fitness[m]) for m in USERFITNESS_METRICS])) )
+        calibratorDB.insertRunFitnessResultsBatch(self.postprocess_id, fitnessResults)
+
+        numScored = len(fitnessResults)
+        self.numScored += numScored
+        if numScored > 0:
+            self.logger.critical("Runs scored in post-process session %d: %d" % \
+                                 (self.postprocess_id, self.numScored))
+        return numScored
+
+    def finish(self, calibratorDB):
+        """ Score any remaining completed runs and mark the live post process
+            session as complete (it can then be updated using 
+            rhessys_calibrator_postprocess --update)
+
+            @param calibratorDB ModelRunnerDB2 for the session
+        """
+        scoredTime = time.time()
+        self.update(calibratorDB, force=True)
+        calibratorDB.setPostProcessOptions(self.postprocess_id, 
+                                           {POSTPROC_OPT_LIVE: LIVE_STATUS_COMPLETE,
+                                            POSTPROC_OPT_SCORED_TIME: repr(scoredTime)})
@@ -0,0 +1,672 @@
+"""@package rhessyscalibrator.mcmc
+
+@brief Markov chain Monte Carlo (MCMC) calibration of RHESSys using parallel 
+chains and differential evolution proposals (after the DREAM algorithm of 
+Vrugt et al. 2009).  The proposals of each generation are run concurrently 
+using the calibration runners; Gelman-Rubin R-hat convergence diagnostics 
+are recorded for each generation.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os, sys
+import argparse
+import logging
+from datetime import datetime
+import time
+
+import numpy
+import pandas as pd
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator, num_jobs_type, polling_delay_type, \
+    PARALLEL_MODES, PARALLEL_MODE_PROCESS, PARALLEL_MODE_PBS, PARALLEL_MODE_SLURM, \
+    MAX_PROCESSORS, MAX_POLLING_DELAY_MULT, MAX_ITERATIONS
+from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.calibration_runner import RunnerOptions, DEFAULT_SCRATCH_KEEP
+from rhessyscalibrator.calibration_parameters import newSessionSeed, MAX_SEED
+from rhessyscalibrator.staging import buildStageManifest, writeStageManifest, getStageManifestPath
+from rhessyscalibrator.run_output import getAvailableCompressionMethods, COMPRESSION_METHODS
+from rhessyscalibrator.observed import readObservedData
+from rhessyscalibrator.convergence import AlignedRunReader
+
+DEFAULT_NUM_CR = 3
+RHAT_CONVERGED = 1.2
+
+
+def gelmanRubin(samples):
+    """ Calculate the Gelman-Rubin potential scale reduction factor (R-hat)
+        for each parameter.
+
+        @param samples Numpy array of dimensions [NUM_GENERATIONS, NUM_CHAINS, NUM_PARAMETERS]
+
+        @return Numpy array of R-hat for each parameter
+    """
+    samples = numpy.asarray(samples, dtype=float)
+    n = samples.shape[0]
+    chainMeans = numpy.mean(samples, axis=0)
+    # Within-chain variance
+    W = numpy.mean(numpy.var(samples, axis=0, ddof=1), axis=0)
+    # Between-chain variance (divided by n)
+    B_n = numpy.var(chainMeans, axis=0, ddof=1)
+    varHat = (n - 1.0) / n * W + B_n
+    W[W == 0] = numpy.finfo(float).tiny
+    return numpy.sqrt(varHat / W)
+
+def logLikelihood(obs, modeled):
+    """ Calculate Gaussian log-likelihood of modeled data, with the error 
+        variance integrated out (i.e. -n/2 * log(SSE/n), up to a constant).
+        Days where either value is missing are ignored.
+
+        @param obs Numpy array of observed data
+        @param modeled Numpy array of modeled data
+
+        @return Float representing log-likelihood; -inf if no day has both 
+        observed and modeled values
+    """
+    obs = numpy.asarray(obs, dtype=float)
+    modeled = numpy.asarray(modeled, dtype=float)
+    valid = numpy.isfinite(obs) & numpy.isfinite(modeled)
+    obs = obs[valid]
+    modeled = modeled[valid]
+    n = len(obs)
+    if n == 0:
+        return -numpy.inf
+    sse = numpy.sum( (obs - modeled)**2 )
+    if sse == 0:
+        sse = numpy.finfo(float).tiny
+    return -0.5 * n * numpy.log(sse / n)
+
+
+class DreamSampler(object):
+    """ Differential evolution proposals and Metropolis acceptance for 
+        parallel Markov chains.  Parameters are scaled to [0, 1].
+    """
+    def __init__(self, num_chains, num_params, delta=1, num_cr=DEFAULT_NUM_CR, 
+                 b=0.1, b_star=1e-6, jump_interval=5, random_state=None):
+        """
+            @param num_chains Integer representing the number of chains
+            @param num_params Integer representing the number of parameters
+            @param delta Integer representing the number of chain pairs used to 
+                generate each proposal
+            @param num_cr Integer representing the number of crossover values
+            @param b Float representing the width of the random scaling of jumps
+            @param b_star Float representing the standard deviation of jump noise
+            @param jump_interval Integer representing how often (in generations) a 
+                jump rate of 1 is used, to allow jumps between modes
+            @param random_state numpy.random.RandomState to draw random numbers from
+            
+            @raise Exception if there are too few chains for delta
+        """
+        if num_chains < 2 * delta + 1:
+            raise Exception("At least %d chains are needed when delta is %d" % (2 * delta + 1, delta))
+        self.num_chains = num_chains
+        self.num_params = num_params
+        self.delta = delta
+        self.crossover = numpy.arange(1, num_cr + 1) / float(num_cr)
+        self.b = b
+        self.b_star = b_star
+        self.jump_interval = jump_interval
+        if random_state is None:
+            random_state = numpy.random.RandomState()
+        self.random = random_state
+
+    @classmethod
+    def reflect(cls, X):
+        """ Reflect values back into [0, 1]
+
+            @param X Numpy array
+            
+            @return Numpy array with values in [0, 1]
+        """
+        X = numpy.mod(numpy.abs(X), 2.0)
+        return numpy.where(X > 1.0, 2.0 - X, X)
+
+    def propose(self, X, generation):
+        """ Generate a proposal for each chain
+
+            @param X Numpy array of current chain states, dimensions [NUM_CHAINS, NUM_PARAMETERS]
+            @param generation Integer representing the generation being proposed
+
+            @return Numpy array of proposals, dimensions [NUM_CHAINS, NUM_PARAMETERS]
+        """
+        proposals = numpy.empty_like(X)
+        for i in xrange(self.num_chains):
+            # Choose 2 * delta other chains to difference
+            others = [j for j in xrange(self.num_chains) if j != i]
+            pairs = self.random.permutation(others)[:2 * self.delta]
+            diff = numpy.sum(X[pairs[:self.delta]] - X[pairs[self.delta:]], axis=0)
+            
+            # Crossover: update a random subset of dimensions
+            cr = self.crossover[self.random.randint(len(self.crossover))]
+            dims = self.random.uniform(size=self.num_params) <= cr
+            if not numpy.any(dims):
+                dims[self.random.randint(self.num_params)] = True
+            dPrime = numpy.sum(dims)
+            
+            if generation % self.jump_interval == 0:
+                gamma = 1.0
+            else:
+                gamma = 2.38 / numpy.sqrt(2 * self.delta * dPrime)
+            e = self.random.uniform(-self.b, self.b, size=self.num_params)
+            eps = self.random.normal(0, self.b_star, size=self.num_params)
+            jump = (1 + e) * gamma * diff + eps
+            
+            proposals[i] = X[i]
+            proposals[i][dims] += jump[dims]
+        return self.reflect(proposals)
+
+    def accept(self, logLikCurrent, logLikProposed):
+        """ Metropolis acceptance (assuming uniform priors)
+
+            @param logLikCurrent Numpy array of log-likelihood of current chain states
+            @param logLikProposed Numpy array of log-likelihood of proposals
+
+            @return Numpy boolean array, True where proposals are accepted
+        """
+        logLikProposed = numpy.asarray(logLikProposed, dtype=float)
+        logLikCurrent = numpy.asarray(logLikCurrent, dtype=float)
+        u = numpy.log(self.random.uniform(size=self.num_chains))
+        with numpy.errstate(invalid='ignore'):
+            ratio = logLikProposed - logLikCurrent
+        ratio[numpy.isneginf(logLikCurrent) & numpy.isfinite(logLikProposed)] = numpy.inf
+        ratio[numpy.isnan(ratio)] = -numpy.inf
+        return u < ratio
+
+
+class RHESSysCalibratorMCMC(RHESSysCalibrator):
+    
+    def __init__(self):
+        RHESSysCalibrator.__init__(self)
+
+    def scaleParameters(self, values):
+        """ Scale parameter values to [0, 1]
+        
+            @param values Numpy array of dimensions [NUM_RUNS, NUM_PARAMETERS]
+        """
+        return (values - self.paramFloor) / (self.paramCeil - self.paramFloor)
+
+    def unscaleParameters(self, X):
+        """ Transform parameter values scaled to [0, 1] to actual values
+        
+            @param X Numpy array of dimensions [NUM_RUNS, NUM_PARAMETERS]
+        """
+        return self.paramFloor + X * (self.paramCeil - self.paramFloor)
+
+    def runGeneration(self, generation, X, cmd_proto_pre, worldfile, options, wall_time, runner_options):
+        """ Run one model run for each chain, and wait for the runs to finish
+
+            @param generation Integer representing the generation
+            @param X Numpy array of scaled parameter values, dimensions [NUM_CHAINS, NUM_PARAMETERS]
+            @param cmd_proto_pre String representing the pre-processed cmd.proto
+            @param worldfile String representing the worldfile to run
+            @param options argparse options
+            @param wall_time Integer representing wall time of jobs
+            @param runner_options RunnerOptions controlling how runs are executed
+            
+            @return List of ModelRun2 objects, one per chain.  Elements will be None
+            for runs that were not recorded in the DB.
+        """
+        (runQueue, consumers) = \
+            RHESSysCalibrator.initializeCalibrationRunnerConsumers(self.basedir, self.logger,
+                                                                   self.session.id, options.parallel_mode, options.processes, options.polling_delay,
+                                                                   options.queue_name, 
+                                                                   mem_limit=options.mem_limit,
+                                                                   wall_time=wall_time, 
+                                                                   bsub_exclusive_mode=options.bsub_exclusive_mode,
+                                                                   simulator_path=options.simulator_path,
+                                                                   runner_options=runner_options)
+        values = self.unscaleParameters(X)
+        outputPaths = []
+        for (i, chainValues) in enumerate(values):
+            itr = generation * options.chains + i + 1
+            self.logger.critical("Generation %d, chain %d, iteration %d" % (generation, i, itr))
+            parameterValues = self.paramsProto.newParameterValues(dict(zip(self.paramKeys, chainValues)))
+            itr_cmd_proto = self.addParametersToCmdProto(cmd_proto_pre,
+                                                         parameterValues)
+            run = self.createRun(itr, worldfile, parameterValues, itr_cmd_proto, options.parallel_mode)
+            outputPaths.append(run.output_path)
+            runQueue.put(run)
+        
+        time.sleep(5)
+        
+        # Wait for all jobs to finish
+        self.logger.critical("calling runQueue.join() ...")
+        runQueue.join()
+        for consumerProcess in consumers:
+            consumerProcess.join()
+        
+        where = "output_path IN (%s)" % ','.join(["'%s'" % p.replace("'", "''") for p in outputPaths])
+        runsByPath = dict([(r.output_path, r) for r in self.calibratorDB.getRunsInSession(self.session.id, where_clause=where)])
+        return [runsByPath.get(p) for p in outputPaths]
+
+    def scoreGeneration(self, runs):
+        """ Calculate log-likelihood of runs against observed streamflow
+        
+            @param runs List of ModelRun2 objects (or None)
+            
+            @return Numpy array of log-likelihood.  Runs that failed, or
+            whose output could not be read, will have a log-likelihood of -inf
+        """
+        logLik = numpy.empty(len(runs))
+        logLik.fill(-numpy.inf)
+        for (i, run) in enumerate(runs):
+            if run is None or run.status != "DONE":
+                continue
+            data = self.runReader.read(run)
+            if data is None:
+                continue
+            (obs, modeled) = data
+            logLik[i] = logLikelihood(obs.streamflow.values, modeled)
+            self.logger.debug("run %s, log-likelihood: %s" % (run.id, logLik[i]))
+        return logLik
+
+    def writePosteriorSamples(self, outfile, samples):
+        """ Write posterior samples to a file in CSV format
+        
+            @param outfile String representing the path of the file to write
+            @param samples List of MCMCSample2 objects
+        """
+        rows = []
+        for sample in samples:
+            row = [sample.generation, sample.chain, sample.state_run_id, sample.log_likelihood]
+            row += [getattr(sample.run, 'param_' + k) for k in self.paramKeys]
+            rows.append(row)
+        df = pd.DataFrame(rows, columns=['generation', 'chain', 'run_id', 'log_likelihood'] + self.paramKeys)
+        df.to_csv(outfile, index=False)
+
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for performing Markov chain Monte Carlo calibration of RHESSys")
+        parser.add_argument("-b", "--basedir", action="store", 
+                          dest="basedir", required=True,
+                          help="Base directory for the calibration session")
+        
+        parser.add_argument("-f", "--file", action="store",
+                          dest="observed_file", required=True,
+                          help="The name of the observed file to use for calculating likelihood.  Filename will be interpreted as being relative to $BASEDIR/obs.")
+        
+        parser.add_argument("-k", "--chains", action="store", type=int,
+                          dest="chains", required=True,
+                          help="The number of Markov chains.  Must be at least 2 * delta + 1; the number of calibration parameters is a good choice.")
+        
+        parser.add_argument("-g", "--generations", action="store", type=int,
+                          dest="generations", required=True,
+                          help="The maximum number of generations.  One run per chain will be made in each generation.")
+        
+        parser.add_argument("--delta", action="store", type=int,
+                          dest="delta", default=1,
+                          help="[ADVANCED] The number of chain pairs used to generate each proposal.  Defaults to 1.")
+        
+        parser.add_argument("--burnin", action="store", type=float,
+                          dest="burnin", default=0.5,
+                          help="Fraction of generations to discard as burn-in when computing R-hat and writing posterior samples.  Defaults to 0.5.")
+        
+        parser.add_argument("--rhat_stop", action="store", type=float,
+                          dest="rhat_stop", default=RHAT_CONVERGED,
+                          help="Stop once R-hat of all parameters is below this value.  Defaults to %.1f.  Specify 0 to run all generations." % (RHAT_CONVERGED,) )
+        
+        parser.add_argument("--seed", action="store", type=int,
+                          dest="seed",
+                          help="Seed for random number generator.  If not specified, a seed will be generated and stored with the session.")
+        
+        parser.add_argument("-w", "--worldfile", action="store",
+                          dest="worldfile",
+                          help="Name of the worldfile to calibrate.  Required if there is more than one worldfile.")
+        
+        parser.add_argument("--add_streamflow_and_gw", action="store_true",
+                          dest="add_streamflow_and_gw", default=False,
+                          help="Add streamflow and gw.Qout when calculating likelihood.")
+        
+        parser.add_argument("-u", "--user", action="store",
+                          dest="user", required=False, default=os.getlogin(),
+                          help="User to associate with the calibration session.  If not supplied, the value of os.getlogin() will be used.")
+        
+        parser.add_argument("-p", "--project", action="store",
+                          dest="project", required=True,
+                          help="Name of the project ot associate with the calibration session.")
+
+        parser.add_argument("-n", "--notes", action="store",
+                          dest="notes",
+                          help="Notes to associate with the calibration session.")
+
+        parser.add_argument("-j", "--jobs", action="store", type=num_jobs_type,
+                          dest="processes", required=True,
+                          help="The number of simultaneous jobs (runs) to run at any given time in the calibration session (e.g. --jobs 32). Maximum is %s." % (MAX_PROCESSORS,) ) 
+
+        parser.add_argument("--simulator_path", action="store", 
+                            dest="simulator_path", required=False,
+                            help="Set path for LSF simulator.  When supplied, jobs will be submitted to the simulator, not via actual LSF commands.  Must be the absolute path (e.g. /Users/joeuser/rhessys_calibrator/lsf-sim)")
+
+        parser.add_argument("-q", "--queue", action="store",
+                          dest="queue_name", required=False,
+                          help="Set queue name to submit jobs to using the underlying queue manager.  " +
+                               "Applies only to non-process-based calibration runners (specified by parallel_mode option).")
+
+        parser.add_argument("--parallel_mode", action="store", 
+                          dest="parallel_mode", required=False,
+                          default='lsf', choices=PARALLEL_MODES,
+                          help="Set method to use for running jobs in parallel.")
+
+        parser.add_argument("--polling_delay", action="store", type=polling_delay_type, 
+                          dest="polling_delay", required=False,
+                          default=1,
+                          help="[ADVANCED] Set multiplier for how long to wait in between successive pollings of job status.  Default polling delay is 60 seconds, thus a multiplier of 5 will result in a delay of 5 minutes instead of 1 minute.  Maximum is %d." % (MAX_POLLING_DELAY_MULT,) )
+
+        parser.add_argument("--use_horizontal_m_and_K_for_vertical", action="store_true",
+                            dest="use_horizontal_m_and_K_for_vertical",
+                            help="[ADVANCED] use The same m and K parameters for horizontal (i.e. -s) as well as vertical (i.e. -sv ) directions.  Defaults to false.")
+
+        parser.add_argument("--bsub_exclusive_mode", action="store_true",
+                          dest="bsub_exclusive_mode", required=False,
+                          help="[ADVANCED] For LSF parallel mode: run bsub with arguments \"-n 1 -R 'span[hosts=1]' -x\" to ensure jobs only run exclusively (i.e. the only job on a node). This can be useful for models that use a lot of memory.")
+
+        parser.add_argument("--mem_limit", action="store", type=int, 
+                          dest="mem_limit", required=False,
+                          default=4,
+                          help="For non-process based parallel modes: Specify memory limit for jobs.  Unit: gigabytes  Defaults to 4.")
+
+        parser.add_argument("--wall_time", action="store",
+                            type=int, dest="wall_time",
+                            help="For PBS- and SLURM-based parallel mode: Specify wall time in hours that jobs should take.")
+
+        parser.add_argument("--scratch", action="store_true",
+                          dest="scratch", default=False,
+                          help="Write the output of each run to node-local scratch rather than the output directory of the run.  " +
+                               "When a run completes, only outputs matching --scratch_keep will be copied back to the output directory of the run.")
+
+        parser.add_argument("--scratch_dir", action="store",
+                          dest="scratch_dir",
+                          help="For --scratch: directory on compute nodes under which to create scratch directories.  Defaults to $TMPDIR on the compute node.")
+
+        parser.add_argument("--scratch_keep", action="store",
+                          dest="scratch_keep", default=','.join(DEFAULT_SCRATCH_KEEP),
+                          help="For --scratch: comma-separated list of filename patterns of outputs to copy back from scratch.  Defaults to '%s'." % \
+                               (','.join(DEFAULT_SCRATCH_KEEP),) )
+
+        parser.add_argument("--stage_inputs", action="store_true",
+                          dest="stage_inputs", default=False,
+                          help="Stage model inputs into a node-local cache on each compute node, so that runs read their inputs from local storage rather than from $BASEDIR.")
+
+        parser.add_argument("--stage_dir", action="store",
+                          dest="stage_dir",
+                          help="For --stage_inputs: directory of the input cache on compute nodes.  Defaults to /tmp/rhessys_calibrator_stage_$USER.")
+
+        parser.add_argument("--compress", action="store",
+                          dest="compress", choices=COMPRESSION_METHODS,
+                          help="Compress the outputs of each run once the run completes.")
+
+        parser.add_argument("--log_archive", action="store_true",
+                          dest="log_archive", default=False,
+                          help="Store standard output and error of each run, and queue system job scripts, in a single run log for the session.")
+
+        parser.add_argument("--columnar", action="store_true",
+                          dest="columnar", default=False,
+                          help="Once each run is done, convert its basin daily output to a columnar NumPy file.")
+
+        parser.add_argument("--integrity", action="store_true",
+                          dest="integrity", default=False,
+                          help="Once each run is done, store the size, line count, last date and checksum of each of its output files in the database.")
+
+        parser.add_argument("-l", "--loglevel", action="store",
+                          dest="loglevel", default="OFF", choices=['OFF', 'DEBUG', 'CRITICAL'], required=False,
+                          help="Set logging level")
+        
+        options = parser.parse_args()
+        
+        # Handle command line parameters
+        if "DEBUG" == options.loglevel:
+            self._initLogger(logging.DEBUG)
+        elif "CRITICAL" == options.loglevel:
+            self._initLogger(logging.CRITICAL)
+        else:
+            self._initLogger(logging.NOTSET)
+         
+        if options.parallel_mode != PARALLEL_MODE_PROCESS and not options.queue_name:
+            sys.exit("""Please specify a queue/partition name that is valid for your system.""")
+            
+        wall_time = None
+        if options.wall_time:
+            if options.parallel_mode == PARALLEL_MODE_PBS or options.parallel_mode == PARALLEL_MODE_SLURM:
+                if options.wall_time < 1 or options.wall_time > 168:
+                    sys.exit("Wall time must be greater than 0 and less than 169 hours")
+            wall_time = options.wall_time
+        
+        if options.delta < 1:
+            sys.exit("Delta must be greater than 0")
+        if options.chains < 2 * options.delta + 1:
+            sys.exit("At least %d chains are needed when delta is %d" % (2 * options.delta + 1, options.delta))
+        if options.generations < 1:
+            sys.exit("The number of generations must be greater than 0")
+        if options.burnin < 0 or options.burnin >= 1:
+            sys.exit("Burn-in must be greater than or equal to 0 and less than 1")
+        if options.rhat_stop < 0:
+            sys.exit("R-hat stopping threshold must not be negative")
+        if options.seed is None:
+            options.seed = newSessionSeed()
+        elif options.seed < 0 or options.seed > MAX_SEED:
+            sys.exit("Seed must be between 0 and %d" % (MAX_SEED,) )
+        if options.compress and options.compress not in getAvailableCompressionMethods():
+            sys.exit("%s compression is not supported, install the module it requires or use one of: %s" % \
+                     (options.compress, ', '.join(getAvailableCompressionMethods())) )
+        
+        # Runner options are the same for the runs of every generation
+        runnerOptions = RunnerOptions(scratch=options.scratch,
+                                      scratch_dir=options.scratch_dir,
+                                      scratch_keep=[p.strip() for p in options.scratch_keep.split(',') if p.strip()],
+                                      stage_dir=options.stage_dir,
+                                      compress=options.compress,
+                                      columnar=options.columnar,
+                                      log_archive=options.log_archive,
+                                      integrity=options.integrity)
+        if (options.generations + 1) * options.chains > MAX_ITERATIONS:
+            sys.exit("The maximum number of runs (chains * (generations + 1)) is %d" % (MAX_ITERATIONS,) )
+            
+        if not os.path.isdir(options.basedir) or not os.access(options.basedir, os.R_OK):
+            sys.exit("Unable to read project directory %s" % (options.basedir,) )
+        self.basedir = os.path.abspath(options.basedir) 
+        
+        obsFilePath = os.path.join(RHESSysCalibrator.getObsPath(self.basedir), options.observed_file)
+        if not os.access(obsFilePath, os.R_OK):
+            sys.exit("The observed data file %s is not readable" % (obsFilePath,) )
+        self.rhessysPath = RHESSysCalibrator.getRhessysPath(self.basedir)
+        self.runReader = AlignedRunReader(self.rhessysPath, readObservedData(obsFilePath), 
+                                          self.logger, options.add_streamflow_and_gw)
+            
+        self.logger.debug("parallel mode: %s" % options.parallel_mode)
+        self.logger.debug("basedir: %s" % self.basedir)
+        self.logger.debug("user: %s" % options.user)
+        self.logger.debug("project: %s" % options.project)
+        self.logger.debug("jobs: %d" % options.processes)
+        
+        try:
+            # Make sure we have everything we need to run calibrations        
+            # Get list of worldfiles
+            self.worldfiles = self.getWorldfiles(self.basedir)
+            if len(self.worldfiles) < 1:
+                raise Exception("No worldfiles found")
+            self.logger.debug("worldfiles: %s" % self.worldfiles)
+            if options.worldfile:
+                if options.worldfile not in self.worldfiles:
+                    raise Exception("Worldfile %s not found" % (options.worldfile,) )
+                worldfile = options.worldfile
+            elif len(self.worldfiles) > 1:
+                raise Exception("More than one worldfile found, please specify worldfile to calibrate with --worldfile")
+            else:
+                worldfile = self.worldfiles.keys()[0]
+            
+            # Get tecfile name
+            (res, tecfilePath) = self.getTecfilePath(self.basedir)
+            if not res:
+                raise Exception("No tecfile found")
+   
+            # Get RHESSys executable path
+            (rhessysExecFound, rhessysExec, rhessysExecPath) = \
+                self.getRHESSysExecPath(self.basedir)
+            if not rhessysExecFound:
+                raise Exception("RHESSys executable not found")
+            
+            # Read cmd.proto
+            cmd_proto = self._readCmdProtoFromFile(self.basedir)
+            if None == cmd_proto:
+                raise Exception("cmd.proto file not found")
+            elif '' == cmd_proto:
+                raise Exception("cmd.proto is an empty file")
+
+            # Parse calibrations parameters out of cmd.proto
+            (cmd_proto_noparam, self.paramsProto) = self.parseCmdProtoForParams(cmd_proto, options.use_horizontal_m_and_K_for_vertical)
+            self.paramKeys = self.paramsProto.getSampledParameterKeys()
+            if len(self.paramKeys) < 1:
+                raise Exception("No calibration parameters found in cmd.proto")
+            self.paramFloor = numpy.array([self.paramsProto.parameterRanges[k][0] for k in self.paramKeys])
+            self.paramCeil = numpy.array([self.paramsProto.parameterRanges[k][1] for k in self.paramKeys])
+
+            # Pre-process cmd.proto to add rhessys exec and tecfile path
+            cmd_proto_pre = self.preProcessCmdProto(cmd_proto_noparam,
+                                                    os.path.join(rhessysExecPath, rhessysExec),
+                                                    tecfilePath)
+
+            # Check for explicit routing and surface flowtable in cmd_proto, get dicts of
+            # flowtables from basedir
+            (self.flowtablePath, self.surfaceFlowtablePath) = self.determineRouting(cmd_proto_noparam)
+            
+            self.calibratorDB = \
+                ModelRunnerDB2(RHESSysCalibrator.getDBPath(self.basedir))
+            
+            notes = options.notes
+            if notes is None:
+                notes = "MCMC calibration, %d chains, %d generations" % (options.chains, options.generations)
+            self.session = self.createCalibrationSession(options.user, 
+                                                         options.project,
+                                                         options.chains * (options.generations + 1),
+                                                         options.processes,
+                                                         self.basedir,
+                                                         notes,
+                                                         seed=options.seed)
+            print("Created session %d with seed %d" % (self.session.id, self.session.seed))
+            mcmcOpts = {'mcmc_chains': str(options.chains),
+                        'mcmc_generations': str(options.generations),
+                        'mcmc_delta': str(options.delta),
+                        'mcmc_obs': options.observed_file,
+                        'mcmc_worldfile': worldfile,
+                        'mcmc_seed': str(options.seed)}
+            self.calibratorDB.setSessionOptions(self.session.id, mcmcOpts)
+            if options.stage_inputs:
+                # Checksum inputs once, runners will verify staged copies against these
+                flowtables = (self.flowtablePath or {}).values() + (self.surfaceFlowtablePath or {}).values()
+                manifest = buildStageManifest(self.rhessysPath, self.worldfiles.values(), 
+                                              flowtables, [tecfilePath])
+                runnerOptions.stage_manifest = getStageManifestPath(self.basedir, self.session.id)
+                writeStageManifest(manifest, runnerOptions.stage_manifest)
+            self.calibratorDB.setSessionOptions(self.session.id, runnerOptions.toSessionOptions())
+            
+            sampler = DreamSampler(options.chains, len(self.paramKeys), delta=options.delta,
+                                   random_state=numpy.random.RandomState(options.seed))
+            
+            # Initial population: sample uniformly from parameter ranges
+            X = sampler.random.uniform(size=(options.chains, len(self.paramKeys)))
+            runs = self.runGeneration(0, X, cmd_proto_pre, worldfile, options, wall_time, runnerOptions)
+            if None in runs:
+                raise Exception("Unable to find runs of initial population in database")
+            logLik = self.scoreGeneration(runs)
+            stateRunIds = [r.id for r in runs]
+            samples = []
+            for i in xrange(options.chains):
+                sample = MCMCSample2()
+                sample.chain = i
+                sample.proposal_run_id = runs[i].id
+                sample.state_run_id = runs[i].id
+                sample.log_likelihood = logLik[i] if numpy.isfinite(logLik[i]) else None
+                sample.accepted = True
+                samples.append(sample)
+            self.calibratorDB.insertMCMCSamples(self.session.id, 0, samples)
+            
+            history = [X.copy()]
+            lastGeneration = 0
+            for generation in xrange(1, options.generations + 1):
+                proposals = sampler.propose(X, generation)
+                runs = self.runGeneration(generation, proposals, cmd_proto_pre, worldfile, options, 
+                                          wall_time, runnerOptions)
+                logLikProposed = self.scoreGeneration(runs)
+                accepted = sampler.accept(logLik, logLikProposed)
+                
+                samples = []
+                for i in xrange(options.chains):
+                    if accepted[i]:
+                        X[i] = proposals[i]
+                        logLik[i] = logLikProposed[i]
+                        stateRunIds[i] = runs[i].id
+                    sample = MCMCSample2()
+                    sample.chain = i
+                    sample.proposal_run_id = runs[i].id if runs[i] else None
+                    sample.state_run_id = stateRunIds[i]
+                    sample.log_likelihood = logLik[i] if numpy.isfinite(logLik[i]) else None
+                    sample.accepted = bool(accepted[i])
+                    samples.append(sample)
+                self.calibratorDB.insertMCMCSamples(self.session.id, generation, samples)
+                history.append(X.copy())
+                lastGeneration = generation
+                
+                # Convergence diagnostics, discarding burn-in
+                diagnostics = {'acceptance_rate': float(numpy.mean(accepted))}
+                firstGeneration = int(options.burnin * len(history))
+                rhat = None
+                if len(history) - firstGeneration >= 4:
+                    rhat = gelmanRubin(numpy.array(history[firstGeneration:]))
+                    for (key, value) in zip(self.paramKeys, rhat):
+                        diagnostics['rhat_' + key] = float(value)
+                self.calibratorDB.insertMCMCDiagnostics(self.session.id, generation, diagnostics)
+                print("Generation %d, acceptance rate: %.2f, max R-hat: %s" % \
+                      (generation, diagnostics['acceptance_rate'], 
+                       "%.3f" % numpy.max(rhat) if rhat is not None else 'n/a'))
+                
+                if options.rhat_stop and rhat is not None and numpy.all(rhat < options.rhat_stop):
+                    print("All parameters have R-hat less than %.3f, stopping" % (options.rhat_stop,) )
+                    break
+            
+            # Update session endtime and status
+            self.calibratorDB.updateSessionEndtime(self.session.id,
+                                                   datetime.utcnow(),
+                                                   "complete")
+            
+            # Write posterior samples (after burn-in)
+            firstGeneration = int(options.burnin * (lastGeneration + 1))
+            posterior = self.calibratorDB.getMCMCSamples(self.session.id, firstGeneration)
+            outfile = os.path.join(self.basedir, "mcmc_posterior_SESSION_%d.csv" % (self.session.id,) )
+            self.writePosteriorSamples(outfile, posterior)
+            print("\n\nMCMC samples saved to session %d, posterior samples from generation %d written to %s" % \
+                  (self.session.id, firstGeneration, outfile))
+        except:
+            raise
+        else:
+            self.logger.debug("exiting normally")
+            return 0
+        finally:
+            self.calibratorDB = None
@@ -0,0 +1,260 @@
+"""@package rhessyscalibrator.metrics
+
+@brief Fitness metrics of an ensemble of model runs, calculated for all runs 
+at once from a matrix of simulated values (one row per run) and a vector of 
+observed values.  Pairs of values where either value is missing (NaN) are 
+ignored; for metrics calculated in log space, pairs where either value is zero
+(or negative) are also ignored.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import numpy
+
+METRIC_NSE = 'nse'
+METRIC_NSE_LOG = 'nse_log'
+METRIC_PBIAS = 'pbias'
+METRIC_RSR = 'rsr'
+METRIC_KGE = 'kge'
+METRIC_KGE_R = 'kge_r'
+METRIC_KGE_ALPHA = 'kge_alpha'
+METRIC_KGE_BETA = 'kge_beta'
+METRIC_RMSE = 'rmse'
+METRIC_RUNOFF_RATIO = 'runoff_ratio'
+
+# Metrics stored in columns of the runfitness table
+RUNFITNESS_METRICS = [METRIC_NSE, METRIC_NSE_LOG, METRIC_PBIAS, METRIC_RSR, METRIC_RUNOFF_RATIO]
+# Metrics stored as user fitness of a runfitness entry
+USERFITNESS_METRICS = [METRIC_KGE, METRIC_KGE_R, METRIC_KGE_ALPHA, METRIC_KGE_BETA, METRIC_RMSE]
+
+
+def _divide(numerator, denominator):
+    """ Divide element-wise, returning NaN where denominator is zero
+    """
+    numerator = numpy.asarray(numerator, dtype=float)
+    denominator = numpy.asarray(denominator, dtype=float)
+    result = numpy.full(numpy.broadcast(numerator, denominator).shape, numpy.nan)
+    valid = denominator != 0
+    numpy.divide(numerator, denominator, out=result, where=valid)
+    return result
+
+def _ensemble(obs, sims):
+    """ @return Tuple (numpy.ndarray, numpy.ndarray) of observed and simulated 
+        values, both of dimensions [NUM_RUNS, NUM_DATA], with NaN wherever 
+        either value is missing
+    """
+    obs = numpy.asarray(obs, dtype=float)
+    sims = numpy.array(sims, dtype=float, ndmin=2)
+    if sims.shape[1] != len(obs):
+        raise Exception("Simulated values have %d columns, but there are %d observed values" % \
+                        (sims.shape[1], len(obs)) )
+    obs = numpy.repeat(obs.reshape( (1, len(obs)) ), sims.shape[0], axis=0)
+    missing = numpy.isnan(obs) | numpy.isnan(sims)
+    obs[missing] = numpy.nan
+    sims[missing] = numpy.nan
+    return (obs, sims)
+
+def _moments(obs, sims):
+    """ @return Tuple (count, obs_mean, sim_mean, sum of squared errors, 
+        sum of squared obs deviations) of NaN-masked ensemble values, one per run
+    """
+    valid = ~numpy.isnan(obs)
+    count = numpy.sum(valid, axis=1)
+    obsMean = _divide(numpy.nansum(obs, axis=1), count)
+    simMean = _divide(numpy.nansum(sims, axis=1), count)
+    sse = numpy.nansum((obs - sims) ** 2, axis=1)
+    sso = numpy.nansum((obs - obsMean[:, numpy.newaxis]) ** 2, axis=1)
+    sse[count == 0] = numpy.nan
+    sso[count == 0] = numpy.nan
+    return (count, obsMean, simMean, sse, sso)
+
+def _logPairs(obs, sims):
+    """ @return Tuple (numpy.ndarray, numpy.ndarray) of log10 of ensemble
+        values, with NaN wherever either value is not positive
+    """
+    with numpy.errstate(invalid='ignore'):
+        invalid = ~(obs > 0) | ~(sims > 0)
+    obs = obs.copy()
+    sims = sims.copy()
+    obs[invalid] = numpy.nan
+    sims[invalid] = numpy.nan
+    return (numpy.log10(obs), numpy.log10(sims))
+
+def logTransform(obs, sims):
+    """ Log10 transform observed and simulated values, setting pairs where 
+        either value is not positive to NaN
+
+        @param obs Sequence of observed values
+        @param sims Array-like of dimensions [NUM_RUNS, NUM_DATA] of simulated values
+        
+        @return Tuple (numpy.ndarray, numpy.ndarray) of log observed and simulated 
+        values, both of dimensions [NUM_RUNS, NUM_DATA]
+    """
+    return _logPairs(*_ensemble(obs, sims))
+
+def calculateNSE(obs, sims):
+    """ Calculate Nash-Sutcliffe efficiency (NSE) (Moriasi et al. 2007) of each run
+
+        @param obs Sequence of observed values
+        @param sims Array-like of dimensions [NUM_RUNS, NUM_DATA] of simulated values
+        
+        @return numpy.ndarray of NSE of each run (NaN if it cannot be calculated)
+    """
+    (obs, sims) = _ensemble(obs, sims)
+    (count, obsMean, simMean, sse, sso) = _moments(obs, sims)
+    return 1 - _divide(sse, sso)
+
+def getObservedTerms(obs):
+    """ Calculate the terms of fitness metrics that depend only on observed 
+        values, so that they are calculated once, rather than for each run, 
+        when scoring many runs against the same observed values (see 
+        calculateMetrics()).
+
+        @param obs Sequence of observed values
+        
+        @return Dict<String, Object> of observed terms, or None if there are no 
+        observed values, or if any are missing (in which case terms depend on 
+        the values missing from each run)
+    """
+    obs = numpy.asarray(obs, dtype=float)
+    if len(obs) == 0 or numpy.isnan(obs).any():
+        return None
+    terms = {}
+    terms['obs'] = obs
+    terms['count'] = len(obs)
+    terms['sum'] = numpy.sum(obs)
+    terms['mean'] = terms['sum'] / len(obs)
+    terms['dev'] = obs - terms['mean']
+    terms['sso'] = numpy.sum(terms['dev'] ** 2)
+    if (obs > 0).all():
+        logObs = numpy.log10(obs)
+        terms['log'] = logObs
+        terms['log_dev'] = logObs - numpy.mean(logObs)
+        terms['log_sso'] = numpy.sum(terms['log_dev'] ** 2)
+    return terms
+
+def _calculateMetricsComplete(terms, sims):
+    """ calculateMetrics() of simulated values without missing values, using 
+        observed terms from getObservedTerms()
+    """
+    obs = terms['obs']
+    count = terms['count']
+    sso = terms['sso']
+    residuals = obs - sims
+    sse = numpy.sum(residuals ** 2, axis=1)
+    simMean = numpy.sum(sims, axis=1) / count
+    simDev = sims - simMean[:, numpy.newaxis]
+    sss = numpy.sum(simDev ** 2, axis=1)
+    covariance = numpy.dot(simDev, terms['dev'])
+    
+    metrics = {}
+    metrics[METRIC_NSE] = 1 - _divide(sse, sso)
+    metrics[METRIC_PBIAS] = 100.0 * _divide(numpy.sum(residuals, axis=1), terms['sum'])
+    metrics[METRIC_RSR] = _divide(numpy.sqrt(sse), numpy.sqrt(sso))
+    metrics[METRIC_RMSE] = numpy.sqrt(sse / count)
+    
+    r = _divide(covariance, numpy.sqrt(sso * sss))
+    alpha = _divide(numpy.sqrt(sss), numpy.sqrt(sso))
+    beta = _divide(simMean, terms['mean'])
+    metrics[METRIC_KGE_R] = r
+    metrics[METRIC_KGE_ALPHA] = alpha
+    metrics[METRIC_KGE_BETA] = beta
+    metrics[METRIC_KGE] = 1 - numpy.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+    
+    if 'log' in terms and (sims > 0).all():
+        logSse = numpy.sum((terms['log'] - numpy.log10(sims)) ** 2, axis=1)
+        metrics[METRIC_NSE_LOG] = 1 - _divide(logSse, terms['log_sso'])
+    else:
+        # Which pairs are left out of log NSE depends on each run
+        (logObs, logSims) = logTransform(obs, sims)
+        (logCount, logObsMean, logSimMean, logSse, logSso) = _moments(logObs, logSims)
+        metrics[METRIC_NSE_LOG] = 1 - _divide(logSse, logSso)
+    return metrics
+
+def calculateMetrics(obs, sims, obs_terms=None):
+    """ Calculate fitness metrics of each run: NSE, NSE of log10 values, 
+        percent bias (PBIAS; positive values indicate underestimation, Moriasi 
+        et al. 2007), RMSE-observations standard deviation ratio (RSR), 
+        root mean squared error (RMSE), and Kling-Gupta efficiency (KGE) and 
+        its components (Gupta et al. 2009): the correlation coefficient (r), 
+        the ratio of simulated to observed standard deviation (alpha), and 
+        the ratio of simulated to observed mean (beta).
+
+        @param obs Sequence of observed values
+        @param sims Array-like of dimensions [NUM_RUNS, NUM_DATA] of simulated values
+        @param obs_terms Dict of observed terms returned by getObservedTerms(obs), 
+            if available.  Used when no simulated values are missing.
+        
+        @return Dict<String, numpy.ndarray> mapping METRIC_* names (except 
+        METRIC_RUNOFF_RATIO, see calculateRunoffRatio()) to the value of each 
+        metric for each run (NaN where a metric cannot be calculated)
+    """
+    if obs_terms is not None:
+        sims = numpy.array(sims, dtype=float, ndmin=2)
+        if sims.shape[1] == obs_terms['count'] and not numpy.isnan(sims).any():
+            return _calculateMetricsComplete(obs_terms, sims)
+    (obs, sims) = _ensemble(obs, sims)
+    (count, obsMean, simMean, sse, sso) = _moments(obs, sims)
+    obsDev = obs - obsMean[:, numpy.newaxis]
+    simDev = sims - simMean[:, numpy.newaxis]
+    sss = numpy.nansum(simDev ** 2, axis=1)
+    covariance = numpy.nansum(obsDev * simDev, axis=1)
+    
+    metrics = {}
+    metrics[METRIC_NSE] = 1 - _divide(sse, sso)
+    metrics[METRIC_PBIAS] = 100.0 * _divide(numpy.nansum(obs - sims, axis=1), numpy.nansum(obs, axis=1))
+    metrics[METRIC_RSR] = _divide(numpy.sqrt(sse), numpy.sqrt(sso))
+    metrics[METRIC_RMSE] = numpy.sqrt(_divide(sse, count))
+    
+    r = _divide(covariance, numpy.sqrt(sso * sss))
+    alpha = _divide(numpy.sqrt(sss), numpy.sqrt(sso))
+    beta = _divide(simMean, obsMean)
+    metrics[METRIC_KGE_R] = r
+    metrics[METRIC_KGE_ALPHA] = alpha
+    metrics[METRIC_KGE_BETA] = beta
+    metrics[METRIC_KGE] = 1 - numpy.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+    
+    (logObs, logSims) = _logPairs(obs, sims)
+    (logCount, logObsMean, logSimMean, logSse, logSso) = _moments(logObs, logSims)
+    metrics[METRIC_NSE_LOG] = 1 - _divide(logSse, logSso)
+    return metrics
+
+def calculateRunoffRatio(streamflow, precip):
+    """ Calculate runoff ratio (total streamflow / total precipitation) of each run
+
+        @param streamflow Array-like of dimensions [NUM_RUNS, NUM_DATA] of simulated streamflow
+        @param precip Array-like of dimensions [NUM_RUNS, NUM_DATA] of simulated precipitation
+        
+        @return numpy.ndarray of runoff ratio of each run
+    """
+    streamflow = numpy.array(streamflow, dtype=float, ndmin=2)
+    precip = numpy.array(precip, dtype=float, ndmin=2)
+    return _divide(numpy.nansum(streamflow, axis=1), numpy.nansum(precip, axis=1))
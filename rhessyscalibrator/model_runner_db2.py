@@ -53,9 +53,30 @@ class ModelRunnerDB2(object):
         with a single session).  Details about calibration run 
         post-processing are stored in the postprocess table.
     """
-    DB_VERSION = 2.0
+    DB_VERSION = 2.1
     ELEM_SEP = '|'
     
+    # Run option recording the outcome of screening runs over a short period
+    RUN_OPT_SCREENING = 'screening'
+    SCREENING_PROMOTED = 'promoted'
+    SCREENING_REJECTED = 'rejected'
+    # Where clause to exclude runs rejected during screening (e.g. from post processing)
+    WHERE_NOT_SCREENED_OUT = "id NOT IN (SELECT run_id FROM run_option WHERE attr='%s' AND value='%s')" % \
+        (RUN_OPT_SCREENING, SCREENING_REJECTED)
+    # Run option recording that outputs of a run were pruned (deleted or archived)
+    RUN_OPT_PRUNED = 'pruned'
+    PRUNED_DELETED = 'deleted'
+    PRUNED_ARCHIVED = 'archived'
+    # Where clauses to exclude pruned runs, for use with getRunsInSession() and
+    #  getRunsInPostProcess() respectively
+    WHERE_NOT_PRUNED = "id NOT IN (SELECT run_id FROM run_option WHERE attr='%s')" % \
+        (RUN_OPT_PRUNED,)
+    WHERE_FITNESS_NOT_PRUNED = "run_id NOT IN (SELECT run_id FROM run_option WHERE attr='%s')" % \
+        (RUN_OPT_PRUNED,)
+    # Number of runs whose fitness results are written by insertRunFitnessResultsBatch() 
+    #  between commits
+    FITNESS_BATCH_CHECKPOINT = 1000
+    
     @classmethod
     def _createTables(cls, conn):
         cursor = conn.cursor()
@@ -65,6 +86,9 @@ class ModelRunnerDB2(object):
         cls._createPostprocessTable(cursor)
         cls._createRunfitnessTable(cursor)
         cls._createUserfitnessTable(cursor)
+        cls._createOptionTables(cursor)
+        cls._createMCMCTables(cursor)
+        cls._createOutputIntegrityTable(cursor)
         
         cursor.close()
 
@@ -86,6 +110,7 @@ processes INTEGER NOT NULL,
 basedir TEXT NOT NULL,
 cmd_proto TEXT NOT NULL,
 status TEXT NOT NULL,
+seed INTEGER,
 CHECK (status="submitted" OR status="complete" OR status="aborted")
 )
 """)
@@ -186,6 +211,79 @@ PRIMARY KEY (runfitness_id, attr)
         cursor.execute("""CREATE INDEX IF NOT EXISTS userfitness_idx ON 
 userfitness (runfitness_id)""")
     
+    @classmethod
+    def _createOptionTables(cls, cursor):
+        """ Create tables for storing arbitrary session and run options as 
+            key-value pairs.  Added in version 2.1.
+        """
+        cursor.execute("""CREATE TABLE IF NOT EXISTS session_option
+(session_id INTEGER NOT NULL REFERENCES session (id) ON DELETE CASCADE,
+attr TEXT NOT NULL,
+value TEXT,
+PRIMARY KEY (session_id, attr)
+)""")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS run_option
+(run_id INTEGER NOT NULL REFERENCES run (id) ON DELETE CASCADE,
+attr TEXT NOT NULL,
+value TEXT,
+PRIMARY KEY (run_id, attr)
+)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS sessopt_idx ON 
+session_option (session_id)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS runopt_idx ON 
+run_option (run_id)""")
+    
+    @classmethod
+    def _addSessionSeedColumn(cls, cursor):
+        """ Add seed column to session table of version 2.0 databases
+        """
+        cursor.execute("""PRAGMA table_info(session)""")
+        columns = [row[1] for row in cursor.fetchall()]
+        if not 'seed' in columns:
+            cursor.execute("""ALTER TABLE session ADD COLUMN seed INTEGER""")
+    
+    @classmethod
+    def _createMCMCTables(cls, cursor):
+        """ Create tables for storing the state of Markov chains of MCMC calibration 
+            sessions, and convergence diagnostics.  Added in version 2.1.
+        """
+        cursor.execute("""CREATE TABLE IF NOT EXISTS mcmc_sample
+(session_id INTEGER NOT NULL REFERENCES session (id) ON DELETE CASCADE,
+generation INTEGER NOT NULL,
+chain INTEGER NOT NULL,
+proposal_run_id INTEGER REFERENCES run (id) ON DELETE SET NULL,
+state_run_id INTEGER NOT NULL REFERENCES run (id) ON DELETE CASCADE,
+log_likelihood REAL,
+accepted INTEGER NOT NULL,
+PRIMARY KEY (session_id, generation, chain)
+)""")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS mcmc_diagnostic
+(session_id INTEGER NOT NULL REFERENCES session (id) ON DELETE CASCADE,
+generation INTEGER NOT NULL,
+attr TEXT NOT NULL,
+value REAL,
+PRIMARY KEY (session_id, generation, attr)
+)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS mcmc_sample_sess_idx ON 
+mcmc_sample (session_id)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS mcmc_diag_sess_idx ON 
+mcmc_diagnostic (session_id)""")
+    
+    @classmethod
+    def _createOutputIntegrityTable(cls, cursor):
+        """ Create table for storing integrity records (size, line count, last date
+            and checksum) of output files of runs 
+        """
+        cursor.execute("""CREATE TABLE IF NOT EXISTS run_output_integrity
+(run_id INTEGER NOT NULL REFERENCES run (id) ON DELETE CASCADE,
+filename TEXT NOT NULL,
+size INTEGER NOT NULL,
+lines INTEGER,
+last_date TEXT,
+checksum TEXT NOT NULL,
+PRIMARY KEY (run_id, filename)
+)""")
+    
     @classmethod
     def migrateDbToCurrentVersion(cls, db_path):
         """ DO NOT CALL THIS FUNCTION UNLESS YOU KNOW WHAT YOU ARE DOING """
@@ -270,6 +368,26 @@ VALUES (?,?,?,?,?,?)""",
             cursor.close()
             conn.close() 
             print("Successfully migrated to version {0}".format(cls.DB_VERSION))
+        
+        elif version == 2.0:
+            # Migrate DB in place: version 2.1 only adds tables and columns
+            # Back-up old db
+            backup_path = "{0}_backup_{1}".format(db_path, int(time.time()))
+            print("Backing up existing database to {0}".format(backup_path))
+            shutil.copy2(db_path, backup_path)
+            
+            conn = sqlite3.connect(db_path, check_same_thread = False)
+            cursor = conn.cursor()
+            cls._addSessionSeedColumn(cursor)
+            cls._createOptionTables(cursor)
+            cls._createMCMCTables(cursor)
+            cls._createOutputIntegrityTable(cursor)
+            cursor.execute("""UPDATE rhessys_calibrator_version SET version=?""", (cls.DB_VERSION,))
+            
+            conn.commit()
+            cursor.close()
+            conn.close()
+            print("Successfully migrated to version {0}".format(cls.DB_VERSION))
                         
         else:
             raise Exception("Database {0} is version {1}, which cannot be migrated by this version of the code".format(db_path, version))
@@ -355,7 +473,7 @@ VALUES (?,?,?,?,?,?)""",
 
 
     def insertSession(self, user, project, notes, iterations, processes,
-                      basedir, cmd_proto):
+                      basedir, cmd_proto, seed=None):
         """ Creates a new session with a starttime of the current time,
             and a status of 'submitted'
 
@@ -369,6 +487,8 @@ VALUES (?,?,?,?,?,?)""",
                                  submit
             @param basedir String representing the basedir where run results are stored
             @param cmd_proto String representing the command template for running RHESSys
+            @param seed Integer representing the seed used to generate parameter values
+                                 for runs in the session
 
             @return The ID of the session
         """
@@ -376,9 +496,9 @@ VALUES (?,?,?,?,?,?)""",
 
         # Create a new session
         cursor.execute("""INSERT INTO session 
-(user,project,notes,iterations,processes,basedir,cmd_proto,status)
-VALUES (?,?,?,?,?,?,?,?)""", 
-(user, project, notes, iterations, processes, basedir, cmd_proto, 'submitted'))
+(user,project,notes,iterations,processes,basedir,cmd_proto,status,seed)
+VALUES (?,?,?,?,?,?,?,?,?)""", 
+(user, project, notes, iterations, processes, basedir, cmd_proto, 'submitted', seed))
 
         self._conn.commit()
 
@@ -407,6 +527,41 @@ id=?""", (endtime.strftime("%Y-%m-%d %H:%M:%S"), status, id))
 
         cursor.close()
 
+    def setSessionOptions(self, session_id, options):
+        """ Set options for a session.  Existing options with the same 
+            names will be replaced.
+
+            @param session_id Integer representing the ID of the session
+            @param options Dict<String, String> representing session options
+        """
+        cursor = self._conn.cursor()
+        
+        for (attr, value) in options.iteritems():
+            cursor.execute("""INSERT OR REPLACE INTO session_option
+(session_id,attr,value) VALUES (?,?,?)""", (session_id, attr, value))
+        
+        self._conn.commit()
+        cursor.close()
+
+    def getSessionOptions(self, session_id):
+        """ Get options for a session
+
+            @param session_id Integer representing the ID of the session
+            
+            @return Dict<String, String> representing session options.  Returns
+            an empty dict if the session has no options.
+        """
+        cursor = self._conn.cursor()
+        
+        opts = {}
+        cursor.execute("""SELECT attr, value FROM session_option WHERE session_id=?""", (session_id,))
+        for row in cursor:
+            opts[row['attr']] = row['value']
+        
+        cursor.close()
+        
+        return opts
+
 #     def updateSessionObservationFilename(self, id, obs_filename):
 #         """ Updates the obs_filename used for calculating model
 #             fitness statistics for runs associated with the session
@@ -600,6 +755,129 @@ id=?""", (endtime.strftime("%Y-%m-%d %H:%M:%S"), status, id))
 
         cursor.close()
 
+    def updateRunCmdRaw(self, id, cmd_raw):
+        """ Updates the command used to run the given run
+
+            @param id Integer representing the ID of the run to update
+            @param cmd_raw String representing the command used to run the run
+        """
+        cursor = self._conn.cursor()
+
+        cursor.execute("""UPDATE run SET cmd_raw=? where id=?""",
+                       (cmd_raw, id))
+
+        self._conn.commit()
+
+        cursor.close()
+
+    def updateRunOutputPath(self, id, output_path, cmd_raw):
+        """ Updates the output path of the given run, and the command
+            used to run it
+
+            @param id Integer representing the ID of the run to update
+            @param output_path String representing the output path of the run
+            @param cmd_raw String representing the command used to run the run
+        """
+        cursor = self._conn.cursor()
+
+        cursor.execute("""UPDATE run SET output_path=?, cmd_raw=? where id=?""",
+                       (output_path, cmd_raw, id))
+
+        self._conn.commit()
+
+        cursor.close()
+
+    def setRunOption(self, run_id, attr, value):
+        """ Set an option for a run, replacing any existing value
+
+            @param run_id Integer representing the ID of the run
+            @param attr String representing the name of the option
+            @param value String representing the value of the option
+        """
+        cursor = self._conn.cursor()
+
+        cursor.execute("""INSERT OR REPLACE INTO run_option
+(run_id,attr,value) VALUES (?,?,?)""", (run_id, attr, value))
+
+        self._conn.commit()
+
+        cursor.close()
+
+    def setRunsOption(self, run_ids, attr, value):
+        """ Set an option for several runs, replacing any existing values
+
+            @param run_ids List of integers representing the IDs of the runs
+            @param attr String representing the name of the option
+            @param value String representing the value of the option
+        """
+        cursor = self._conn.cursor()
+
+        cursor.executemany("""INSERT OR REPLACE INTO run_option
+(run_id,attr,value) VALUES (?,?,?)""", [(run_id, attr, value) for run_id in run_ids])
+
+        self._conn.commit()
+
+        cursor.close()
+
+    def getRunOptions(self, run_id):
+        """ Get options for a run
+
+            @param run_id Integer representing the ID of the run
+            
+            @return Dict<String, String> representing run options.  Returns
+            an empty dict if the run has no options.
+        """
+        cursor = self._conn.cursor()
+        
+        opts = {}
+        cursor.execute("""SELECT attr, value FROM run_option WHERE run_id=?""", (run_id,))
+        for row in cursor:
+            opts[row['attr']] = row['value']
+        
+        cursor.close()
+        
+        return opts
+
+    def setRunOutputIntegrity(self, run_id, records):
+        """ Set integrity records of output files of a run, replacing any 
+            existing records for the run
+
+            @param run_id Integer representing the ID of the run
+            @param records List of RunOutputIntegrity2 objects
+        """
+        cursor = self._conn.cursor()
+
+        cursor.execute("""DELETE FROM run_output_integrity WHERE run_id=?""", (run_id,))
+        cursor.executemany("""INSERT INTO run_output_integrity
+(run_id,filename,size,lines,last_date,checksum) VALUES (?,?,?,?,?,?)""",
+                           [(run_id, r.filename, r.size, r.lines, r.last_date, r.checksum) \
+                            for r in records])
+
+        self._conn.commit()
+
+        cursor.close()
+
+    def getOutputIntegrityForSession(self, session_id):
+        """ Get integrity records of output files of runs of a session
+
+            @param session_id Integer representing the ID of the session
+            
+            @return Dict<Integer, List<RunOutputIntegrity2>> mapping run ID to the
+            integrity records of the run.  Runs without records are not included.
+        """
+        cursor = self._conn.cursor()
+        
+        records = {}
+        cursor.execute("""SELECT i.* FROM run_output_integrity i JOIN run r ON i.run_id=r.id
+WHERE r.session_id=? ORDER BY i.run_id, i.filename""", (session_id,))
+        for row in cursor:
+            record = self._outputIntegrityRecordToObject(row)
+            records.setdefault(record.run_id, []).append(record)
+        
+        cursor.close()
+        
+        return records
+
     def insertPostProcess(self, session_id, 
                           obs_filename, fitness_period, exclude_date_ranges=None,
                           obs_runoff_ratio=None,
@@ -642,6 +920,22 @@ VALUES (?,?,?,?,?)""", (session_id,obs_filename,fitness_period,exclude_date_rang
         
         return postprocess_id
     
+    def setPostProcessOptions(self, postprocess_id, options):
+        """ Set options for a post process entry.  Existing options with the same 
+            names will be replaced.
+
+            @param postprocess_id Integer representing the ID of the post process entry
+            @param options Dict<String, String> representing post process options
+        """
+        cursor = self._conn.cursor()
+        
+        for (attr, value) in options.iteritems():
+            cursor.execute("""INSERT OR REPLACE INTO postprocess_option
+(postprocess_id,attr,value) VALUES (?,?,?)""", (postprocess_id, attr, value))
+        
+        self._conn.commit()
+        cursor.close()
+    
     def insertRunFitnessResults(self, postprocess_id, run_id, 
                                 nse=None, nse_log=None, 
                                 pbias=None, rsr=None,
@@ -684,6 +978,146 @@ VALUES (?,?,?,?,?,?,?)""", (postprocess_id, run_id, nse, nse_log, pbias, rsr, ru
         
         return runfitness_id
 
+    def insertRunFitnessResultsBatch(self, postprocess_id, results, 
+                                     checkpoint=FITNESS_BATCH_CHECKPOINT, replace=False):
+        """ Set fitness results of many model runs for a particular post process 
+            entry.  Unlike insertRunFitnessResults(), which commits once per run, 
+            results are written checkpoint runs at a time, each batch in a single
+            transaction, so that results already written are kept if writing is
+            interrupted.
+
+            @param postprocess_id Integer representing The ID of the post process entry
+            @param results Sequence of tuples (run_id, nse, nse_log, pbias, rsr, 
+            runoff_ratio, userfitness), one per run, see insertRunFitnessResults().  
+            Fitness values may be NumPy scalars; userfitness may be None.
+            @param checkpoint Integer representing the number of runs written per
+            transaction
+            @param replace True if existing fitness results of the runs for the post 
+            process entry are to be deleted (in the same transaction)
+            
+            @return List of IDs of run fitness entries created, in the order of results
+        """
+        results = list(results)
+        runfitnessIds = []
+        cursor = self._conn.cursor()
+        try:
+            for start in xrange(0, len(results), checkpoint):
+                batch = results[start:start + checkpoint]
+                if replace:
+                    keys = [(postprocess_id, int(r[0])) for r in batch]
+                    cursor.executemany("""DELETE FROM userfitness WHERE runfitness_id IN
+(SELECT id FROM runfitness WHERE postprocess_id=? AND run_id=?)""", keys)
+                    cursor.executemany("""DELETE FROM runfitness WHERE postprocess_id=? AND run_id=?""", keys)
+                # Insert runfitness rows one at a time (still in one transaction) to get 
+                #  the ID of each, as other processes may be writing to the table
+                ids = []
+                for r in batch:
+                    cursor.execute("""INSERT INTO runfitness
+(postprocess_id,run_id,nse,nse_log,pbias,rsr,runoff_ratio)
+VALUES (?,?,?,?,?,?,?)""", (postprocess_id, int(r[0])) + \
+                                   tuple([None if v is None else float(v) for v in r[1:6]]))
+                    ids.append(cursor.lastrowid)
+                
+                cursor.executemany("""INSERT INTO userfitness
+(runfitness_id,attr,value) VALUES (?,?,?)""", [(runfitness_id, attr, None if value is None else float(value)) \
+                                              for (runfitness_id, r) in zip(ids, batch) if r[6] \
+                                              for (attr, value) in r[6].iteritems()])
+                self._conn.commit()
+                runfitnessIds.extend(ids)
+        except:
+            self._conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        
+        return runfitnessIds
+
+    def insertMCMCSamples(self, session_id, generation, samples):
+        """ Record the state of each Markov chain of an MCMC session after a generation
+
+            @param session_id Integer representing the ID of the session
+            @param generation Integer representing the generation (0 for the initial population)
+            @param samples List of MCMCSample2 objects, one per chain
+        """
+        cursor = self._conn.cursor()
+
+        for sample in samples:
+            cursor.execute("""INSERT INTO mcmc_sample
+(session_id,generation,chain,proposal_run_id,state_run_id,log_likelihood,accepted)
+VALUES (?,?,?,?,?,?,?)""", (session_id, generation, sample.chain, sample.proposal_run_id,
+                            sample.state_run_id, sample.log_likelihood, int(sample.accepted)))
+
+        self._conn.commit()
+        cursor.close()
+
+    def insertMCMCDiagnostics(self, session_id, generation, diagnostics):
+        """ Record convergence diagnostics of an MCMC session after a generation
+
+            @param session_id Integer representing the ID of the session
+            @param generation Integer representing the generation
+            @param diagnostics Dict<String, Float> representing diagnostics (e.g. R-hat 
+            for each parameter, acceptance rate)
+        """
+        cursor = self._conn.cursor()
+
+        for (attr, value) in diagnostics.iteritems():
+            cursor.execute("""INSERT OR REPLACE INTO mcmc_diagnostic
+(session_id,generation,attr,value) VALUES (?,?,?,?)""", (session_id, generation, attr, value))
+
+        self._conn.commit()
+        cursor.close()
+
+    def getMCMCSamples(self, session_id, min_generation=0):
+        """ Get states of the Markov chains of an MCMC session
+
+            @param session_id Integer representing the ID of the session
+            @param min_generation Integer representing the first generation to return 
+            (e.g. to discard burn-in)
+
+            @return List of MCMCSample2 objects, with run set to the ModelRun2 of the 
+            chain state, ordered by generation and chain
+        """
+        cursor = self._conn.cursor()
+        sub_cursor = self._conn.cursor()
+
+        samples = []
+
+        cursor.execute("""SELECT * FROM mcmc_sample WHERE session_id=? AND generation>=?
+ORDER BY generation, chain""", (session_id, min_generation))
+        for row in cursor:
+            sample = self._mcmcSampleRecordToObject(row)
+            sub_cursor.execute("""SELECT * FROM run WHERE id=?""", (row['state_run_id'],))
+            run_row = sub_cursor.fetchone()
+            assert(run_row != None)
+            sample.run = self._runRecordToObject(run_row)
+            samples.append(sample)
+
+        sub_cursor.close()
+        cursor.close()
+
+        return samples
+
+    def getMCMCDiagnostics(self, session_id, generation):
+        """ Get convergence diagnostics of an MCMC session for a generation
+
+            @param session_id Integer representing the ID of the session
+            @param generation Integer representing the generation
+
+            @return Dict<String, Float> representing diagnostics.  Returns an empty 
+            dict if there are no diagnostics for the generation.
+        """
+        cursor = self._conn.cursor()
+
+        diagnostics = {}
+        cursor.execute("""SELECT attr, value FROM mcmc_diagnostic WHERE session_id=? AND generation=?""",
+                       (session_id, generation))
+        for row in cursor:
+            diagnostics[row['attr']] = row['value']
+
+        cursor.close()
+
+        return diagnostics
+
     def getRun(self, run_id):
         """ Get the run with the supplied ID
 
@@ -734,6 +1168,31 @@ VALUES (?,?,?,?,?,?,?)""", (postprocess_id, run_id, nse, nse_log, pbias, rsr, ru
 
         return runs
 
+    def countRunsInSession(self, session_id, where_clause=None):
+        """ Count runs associated with a session
+
+            @param session_id Integer representing the session whose runs we want to count
+            @param where_clause String representing SQLite3 where clause used to restrict
+            runs counted.
+
+            @note This method does not scrub the where_clause of dangerous elements. 
+            Use at your own risk.
+
+            @return Integer representing the number of runs
+        """
+        cursor = self._conn.cursor()
+
+        queryProto = "SELECT COUNT(*) from run WHERE session_id=?"
+        if where_clause:
+            queryProto += " AND " + where_clause
+
+        cursor.execute(queryProto, (session_id,))
+        count = cursor.fetchone()[0]
+
+        cursor.close()
+
+        return count
+
     def getRunInSession(self, session_id, job_id):
         """ Get all runs associated with a session
 
@@ -991,6 +1450,7 @@ FROM run AS r JOIN runfitness AS rf ON r.id=rf.run_id WHERE rf.postprocess_id=?"
         session.basedir = row["basedir"]
         session.cmd_proto = row["cmd_proto"]
         session.status = row["status"]
+        session.seed = row["seed"]
 
         return session
 
@@ -1033,6 +1493,45 @@ FROM run AS r JOIN runfitness AS rf ON r.id=rf.run_id WHERE rf.postprocess_id=?"
 
         return run
     
+    def _outputIntegrityRecordToObject(self, row):
+        """ Translate a record from the "run_output_integrity" table into a 
+            RunOutputIntegrity2 object
+
+            @param row sqlite3.Row: row record to be copied into the
+                                  RunOutputIntegrity2 object
+
+            @return RunOutputIntegrity2 representing the run_output_integrity record
+        """
+        record = RunOutputIntegrity2()
+        record.run_id = row["run_id"]
+        record.filename = row["filename"]
+        record.size = row["size"]
+        record.lines = row["lines"]
+        record.last_date = row["last_date"]
+        record.checksum = row["checksum"]
+        
+        return record
+
+    def _mcmcSampleRecordToObject(self, row):
+        """ Translate a record from the "mcmc_sample" table into a MCMCSample2
+            object
+
+            @param row sqlite3.Row: row record to be copied into the
+                                  MCMCSample2 object
+
+            @return MCMCSample2 representing the mcmc_sample record
+        """
+        sample = MCMCSample2()
+        sample.session_id = row["session_id"]
+        sample.generation = row["generation"]
+        sample.chain = row["chain"]
+        sample.proposal_run_id = row["proposal_run_id"]
+        sample.state_run_id = row["state_run_id"]
+        sample.log_likelihood = row["log_likelihood"]
+        sample.accepted = bool(row["accepted"])
+        
+        return sample
+
     def _postprocessRecordToObject(self, row, options=None):
         """ Translate a record from the "postprocess" table into a PostProcess2
             object
@@ -1100,6 +1599,7 @@ class ModelSession2(object):
         self.basedir = None
         self.cmd_proto = None
         self.status = None
+        self.seed = None
 
 class ModelRun2(object):
     """ Class for representing a modeling run with a modeling session
@@ -1219,3 +1719,29 @@ class UserFitness2(object):
         self.runfitness_id = None
         self.attr = None
         self.value = None
+
+class MCMCSample2(object):
+    """ Class for representing the state of a Markov chain after a generation
+        of an MCMC calibration session
+    """
+    def __init__(self):
+        self.session_id = None
+        self.generation = None
+        self.chain = None
+        self.proposal_run_id = None
+        self.state_run_id = None
+        self.log_likelihood = None
+        self.accepted = None
+        self.run = None
+
+class RunOutputIntegrity2(object):
+    """ Class for representing the integrity record of an output file of a run,
+        recorded when the run completed
+    """
+    def __init__(self):
+        self.run_id = None
+        self.filename = None
+        self.size = None
+        self.lines = None
+        self.last_date = None
+        self.checksum = None
@@ -0,0 +1,171 @@
+"""@package rhessyscalibrator.observed
+
+@brief Observed streamflow and precipitation used to score model runs.  Observed 
+data are read once per observed file, and their aggregates (weekly and monthly 
+sums) and the observed terms of fitness metrics (see rhessyscalibrator.metrics) 
+are calculated once per period, so that scoring each run only requires 
+aggregating and comparing the arrays of its output.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+
+import numpy
+import pandas as pd
+
+from rhessyscalibrator.metrics import getObservedTerms
+
+OBS_HEADER_STREAMFLOW = 'streamflow_mm'
+OBS_HEADER_PRECIP = 'precip_mm'
+
+FITNESS_PERIODS = ['daily', 'weekly', 'monthly']
+# Pandas frequencies of fitness periods over which daily values are summed
+PERIOD_FREQUENCIES = {'weekly': 'W-SUN', 'monthly': 'M'}
+
+# Observed data read by readObservedData(), by path
+_observedData = {}
+
+
+def readObservedData(path):
+    """ Read observed data.  Observed data already read from path are re-used 
+        unless the file has since changed.
+    
+        @param path String representing the path of the observed data file
+        
+        @return ObservedData
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+    (cachedKey, obs) = _observedData.get(path, (None, None))
+    if cachedKey != key:
+        obs = ObservedData(pd.read_csv(path, index_col=0, parse_dates=True))
+        _observedData[path] = (key, obs)
+    return obs
+
+class ObservedAggregate(object):
+    """ Observed streamflow summed over a fitness period, the observed terms of 
+        fitness metrics, and the positions of the first day of each period, 
+        used to sum modeled values aligned with the observed data in the same 
+        way.
+    """
+    def __init__(self, streamflow, period):
+        """
+            @param streamflow pandas.Series of daily observed streamflow
+            @param period String, one of FITNESS_PERIODS
+        """
+        self.period = period
+        freq = PERIOD_FREQUENCIES.get(period)
+        if freq is None:
+            self.bins = None
+            self.values = streamflow.values.astype(float)
+        else:
+            self.values = streamflow.resample(freq).sum().values.astype(float)
+            periods = streamflow.index.to_period(freq).asi8
+            self.bins = numpy.flatnonzero(numpy.concatenate( ([True], periods[1:] != periods[:-1]) ))
+        self.terms = getObservedTerms(self.values)
+
+    def aggregate(self, values):
+        """ Sum daily modeled values, aligned with the observed data, over the
+            fitness period
+        
+            @param values numpy.ndarray of daily values (or of dimensions 
+                [NUM_RUNS, NUM_DAYS])
+            
+            @return numpy.ndarray of aggregated values
+        """
+        if self.bins is None:
+            return values
+        return numpy.add.reduceat(values, self.bins, axis=-1)
+
+class ObservedData(object):
+    """ Daily observed streamflow and (optionally) precipitation
+    """
+    def __init__(self, data):
+        """
+            @param data pandas.DataFrame of daily observed data, indexed by date, 
+                with column OBS_HEADER_STREAMFLOW and, if runoff ratio is needed,
+                OBS_HEADER_PRECIP
+        """
+        self.data = data
+        self.index = data.index
+        self.streamflow = data[OBS_HEADER_STREAMFLOW]
+        self._runoffRatio = None
+        self._windows = {}
+        self._aggregates = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def start(self):
+        return self.index[0]
+
+    @property
+    def end(self):
+        return self.index[-1]
+
+    @property
+    def runoffRatio(self):
+        """ Observed runoff ratio, computed when first needed as observed data 
+            used only to score streamflow need not include precipitation
+        
+            @raise KeyError if the observed data do not include OBS_HEADER_PRECIP
+        """
+        if self._runoffRatio is None:
+            self._runoffRatio = numpy.sum(self.streamflow) / numpy.sum(self.data[OBS_HEADER_PRECIP])
+        return self._runoffRatio
+
+    def getWindow(self, startdate, enddate):
+        """ @param startdate datetime representing the first date of the window
+            @param enddate datetime representing the last date of the window
+        
+            @return ObservedData of observed data from startdate to enddate 
+            (inclusive)
+        """
+        key = (startdate, enddate)
+        window = self._windows.get(key)
+        if window is None:
+            window = ObservedData(self.data[startdate:enddate])
+            self._windows[key] = window
+        return window
+
+    def getAggregate(self, period):
+        """ @param period String, one of FITNESS_PERIODS
+        
+            @return ObservedAggregate of observed streamflow over period
+        """
+        aggregate = self._aggregates.get(period)
+        if aggregate is None:
+            aggregate = ObservedAggregate(self.streamflow, period)
+            self._aggregates[period] = aggregate
+        return aggregate
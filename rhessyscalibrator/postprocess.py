@@ -42,6 +42,9 @@ import errno
 from optparse import OptionParser
 import argparse
 import logging
+import multiprocessing
+import hashlib
+import time
 # import string
 # from datetime import datetime
 # from datetime import timedelta
@@ -58,9 +61,263 @@ from mpl_toolkits.mplot3d import Axes3D
 from rhessyscalibrator.calibrator import RHESSysCalibrator
 from rhessyscalibrator.calibration_parameters import *
 from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.run_output import readBasinDaily, BasinDailyReader, getDateWindow
+from rhessyscalibrator.metrics import calculateMetrics, calculateRunoffRatio, \
+    METRIC_NSE, METRIC_NSE_LOG, METRIC_PBIAS, METRIC_RSR, METRIC_RUNOFF_RATIO, USERFITNESS_METRICS
+from rhessyscalibrator.observed import readObservedData, \
+    OBS_HEADER_STREAMFLOW, OBS_HEADER_PRECIP, FITNESS_PERIODS
 
-OBS_HEADER_STREAMFLOW = 'streamflow_mm'
-OBS_HEADER_PRECIP = 'precip_mm'
+# Status of fitness calculations for a run
+FITNESS_OK = 'ok'
+FITNESS_MISSING_OUTPUT = 'missing_output'
+FITNESS_MISALIGNED = 'misaligned'
+
+# Number of runs scored at a time (by a worker, when scoring runs in parallel)
+FITNESS_CHUNK_SIZE = 16
+
+# Post process options identifying the observed data and fitness options runs 
+#  were scored with, and when runs were last scored (seconds since the epoch)
+POSTPROC_OPT_FINGERPRINT = 'fingerprint'
+POSTPROC_OPT_SCORED_TIME = 'scored_time'
+# Post process option recording the fitness spec (see parseFitnessSpec()) of 
+#  a post process session
+POSTPROC_OPT_SPEC = 'spec'
+
+# Observed data and options used by calculateFitnessOfChunk(), set in each worker process
+_fitnessContext = None
+_fitnessReader = None
+
+def _initFitnessWorker(context):
+    global _fitnessContext, _fitnessReader
+    _fitnessContext = context
+    columns = ['streamflow', 'precip']
+    if context['add_streamflow_and_gw']:
+        columns.append('gw.Qout')
+    _fitnessReader = BasinDailyReader(columns)
+
+def getFitnessFingerprint(obs_path, period, startdate, enddate, add_streamflow_and_gw):
+    """ Fingerprint observed data and fitness options, so that runs scored later 
+        can be checked to be scored in the same way as those already scored.
+    
+        @param obs_path String representing the path of the observed data file
+        @param period String representing the period over which fitness is calculated
+        @param startdate datetime representing the date from which fitness is calculated
+        @param enddate datetime representing the date on which fitness calculations end
+        @param add_streamflow_and_gw True if streamflow and gw.Qout are added before
+            scoring
+        
+        @return String representing the SHA-1 hex digest of the observed data and options
+    """
+    sha1 = hashlib.sha1()
+    f = open(obs_path, 'rb')
+    try:
+        for block in iter(lambda: f.read(65536), ''):
+            sha1.update(block)
+    finally:
+        f.close()
+    sha1.update("period=%s;startdate=%s;enddate=%s;add_streamflow_and_gw=%s" % \
+                (period, startdate.strftime('%Y-%m-%d'), enddate.strftime('%Y-%m-%d'), 
+                 bool(add_streamflow_and_gw)) )
+    return sha1.hexdigest()
+
+def getRunsToUpdate(calibratorDB, postprocess_id, outputs):
+    """ Find runs of a post process session to score when updating it
+    
+        @param calibratorDB ModelRunnerDB2 for the session
+        @param postprocess_id Integer representing the ID of the post process 
+            session, which must have option POSTPROC_OPT_SCORED_TIME
+        @param outputs Dict<Integer, String> mapping the ID of each completed run
+            to the path of its basin daily output
+        
+        @return List of IDs of runs not yet scored in the post process session, or 
+        whose output changed since runs were last scored
+    """
+    postproc = calibratorDB.getPostProcess(postprocess_id)
+    lastScored = float(postproc.options[POSTPROC_OPT_SCORED_TIME])
+    scored = set([r.run_id for r in calibratorDB.getRunFitnessForPostProcess(postprocess_id)])
+    return sorted([runId for (runId, path) in outputs.iteritems() \
+                   if runId not in scored or not os.path.exists(path) or \
+                   os.path.getmtime(path) >= lastScored])
+
+def parseFitnessSpec(spec):
+    """ Parse a fitness spec of format START,END,PERIOD, e.g. 
+        2005-10-01,2008-09-30,monthly.  START and END may be empty.
+    
+        @param spec String representing the fitness spec
+        
+        @return Tuple (datetime, datetime, String) representing the start date 
+        (None if empty), end date (None if empty) and period (one of 
+        FITNESS_PERIODS) of the spec
+        
+        @raise ValueError if the spec is not valid
+    """
+    parts = spec.split(',')
+    if len(parts) != 3:
+        raise ValueError("Fitness spec %s is not of format START,END,PERIOD" % (spec,) )
+    dates = []
+    for part in parts[:2]:
+        part = part.strip()
+        if part:
+            try:
+                dates.append(datetime.strptime(part, '%Y-%m-%d'))
+            except ValueError:
+                raise ValueError("Date %s of fitness spec %s is not of format YYYY-MM-DD" % (part, spec) )
+        else:
+            dates.append(None)
+    period = parts[2].strip()
+    if period not in FITNESS_PERIODS:
+        raise ValueError("Period %s of fitness spec %s is not one of: %s" % \
+                         (period, spec, ', '.join(FITNESS_PERIODS)) )
+    return (dates[0], dates[1], period)
+
+def formatFitnessSpec(startdate, enddate, period):
+    """ @return String representing the fitness spec, see parseFitnessSpec()
+    """
+    return "%s,%s,%s" % (startdate.strftime('%Y-%m-%d'), enddate.strftime('%Y-%m-%d'), period)
+
+def _getMisalignment(index, window, obs):
+    """ @return String describing how modeled data in window are not aligned 
+        with observed data, or None if they are aligned
+    """
+    numValues = window.stop - window.start
+    if len(obs) != numValues:
+        return "Calibration timeseries has %d values, but modeled data has %d.\n" \
+                % ( len(obs), numValues ) + \
+                "You may have to specify an end date so that calibration and model time series align."
+    if index[window.start] != obs.start:
+        msg = "Aligned model start date {mod_st} does not equal the observed start date {obs_st}"
+        return msg.format(mod_st=index[window.start], obs_st=obs.start)
+    if index[window.stop - 1] != obs.end:
+        msg = "Aligned model end date {mod_ed} does not equal the observed end date {obs_ed}"
+        return msg.format(mod_ed=index[window.stop - 1], obs_ed=obs.end)
+    return None
+
+def readRunForFitness(task, context, reader):
+    """ Read the output of a run, aligned with observed data, and aggregated 
+        to the fitness period, of each fitness spec.  The output is read once
+        for all specs.
+    
+        @param task Tuple (Integer, String) representing the ID of the run, and 
+            the path of its basin daily output
+        @param context Dict representing observed data and options, see 
+            calculateFitnessOfRuns()
+        @param reader rhessyscalibrator.run_output.BasinDailyReader used to read 
+            the output
+        
+        @return Tuple (String, Object) representing the status (one of FITNESS_OK, 
+        FITNESS_MISSING_OUTPUT, FITNESS_MISALIGNED) and the result: a list, 
+        with one tuple of numpy.ndarray (modeled values aggregated to the 
+        fitness period, daily streamflow, daily precipitation) per fitness spec,
+        if status is FITNESS_OK, the path of the output if it is 
+        FITNESS_MISSING_OUTPUT, or an error message if it is FITNESS_MISALIGNED
+    """
+    (runId, outfile) = task
+    if not os.access(outfile, os.R_OK):
+        return (FITNESS_MISSING_OUTPUT, outfile)
+    
+    (index, mod) = reader.read(outfile)
+    specs = context['specs']
+    result = []
+    for spec in specs:
+        window = getDateWindow(index, spec['startdate'], spec['enddate'])
+        
+        # Make sure observed and modeled data are of the same extent
+        obs = spec['obs']
+        msg = _getMisalignment(index, window, obs)
+        if msg is not None:
+            if len(specs) > 1:
+                msg = "Fitness spec %s: %s" % (spec['name'], msg)
+            return (FITNESS_MISALIGNED, msg)
+        
+        streamflow = mod['streamflow'][window]
+        precip = mod['precip'][window]
+        if context['add_streamflow_and_gw']:
+            tmpResults = streamflow + mod['gw.Qout'][window]
+        else:
+            tmpResults = streamflow
+        
+        # Aggregate modeled data as needed
+        tmpResults = obs.getAggregate(spec['period']).aggregate(tmpResults)
+        result.append( (tmpResults, streamflow, precip) )
+    
+    return (FITNESS_OK, result)
+
+def calculateFitnessOfChunk(tasks):
+    """ Read the output of runs and calculate their fitness for each fitness 
+        spec, for all runs at once (see rhessyscalibrator.metrics).  Observed 
+        data and options are those passed to calculateFitnessOfRuns().
+    
+        @param tasks List of tuples (Integer, String) representing the ID of 
+            each run, and the path of its basin daily output
+        
+        @return List of tuples (Integer, String, Object) representing the ID of 
+        each run, the status (one of FITNESS_OK, FITNESS_MISSING_OUTPUT, 
+        FITNESS_MISALIGNED) and the result: a list with one Dict<String, Float>
+        per fitness spec, mapping metric names (rhessyscalibrator.metrics.RUNFITNESS_METRICS 
+        and USERFITNESS_METRICS) to values, if status is FITNESS_OK, the path of 
+        the output if it is FITNESS_MISSING_OUTPUT, or an error message if 
+        it is FITNESS_MISALIGNED
+    """
+    context = _fitnessContext
+    results = []
+    okIdx = []
+    okData = []
+    for task in tasks:
+        (status, result) = readRunForFitness(task, context, _fitnessReader)
+        if FITNESS_OK == status:
+            okIdx.append(len(results))
+            okData.append(result)
+            result = None
+        results.append( [task[0], status, result] )
+    
+    if len(okIdx) > 0:
+        fitness = [[] for idx in okIdx]
+        for (i, spec) in enumerate(context['specs']):
+            obsTs = spec['obs'].getAggregate(spec['period'])
+            sims = numpy.vstack([data[i][0] for data in okData])
+            metrics = calculateMetrics(obsTs.values, sims, obsTs.terms)
+            metrics[METRIC_RUNOFF_RATIO] = calculateRunoffRatio(numpy.vstack([data[i][1] for data in okData]), 
+                                                                numpy.vstack([data[i][2] for data in okData]))
+            for row in xrange(len(okIdx)):
+                fitness[row].append(dict([(name, float(values[row])) for (name, values) in metrics.iteritems()]))
+        for (row, idx) in enumerate(okIdx):
+            results[idx][2] = fitness[row]
+    
+    return [tuple(r) for r in results]
+
+def calculateFitnessOfRuns(tasks, context, jobs=1):
+    """ Calculate fitness of runs, FITNESS_CHUNK_SIZE runs at a time, using a 
+        pool of jobs worker processes if jobs is greater than 1.  Results are 
+        returned in the order of tasks as they become available, so that they 
+        can be stored while other runs are scored.
+    
+        @param tasks List of tuples (Integer, String) representing the ID of 
+            each run, and the path of its basin daily output
+        @param context Dict representing observed data and options: specs (list 
+            of fitness specs, each a dict of name, obs (rhessyscalibrator.observed.ObservedData 
+            of the observed data from startdate to enddate), startdate, enddate 
+            and period) and add_streamflow_and_gw
+        @param jobs Integer representing the number of worker processes
+        
+        @return Generator of tuples, see calculateFitnessOfChunk()
+    """
+    chunks = [tasks[i:i + FITNESS_CHUNK_SIZE] for i in xrange(0, len(tasks), FITNESS_CHUNK_SIZE)]
+    if jobs <= 1:
+        _initFitnessWorker(context)
+        for chunk in chunks:
+            for result in calculateFitnessOfChunk(chunk):
+                yield result
+        return
+    
+    pool = multiprocessing.Pool(jobs, _initFitnessWorker, (context,))
+    try:
+        for results in pool.imap(calculateFitnessOfChunk, chunks):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
 
 class RHESSysCalibratorPostprocess(object):
     """ Main driver class for rhessys_calibrator_postprocess tool
@@ -146,22 +403,15 @@ class RHESSysCalibratorPostprocess(object):
             list1 -- list   The first list
             list2 -- list   The second list
 
-            Returns a tuple containing the filtered lists.
+            Returns a tuple containing the filtered lists (as numpy arrays).
         """
         assert(len(list1) == len(list2))
 
-        # Maybe find a way to more efficiently allocate these
-        ret_list1 = list()
-        ret_list2 = list()
+        array1 = numpy.asarray(list1, dtype=float)
+        array2 = numpy.asarray(list2, dtype=float)
+        keep = (array1 > 0) & (array2 > 0)
 
-        idx = 0
-        for item in list1:
-            if list1[idx] > 0 and list2[idx] > 0:
-                ret_list1.append(math.log10(list1[idx]))
-                ret_list2.append(math.log10(list2[idx]))
-            idx += 1
-
-        return (ret_list1, ret_list2)
+        return (numpy.log10(array1[keep]), numpy.log10(array2[keep]))
 
     @classmethod
     def calculateNSE(cls, obs, model, obs_mean=None):
@@ -174,22 +424,31 @@ class RHESSysCalibratorPostprocess(object):
 
             Returns a float representing the NSE
         """
+        obs = numpy.asarray(obs, dtype=float)
+        model = numpy.asarray(model, dtype=float)
         if None == obs_mean:
-            obs_mean = sum(obs) / len(obs)
-
-        numerator = 0
-        denominator = 0
+            obs_mean = numpy.mean(obs)
 
-        idx = 0
-        for datum in model:
-            numerator += (obs[idx] - model[idx]) ** 2
-            denominator += (obs[idx] - obs_mean) ** 2
-            idx += 1
+        numerator = numpy.sum( (obs - model) ** 2 )
+        denominator = numpy.sum( (obs - obs_mean) ** 2 )
 
         assert(denominator != 0)
         return 1 - (numerator / denominator)
 
     
+    def _storeFitnessResults(self, calibratorDB, postprocIDs, fitnessResults, replace):
+        """ Store fitness results of runs scored so far, emptying fitnessResults
+        
+            @param calibratorDB ModelRunnerDB2 for the session
+            @param postprocIDs List of IDs of the post process session of each fitness spec
+            @param fitnessResults List of lists of fitness results (see 
+                ModelRunnerDB2.insertRunFitnessResultsBatch()), one per fitness spec
+            @param replace True if existing fitness results of the runs are to be replaced
+        """
+        for (postprocID, results) in zip(postprocIDs, fitnessResults):
+            calibratorDB.insertRunFitnessResultsBatch(postprocID, results, replace=replace)
+            del results[:]
+    
     def _storePerformanceDataForRun(self, run, data, performance):
         self.numParams = -1
         if run.param_s1:
@@ -898,6 +1157,18 @@ Run "%prog --help" for detailed description of all options
                           dest="period", choices=['daily', 'weekly', 'monthly'], default='daily',
                           help="[OPTIONAL] Period over which fitness parameters will be calculated.")
 
+        parser.add_option("--spec", action="append", type="string",
+                          dest="specs", default=[],
+                          help="[OPTIONAL] additional fitness spec, of format START,END,PERIOD (e.g. 2005-10-01,2008-09-30,monthly), for which fitness statistics will be calculated from the same read of each run's output.  START and END (YYYY-MM-DD) may be left empty to use the start and end of observed data.  Fitness statistics for each spec are stored in a separate post process session.  May be specified more than once.")
+
+        parser.add_option("-u", "--update", action="store", type="int",
+                          dest="update_postprocess_id",
+                          help="[OPTIONAL] the ID of an existing post process session of the session to update.  Only runs not yet scored in the post process session, or whose output changed since they were scored, will be scored.  The observed file and fitness options must be the same as those used to create the post process session.")
+
+        parser.add_option("-j", "--jobs", action="store", type="int",
+                          dest="jobs", default=1,
+                          help="[OPTIONAL] number of processes to use to read and score run output.  Defaults to 1.")
+
         parser.add_option("-l", "--loglevel", action="store", type="string",
                           dest="loglevel", default="OFF",
                           help="[OPTIONAL] set logging level, one of: OFF [default], DEBUG, CRITICAL (case sensitive)")
@@ -942,6 +1213,12 @@ Run "%prog --help" for detailed description of all options
         if not options.observed_file:
             parser.error("Please specify the name of the observed file to use for calculating model fitness statistics")
 
+        if options.jobs < 1:
+            parser.error("--jobs must be greater than 0")
+
+        if options.specs and options.update_postprocess_id:
+            parser.error("--spec cannot be used with --update")
+
         if not os.path.isdir(options.outdir) and os.access(options.outdir, os.W_OK):
             parser.error("Figure output directory %s must be a writable directory" % (options.outdir,) )
         outdirPath = os.path.abspath(options.outdir)
@@ -966,7 +1243,7 @@ Run "%prog --help" for detailed description of all options
         rhessysPath = RHESSysCalibrator.getRhessysPath(basedir)
 
         # Read observed data from file
-        obs_all = pd.read_csv(obsFilePath, index_col=0, parse_dates=True)
+        obs_all = readObservedData(obsFilePath)
 
         startDate = None
         endDate = None
@@ -978,7 +1255,7 @@ Run "%prog --help" for detailed description of all options
                                  0)
         else:
             # Set start data based on observed data
-            startDate = obs_all.index[0].to_datetime()
+            startDate = obs_all.start.to_datetime()
             
         if options.enddate:
             # Set end date based on command line
@@ -991,22 +1268,32 @@ Run "%prog --help" for detailed description of all options
                          (str(endDate), str(startDate) ) )
         else:
             # Set end date based on observed data
-            endDate = obs_all.index[-1].to_datetime()
+            endDate = obs_all.end.to_datetime()
         
-        obs_all = obs_all[startDate:endDate]
-        obs_streamflow = obs_all[OBS_HEADER_STREAMFLOW]
-
-        # Determine observed runoff ratio
-        obs_runoff_ratio = numpy.sum( obs_all[OBS_HEADER_STREAMFLOW] ) / \
-                           numpy.sum( obs_all[OBS_HEADER_PRECIP] )
-
-        # Aggregate observed data as needed
-        if options.period == 'weekly':
-            obsTs = obs_streamflow.resample('W-SUN', how='sum')
-        elif options.period == 'monthly':
-            obsTs = obs_streamflow.resample('M', how='sum')
-        else:
-            obsTs = obs_streamflow
+        # Fitness is calculated for each spec from one read of each run's output
+        specs = [(startDate, endDate, options.period)]
+        for spec in options.specs:
+            try:
+                (specStart, specEnd, specPeriod) = parseFitnessSpec(spec)
+            except ValueError as e:
+                parser.error(str(e))
+            specStart = specStart or obs_all.start
+            specEnd = specEnd or obs_all.end
+            if not specEnd > specStart:
+                sys.exit("End date %s of fitness spec %s is not greater than start date %s" % \
+                         (str(specEnd), spec, str(specStart)) )
+            specs.append( (specStart, specEnd, specPeriod) )
+        
+        # Observed data are aggregated once, and runs aligned with them by offset
+        fitnessSpecs = []
+        for (specStart, specEnd, specPeriod) in specs:
+            obs = obs_all.getWindow(specStart, specEnd)
+            obs.getAggregate(specPeriod)
+            fitnessSpecs.append({'name': formatFitnessSpec(specStart, specEnd, specPeriod),
+                                 'obs': obs,
+                                 'startdate': specStart,
+                                 'enddate': specEnd,
+                                 'period': specPeriod})
 
         try:
             calibratorDB = \
@@ -1026,104 +1313,102 @@ Run "%prog --help" for detailed description of all options
             self.param_proto = CalibrationParametersProto()
             self.param_proto.parseParameterString(session.cmd_proto)
                 
-            # Get runs in session
-            runs = calibratorDB.getRunsInSession(session.id)
+            # Get runs in session (excluding those rejected during screening, and
+            #  those whose outputs were pruned)
+            runs = calibratorDB.getRunsInSession(session.id,
+                                                 where_clause="%s AND %s" % \
+                                                 (ModelRunnerDB2.WHERE_NOT_SCREENED_OUT,
+                                                  ModelRunnerDB2.WHERE_NOT_PRUNED))
             self.numRuns = len(runs) 
             if self.numRuns == 0:
                 raise Exception("No runs found for session %d" 
                                 % (session.id,))
 
-            # Create postprocess entry placeholder
-            postprocID = None
-
-            runsProcessed = False
-            for run in runs:
-                if "DONE" == run.status:
-                    if postprocID is None:
-                        # Create postprocess entry to store all run fitness data in ...
-                        postprocID = calibratorDB.insertPostProcess(session.id,
-                                                                    options.observed_file,
-                                                                    options.period,
-                                                                    obs_runoff_ratio=obs_runoff_ratio)
-                        
-                    runOutput = os.path.join(rhessysPath, run.output_path)
-                    self.logger.debug(">>>\nOutput dir of run %d is %s" %
-                                         (run.id, runOutput))
-                    tmpOutfile = \
-                        RHESSysCalibrator.getRunOutputFilePath(runOutput)
-                    if not os.access(tmpOutfile, os.R_OK):
-                        print "Output file %s for run %d not found or not readable, unable to calculate fitness statistics for this run" % (tmpOutfile, run.id)
-                        continue
-                    
-                    mod = pd.read_csv(tmpOutfile, sep=' ', 
-                                      parse_dates={'date':[2,1,0]}, 
-                                      index_col=0)
-                    mod = mod[startDate:endDate]
-                    
-                    if options.add_streamflow_and_gw:
-                        tmpResults = mod['streamflow'] + mod['gw.Qout']                                  
-                    else:
-                        tmpResults = mod['streamflow']
-                      
-                    # Make sure observed and modeled data are of the same extent
-                    # Don't use panda's alignment as this doesn't work correctly in some versions
-                    if len(obs_all) != len(tmpResults):
-                        sys.exit("Calibration timeseries has %d values, but modeled data has %d.\n" \
-                                 % ( len(obs_all), len(tmpResults) ) +
-                                 "You may have to specify an end date so that calibration and model time series align.")
-                    if mod.index[0] != obs_all.index[0]:
-                        msg = "Aligned model start date {mod_st} does not equal the observed start date {obs_st}"
-                        sys.exit(msg.format(mod_st=mod.index[0],
-                                            obs_st=obs_all.index[0]))
-                    if mod.index[-1] != obs_all.index[-1]:
-                        msg = "Aligned model end date {mod_ed} does not equal the observed end date {obs_ed}"
-                        sys.exit(msg.format(mod_ed=mod.index[-1],
-                                            obs_ed=obs_all.index[-1]))
-                    
-                    runoff_ratio = numpy.sum( mod['streamflow'] ) / \
-                                   numpy.sum( mod['precip'])
-                    
-                    # Aggregate modeled data as needed
-                    if options.period == 'weekly':
-                        modelTs = tmpResults.resample('W-SUN', how='sum')
-                    elif options.period == 'monthly':
-                        modelTs = tmpResults.resample('M', how='sum')
-                    else:
-                        modelTs = tmpResults
-                        
-                    my_obs_data = obsTs
-                    tmpResults = modelTs
-                                       
-                    # Calculate NSE
-                    my_nse = \
-                        RHESSysCalibratorPostprocess.calculateNSE(my_obs_data,
-                                                                  tmpResults)
-                    # Calculate NSE-log
-                    # 1. Log-transform model data
-                    (my_log_obs_data, log_tmpResults) = \
-                        RHESSysCalibratorPostprocess.logTransform(my_obs_data,
-                                                                  tmpResults)
-                    # 2. NSE
-                    my_nse_log = \
-                        RHESSysCalibratorPostprocess.calculateNSE(my_log_obs_data, 
-                                                                  log_tmpResults)
-
-                    self.logger.debug("run %s, NSE: %s, NSE-log: %s\n>>>" %
-                                      (run.id, my_nse, my_nse_log))
-                    
-                    # Store fitness parameters for this run
-                    calibratorDB.insertRunFitnessResults(postprocID,
-                                                         run.id,
-                                                         nse=my_nse,
-                                                         nse_log=my_nse_log,
-                                                         runoff_ratio=runoff_ratio)
-                    
-                    # Store performance parameters for this run so we can plot later
+            # Score runs that are DONE, in parallel if requested
+            doneRuns = dict([(run.id, run) for run in runs if "DONE" == run.status])
+            outputs = dict([(runId, RHESSysCalibrator.getRunOutputFilePath(os.path.join(rhessysPath, doneRuns[runId].output_path))) \
+                            for runId in doneRuns.keys()])
+            fingerprints = [getFitnessFingerprint(obsFilePath, spec['period'], spec['startdate'], 
+                                                  spec['enddate'], options.add_streamflow_and_gw) \
+                            for spec in fitnessSpecs]
+            scoredTime = time.time()
+            postprocIDs = []
+            if options.update_postprocess_id:
+                postprocID = options.update_postprocess_id
+                postproc = calibratorDB.getPostProcess(postprocID)
+                if postproc is None or postproc.session_id != session.id:
+                    sys.exit("Post process session %d of session %d was not found" % (postprocID, session.id))
+                if POSTPROC_OPT_FINGERPRINT not in postproc.options or \
+                   POSTPROC_OPT_SCORED_TIME not in postproc.options:
+                    sys.exit("Post process session %d was created without a fingerprint of its observed data and fitness options, and cannot be updated" % \
+                             (postprocID,) )
+                if postproc.options[POSTPROC_OPT_FINGERPRINT] != fingerprints[0]:
+                    sys.exit("Observed data or fitness options differ from those used to create post process session %d" % \
+                             (postprocID,) )
+                # Only score runs not yet scored, or whose output changed since they were scored
+                doneRuns = dict([(runId, doneRuns[runId]) for runId in \
+                                 getRunsToUpdate(calibratorDB, postprocID, outputs)])
+                print("Scoring {0} new or changed runs in post-process session {1}".format(len(doneRuns), postprocID))
+                postprocIDs.append(postprocID)
+            elif len(doneRuns) > 0:
+                # Create postprocess entries to store all run fitness data of each spec in ...
+                for (spec, fingerprint) in zip(fitnessSpecs, fingerprints):
+                    postprocIDs.append(calibratorDB.insertPostProcess(session.id,
+                                                                      options.observed_file,
+                                                                      spec['period'],
+                                                                      obs_runoff_ratio=spec['obs'].runoffRatio,
+                                                                      options={POSTPROC_OPT_FINGERPRINT: fingerprint,
+                                                                               POSTPROC_OPT_SPEC: spec['name']}))
+            postprocID = postprocIDs[0] if postprocIDs else None
+            tasks = [(runId, outputs[runId]) for runId in sorted(doneRuns.keys())]
+            context = {'specs': fitnessSpecs,
+                       'add_streamflow_and_gw': options.add_streamflow_and_gw}
+
+            replace = bool(options.update_postprocess_id)
+            fitnessResults = [[] for spec in fitnessSpecs]
+            numScored = 0
+            for (runId, status, specResults) in calculateFitnessOfRuns(tasks, context, options.jobs):
+                run = doneRuns[runId]
+                if FITNESS_MISSING_OUTPUT == status:
+                    print "Output file %s for run %d not found or not readable, unable to calculate fitness statistics for this run" % (specResults, run.id)
+                    continue
+                elif FITNESS_MISALIGNED == status:
+                    # Keep fitness results of runs already scored
+                    self._storeFitnessResults(calibratorDB, postprocIDs, fitnessResults, replace)
+                    sys.exit(specResults)
+                
+                # Fitness parameters for this run are stored with those of all runs
+                for (results, result) in zip(fitnessResults, specResults):
+                    results.append( (run.id, result[METRIC_NSE], result[METRIC_NSE_LOG], result[METRIC_PBIAS],
+                                     result[METRIC_RSR], result[METRIC_RUNOFF_RATIO],
+                                     dict([(m, result[m]) for m in USERFITNESS_METRICS])) )
+                numScored += 1
+                if len(fitnessResults[0]) >= ModelRunnerDB2.FITNESS_BATCH_CHECKPOINT:
+                    self._storeFitnessResults(calibratorDB, postprocIDs, fitnessResults, replace)
+                
+                result = specResults[0]
+                my_nse = result[METRIC_NSE]
+                my_nse_log = result[METRIC_NSE_LOG]
+
+                self.logger.debug("run %s, NSE: %s, NSE-log: %s\n>>>" %
+                                  (run.id, my_nse, my_nse_log))
+                
+                # Store performance parameters for this run so we can plot later
+                if not options.update_postprocess_id:
                     self.recordPlotDataForRun(run, my_nse, my_nse_log)
-                    
-                    runsProcessed = True
 
-            if runsProcessed:
+            self._storeFitnessResults(calibratorDB, postprocIDs, fitnessResults, replace)
+            for specPostprocID in postprocIDs:
+                calibratorDB.setPostProcessOptions(specPostprocID, {POSTPROC_OPT_SCORED_TIME: repr(scoredTime)})
+
+            if numScored > 0:
+                if options.update_postprocess_id:
+                    # Plot all runs in the post process session
+                    scoredRuns = calibratorDB.getRunsInPostProcess(postprocID)
+                    self.numRuns = len(scoredRuns)
+                    for run in scoredRuns:
+                        self.recordPlotDataForRun(run, run.run_fitness.nse, run.run_fitness.nse_log)
+                
                 # Generate and save dotty plot
                 dottyFilename = "dotty_plots_SESSION_%s_POSTPROCESS_%s_%s" % ( options.session_id, postprocID, options.period )
                 self.saveDottyPlot(outdirPath, dottyFilename, format='PDF', 
@@ -1136,6 +1421,8 @@ Run "%prog --help" for detailed description of all options
                                             sizeX=options.figureX, sizeY=options.figureY, dpi=options.figureDPI)
                 
                 print("\n\nFitness results saved to post-process session: {0}".format(postprocID))
+                for (spec, specPostprocID) in zip(fitnessSpecs[1:], postprocIDs[1:]):
+                    print("Fitness results for spec {0} saved to post-process session: {1}".format(spec['name'], specPostprocID))
         except:
             raise
         else:
@@ -44,15 +44,13 @@ import math
 import numpy as np
 import pandas as pd
 from scipy import stats
-import statsmodels.api as sm
 import matplotlib
 matplotlib.use('Agg') # Allow for running on machines without X servers
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 
-from rhessysworkflows.rhessys import RHESSysOutput
-
 from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.run_output import readBasinDaily
 from rhessyscalibrator import postprocess
 from rhessyscalibrator.model_runner_db2 import *
 
@@ -340,6 +338,19 @@ class RHESSysCalibratorPostprocessBehavioral(object):
         self.logger.addHandler(consoleHandler)
         
         
+    def getBehavioralWhereClause(self, behavioral_filter):
+        """ Get the where clause selecting behavioral runs whose outputs have not
+            been pruned
+        
+            @param behavioral_filter String representing the SQLite3 where clause
+                selecting behavioral runs, or None
+            
+            @return String representing the where clause
+        """
+        if behavioral_filter:
+            return "(%s) AND %s" % (behavioral_filter, ModelRunnerDB2.WHERE_FITNESS_NOT_PRUNED)
+        return ModelRunnerDB2.WHERE_FITNESS_NOT_PRUNED
+        
     def readBehavioralData(self, basedir, postprocess_id, variable='streamflow',
                            observed_file=None, behavioral_filter=None, end_date=None):
         
@@ -387,7 +398,8 @@ class RHESSysCalibratorPostprocessBehavioral(object):
         self.logger.debug("Obs path: %s" % obsFilePath)
         
         # Get runs in session
-        runs = calibratorDB.getRunsInPostProcess(postprocess_id, where_clause=behavioral_filter)
+        runs = calibratorDB.getRunsInPostProcess(postprocess_id, 
+                                                 where_clause=self.getBehavioralWhereClause(behavioral_filter))
         numRuns = len(runs) 
         if numRuns == 0:
             raise Exception("No runs found for post process session %d, calibration session %d" 
@@ -422,12 +434,7 @@ class RHESSysCalibratorPostprocessBehavioral(object):
                     print "Output file %s for run %d not found or not readable, unable to calculate fitness statistics for this run" % (tmpOutfile, run.id)
                     continue
                 
-                tmpFile = open(tmpOutfile, 'r')
-                 
-                (tmp_datetime, tmp_data) = \
-                        RHESSysOutput.readColumnFromFile(tmpFile,
-                                                         "streamflow", startHour=0)
-                tmp_mod = pd.Series(tmp_data, index=tmp_datetime)
+                tmp_mod = readBasinDaily(tmpOutfile)['streamflow']
                 # Align timeseries to observed
                 (mod, obs) = tmp_mod.align(obs, join='inner')
                                  
@@ -445,8 +452,6 @@ class RHESSysCalibratorPostprocessBehavioral(object):
                 
                 # Store fitness parameter
                 likelihood[i] = run.run_fitness.nse
-                        
-                tmpFile.close()                
                 runsProcessed = True
         
         return (runsProcessed, obs, x, ysim, likelihood)
@@ -499,7 +504,8 @@ class RHESSysCalibratorPostprocessBehavioral(object):
         self.logger.debug("Obs path: %s" % obsFilePath)
         
         # Get runs in session
-        runs = calibratorDB.getRunsInPostProcess(postprocess_id, where_clause=behavioral_filter)
+        runs = calibratorDB.getRunsInPostProcess(postprocess_id, 
+                                                 where_clause=self.getBehavioralWhereClause(behavioral_filter))
         numRuns = len(runs) 
         if numRuns == 0:
             raise Exception("No runs found for post process session %d, calibration session %d" 
@@ -536,8 +542,7 @@ class RHESSysCalibratorPostprocessBehavioral(object):
                     print "Output file %s for run %d not found or not readable, unable to calculate fitness statistics for this run" % (tmpOutfile, run.id)
                     continue
                 
-                tmpFile = open(tmpOutfile, 'r')
-                tmp_data = RHESSysOutput.readColumnsFromFile(tmpFile, cols)
+                tmp_data = readBasinDaily(tmpOutfile)[cols]
                 # Align timeseries to observed
                 (mod_align, obs_align) = tmp_data.align(obs_day, axis=0, join='inner')
                                  
@@ -553,8 +558,6 @@ class RHESSysCalibratorPostprocessBehavioral(object):
                 
                 # Store fitness parameter
                 likelihood[i] = run.run_fitness.nse
-                        
-                tmpFile.close()                
                 runsProcessed = True
         
         return (runsProcessed, obs_align, x, sim, likelihood)
@@ -0,0 +1,253 @@
+"""@package rhessyscalibrator.project_import
+
+@brief Import of RHESSysWorkflows projects into RHESSysCalibrator projects 
+(see bin/rw2rc.py).  Read-only model inputs can be hard linked, reflinked
+(copy-on-write) or symbolically linked rather than copied, and the imported
+project is checked for the inputs the calibrator needs.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import errno
+import shutil
+from multiprocessing.pool import ThreadPool
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.staging import readReferences, isHeaderReference, isClimatePrefix, \
+    getClimateFiles, HEADER_SUFFIX, BASE_STATION_KEY
+
+IMPORT_COPY = 'copy'
+IMPORT_HARDLINK = 'hardlink'
+IMPORT_REFLINK = 'reflink'
+IMPORT_SYMLINK = 'symlink'
+IMPORT_MODES = [IMPORT_COPY, IMPORT_HARDLINK, IMPORT_REFLINK, IMPORT_SYMLINK]
+
+DEFAULT_JOBS = 4
+
+RHESSYS_BINARY = 'rhessys5.18.r2'
+WORLDFILE = 'world'
+
+# Linux ioctl to clone the extents of one file into another (copy-on-write)
+FICLONE = 0x40049409
+
+
+def copyFile(src, dest):
+    shutil.copy2(src, dest)
+
+def reflinkFile(src, dest):
+    """ Create dest as a copy-on-write clone of src
+    
+        @raise IOError or OSError if the filesystem of dest does not support 
+        cloning from src
+    """
+    import fcntl
+    srcFile = open(src, 'rb')
+    try:
+        destFile = open(dest, 'wb')
+        try:
+            fcntl.ioctl(destFile.fileno(), FICLONE, srcFile.fileno())
+        finally:
+            destFile.close()
+    except (IOError, OSError):
+        if os.path.exists(dest):
+            os.unlink(dest)
+        raise
+    finally:
+        srcFile.close()
+    shutil.copystat(src, dest)
+
+def importFile(src, dest, mode=IMPORT_COPY):
+    """ Import a file into a calibration project.  If the file cannot be
+        linked (e.g. because src and dest are on different filesystems, or
+        the filesystem does not support reflinks), it will be copied.
+    
+        @param src String representing the path of the file to import
+        @param dest String representing the path to import the file to; 
+            an existing file at dest will be replaced
+        @param mode String, one of IMPORT_MODES
+        
+        @return String representing the mode the file was imported with
+    """
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    try:
+        if IMPORT_HARDLINK == mode:
+            os.link(src, dest)
+            return mode
+        elif IMPORT_REFLINK == mode:
+            reflinkFile(src, dest)
+            return mode
+        elif IMPORT_SYMLINK == mode:
+            os.symlink(os.path.abspath(src), dest)
+            return mode
+    except (IOError, OSError) as e:
+        if e.errno in (errno.ENOENT, errno.EACCES):
+            raise
+    copyFile(src, dest)
+    return IMPORT_COPY
+
+def importFiles(files, mode=IMPORT_COPY, jobs=DEFAULT_JOBS):
+    """ Import files into a calibration project, importing up to jobs 
+        files at the same time
+    
+        @param files List of tuples (src, dest) of paths of files to import
+        @param mode String, one of IMPORT_MODES
+        @param jobs Integer representing the number of files to import at the 
+            same time
+        
+        @return Dict<String, Integer> representing the number of files
+        imported with each mode
+    """
+    pool = ThreadPool(max(1, jobs))
+    try:
+        modes = pool.map(lambda f: importFile(f[0], f[1], mode), files)
+    finally:
+        pool.close()
+        pool.join()
+    counts = {}
+    for m in modes:
+        counts[m] = counts.get(m, 0) + 1
+    return counts
+
+def listFiles(src_dir, dest_dir):
+    """ @return List of tuples (src, dest) of paths of files in src_dir, and 
+        the paths they are to be imported to in dest_dir
+    """
+    return [(os.path.join(src_dir, f), os.path.join(dest_dir, f)) \
+            for f in sorted(os.listdir(src_dir)) if os.path.isfile(os.path.join(src_dir, f))]
+
+def getProjectFiles(src, dest):
+    """ Get the files of a RHESSysWorkflows project to be imported into a 
+        calibration project.  Source code is not included as it is built 
+        in place, see importProject().
+    
+        @param src String representing the RHESSysWorkflows project directory
+        @param dest String representing the calibration project directory ($BASEDIR)
+        
+        @return List of tuples (src, dest) of paths of files to import
+    """
+    srcRhessys = os.path.join(src, 'rhessys')
+    destRhessys = os.path.join(dest, 'rhessys')
+    files = [(os.path.join(srcRhessys, 'bin', RHESSYS_BINARY),
+              os.path.join(destRhessys, 'bin', RHESSYS_BINARY))]
+    files.extend(listFiles(os.path.join(srcRhessys, 'clim'), os.path.join(destRhessys, 'clim')))
+    files.extend(listFiles(os.path.join(srcRhessys, 'defs'), os.path.join(destRhessys, 'defs')))
+    files.append( (os.path.join(srcRhessys, 'flow', WORLDFILE + '.flow'),
+                   os.path.join(destRhessys, 'flow', WORLDFILE + '_flow_table.dat')) )
+    files.append( (os.path.join(srcRhessys, 'tecfiles', 'tec_daily.txt'),
+                   os.path.join(destRhessys, 'tecfiles', 'active', 'tec_daily.txt')) )
+    files.append( (os.path.join(srcRhessys, 'templates', 'template'),
+                   os.path.join(destRhessys, 'templates', 'template')) )
+    for f in [WORLDFILE + HEADER_SUFFIX, WORLDFILE]:
+        files.append( (os.path.join(srcRhessys, 'worldfiles', f),
+                       os.path.join(destRhessys, 'worldfiles', 'active', f)) )
+    return files
+
+def importProject(src, dest, mode=IMPORT_COPY, jobs=DEFAULT_JOBS):
+    """ Import a RHESSysWorkflows project into a calibration project.
+        Model inputs are imported using mode; source code is always copied.
+    
+        @param src String representing the RHESSysWorkflows project directory
+        @param dest String representing the calibration project directory ($BASEDIR)
+        @param mode String, one of IMPORT_MODES
+        @param jobs Integer representing the number of files to import at the 
+            same time
+        
+        @return Tuple (List<(String, String)>, Dict<String, Integer>) representing
+        the files imported, and the number of files imported with each mode
+    """
+    files = getProjectFiles(src, dest)
+    for (s, d) in files:
+        if not os.path.isfile(s):
+            raise Exception("RHESSysWorkflows project file %s not found" % (s,) )
+        if not os.path.isdir(os.path.dirname(d)):
+            os.makedirs(os.path.dirname(d))
+    counts = importFiles(files, mode, jobs)
+    
+    destSrcDir = os.path.join(dest, 'rhessys', 'src')
+    if os.path.isdir(destSrcDir):
+        shutil.rmtree(destSrcDir)
+    shutil.copytree(os.path.join(src, 'rhessys', 'src'), destSrcDir)
+    
+    return (files, counts)
+
+def verifyProject(basedir, files=None):
+    """ Check that a calibration project has the inputs the calibrator needs: 
+        an executable RHESSys binary, a TEC file, and worldfiles with flow 
+        tables and with the def, base station and climate files their headers
+        reference.
+    
+        @param basedir String representing the calibration project directory ($BASEDIR)
+        @param files List of tuples (src, dest) of paths of imported files, 
+            whose sizes are to be compared, or None
+        
+        @return List of strings describing problems found; empty if there 
+        were none
+    """
+    problems = []
+    calibrator = RHESSysCalibrator()
+    rhessysPath = RHESSysCalibrator.getRhessysPath(basedir)
+    
+    if files:
+        for (src, dest) in files:
+            if not os.path.isfile(dest):
+                problems.append("%s was not imported" % (dest,) )
+            elif os.path.getsize(src) != os.path.getsize(dest):
+                problems.append("%s is %d bytes, %s is %d bytes" % \
+                                (dest, os.path.getsize(dest), src, os.path.getsize(src)) )
+    
+    if not calibrator.getRHESSysExecPath(basedir)[0]:
+        problems.append("No executable RHESSys binary in %s" % (os.path.join(rhessysPath, 'bin'),) )
+    if not calibrator.getTecfilePath(basedir)[0]:
+        problems.append("No TEC file in %s" % (os.path.join(rhessysPath, 'tecfiles', 'active'),) )
+    
+    worldfiles = calibrator.getWorldfiles(basedir)
+    if len(worldfiles) == 0:
+        problems.append("No worldfiles in %s" % (os.path.join(rhessysPath, 'worldfiles', 'active'),) )
+    (flowTablesOK, flowtablePath, surfaceFlowtablePath, withoutFlowTables, withoutSurface) = \
+        calibrator.verifyFlowTables(basedir, worldfiles.keys())
+    for worldfile in withoutFlowTables:
+        problems.append("No flow table for worldfile %s" % (worldfile,) )
+    
+    for worldfile in sorted(worldfiles.values()):
+        header = worldfile + HEADER_SUFFIX
+        if not os.path.isfile(os.path.join(rhessysPath, header)):
+            problems.append("No header for worldfile %s" % (worldfile,) )
+            continue
+        for (key, ref) in readReferences(os.path.join(rhessysPath, header), isHeaderReference):
+            if not os.path.isfile(os.path.join(rhessysPath, ref)):
+                problems.append("%s referenced by %s not found" % (ref, header) )
+            elif key == BASE_STATION_KEY:
+                for (k, prefix) in readReferences(os.path.join(rhessysPath, ref), isClimatePrefix):
+                    if len(getClimateFiles(rhessysPath, prefix)) == 0:
+                        problems.append("No climate files %s.* referenced by %s" % (prefix, ref) )
+    return problems
@@ -0,0 +1,251 @@
+"""@package rhessyscalibrator.prune
+
+@brief Retention policy for run outputs: delete, or compress into an archive,
+the outputs of runs that are not behavioral according to a post process 
+session, and mark the runs as pruned so that postprocessing tools skip them.
+Files needed to reproduce a run (its command and parameters) are kept in the
+calibration database; command and job script files in the output directory 
+of each run are also kept.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import sys
+import argparse
+import tarfile
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.disk_space import getFileSize, formatGB
+
+PRUNE_METHODS = [ModelRunnerDB2.PRUNED_DELETED, ModelRunnerDB2.PRUNED_ARCHIVED]
+# Files in the output directory of a run that are kept when the run is pruned
+PRUNE_KEEP_FILES = ['cmd.txt', 'pbs.script', 'slurm.script']
+PRUNE_ARCHIVE_NAME = 'pruned_outputs.tar.gz'
+DEFAULT_BEHAVIORAL_FILTER = "nse>0.5 AND nse_log>0.5"
+# Number of runs to prune between updates of the DB
+MARK_BATCH_SIZE = 1000
+
+
+def getPrunableFiles(output_dir):
+    """ @param output_dir String representing the output directory of a run
+    
+        @return List of strings representing the paths, relative to output_dir, 
+        of files to be pruned
+    """
+    prunable = []
+    for (root, dirs, files) in os.walk(output_dir):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), output_dir)
+            if path in PRUNE_KEEP_FILES or path == PRUNE_ARCHIVE_NAME:
+                continue
+            prunable.append(path)
+    prunable.sort()
+    return prunable
+
+def archiveFiles(output_dir, files):
+    """ Compress files into an archive in output_dir.  The archive is verified
+        to contain each file before being moved into place.
+    
+        @param output_dir String representing the output directory of a run
+        @param files List of strings representing paths relative to output_dir
+        
+        @return String representing the path of the archive
+        
+        @raise IOError if the archive cannot be verified
+    """
+    archivePath = os.path.join(output_dir, PRUNE_ARCHIVE_NAME)
+    tmp = archivePath + '.part'
+    try:
+        tar = tarfile.open(tmp, 'w:gz')
+        try:
+            for path in files:
+                tar.add(os.path.join(output_dir, path), arcname=path)
+        finally:
+            tar.close()
+        tar = tarfile.open(tmp, 'r:gz')
+        try:
+            members = dict([(m.name, m.size) for m in tar.getmembers()])
+        finally:
+            tar.close()
+        for path in files:
+            if members.get(path) != os.path.getsize(os.path.join(output_dir, path)):
+                raise IOError("Archive of %s does not match original" % (os.path.join(output_dir, path),) )
+        os.rename(tmp, archivePath)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return archivePath
+
+def removeEmptyDirs(output_dir):
+    """ Remove empty directories under output_dir (output_dir is not removed)
+    """
+    for (root, dirs, files) in os.walk(output_dir, topdown=False):
+        if root != output_dir and len(os.listdir(root)) == 0:
+            os.rmdir(root)
+
+def pruneRunOutput(output_dir, method, dry_run=False):
+    """ Prune the output of a run
+    
+        @param output_dir String representing the output directory of the run
+        @param method String, one of PRUNE_METHODS
+        @param dry_run Boolean indicating that files should not be removed
+        
+        @return Integer representing the number of bytes reclaimed.  For dry runs,
+        this is the number of bytes used by files that would be pruned (archived
+        files will use less space once compressed).
+    """
+    if not os.path.isdir(output_dir):
+        return 0
+    files = getPrunableFiles(output_dir)
+    if len(files) == 0:
+        return 0
+    size = sum([getFileSize(os.path.join(output_dir, path)) for path in files])
+    if dry_run:
+        return size
+    
+    if ModelRunnerDB2.PRUNED_ARCHIVED == method:
+        archivePath = archiveFiles(output_dir, files)
+        size -= getFileSize(archivePath)
+    for path in files:
+        os.unlink(os.path.join(output_dir, path))
+    removeEmptyDirs(output_dir)
+    return size
+
+def getNonBehavioralRuns(calibratorDB, postprocess_id, behavioral_filter):
+    """ Get runs of a post process session that are not behavioral and have
+        not been pruned
+    
+        @param calibratorDB ModelRunnerDB2 of the calibration project
+        @param postprocess_id Integer representing the post process session
+        @param behavioral_filter String representing the SQLite3 where clause
+            selecting behavioral runs
+        
+        @return List of ModelRun2 objects
+    """
+    behavioral = set([r.id for r in calibratorDB.getRunsInPostProcess(postprocess_id, 
+                                                                      where_clause=behavioral_filter)])
+    runs = calibratorDB.getRunsInPostProcess(postprocess_id, 
+                                             where_clause=ModelRunnerDB2.WHERE_FITNESS_NOT_PRUNED)
+    return [r for r in runs if r.id not in behavioral]
+
+def pruneRuns(calibratorDB, rhessys_path, runs, method, dry_run=False):
+    """ Prune the outputs of runs, marking them as pruned in the DB
+    
+        @param calibratorDB ModelRunnerDB2 of the calibration project
+        @param rhessys_path String representing the path of $BASEDIR/rhessys
+        @param runs List of ModelRun2 objects representing runs to prune
+        @param method String, one of PRUNE_METHODS
+        @param dry_run Boolean indicating that outputs should not be pruned, or
+            runs marked
+        
+        @return Integer representing the number of bytes reclaimed
+    """
+    reclaimed = 0
+    pruned = []
+    for run in runs:
+        reclaimed += pruneRunOutput(os.path.join(rhessys_path, run.output_path),
+                                    method, dry_run)
+        if dry_run:
+            continue
+        pruned.append(run.id)
+        if len(pruned) >= MARK_BATCH_SIZE:
+            calibratorDB.setRunsOption(pruned, ModelRunnerDB2.RUN_OPT_PRUNED, method)
+            pruned = []
+    if len(pruned) > 0:
+        calibratorDB.setRunsOption(pruned, ModelRunnerDB2.RUN_OPT_PRUNED, method)
+    return reclaimed
+
+
+class RHESSysCalibratorPrune(object):
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for deleting or archiving the outputs of non-behavioral runs of a post process session")
+        parser.add_argument("-b", "--basedir", action="store", 
+                            dest="basedir", required=True,
+                            help="Base directory for the calibration session")
+        parser.add_argument("-s", "--postprocess_session", action="store", type=int,
+                            dest="postprocess_id", required=True,
+                            help="Post-process session whose fitness results determine which runs are behavioral")
+        parser.add_argument("-f", "--behavioral_filter", action="store",
+                            dest="behavioral_filter", default=DEFAULT_BEHAVIORAL_FILTER,
+                            help="SQLite where clause selecting behavioral runs, whose outputs are kept.  Defaults to '%s'." % (DEFAULT_BEHAVIORAL_FILTER,) )
+        parser.add_argument("--method", action="store",
+                            dest="method", default=ModelRunnerDB2.PRUNED_ARCHIVED, choices=PRUNE_METHODS,
+                            help="Delete outputs of non-behavioral runs, or compress them into an archive (%s) in the output directory of each run.  Defaults to %s." % \
+                                (PRUNE_ARCHIVE_NAME, ModelRunnerDB2.PRUNED_ARCHIVED) )
+        parser.add_argument("--dry_run", action="store_true", default=False,
+                            help="Report the runs that would be pruned and the space used by their outputs, without pruning them")
+        parser.add_argument("-y", "--yes", action="store_true", default=False,
+                            help="Do not ask for confirmation before pruning")
+        
+        options = parser.parse_args(args[1:])
+        
+        rhessysPath = RHESSysCalibrator.getRhessysPath(options.basedir)
+        if not os.access(rhessysPath, os.W_OK):
+            sys.exit("Unable to write to directory %s" % (rhessysPath,) )
+        
+        try:
+            calibratorDB = \
+                ModelRunnerDB2(RHESSysCalibrator.getDBPath(
+                    options.basedir))
+            postproc = calibratorDB.getPostProcess(options.postprocess_id)
+            if postproc is None:
+                sys.exit("Post-process session %d was not found" % (options.postprocess_id,) )
+            
+            runs = getNonBehavioralRuns(calibratorDB, options.postprocess_id, options.behavioral_filter)
+            if len(runs) == 0:
+                print("No non-behavioral runs to prune in post-process session %d" % (options.postprocess_id,) )
+                return 0
+            
+            if options.dry_run:
+                size = pruneRuns(calibratorDB, rhessysPath, runs, options.method, dry_run=True)
+                print("%d non-behavioral runs of post-process session %d would be pruned (%s), reclaiming up to %s" % \
+                      (len(runs), options.postprocess_id, options.method, formatGB(size)) )
+                return 0
+            
+            if not options.yes:
+                response = raw_input("Prune (%s) outputs of %d non-behavioral runs of post-process session %d in basedir '%s', continue? [yes | no] " % \
+                                     (options.method, len(runs), options.postprocess_id, os.path.basename(options.basedir)) )
+                response = response.lower()
+                if response != 'y' and response != 'yes':
+                    # Exit normally
+                    return 0
+            
+            size = pruneRuns(calibratorDB, rhessysPath, runs, options.method)
+            print("Pruned (%s) outputs of %d non-behavioral runs, reclaiming %s" % \
+                  (options.method, len(runs), formatGB(size)) )
+        finally:
+            calibratorDB = None
+        
+        return 0
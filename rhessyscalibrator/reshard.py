@@ -0,0 +1,195 @@
+"""@package rhessyscalibrator.reshard
+
+@brief Move the run output directories of existing calibration sessions to a 
+different output layout (e.g. from the flat layout, where all run output 
+directories are stored in $BASEDIR/rhessys/output, to the sharded layout), 
+updating the output path and command of each run.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import sys
+import re
+import argparse
+import errno
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator, OUTPUT_LAYOUTS, \
+    OUTPUT_LAYOUT_FLAT, OUTPUT_LAYOUT_SHARDED, SESSION_OPT_OUTPUT_LAYOUT
+from rhessyscalibrator.model_runner_db2 import *
+
+# Matches the name of a run output directory, e.g. SESSION_1_world_ITR_1234
+RUN_DIR_REGEX = re.compile("^SESSION_(\d+)_(.+)_ITR_(\d+)$")
+
+
+def getReshardedOutputPath(output_path, layout):
+    """ Get the output path of a run in a given layout
+    
+        @param output_path String representing the output path of the run, 
+            relative to $BASEDIR/rhessys
+        @param layout String, one of calibrator.OUTPUT_LAYOUTS
+        
+        @return String representing the output path of the run in layout, or None
+        if output_path is not the output path of a calibration run
+    """
+    m = RUN_DIR_REGEX.match(os.path.basename(output_path.rstrip(os.sep)))
+    if m is None:
+        return None
+    return RHESSysCalibrator.getRunOutputPath(int(m.group(1)), m.group(2), 
+                                              int(m.group(3)), layout)
+
+def reshardSession(calibratorDB, rhessys_path, session_id, layout, dry_run=False):
+    """ Move the output directories of the runs of a session to a given layout.
+        Each output directory is moved before the run is updated in the DB, so 
+        an interrupted migration can be completed by running it again.
+    
+        @param calibratorDB ModelRunnerDB2 of the calibration project
+        @param rhessys_path String representing the path of $BASEDIR/rhessys
+        @param session_id Integer representing the session whose runs are to be moved
+        @param layout String, one of calibrator.OUTPUT_LAYOUTS
+        @param dry_run Boolean indicating that runs should not be moved
+        
+        @return List of tuples (ModelRun2, String) representing each run moved
+        and its new output path
+        
+        @raise Exception if the output path of a run is already in use
+    """
+    moved = []
+    emptied = set()
+    for run in calibratorDB.getRunsInSession(session_id):
+        newPath = getReshardedOutputPath(run.output_path, layout)
+        if newPath is None:
+            sys.stderr.write("WARNING: unable to determine new output path of run %d with output path %s, skipping\n" % \
+                             (run.id, run.output_path) )
+            continue
+        if newPath == run.output_path:
+            continue
+        moved.append((run, newPath))
+        if dry_run:
+            continue
+        
+        src = os.path.join(rhessys_path, run.output_path)
+        dest = os.path.join(rhessys_path, newPath)
+        emptied.add(os.path.dirname(src))
+        if os.path.exists(src):
+            if os.path.exists(dest):
+                raise Exception("Unable to move output of run %d from %s to %s, destination already exists" % \
+                                (run.id, src, dest) )
+            try:
+                os.makedirs(os.path.dirname(dest))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise e
+            os.rename(src, dest)
+        # Else: output was already moved by an interrupted migration, or
+        #  the run has not yet written output
+        
+        cmd_raw = run.cmd_raw.replace(os.path.join(run.output_path, "rhessys"),
+                                      os.path.join(newPath, "rhessys"))
+        calibratorDB.updateRunOutputPath(run.id, newPath, cmd_raw)
+    
+    if not dry_run:
+        calibratorDB.setSessionOptions(session_id, {SESSION_OPT_OUTPUT_LAYOUT: layout})
+        removeEmptyShardDirs(os.path.join(rhessys_path, "output"), session_id, emptied)
+    
+    return moved
+
+def removeEmptyShardDirs(output_dir, session_id, dirs):
+    """ Remove directories of a session's sharded layout left empty by moving 
+        run output directories out of them, and their parents up to and 
+        including output/SESSION_<session_id>.  Other directories (e.g. output 
+        directories of runs not yet started) are left alone.
+    
+        @param output_dir String representing the path of $BASEDIR/rhessys/output
+        @param session_id Integer representing the session whose runs were moved
+        @param dirs Set of strings representing the paths of the directories run
+            output directories were moved out of
+    """
+    sessionDir = os.path.join(output_dir, "SESSION_%d" % (session_id,))
+    # Remove deepest directories first
+    for path in sorted(dirs, reverse=True):
+        while path == sessionDir or path.startswith(sessionDir + os.sep):
+            try:
+                # Fails unless the directory exists and is empty
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
+
+
+class RHESSysCalibratorReshard(object):
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for moving the run output directories of an existing calibration session to a different layout")
+        parser.add_argument("-b", "--basedir", action="store", 
+                            dest="basedir", required=True,
+                            help="Base directory for the calibration session")
+        parser.add_argument("-s", "--session", action="store", type=int,
+                            dest="session_id", required=True,
+                            help="Session whose run output directories are to be moved")
+        parser.add_argument("--layout", action="store",
+                            dest="layout", default=OUTPUT_LAYOUT_SHARDED, choices=OUTPUT_LAYOUTS,
+                            help="Layout to move run output directories to.  Defaults to %s." % (OUTPUT_LAYOUT_SHARDED,) )
+        parser.add_argument("--dry_run", action="store_true", default=False,
+                            help="Print the runs that would be moved, without moving them")
+        parser.add_argument("--force", action="store_true", default=False,
+                            help="Move run output directories even if the session appears to still be running")
+        
+        options = parser.parse_args(args[1:])
+        
+        rhessysPath = RHESSysCalibrator.getRhessysPath(options.basedir)
+        if not os.access(rhessysPath, os.W_OK):
+            sys.exit("Unable to write to directory %s" % (rhessysPath,) )
+        
+        try:
+            calibratorDB = \
+                ModelRunnerDB2(RHESSysCalibrator.getDBPath(
+                    options.basedir))
+            session = calibratorDB.getSession(options.session_id)
+            if session is None:
+                sys.exit("Session %d was not found" % (options.session_id,) )
+            if session.status == "submitted" and not options.force:
+                sys.exit("Session %d has status submitted and may still be running; use --force to move its run output directories anyway" % \
+                         (options.session_id,) )
+            
+            moved = reshardSession(calibratorDB, rhessysPath, options.session_id, 
+                                   options.layout, options.dry_run)
+        finally:
+            calibratorDB = None
+        
+        for (run, newPath) in moved:
+            print("%s -> %s" % (run.output_path, newPath))
+        if options.dry_run:
+            print("%d run(s) would be moved to %s layout" % (len(moved), options.layout))
+        else:
+            print("%d run(s) moved to %s layout" % (len(moved), options.layout))
+        
+        return 0
@@ -0,0 +1,343 @@
+"""@package rhessyscalibrator.run_log
+
+@brief Append-only log, one per calibration session, of the side files of 
+each run (standard output and error of the run, and queue system job scripts), 
+keyed by run ID.  Storing these in a single file avoids creating several
+small files in the output directory of every run.
+
+Each record of the log consists of a header line of the form:
+RUN_ID STREAM LENGTH
+followed by LENGTH bytes of data and a newline.
+
+Each log has an index ($LOG.idx) with one line per record of the form:
+RUN_ID STREAM OFFSET LENGTH
+where OFFSET is the byte offset of the header of the record in the log, so that
+the records of a run can be read without scanning the log.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import sys
+import fcntl
+import argparse
+
+STREAM_STDOUT = 'stdout'
+STREAM_STDERR = 'stderr'
+STREAM_SCRIPT = 'script'
+STREAMS = [STREAM_STDOUT, STREAM_STDERR, STREAM_SCRIPT]
+
+# Number of bytes at the end of an index to read to find its last entry
+INDEX_TAIL = 512
+
+
+def getRunLogPath(basedir, session_id):
+    """ @return String representing the path of the run log for a session, e.g.
+        $BASEDIR/rhessys/run_log_SESSION_N.log
+    """
+    return os.path.join(basedir, 'rhessys', "run_log_SESSION_%d.log" % (session_id,) )
+
+def getRunLogIndexPath(path):
+    """ @return String representing the path of the index of a run log
+    """
+    return path + '.idx'
+
+def _recordHeader(run_id, stream, length):
+    return "%d %s %d\n" % (run_id, stream, length)
+
+def _appendRunLogIndex(path, entries):
+    """ Append entries to the index of a run log.  The caller must hold the lock
+        of the log.
+    
+        @param path String representing the path of the run log
+        @param entries List of tuples (Integer, String, Integer, Integer) representing
+        the run ID, stream, offset and length of each record
+    """
+    lines = ''.join(["%d %s %d %d\n" % entry for entry in entries])
+    f = open(getRunLogIndexPath(path), 'a+b')
+    try:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            # Terminate an incomplete line left by a writer that was interrupted
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != '\n':
+                lines = '\n' + lines
+            f.seek(0, os.SEEK_END)
+        f.write(lines)
+    finally:
+        f.close()
+
+def _readRunLogIndex(path, tail=None):
+    """ Read the index of a run log.  Incomplete or invalid lines (e.g. from a 
+        writer that was interrupted) are ignored.
+    
+        @param path String representing the path of the run log
+        @param tail Integer representing the number of bytes to read from the
+        end of the index, or None to read the whole index
+        
+        @return List of tuples (Integer, String, Integer, Integer) representing
+        the run ID, stream, offset and length of each record indexed
+    """
+    entries = []
+    indexPath = getRunLogIndexPath(path)
+    if not os.path.exists(indexPath):
+        return entries
+    f = open(indexPath, 'rb')
+    try:
+        if tail is not None and os.path.getsize(indexPath) > tail:
+            f.seek(-tail, os.SEEK_END)
+            # Skip partial line
+            f.readline()
+        for line in f:
+            fields = line.split()
+            if not line.endswith('\n') or len(fields) != 4:
+                continue
+            try:
+                entries.append( (int(fields[0]), fields[1], int(fields[2]), int(fields[3])) )
+            except ValueError:
+                continue
+    finally:
+        f.close()
+    return entries
+
+def _indexedLength(entries):
+    """ @return Integer representing the number of bytes of the log covered by
+        index entries
+    """
+    end = 0
+    for (runId, stream, offset, length) in entries:
+        end = max(end, offset + len(_recordHeader(runId, stream, length)) + length + 1)
+    return end
+
+def appendRunLog(path, run_id, stream, data):
+    """ Append a record to a run log, and to the index of the log.  The log is 
+        locked while the record is written, so that records from concurrent 
+        writers are not interleaved.
+    
+        @param path String representing the path of the run log
+        @param run_id Integer representing the ID of the run
+        @param stream String, one of STREAMS
+        @param data String representing the data to append
+    """
+    record = "%s%s\n" % (_recordHeader(run_id, stream, len(data)), data)
+    f = open(path, 'ab')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(record)
+            f.flush()
+            # Only index the record if the index covers all preceding records,
+            # otherwise preceding records are indexed by indexRunLog
+            if _indexedLength(_readRunLogIndex(path, INDEX_TAIL)[-1:]) == offset:
+                _appendRunLogIndex(path, [(run_id, stream, offset, len(data))])
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
+
+def archiveRunFiles(path, run_id, files):
+    """ Append side files of a run to a run log, removing each file once it has
+        been appended.  Files that do not exist are skipped.
+    
+        @param path String representing the path of the run log
+        @param run_id Integer representing the ID of the run
+        @param files Dict<String, String> mapping stream (one of STREAMS) to the 
+            path of the file
+        
+        @return List of strings representing the paths of files archived
+    """
+    archived = []
+    for stream in STREAMS:
+        filePath = files.get(stream)
+        if filePath is None or not os.path.isfile(filePath):
+            continue
+        f = open(filePath, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        appendRunLog(path, run_id, stream, data)
+        os.unlink(filePath)
+        archived.append(filePath)
+    return archived
+
+def _readRecord(f, path):
+    """ Read the record at the current position of a run log
+    
+        @param f File object of the run log
+        @param path String representing the path of the run log
+        
+        @return Tuple (Integer, String, String) representing the run ID, stream 
+        and data of the record, or None if the record is truncated
+        
+        @raise ValueError if the record header is invalid
+    """
+    header = f.readline()
+    if not header.endswith('\n'):
+        return None
+    fields = header.split()
+    if len(fields) != 3:
+        raise ValueError("Invalid record header '%s' in run log %s" % (header.strip(), path) )
+    (runId, stream, length) = (int(fields[0]), fields[1], int(fields[2]))
+    data = f.read(length)
+    if len(data) < length or f.read(1) != '\n':
+        return None
+    return (runId, stream, data)
+
+def iterRunLog(path):
+    """ Iterate over records of a run log.  A truncated record at the end of
+        the log (e.g. from a writer that was interrupted) is ignored.
+    
+        @param path String representing the path of the run log
+        
+        @return Generator yielding tuples (Integer, String, String) representing
+        the run ID, stream and data of each record
+        
+        @raise ValueError if the log is not a run log
+    """
+    f = open(path, 'rb')
+    try:
+        while True:
+            record = _readRecord(f, path)
+            if record is None:
+                break
+            yield record
+    finally:
+        f.close()
+
+def indexRunLog(path):
+    """ Get the index of a run log.  Records not in the index (e.g. records of
+        logs written by earlier releases) are indexed once, and added to the 
+        index if it is writable.
+    
+        @param path String representing the path of the run log
+        
+        @return List of tuples (Integer, String, Integer, Integer) representing
+        the run ID, stream, offset and length of each record, in the order the
+        records were appended
+        
+        @raise ValueError if the log is not a run log
+    """
+    entries = _readRunLogIndex(path)
+    if _indexedLength(entries) >= os.path.getsize(path):
+        return entries
+    
+    f = open(path, 'rb')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            # Re-read the index, which may have been updated by another writer
+            entries = _readRunLogIndex(path)
+            f.seek(_indexedLength(entries))
+            unindexed = []
+            while True:
+                offset = f.tell()
+                record = _readRecord(f, path)
+                if record is None:
+                    break
+                (runId, stream, data) = record
+                unindexed.append( (runId, stream, offset, len(data)) )
+            if len(unindexed) > 0:
+                try:
+                    _appendRunLogIndex(path, unindexed)
+                except IOError:
+                    pass
+                entries.extend(unindexed)
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
+    return entries
+
+def getRunLog(path, run_id, stream=STREAM_STDOUT):
+    """ Get the data of a run written to a stream.  Records for a run that was
+        restarted are concatenated.  Records are located using the index of 
+        the log.
+    
+        @param path String representing the path of the run log
+        @param run_id Integer representing the ID of the run
+        @param stream String, one of STREAMS
+        
+        @return String representing the data, or None if the log has no records
+        for the run and stream
+    """
+    if not os.path.exists(path):
+        return None
+    data = None
+    f = open(path, 'rb')
+    try:
+        for (runId, recordStream, offset, length) in indexRunLog(path):
+            if runId != run_id or recordStream != stream:
+                continue
+            f.seek(offset)
+            record = _readRecord(f, path)
+            if record is None or record[:2] != (run_id, stream):
+                raise ValueError("Index of run log %s does not match record at offset %d" % (path, offset) )
+            if data is None:
+                data = record[2]
+            else:
+                data += record[2]
+    finally:
+        f.close()
+    return data
+
+
+class RHESSysCalibratorRunLog(object):
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for printing the standard output, standard error or job script of a run from the run log of a calibration session")
+        parser.add_argument("-b", "--basedir", action="store", 
+                            dest="basedir", required=True,
+                            help="Base directory for the calibration session")
+        parser.add_argument("-s", "--session", action="store", type=int,
+                            dest="session_id", required=True,
+                            help="Session the run belongs to")
+        parser.add_argument("-r", "--run", action="store", type=int,
+                            dest="run_id", required=True,
+                            help="ID of the run")
+        parser.add_argument("--stream", action="store",
+                            dest="stream", default=STREAM_STDOUT, choices=STREAMS,
+                            help="Stream to print.  Defaults to %s." % (STREAM_STDOUT,) )
+        
+        options = parser.parse_args(args[1:])
+        
+        logPath = getRunLogPath(options.basedir, options.session_id)
+        if not os.access(logPath, os.R_OK):
+            sys.exit("Unable to read run log %s" % (logPath,) )
+        
+        data = getRunLog(logPath, options.run_id, options.stream)
+        if data is None:
+            sys.exit("No %s found for run %d" % (options.stream, options.run_id) )
+        sys.stdout.write(data)
+        
+        return 0
@@ -0,0 +1,442 @@
+"""@package rhessyscalibrator.run_output
+
+@brief Functions for storing and reading the output of RHESSys model runs, 
+including transparent compression of output files.  Output files may be 
+compressed using gzip, or zstd or lz4 when the zstandard or lz4 modules are 
+installed.  Basin daily output may also be converted to a columnar NumPy 
+(.npz) file, which is read in preference to the text output.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import gzip
+import shutil
+import hashlib
+from cStringIO import StringIO
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_LZ4 = 'lz4'
+COMPRESSION_METHODS = (COMPRESSION_GZIP, COMPRESSION_ZSTD, COMPRESSION_LZ4)
+COMPRESSION_SUFFIXES = {COMPRESSION_GZIP: '.gz',
+                        COMPRESSION_ZSTD: '.zst',
+                        COMPRESSION_LZ4: '.lz4'}
+
+COLUMNAR_SUFFIX = '.npz'
+COLUMNAR_DATE_KEY = '__date__'
+COLUMNAR_COLUMNS_KEY = '__columns__'
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def getAvailableCompressionMethods():
+    """ @return List of compression methods supported by the installed modules
+    """
+    methods = [COMPRESSION_GZIP]
+    if zstandard is not None:
+        methods.append(COMPRESSION_ZSTD)
+    if lz4frame is not None:
+        methods.append(COMPRESSION_LZ4)
+    return methods
+
+def getCompressionMethod(path):
+    """ @return String representing the compression method of a file, based on
+        its suffix, or None if the file is not compressed
+    """
+    for method in COMPRESSION_METHODS:
+        if path.endswith(COMPRESSION_SUFFIXES[method]):
+            return method
+    return None
+
+def findOutputFile(path):
+    """ Find an output file, which may have been compressed
+    
+        @param path String representing the path of the uncompressed output file
+        
+        @return String representing path, if it exists, otherwise the path of a
+        compressed version of the file, if one exists.  Returns path if 
+        neither exist.
+    """
+    if os.path.exists(path):
+        return path
+    for method in getAvailableCompressionMethods():
+        compressedPath = path + COMPRESSION_SUFFIXES[method]
+        if os.path.exists(compressedPath):
+            return compressedPath
+    return path
+
+def openOutputFile(path):
+    """ Open an output file for reading, decompressing it if needed
+    
+        @param path String representing the path of the output file, as returned
+            by findOutputFile()
+        
+        @return File-like object
+        
+        @raise IOError if the file cannot be read, or the module needed to 
+        decompress it is not installed
+    """
+    method = getCompressionMethod(path)
+    if method is None:
+        return open(path, 'r')
+    if method not in getAvailableCompressionMethods():
+        raise IOError("Unable to read %s, %s compression is not supported" % (path, method))
+    return _openCompressed(path, method)
+
+def _openCompressed(path, method):
+    if method == COMPRESSION_GZIP:
+        return gzip.open(path, 'rb')
+    if method == COMPRESSION_LZ4:
+        return lz4frame.open(path, 'rb')
+    f = open(path, 'rb')
+    try:
+        return StringIO(zstandard.ZstdDecompressor().decompressobj().decompress(f.read()))
+    finally:
+        f.close()
+
+def getColumnarOutputPath(path):
+    """ @param path String representing the path of an output file (or a compressed
+            version of it)
+        
+        @return String representing the path of the columnar version of the file
+    """
+    method = getCompressionMethod(path)
+    if method is not None:
+        path = path[:-len(COMPRESSION_SUFFIXES[method])]
+    return path + COLUMNAR_SUFFIX
+
+def writeColumnarOutput(path):
+    """ Convert basin daily output of a run to a columnar NumPy (.npz) file, 
+        stored alongside the output.  The file is written to a temporary 
+        file and moved into place, so that readers never see a partial file.
+    
+        @param path String representing the path of the rhessys_basin.daily file
+            (or a compressed version of it)
+        
+        @return String representing the path of the columnar file
+    """
+    data = _readBasinDailyText(path)
+    columnarPath = getColumnarOutputPath(path)
+    arrays = dict([(str(c), data[c].values) for c in data.columns])
+    arrays[COLUMNAR_DATE_KEY] = data.index.values.astype('datetime64[D]')
+    arrays[COLUMNAR_COLUMNS_KEY] = np.array([str(c) for c in data.columns])
+    tmp = columnarPath + '.part'
+    try:
+        f = open(tmp, 'wb')
+        try:
+            np.savez(f, **arrays)
+        finally:
+            f.close()
+        os.rename(tmp, columnarPath)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return columnarPath
+
+def readColumnarOutput(path):
+    """ Read a columnar output file written by writeColumnarOutput()
+    
+        @param path String representing the path of the columnar file
+        
+        @return pandas.DataFrame indexed by date
+    """
+    npz = np.load(path)
+    try:
+        columns = [str(c) for c in npz[COLUMNAR_COLUMNS_KEY]]
+        index = pd.DatetimeIndex(npz[COLUMNAR_DATE_KEY], name='date')
+        return pd.DataFrame(dict([(c, npz[c]) for c in columns]), 
+                            index=index, columns=columns)
+    finally:
+        npz.close()
+
+def readBasinDaily(path):
+    """ Read basin daily output of a run.  If a columnar version of the output
+        at least as new as the output exists, it will be read instead.
+    
+        @param path String representing the path of the rhessys_basin.daily file
+            (or a compressed version of it)
+        
+        @return pandas.DataFrame indexed by date
+    """
+    columnarPath = getColumnarOutputPath(path)
+    if os.path.exists(columnarPath) and \
+        (not os.path.exists(path) or os.path.getmtime(columnarPath) >= os.path.getmtime(path)):
+        return readColumnarOutput(columnarPath)
+    return _readBasinDailyText(path)
+
+def _readBasinDailyText(path):
+    f = openOutputFile(path)
+    try:
+        return pd.read_csv(f, sep=' ',
+                           parse_dates={'date':[2,1,0]},
+                           index_col=0)
+    finally:
+        f.close()
+
+def getDateWindow(index, startdate, enddate):
+    """ Locate the dates from startdate to enddate (inclusive) in the dates of 
+        an output.  Dates of outputs of consecutive days (see BasinDailyReader) 
+        are located by their offset in days from the first date, other dates 
+        are searched.
+    
+        @param index pandas.DatetimeIndex representing the dates of an output
+        @param startdate datetime representing the first date of the window
+        @param enddate datetime representing the last date of the window
+        
+        @return slice of positions in index of dates in the window
+    """
+    if len(index) > 0 and index.freqstr == 'D':
+        first = min(max(0, (startdate - index[0]).days), len(index))
+        last = max(first, min(len(index), (enddate - index[0]).days + 1))
+        return slice(first, last)
+    return index.slice_indexer(startdate, enddate)
+
+class BasinDailyReader(object):
+    """ Reads selected columns of the basin daily output of runs.  Unlike 
+        readBasinDaily(), only the requested columns are parsed, and dates 
+        are not parsed: the date index of an output is built from the date of
+        its first row and its number of rows (checked against the date of its 
+        last row), and is shared by outputs spanning the same period, as the 
+        outputs of runs of a session usually do.  Column positions are cached
+        by header, so one reader should be used for all outputs of a session.
+    """
+    # Positions of day, month and year columns in basin daily output
+    DAY_IDX = 0
+    MONTH_IDX = 1
+    YEAR_IDX = 2
+    
+    def __init__(self, columns):
+        """
+            @param columns List of strings representing the names of the columns to read
+        """
+        self.columns = list(columns)
+        self._columnIndices = {}
+        self._dateIndices = {}
+    
+    def getColumnIndices(self, header):
+        """ @param header String representing the header line of an output
+        
+            @return List of integers representing the positions of self.columns
+            
+            @raise ValueError if a column is not in the header
+        """
+        indices = self._columnIndices.get(header)
+        if indices is None:
+            names = header.rstrip('\r\n').split(' ')
+            missing = [c for c in self.columns if c not in names]
+            if len(missing) > 0:
+                raise ValueError("Output has no column(s) %s" % (', '.join(missing),) )
+            indices = [names.index(c) for c in self.columns]
+            self._columnIndices[header] = indices
+        return indices
+    
+    def getDateIndex(self, start, length):
+        """ @param start datetime.date representing the first date of the index
+            @param length Integer representing the number of days in the index
+        
+            @return pandas.DatetimeIndex of length consecutive days
+        """
+        key = (start, length)
+        index = self._dateIndices.get(key)
+        if index is None:
+            index = pd.date_range(start, periods=length, freq='D', name='date')
+            self._dateIndices[key] = index
+        return index
+    
+    def read(self, path):
+        """ Read basin daily output of a run.  If a columnar version of the output
+            at least as new as the output exists, it will be read instead.
+        
+            @param path String representing the path of the rhessys_basin.daily file
+                (or a compressed version of it)
+            
+            @return Tuple (pandas.DatetimeIndex, Dict<String, numpy.ndarray>) representing
+            the dates of the output, and the values of each column as float arrays
+            
+            @raise ValueError if the output does not have one of the columns
+        """
+        columnarPath = getColumnarOutputPath(path)
+        if os.path.exists(columnarPath) and \
+            (not os.path.exists(path) or os.path.getmtime(columnarPath) >= os.path.getmtime(path)):
+            return self._readColumnar(columnarPath)
+        
+        f = openOutputFile(path)
+        try:
+            header = f.readline()
+            indices = self.getColumnIndices(header)
+            dateIndices = [self.DAY_IDX, self.MONTH_IDX, self.YEAR_IDX]
+            usecols = sorted(set(dateIndices + indices))
+            data = pd.read_csv(f, sep=' ', header=None, usecols=usecols,
+                               engine='c').values.astype(float)
+        finally:
+            f.close()
+        position = dict([(idx, i) for (i, idx) in enumerate(usecols)])
+        
+        if len(data) == 0:
+            index = pd.DatetimeIndex([], name='date')
+        else:
+            (day, month, year) = [data[:, position[i]] for i in dateIndices]
+            start = pd.Timestamp(int(year[0]), int(month[0]), int(day[0]))
+            end = pd.Timestamp(int(year[-1]), int(month[-1]), int(day[-1]))
+            if (end - start).days == len(data) - 1:
+                index = self.getDateIndex(start, len(data))
+            else:
+                # Dates are not consecutive days, parse the date of each row
+                index = pd.DatetimeIndex(pd.to_datetime(pd.DataFrame({'year': year.astype(int),
+                                                                      'month': month.astype(int),
+                                                                      'day': day.astype(int)})),
+                                         name='date')
+        values = dict([(c, data[:, position[idx]]) for (c, idx) in zip(self.columns, indices)])
+        return (index, values)
+    
+    def _readColumnar(self, path):
+        npz = np.load(path)
+        try:
+            columns = [str(c) for c in npz[COLUMNAR_COLUMNS_KEY]]
+            missing = [c for c in self.columns if c not in columns]
+            if len(missing) > 0:
+                raise ValueError("Output has no column(s) %s" % (', '.join(missing),) )
+            dates = npz[COLUMNAR_DATE_KEY]
+            if len(dates) > 0 and \
+                (dates[-1] - dates[0]).astype(int) == len(dates) - 1:
+                index = self.getDateIndex(pd.Timestamp(dates[0]), len(dates))
+            else:
+                index = pd.DatetimeIndex(dates, name='date')
+            values = dict([(c, npz[c].astype(float)) for c in self.columns])
+        finally:
+            npz.close()
+        return (index, values)
+
+def _writeCompressed(src, dest, method):
+    inFile = open(src, 'rb')
+    try:
+        if method == COMPRESSION_GZIP:
+            outFile = gzip.open(dest, 'wb')
+            try:
+                shutil.copyfileobj(inFile, outFile, BLOCK_SIZE)
+            finally:
+                outFile.close()
+        elif method == COMPRESSION_LZ4:
+            outFile = lz4frame.open(dest, 'wb')
+            try:
+                shutil.copyfileobj(inFile, outFile, BLOCK_SIZE)
+            finally:
+                outFile.close()
+        else:
+            outFile = open(dest, 'wb')
+            try:
+                zstandard.ZstdCompressor().copy_stream(inFile, outFile)
+            finally:
+                outFile.close()
+    finally:
+        inFile.close()
+
+def _checksum(f):
+    digest = hashlib.sha1()
+    try:
+        block = f.read(BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = f.read(BLOCK_SIZE)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+def compressFile(path, method=COMPRESSION_GZIP, dest_dir=None):
+    """ Compress a file.  The compressed file is verified against the 
+        original before being moved into place.
+    
+        @param path String representing the path of the file to compress
+        @param method String, one of COMPRESSION_METHODS
+        @param dest_dir String representing the directory to write the compressed 
+            file to.  If None, the compressed file will be written alongside the 
+            file, and the file will be removed.
+        
+        @return String representing the path of the compressed file
+        
+        @raise IOError if method is not supported, or the compressed file does not
+        decompress to the original
+    """
+    if method not in getAvailableCompressionMethods():
+        raise IOError("%s compression is not supported" % (method,) )
+    if dest_dir is None:
+        dest_dir = os.path.dirname(path)
+        removeOriginal = True
+    else:
+        removeOriginal = False
+    dest = os.path.join(dest_dir, os.path.basename(path) + COMPRESSION_SUFFIXES[method])
+    tmp = dest + '.part'
+    try:
+        _writeCompressed(path, tmp, method)
+        if _checksum(_openCompressed(tmp, method)) != _checksum(open(path, 'rb')):
+            raise IOError("Compressed copy of %s does not match original" % (path,) )
+        os.rename(tmp, dest)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    if removeOriginal:
+        os.unlink(path)
+    return dest
+
+def compressRunOutputs(output_path, prefix='rhessys', method=COMPRESSION_GZIP):
+    """ Compress the output files of a run
+    
+        @param output_path String representing the output directory of the run
+        @param prefix String representing the output prefix of the run (output files
+            are named $PREFIX_basin.daily, etc.)
+        @param method String, one of COMPRESSION_METHODS
+        
+        @return List of strings representing the paths of compressed files
+    """
+    compressed = []
+    for name in sorted(os.listdir(output_path)):
+        path = os.path.join(output_path, name)
+        if not name.startswith(prefix + '_') or not os.path.isfile(path) or \
+            getCompressionMethod(name) is not None or name.endswith('.part'):
+            continue
+        compressed.append(compressFile(path, method))
+    return compressed
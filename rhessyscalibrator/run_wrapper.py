@@ -0,0 +1,267 @@
+"""@package rhessyscalibrator.run_wrapper
+
+@brief Wrapper executed on compute nodes to run a single RHESSys model run.  
+Allows runs to write their output to node-local scratch storage, with only 
+selected outputs copied back to the output directory of the run on the
+shared filesystem, and to read their inputs from a node-local cache (see 
+rhessyscalibrator.staging).
+
+Invoked by calibration runners as:
+    python -m rhessyscalibrator.run_wrapper [options] -- CMD_RAW
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import sys
+import os
+import argparse
+import re
+import shutil
+import tempfile
+import getpass
+import fnmatch
+from subprocess import call
+
+from rhessyscalibrator.staging import fileChecksum, readStageManifest, StageCache
+from rhessyscalibrator.run_output import compressFile, compressRunOutputs, COMPRESSION_METHODS
+from rhessyscalibrator.integrity import getOutputIntegrity, getRunOutputIntegrity, writeIntegrityRecords
+
+# Matches the output prefix of a RHESSys command, e.g. "-pre output/SESSION_1_world_ITR_1/rhessys"
+OUTPUT_PREFIX_REGEX = re.compile("(-pre\s+)(\S+)")
+
+
+def copyVerified(src, dest):
+    """ Copy a file, verifying the checksum of the copy before moving it into
+        place, so that dest is never left partially written.
+    
+        @param src String representing the path of the file to copy
+        @param dest String representing the path to copy the file to
+        
+        @return String representing the checksum of the copy
+        
+        @raise IOError if the checksum of the copy does not match that of src
+    """
+    tmp = dest + '.part'
+    shutil.copyfile(src, tmp)
+    checksum = fileChecksum(tmp)
+    if fileChecksum(src) != checksum:
+        os.unlink(tmp)
+        raise IOError("Checksum of copy of %s does not match original" % (src,) )
+    os.rename(tmp, dest)
+    return checksum
+
+
+class RunWrapper(object):
+    """ Runs a RHESSys command on behalf of a calibration runner
+    """
+    
+    def copyBack(self, scratch_path, output_path, keep, compress=None, integrity=False):
+        """ Copy outputs from scratch back to the output directory of a run.
+            If any copy fails, files already copied are removed.
+        
+            @param scratch_path String representing the scratch directory of the run
+            @param output_path String representing the output directory of the run
+            @param keep List of strings representing filename patterns of outputs
+                to copy
+            @param compress String representing the compression method to compress
+                outputs with as they are copied.  If None, outputs are copied as is.
+            @param integrity Boolean indicating that integrity records of the copied
+                outputs should be written to the output directory of the run
+            
+            @return List of strings representing the paths of copied outputs
+        """
+        copied = []
+        checksums = []
+        try:
+            for name in sorted(os.listdir(scratch_path)):
+                if not any([fnmatch.fnmatch(name, p) for p in keep]):
+                    continue
+                src = os.path.join(scratch_path, name)
+                if compress:
+                    dest = compressFile(src, compress, dest_dir=output_path)
+                    checksums.append(None)
+                else:
+                    dest = os.path.join(output_path, name)
+                    checksums.append(copyVerified(src, dest))
+                copied.append(dest)
+        except:
+            for dest in copied:
+                os.unlink(dest)
+            raise
+        if integrity:
+            # Re-use checksums of verified copies
+            try:
+                records = [getOutputIntegrity(output_path, os.path.basename(dest), checksum) \
+                           for (dest, checksum) in zip(copied, checksums)]
+                writeIntegrityRecords(output_path, records)
+            except (IOError, OSError, EOFError) as e:
+                sys.stderr.write("WARNING: unable to record integrity of outputs: %s\n" % (str(e),) )
+        return copied
+    
+    def runInScratch(self, cmd, scratch_dir, keep, compress=None, integrity=False):
+        """ Run a RHESSys command with its output written to a scratch 
+            directory.  If the run succeeds, outputs matching keep are copied
+            back to the output directory given in cmd.  The scratch directory
+            is always removed.
+            
+            @param cmd String representing the raw RHESSys command
+            @param scratch_dir String representing the directory under which to create
+                the scratch directory.  If None, $TMPDIR will be used.
+            @param keep List of strings representing filename patterns of outputs
+                to copy back
+            @param compress String representing the compression method to compress
+                outputs with as they are copied back.  If None, outputs are not compressed.
+            @param integrity Boolean indicating that integrity records of the outputs
+                copied back should be written to the output directory of the run
+            
+            @return Integer representing the exit status
+        """
+        m = OUTPUT_PREFIX_REGEX.search(cmd)
+        if m is None:
+            sys.stderr.write("No output prefix found in command, running without scratch\n")
+            return self.run(cmd, compress, integrity)
+        prefix = m.group(2)
+        output_path = os.path.dirname(prefix)
+        
+        if scratch_dir is None:
+            scratch_dir = os.environ.get('TMPDIR', tempfile.gettempdir())
+        scratch_path = tempfile.mkdtemp(prefix='rhessys_calibrator_', dir=scratch_dir)
+        try:
+            scratchCmd = cmd[:m.start(2)] + \
+                os.path.join(scratch_path, os.path.basename(prefix)) + cmd[m.end(2):]
+            returncode = call(scratchCmd, shell=True)
+            if 0 == returncode:
+                copied = self.copyBack(scratch_path, output_path, keep, compress, integrity)
+                if len(copied) == 0:
+                    sys.stderr.write("WARNING: no outputs matching %s found in scratch\n" % (', '.join(keep),) )
+        except (IOError, OSError) as e:
+            sys.stderr.write("Unable to copy outputs from scratch to %s: %s\n" % (output_path, str(e)) )
+            returncode = 1
+        finally:
+            shutil.rmtree(scratch_path, ignore_errors=True)
+        
+        return returncode
+    
+    def run(self, cmd, compress=None, integrity=False):
+        """ Run a RHESSys command, compressing its outputs in place if the run
+            succeeds.  If compression fails, the uncompressed outputs are kept.
+            
+            @param cmd String representing the raw RHESSys command
+            @param compress String representing the compression method.  If None,
+                outputs are not compressed.
+            @param integrity Boolean indicating that integrity records of the outputs
+                should be written to the output directory of the run
+            
+            @return Integer representing the exit status
+        """
+        returncode = call(cmd, shell=True)
+        if 0 == returncode and (compress or integrity):
+            m = OUTPUT_PREFIX_REGEX.search(cmd)
+            if m is None:
+                sys.stderr.write("No output prefix found in command, outputs not compressed or recorded\n")
+                return returncode
+            prefix = m.group(2)
+            output_path = os.path.dirname(prefix) or '.'
+            if compress:
+                try:
+                    compressRunOutputs(output_path, os.path.basename(prefix), compress)
+                except (IOError, OSError) as e:
+                    sys.stderr.write("WARNING: unable to compress outputs: %s\n" % (str(e),) )
+            if integrity:
+                try:
+                    writeIntegrityRecords(output_path, 
+                                          getRunOutputIntegrity(output_path, os.path.basename(prefix)))
+                except (IOError, OSError, EOFError) as e:
+                    sys.stderr.write("WARNING: unable to record integrity of outputs: %s\n" % (str(e),) )
+        return returncode
+    
+    def stageInputs(self, cmd, manifest_path, stage_dir):
+        """ Stage the inputs of a RHESSys command into the node-local input cache.
+            If staging fails, the command will be run using its original inputs.
+        
+            @param cmd String representing the raw RHESSys command
+            @param manifest_path String representing the path of the stage manifest
+            @param stage_dir String representing the directory of the cache.  If None,
+                a directory for the current user under the system temporary directory 
+                will be used.
+            
+            @return String representing the command, with paths of inputs replaced
+            by those of their staged copies
+        """
+        if stage_dir is None:
+            stage_dir = os.path.join('/tmp', 'rhessys_calibrator_stage_' + getpass.getuser())
+        try:
+            cache = StageCache(stage_dir, os.getcwd(), readStageManifest(manifest_path))
+            return cache.stageCmd(cmd)
+        except (IOError, OSError, ValueError) as e:
+            sys.stderr.write("WARNING: unable to stage inputs, using original inputs: %s\n" % (str(e),) )
+            return cmd
+    
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Wrapper for running a single RHESSys model run on a compute node")
+        parser.add_argument("--scratch", action="store_true", default=False,
+                            help="Write output to node-local scratch, copying outputs matching --keep back to the output directory of the run")
+        parser.add_argument("--scratch_dir", action="store",
+                            help="Directory under which to create scratch directories.  Defaults to $TMPDIR.")
+        parser.add_argument("--keep", action="append", dest="keep", default=[],
+                            help="Filename pattern of outputs to copy back from scratch.  May be specified more than once.")
+        parser.add_argument("--stage", action="store", dest="stage_manifest",
+                            help="Stage inputs listed in the given stage manifest into a node-local cache, and run using the staged copies")
+        parser.add_argument("--stage_dir", action="store",
+                            help="Directory of the node-local input cache.  Defaults to /tmp/rhessys_calibrator_stage_$USER.")
+        parser.add_argument("--compress", action="store", choices=COMPRESSION_METHODS,
+                            help="Compress outputs of the run using the given method once the run completes")
+        parser.add_argument("--integrity", action="store_true", default=False,
+                            help="Write integrity records of outputs of the run (of those matching --keep if --scratch is specified) to the output directory of the run")
+        parser.add_argument("cmd", nargs=argparse.REMAINDER,
+                            help="RHESSys command to run")
+        
+        options = parser.parse_args(args[1:])
+        
+        cmd = options.cmd
+        if len(cmd) > 0 and cmd[0] == '--':
+            cmd = cmd[1:]
+        if len(cmd) == 0:
+            parser.error("No command specified")
+        # Queueing systems may split the command into separate arguments
+        cmd = ' '.join(cmd)
+        
+        if options.stage_manifest:
+            cmd = self.stageInputs(cmd, options.stage_manifest, options.stage_dir)
+        if options.scratch:
+            keep = options.keep or ['rhessys_basin.daily']
+            return self.runInScratch(cmd, options.scratch_dir, keep, options.compress, options.integrity)
+        return self.run(cmd, options.compress, options.integrity)
+
+
+if __name__ == "__main__":
+    sys.exit(RunWrapper().main(sys.argv))
@@ -0,0 +1,157 @@
+"""@package rhessyscalibrator.screening
+
+@brief Multi-fidelity screening of calibration runs.  All candidate parameter
+sets are first run over a short screening period; runs are then scored against
+observed streamflow and only the best runs are promoted to a run over the full
+simulation period.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import errno
+import math
+
+import numpy
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.observed import readObservedData
+from rhessyscalibrator.convergence import AlignedRunReader
+from rhessyscalibrator.metrics import METRIC_NSE, METRIC_NSE_LOG, METRIC_PBIAS, METRIC_RSR, \
+    USERFITNESS_METRICS
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+
+# Post process option used to identify post process sessions holding screening results
+POSTPROC_OPT_SCREENING = 'screening'
+
+
+class RunScreener(object):
+    """ Scores runs simulated over a screening period and selects runs
+        to promote to the full simulation period.
+    """
+    def __init__(self, basedir, obs_filename, logger, add_streamflow_and_gw=False):
+        """
+            @param basedir String representing the basedir of the calibration session
+            @param obs_filename String representing the name of the observed file, relative to
+                $BASEDIR/obs
+            @param logger logging.Logger to use to for debug messages
+            @param add_streamflow_and_gw True if streamflow and gw.Qout are to be added before
+                scoring
+
+            @raise IOError if the observed data file is not readable
+        """
+        self.obs_filename = obs_filename
+        self.logger = logger
+        self.add_streamflow_and_gw = add_streamflow_and_gw
+
+        obsFilePath = os.path.join(RHESSysCalibrator.getObsPath(basedir), obs_filename)
+        if not os.access(obsFilePath, os.R_OK):
+            raise IOError(errno.EACCES, "The observed data file %s is  not readable" % obsFilePath)
+        self.obs = readObservedData(obsFilePath)
+        self.rhessysPath = RHESSysCalibrator.getRhessysPath(basedir)
+        self.runReader = AlignedRunReader(self.rhessysPath, self.obs, logger, 
+                                          add_streamflow_and_gw)
+
+    def scoreRuns(self, calibratorDB, session_id, runs):
+        """ Score screening runs, storing fitness results in a new post process
+            session.
+
+            @param calibratorDB ModelRunnerDB2 for the session
+            @param session_id Integer representing the session the runs belong to
+            @param runs List of ModelRun2 objects to score.  Runs whose status 
+                is not DONE will not be scored.
+
+            @return Integer representing the ID of the post process session holding
+            screening results
+        """
+        postprocID = calibratorDB.insertPostProcess(session_id, self.obs_filename, 'daily',
+                                                    options={POSTPROC_OPT_SCREENING: 'true'})
+        fitnessResults = []
+        for run in runs:
+            if "DONE" != run.status:
+                continue
+            data = self.runReader.read(run)
+            if data is None:
+                continue
+            fitness = AlignedRunReader.calculateFitness(*data)
+            self.logger.debug("screening run %s, NSE: %s, NSE-log: %s" % \
+                              (run.id, fitness[METRIC_NSE], fitness[METRIC_NSE_LOG]))
+            fitnessResults.append( (run.id, fitness[METRIC_NSE], fitness[METRIC_NSE_LOG],
+                                    fitness[METRIC_PBIAS], fitness[METRIC_RSR], None,
+                                    dict([(m, fitness[m]) for m in USERFITNESS_METRICS])) )
+        calibratorDB.insertRunFitnessResultsBatch(postprocID, fitnessResults)
+        return postprocID
+
+    @classmethod
+    def selectRunsToPromote(cls, scoredRuns, numScreened, fraction=None):
+        """ Select runs to promote to the full simulation period
+
+            @param scoredRuns List of ModelRun2 objects, with run_fitness set, that 
+                are eligible for promotion
+            @param numScreened Integer representing the number of runs screened
+            @param fraction Float in the range (0, 1] representing the fraction of screened 
+                runs to promote.  If None, all eligible runs will be promoted.
+
+            @return List of ModelRun2 objects to promote, ordered from best to worst NSE
+        """
+        ranked = sorted([r for r in scoredRuns if r.run_fitness.nse is not None and 
+                         not numpy.isnan(r.run_fitness.nse)],
+                        key=lambda r: r.run_fitness.nse, reverse=True)
+        if fraction is not None:
+            numToPromote = int(math.ceil(fraction * numScreened))
+            ranked = ranked[:numToPromote]
+        return ranked
+
+    def promoteRuns(self, calibratorDB, session_id, postprocess_id, 
+                    fraction=None, where_clause=None):
+        """ Mark runs of the session as promoted or rejected based on screening results
+
+            @param calibratorDB ModelRunnerDB2 for the session
+            @param session_id Integer representing the session the runs belong to
+            @param postprocess_id Integer representing the post process session holding
+                screening results
+            @param fraction Float representing the fraction of screened runs to promote
+            @param where_clause String representing SQLite3 where clause on run fitness 
+                results that runs must satisfy to be promoted (e.g. 'nse>0.2')
+
+            @return List of ModelRun2 objects to promote
+        """
+        runs = calibratorDB.getRunsInSession(session_id)
+        eligible = calibratorDB.getRunsInPostProcess(postprocess_id, where_clause=where_clause)
+        promoted = self.selectRunsToPromote(eligible, len(runs), fraction)
+        promotedIds = set([r.id for r in promoted])
+        for run in runs:
+            if run.id in promotedIds:
+                value = ModelRunnerDB2.SCREENING_PROMOTED
+            else:
+                value = ModelRunnerDB2.SCREENING_REJECTED
+            calibratorDB.setRunOption(run.id, ModelRunnerDB2.RUN_OPT_SCREENING, value)
+        return promoted
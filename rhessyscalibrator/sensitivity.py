@@ -0,0 +1,330 @@
+"""@package rhessyscalibrator.sensitivity
+
+@brief Global sensitivity analysis of model fitness to calibration parameters,
+computed from the runs and fitness results of a post process session: 
+regional sensitivity (Kolmogorov-Smirnov distance between behavioral and 
+non-behavioral runs), standardized regression coefficients, first-order 
+Sobol indices, and Morris elementary effects.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import sys
+import os
+import argparse
+import math
+
+import numpy
+from scipy import stats
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.calibration_parameters import PARAM_KEYS
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+
+# Fitness metrics stored in the runfitness table, and functions transforming 
+#  each metric into a score for which higher values are better.
+METRIC_SCORES = [('nse', lambda v: v),
+                 ('nse_log', lambda v: v),
+                 ('pbias', lambda v: -numpy.abs(v)),
+                 ('rsr', lambda v: -v)]
+
+# Minimum number of runs needed to compute first-order Sobol indices
+MIN_SOBOL_RUNS = 100
+
+SENSITIVITY_HEADER = ['metric', 'parameter', 'runs', 'ks_d', 'ks_p',
+                      'src', 'src_r2', 'sobol_s1',
+                      'morris_mu_star', 'morris_sigma', 'morris_effects']
+
+
+def getSensitivityData(runs):
+    """ Get parameter values and fitness scores of runs as arrays
+    
+        @param runs List of ModelRun2 objects, with run_fitness set, 
+            ordered by run ID
+        
+        @return Tuple (List of parameter names, numpy.ndarray of parameter 
+        values of dimensions [NUM_RUNS, NUM_PARAMS], dict mapping metric 
+        name to numpy.ndarray of scores).  Only parameters with values
+        for all runs, which are not constant, are included.  Scores are 
+        NaN for runs lacking a value for a metric.  User-defined metrics 
+        are assumed to be better when higher.
+    """
+    paramKeys = []
+    for key in PARAM_KEYS:
+        values = [getattr(run, 'param_' + key) for run in runs]
+        if None in values or len(set(values)) < 2:
+            continue
+        paramKeys.append(key)
+    X = numpy.array([[getattr(run, 'param_' + k) for k in paramKeys] for run in runs],
+                    dtype=float).reshape( (len(runs), len(paramKeys)) )
+    
+    def toArray(values):
+        return numpy.array([numpy.nan if v is None else v for v in values], dtype=float)
+    
+    scores = {}
+    for (metric, score) in METRIC_SCORES:
+        scores[metric] = score(toArray([getattr(run.run_fitness, metric) for run in runs]))
+    userMetrics = set()
+    for run in runs:
+        if run.run_fitness.userfitness:
+            userMetrics.update(run.run_fitness.userfitness.keys())
+    for metric in sorted(userMetrics):
+        scores[metric] = toArray([(run.run_fitness.userfitness or {}).get(metric) for run in runs])
+    
+    return (paramKeys, X, scores)
+
+def regionalSensitivity(X, behavioral):
+    """ Regional sensitivity analysis: the Kolmogorov-Smirnov distance between
+        the distributions of parameter values of behavioral and non-behavioral
+        runs.  Larger distances indicate more sensitive parameters.
+        
+        @param X numpy.ndarray of parameter values of dimensions [NUM_RUNS, NUM_PARAMS]
+        @param behavioral numpy.ndarray of booleans, True for behavioral runs
+        
+        @return Tuple (numpy.ndarray of KS distance, numpy.ndarray of p-value); 
+        NaN if either group of runs is empty.
+    """
+    numParams = X.shape[1]
+    d = numpy.empty(numParams)
+    p = numpy.empty(numParams)
+    d.fill(numpy.nan)
+    p.fill(numpy.nan)
+    if numpy.all(behavioral) or not numpy.any(behavioral):
+        return (d, p)
+    for i in xrange(numParams):
+        (d[i], p[i]) = stats.ks_2samp(X[behavioral, i], X[~behavioral, i])
+    return (d, p)
+
+def standardizedRegressionCoefficients(X, y):
+    """ Standardized regression coefficients of a linear regression of score on
+        parameter values.  Coefficients are only meaningful measures of
+        sensitivity if the coefficient of determination is high (e.g. > 0.7).
+        
+        @param X numpy.ndarray of parameter values of dimensions [NUM_RUNS, NUM_PARAMS]
+        @param y numpy.ndarray of scores
+        
+        @return Tuple (numpy.ndarray of coefficients, coefficient of determination);
+        coefficients are NaN for parameters whose values do not vary.
+    """
+    yStd = y.std()
+    if yStd == 0:
+        return (numpy.zeros(X.shape[1]), numpy.nan)
+    z = (y - y.mean()) / yStd
+    # Parameters that do not vary (e.g. among runs with finite scores) 
+    #  cannot be standardized
+    xStd = X.std(axis=0)
+    varies = xStd > 0
+    src = numpy.empty(X.shape[1])
+    src.fill(numpy.nan)
+    if not numpy.any(varies):
+        return (src, numpy.nan)
+    Z = (X[:, varies] - X[:, varies].mean(axis=0)) / xStd[varies]
+    (coef, residuals, rank, sv) = numpy.linalg.lstsq(Z, z, rcond=None)
+    src[varies] = coef
+    r2 = 1.0 - numpy.sum((z - Z.dot(coef))**2) / numpy.sum(z**2)
+    return (src, r2)
+
+def firstOrderSobol(X, y, num_bins=None):
+    """ First-order Sobol indices, Var(E[y|x_i]) / Var(y), estimated from 
+        randomly sampled runs by partitioning the values of each parameter 
+        into bins of equal numbers of runs.
+        
+        @param X numpy.ndarray of parameter values of dimensions [NUM_RUNS, NUM_PARAMS]
+        @param y numpy.ndarray of scores
+        @param num_bins Integer representing the number of bins to use.  Defaults
+            to the square root of the number of runs.
+        
+        @return numpy.ndarray of indices; NaN if there are fewer than 
+        MIN_SOBOL_RUNS runs.
+    """
+    (numRuns, numParams) = X.shape
+    s1 = numpy.empty(numParams)
+    s1.fill(numpy.nan)
+    variance = y.var()
+    if numRuns < MIN_SOBOL_RUNS or variance == 0:
+        return s1
+    if num_bins is None:
+        num_bins = int(math.sqrt(numRuns))
+    for i in xrange(numParams):
+        # Bin of each run, by rank of its parameter value
+        bins = numpy.empty(numRuns, dtype=int)
+        bins[numpy.argsort(X[:, i], kind='mergesort')] = \
+            numpy.arange(numRuns) * num_bins // numRuns
+        counts = numpy.bincount(bins, minlength=num_bins)
+        means = numpy.bincount(bins, weights=y, minlength=num_bins) / counts
+        s1[i] = numpy.sum(counts * (means - y.mean())**2) / numRuns / variance
+    return s1
+
+def morrisElementaryEffects(X, y, rtol=1e-9):
+    """ Morris elementary effects, computed from consecutive runs that differ
+        in the value of exactly one parameter (i.e. runs made using a 
+        one-at-a-time design).  Randomly sampled runs do not support Morris 
+        screening.
+        
+        @param X numpy.ndarray of parameter values of dimensions [NUM_RUNS, NUM_PARAMS],
+            in the order runs were generated
+        @param y numpy.ndarray of scores
+        @param rtol Float representing relative tolerance used to decide whether
+            parameter values differ
+        
+        @return Tuple (numpy.ndarray of mean absolute elementary effect (mu*), 
+        numpy.ndarray of standard deviation of elementary effects, numpy.ndarray 
+        of number of elementary effects).  mu* and standard deviation are NaN for
+        parameters without elementary effects.
+    """
+    numParams = X.shape[1]
+    muStar = numpy.empty(numParams)
+    sigma = numpy.empty(numParams)
+    muStar.fill(numpy.nan)
+    sigma.fill(numpy.nan)
+    numEffects = numpy.zeros(numParams, dtype=int)
+    if X.shape[0] < 2:
+        return (muStar, sigma, numEffects)
+    
+    # Scale steps by the range of each parameter
+    width = X.max(axis=0) - X.min(axis=0)
+    width[width == 0] = 1.0
+    dX = numpy.diff(X, axis=0) / width
+    dy = numpy.diff(y)
+    changed = numpy.abs(dX) > rtol
+    oneAtATime = (numpy.sum(changed, axis=1) == 1) & numpy.isfinite(dy)
+    for i in xrange(numParams):
+        steps = oneAtATime & changed[:, i]
+        numEffects[i] = numpy.sum(steps)
+        if numEffects[i] == 0:
+            continue
+        effects = dy[steps] / dX[steps, i]
+        muStar[i] = numpy.mean(numpy.abs(effects))
+        sigma[i] = numpy.std(effects)
+    return (muStar, sigma, numEffects)
+
+def computeSensitivity(paramKeys, X, scores, behavioral_fraction=0.1):
+    """ Compute sensitivity indices of each score to each parameter
+    
+        @param paramKeys List of parameter names
+        @param X numpy.ndarray of parameter values of dimensions [NUM_RUNS, NUM_PARAMS]
+        @param scores Dict mapping metric name to numpy.ndarray of scores
+        @param behavioral_fraction Float representing the fraction of runs, 
+            with the highest scores, considered behavioral for regional 
+            sensitivity analysis
+        
+        @return List of dicts, one per metric and parameter, with keys
+        SENSITIVITY_HEADER
+    """
+    results = []
+    for metric in sorted(scores.keys()):
+        y = scores[metric]
+        valid = numpy.isfinite(y)
+        Xv = X[valid]
+        yv = y[valid]
+        numRuns = len(yv)
+        if numRuns < 2:
+            continue
+        
+        numBehavioral = max(1, int(round(behavioral_fraction * numRuns)))
+        behavioral = numpy.zeros(numRuns, dtype=bool)
+        behavioral[numpy.argsort(yv)[-numBehavioral:]] = True
+        (ksD, ksP) = regionalSensitivity(Xv, behavioral)
+        (src, r2) = standardizedRegressionCoefficients(Xv, yv)
+        s1 = firstOrderSobol(Xv, yv)
+        (muStar, sigma, numEffects) = morrisElementaryEffects(Xv, yv)
+        
+        for (i, key) in enumerate(paramKeys):
+            results.append({'metric': metric, 'parameter': key, 'runs': numRuns,
+                            'ks_d': ksD[i], 'ks_p': ksP[i],
+                            'src': src[i], 'src_r2': r2, 'sobol_s1': s1[i],
+                            'morris_mu_star': muStar[i], 'morris_sigma': sigma[i],
+                            'morris_effects': numEffects[i]})
+    return results
+
+def writeSensitivity(results, outfile, sep=','):
+    """ Write sensitivity indices to a delimited text file
+    
+        @param results List of dicts, as returned by computeSensitivity()
+        @param outfile File object to write to
+        @param sep String representing field separator
+    """
+    outfile.write(sep.join(SENSITIVITY_HEADER) + os.linesep)
+    for result in results:
+        outfile.write(sep.join([str(result[h]) for h in SENSITIVITY_HEADER]) + os.linesep)
+
+
+class RHESSysCalibratorSensitivity(object):
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for computing global sensitivity indices of model fitness to calibration parameters for a post process session")
+        parser.add_argument("-b", "--basedir", action="store", 
+                            dest="basedir", required=True,
+                            help="Base directory for the calibration session")
+        parser.add_argument("-s", "--postprocess_session", action="store", type=int,
+                            dest="postprocess_id", required=True,
+                            help="Post-process session whose runs and fitness results are to be analyzed.")
+        parser.add_argument("-f", "--outfile", 
+                            help="Name of the file to write sensitivity indices to (contents will be overwritten).  If not supplied, indices will be written to standard output.")
+        parser.add_argument("--behavioral_fraction", action="store", type=float,
+                            dest="behavioral_fraction", default=0.1,
+                            help="Fraction of runs, with the best fitness, considered behavioral for regional sensitivity analysis.  Defaults to 0.1.")
+        
+        options = parser.parse_args()
+        
+        if options.behavioral_fraction <= 0 or options.behavioral_fraction >= 1:
+            sys.exit("Behavioral fraction must be greater than 0 and less than 1")
+        
+        outfile = None
+        if options.outfile:
+            outfile = os.path.abspath(options.outfile)
+            if not os.access(os.path.dirname(outfile), os.W_OK):
+                sys.exit("Unable to write to directory {0}".format(outfile))
+        
+        try:
+            calibratorDB = \
+                ModelRunnerDB2(RHESSysCalibrator.getDBPath(
+                    options.basedir))
+            runs = calibratorDB.getRunsInPostProcess(options.postprocess_id)
+        finally:
+            calibratorDB = None
+        if len(runs) == 0:
+            sys.exit("No runs found for post-process session %d" % (options.postprocess_id,) )
+        runs.sort(key=lambda r: r.id)
+        
+        (paramKeys, X, scores) = getSensitivityData(runs)
+        if len(paramKeys) == 0:
+            sys.exit("No calibration parameters vary among runs of post-process session %d" % (options.postprocess_id,) )
+        results = computeSensitivity(paramKeys, X, scores, options.behavioral_fraction)
+        
+        if outfile:
+            of = open(outfile, 'w')
+            writeSensitivity(results, of)
+            of.close()
+        else:
+            writeSensitivity(results, sys.stdout)
+        
+        return 0
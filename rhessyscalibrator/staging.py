@@ -0,0 +1,349 @@
+"""@package rhessyscalibrator.staging
+
+@brief Staging of model inputs (worldfiles and their headers, def files, 
+climate files, flowtables and tecfiles) into a node-local, content-addressed 
+cache, so that concurrent runs on a compute node read their inputs from 
+local storage rather than the shared filesystem.
+
+The contents of all inputs are checksummed once, when a session is created, 
+and recorded in a stage manifest.  On each compute node, inputs are copied to 
+the cache the first time they are needed and verified against the manifest; 
+later runs on the node re-use the cached copies.  Worldfile headers and base 
+station files are rewritten to refer to the cached copies of the files they 
+reference.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import errno
+import json
+import fcntl
+import glob
+import shutil
+import hashlib
+import tempfile
+
+# Name of file marking that a cache entry has been completely populated
+COMPLETE_MARKER = '.complete'
+
+HEADER_SUFFIX = '.hdr'
+HEADER_FILENAME_KEY_SUFFIX = '_filename'
+BASE_STATION_KEY = 'base_station_filename'
+CLIMATE_PREFIX_KEY = 'climate_prefix'
+
+# Command line options of RHESSys whose arguments are staged
+TECFILE_OPT = '-t'
+WORLDFILE_OPT = '-w'
+FLOWTABLE_OPT = '-r'
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def fileChecksum(path):
+    """ Compute the SHA-1 checksum of a file
+    
+        @param path String representing the path of the file
+        
+        @return String representing the hexadecimal digest
+    """
+    digest = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        block = f.read(BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = f.read(BLOCK_SIZE)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def getStageManifestPath(basedir, session_id):
+    """ Get the path of the stage manifest of a session
+    
+        @param basedir String representing the basedir of the calibration session
+        @param session_id Integer representing the ID of the session
+        
+        @return String representing the absolute path of the manifest
+    """
+    return os.path.abspath(os.path.join(basedir, 'rhessys', 
+                                        "stage_manifest_SESSION_%d.json" % (session_id,)))
+
+def readReferences(path, key_test):
+    """ Read paths referenced by a RHESSys input file whose lines are 
+        of the form "VALUE KEY" (e.g. worldfile headers and base station files)
+        
+        @param path String representing the path of the file
+        @param key_test Function taking a key and returning True if the value
+            of that key is a path to be returned
+        
+        @return List of tuples (key, value)
+    """
+    refs = []
+    f = open(path, 'r')
+    try:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) >= 2 and key_test(tokens[-1]):
+                refs.append( (tokens[-1], tokens[0]) )
+    finally:
+        f.close()
+    return refs
+
+def isHeaderReference(key):
+    return key.endswith(HEADER_FILENAME_KEY_SUFFIX)
+
+def isClimatePrefix(key):
+    return key == CLIMATE_PREFIX_KEY
+
+def getClimateFiles(run_path, prefix):
+    """ @return List of paths, relative to run_path, of climate files with 
+        the given prefix
+    """
+    files = glob.glob(os.path.join(run_path, prefix + '.*'))
+    return sorted([os.path.relpath(f, run_path) for f in files if os.path.isfile(f)])
+
+def buildStageManifest(run_path, worldfiles, flowtables, tecfiles):
+    """ Build a stage manifest listing the checksum of each input of a session.
+        Headers of worldfiles, and the def, base station and climate files they 
+        reference, are included.
+    
+        @param run_path String representing the directory from which runs are 
+            run (i.e. $BASEDIR/rhessys); all paths are relative to run_path
+        @param worldfiles List of strings representing worldfile paths
+        @param flowtables List of strings representing flowtable (and surface
+            flowtable) paths
+        @param tecfiles List of strings representing tecfile paths
+        
+        @return Dict of the form {'files': {path: checksum}}
+    """
+    paths = set(flowtables) | set(tecfiles)
+    for worldfile in worldfiles:
+        paths.add(worldfile)
+        header = worldfile + HEADER_SUFFIX
+        if not os.path.isfile(os.path.join(run_path, header)):
+            continue
+        paths.add(header)
+        for (key, ref) in readReferences(os.path.join(run_path, header), isHeaderReference):
+            paths.add(ref)
+            if key == BASE_STATION_KEY:
+                for (k, prefix) in readReferences(os.path.join(run_path, ref), isClimatePrefix):
+                    paths.update(getClimateFiles(run_path, prefix))
+    files = {}
+    for path in paths:
+        files[path] = fileChecksum(os.path.join(run_path, path))
+    return {'files': files}
+
+def writeStageManifest(manifest, path):
+    f = open(path, 'w')
+    try:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+def readStageManifest(path):
+    f = open(path, 'r')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+class StageCache(object):
+    """ Node-local, content-addressed cache of model inputs.  Each cache 
+        entry is a directory, named by the checksum of its contents, holding
+        one or more files.
+    """
+    def __init__(self, cache_dir, run_path, manifest):
+        """
+            @param cache_dir String representing the directory of the cache
+            @param run_path String representing the directory from which runs are run;
+                paths in the manifest are relative to this directory
+            @param manifest Dict, as returned by buildStageManifest()
+        """
+        self.cache_dir = cache_dir
+        self.run_path = run_path
+        self.files = manifest['files']
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise e
+    
+    def stageEntry(self, entries):
+        """ Stage a cache entry, populating it if it is not already in the cache.
+            Population is done under a lock, so that concurrent jobs on a node 
+            copy each entry only once, into a temporary directory that is renamed 
+            into place when complete.
+        
+            @param entries List of tuples (name, path, checksum, content).  If content 
+                is None, the file at path (relative to run_path) will be copied and 
+                verified against checksum; otherwise content will be written.
+            
+            @return String representing the path of the cache entry directory
+            
+            @raise IOError if a copied file does not match its checksum
+        """
+        key = hashlib.sha1()
+        for (name, path, checksum, content) in entries:
+            if content is not None:
+                checksum = hashlib.sha1(content).hexdigest()
+            key.update("%s:%s\n" % (name, checksum))
+        key = key.hexdigest()
+        entryPath = os.path.join(self.cache_dir, key)
+        if os.path.exists(os.path.join(entryPath, COMPLETE_MARKER)):
+            return entryPath
+        
+        lock = open(entryPath + '.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(os.path.join(entryPath, COMPLETE_MARKER)):
+                return entryPath
+            tmpPath = tempfile.mkdtemp(prefix='.' + key, dir=self.cache_dir)
+            try:
+                for (name, path, checksum, content) in entries:
+                    dest = os.path.join(tmpPath, name)
+                    if content is None:
+                        shutil.copyfile(os.path.join(self.run_path, path), dest)
+                        if fileChecksum(dest) != checksum:
+                            raise IOError("Checksum of %s does not match stage manifest" % (path,) )
+                    else:
+                        f = open(dest, 'w')
+                        f.write(content)
+                        f.close()
+                open(os.path.join(tmpPath, COMPLETE_MARKER), 'w').close()
+                if os.path.exists(entryPath):
+                    # Remove incomplete entry
+                    shutil.rmtree(entryPath)
+                os.rename(tmpPath, entryPath)
+            except:
+                shutil.rmtree(tmpPath, ignore_errors=True)
+                raise
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+        return entryPath
+    
+    def stageFile(self, path):
+        """ Stage a single input file
+        
+            @param path String representing the path of the file, relative to run_path
+            
+            @return String representing the path of the staged copy, or path if the 
+            file is not in the stage manifest
+        """
+        if path not in self.files:
+            return path
+        name = os.path.basename(path)
+        return os.path.join(self.stageEntry([(name, path, self.files[path], None)]), name)
+    
+    def rewriteReferences(self, path, key_test, stage):
+        """ Read an input file, replacing the paths it references with staged paths
+        
+            @param path String representing the path of the file, relative to run_path
+            @param key_test Function taking a key and returning True if the value
+                of that key is a path to be staged
+            @param stage Function taking a key and value and returning staged value
+            
+            @return String representing the rewritten contents of the file
+        """
+        lines = []
+        f = open(os.path.join(self.run_path, path), 'r')
+        try:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) >= 2 and key_test(tokens[-1]):
+                    line = line.replace(tokens[0], stage(tokens[-1], tokens[0]), 1)
+                lines.append(line)
+        finally:
+            f.close()
+        return ''.join(lines)
+    
+    def stageClimate(self, prefix):
+        """ Stage the climate files with a given prefix into a single cache entry
+        
+            @return String representing the staged prefix
+        """
+        climateFiles = [p for p in sorted(self.files.keys()) if p.startswith(prefix + '.')]
+        if len(climateFiles) == 0:
+            return prefix
+        entryPath = self.stageEntry([(os.path.basename(p), p, self.files[p], None) for p in climateFiles])
+        return os.path.join(entryPath, os.path.basename(prefix))
+    
+    def stageHeaderReference(self, key, ref):
+        if key == BASE_STATION_KEY and ref in self.files:
+            content = self.rewriteReferences(ref, isClimatePrefix,
+                                             lambda k, prefix: self.stageClimate(prefix))
+            name = os.path.basename(ref)
+            return os.path.join(self.stageEntry([(name, None, None, content)]), name)
+        return self.stageFile(ref)
+    
+    def stageWorldfile(self, path):
+        """ Stage a worldfile together with its header, and the files 
+            referenced by its header.
+        
+            @param path String representing the path of the worldfile, relative to run_path
+            
+            @return String representing the path of the staged worldfile, or path if 
+            the worldfile is not in the stage manifest
+        """
+        if path not in self.files:
+            return path
+        name = os.path.basename(path)
+        entries = [(name, path, self.files[path], None)]
+        header = path + HEADER_SUFFIX
+        if header in self.files:
+            content = self.rewriteReferences(header, isHeaderReference, self.stageHeaderReference)
+            entries.append( (name + HEADER_SUFFIX, None, None, content) )
+        return os.path.join(self.stageEntry(entries), name)
+    
+    def stageCmd(self, cmd):
+        """ Stage the inputs of a RHESSys command
+        
+            @param cmd String representing the raw RHESSys command
+            
+            @return String representing the command, with paths of inputs
+            replaced by those of their staged copies
+        """
+        tokens = cmd.split()
+        for i in xrange(len(tokens) - 1):
+            if tokens[i] == TECFILE_OPT:
+                tokens[i+1] = self.stageFile(tokens[i+1])
+            elif tokens[i] == WORLDFILE_OPT:
+                tokens[i+1] = self.stageWorldfile(tokens[i+1])
+            elif tokens[i] == FLOWTABLE_OPT:
+                # Flowtable, and optionally surface flowtable
+                for j in xrange(i + 1, min(i + 3, len(tokens))):
+                    if tokens[j].startswith('-'):
+                        break
+                    tokens[j] = self.stageFile(tokens[j])
+        return ' '.join(tokens)
@@ -0,0 +1,244 @@
+"""@package rhessyscalibrator.surrogate
+
+@brief Surrogate-assisted sampling of calibration parameters.  A Gaussian 
+process emulator of model fitness is trained on the parameters and fitness 
+results of completed runs, and is used to choose, from many randomly 
+generated candidate parameter sets, those that are most promising to run.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import math
+
+import numpy
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from scipy.stats import norm
+
+SURROGATE_METRIC_NSE = 'nse'
+SURROGATE_METRIC_NSE_LOG = 'nse_log'
+SURROGATE_METRIC_MIN = 'min'
+SURROGATE_METRICS = [SURROGATE_METRIC_MIN, SURROGATE_METRIC_NSE, SURROGATE_METRIC_NSE_LOG]
+
+SURROGATE_CRITERION_EI = 'ei'
+SURROGATE_CRITERION_MEAN = 'mean'
+SURROGATE_CRITERIA = [SURROGATE_CRITERION_EI, SURROGATE_CRITERION_MEAN]
+
+# Fitness values below this are all equally poor; clipping keeps very
+#  negative NSE values from dominating the emulator.
+FITNESS_FLOOR = -1.0
+MIN_TRAINING_RUNS = 50
+
+
+def expectedImprovement(mean, std, best, xi=0.01):
+    """ Calculate expected improvement over the best fitness observed so far
+
+        @param mean Numpy array of predicted fitness
+        @param std Numpy array of standard deviation of predicted fitness
+        @param best Float representing the best fitness observed so far
+        @param xi Float representing the minimum improvement of interest
+
+        @return Numpy array of expected improvement
+    """
+    std = numpy.maximum(std, 1e-12)
+    improvement = mean - best - xi
+    z = improvement / std
+    return improvement * norm.cdf(z) + std * norm.pdf(z)
+
+
+class GaussianProcessSurrogate(object):
+    """ Gaussian process regression with a squared exponential kernel.  Inputs are 
+        expected to be scaled to [0, 1]; the length scale is chosen from 
+        LENGTH_SCALES by maximizing the marginal likelihood of the training data.
+    """
+    LENGTH_SCALES = (0.1, 0.2, 0.3, 0.5, 0.75, 1.0)
+    
+    def __init__(self, noise=0.05, max_training=1000):
+        """
+            @param noise Float representing noise variance, relative to the variance
+                of training fitness values
+            @param max_training Integer representing the maximum number of training 
+                points to use.  If more are supplied, those with the highest fitness 
+                will be used.
+        """
+        self.noise = noise
+        self.max_training = max_training
+        self.lengthScale = None
+
+    @classmethod
+    def _kernel(cls, X1, X2, lengthScale):
+        sqdist = numpy.sum(X1**2, axis=1)[:, numpy.newaxis] + \
+            numpy.sum(X2**2, axis=1)[numpy.newaxis, :] - 2 * numpy.dot(X1, X2.T)
+        return numpy.exp(-0.5 * numpy.maximum(sqdist, 0) / lengthScale**2)
+
+    def fit(self, X, y):
+        """ Fit surrogate to training data
+
+            @param X Numpy array of dimensions [NUM_RUNS, NUM_PARAMETERS], scaled to [0, 1]
+            @param y Numpy array of fitness values, dimensions [NUM_RUNS]
+        """
+        X = numpy.asarray(X, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        if len(y) > self.max_training:
+            idx = numpy.argsort(y)[-self.max_training:]
+            X = X[idx]
+            y = y[idx]
+        self.yMean = numpy.mean(y)
+        self.yStd = numpy.std(y)
+        if self.yStd == 0:
+            self.yStd = 1.0
+        yNorm = (y - self.yMean) / self.yStd
+        
+        n = len(y)
+        bestLogLik = None
+        for lengthScale in self.LENGTH_SCALES:
+            K = self._kernel(X, X, lengthScale) + self.noise * numpy.eye(n)
+            try:
+                (L, lower) = cho_factor(K, lower=True)
+            except numpy.linalg.LinAlgError:
+                continue
+            alpha = cho_solve((L, lower), yNorm)
+            logLik = -0.5 * numpy.dot(yNorm, alpha) - numpy.sum(numpy.log(numpy.diag(L)))
+            if bestLogLik is None or logLik > bestLogLik:
+                bestLogLik = logLik
+                self.lengthScale = lengthScale
+                self._L = L
+                self._alpha = alpha
+        if self.lengthScale is None:
+            raise Exception("Unable to fit surrogate to training data")
+        self._X = X
+        self.bestFitness = numpy.max(y)
+
+    def predict(self, X):
+        """ Predict fitness
+
+            @param X Numpy array of dimensions [NUM_CANDIDATES, NUM_PARAMETERS], scaled to [0, 1]
+
+            @return Tuple (numpy.ndarray, numpy.ndarray) of predicted mean and
+            standard deviation of fitness
+        """
+        X = numpy.asarray(X, dtype=float)
+        Ks = self._kernel(X, self._X, self.lengthScale)
+        mean = numpy.dot(Ks, self._alpha)
+        v = solve_triangular(self._L, Ks.T, lower=True)
+        var = numpy.maximum(1.0 - numpy.sum(v**2, axis=0), 1e-12)
+        return (mean * self.yStd + self.yMean, numpy.sqrt(var) * self.yStd)
+
+
+class SurrogateSampler(object):
+    """ Generate parameter values by choosing, from randomly generated candidates,
+        the candidate with the highest predicted fitness or expected improvement.
+        Can be used in place of CalibrationParametersProto.generateParameterValues().
+    """
+    def __init__(self, paramsProto, surrogate, oversample=10, criterion=SURROGATE_CRITERION_EI):
+        """
+            @param paramsProto CalibrationParametersProto used to generate candidates
+            @param surrogate Fitted GaussianProcessSurrogate
+            @param oversample Integer representing number of candidates to generate for 
+                each parameter set returned
+            @param criterion String, one of SURROGATE_CRITERIA
+        """
+        self.paramsProto = paramsProto
+        self.surrogate = surrogate
+        self.oversample = max(1, oversample)
+        self.criterion = criterion
+        self.paramKeys = paramsProto.getSampledParameterKeys()
+
+    @classmethod
+    def scaleParameters(cls, values, paramKeys, paramRanges):
+        """ Scale parameter values to [0, 1] using parameter ranges
+
+            @param values Numpy array of dimensions [NUM_RUNS, len(paramKeys)]
+            @param paramKeys List of parameter names
+            @param paramRanges Dict mapping parameter name to [floor, ceiling]
+
+            @return Numpy array of scaled values
+        """
+        floor = numpy.array([paramRanges[k][0] for k in paramKeys])
+        ceil = numpy.array([paramRanges[k][1] for k in paramKeys])
+        return (numpy.asarray(values, dtype=float) - floor) / (ceil - floor)
+
+    @classmethod
+    def getTrainingData(cls, runs, paramKeys, paramRanges, metric=SURROGATE_METRIC_MIN):
+        """ Get training data from completed runs
+
+            @param runs List of ModelRun2 objects, with run_fitness set
+            @param paramKeys List of parameter names
+            @param paramRanges Dict mapping parameter name to [floor, ceiling]
+            @param metric String, one of SURROGATE_METRICS
+
+            @return Tuple (numpy.ndarray, numpy.ndarray) of scaled parameter values 
+            and fitness.  Runs without fitness or parameter values are skipped.
+        """
+        X = []
+        y = []
+        for run in runs:
+            fitness = run.run_fitness
+            if metric == SURROGATE_METRIC_NSE:
+                value = fitness.nse
+            elif metric == SURROGATE_METRIC_NSE_LOG:
+                value = fitness.nse_log
+            else:
+                if fitness.nse is None or fitness.nse_log is None:
+                    continue
+                value = min(fitness.nse, fitness.nse_log)
+            if value is None or math.isnan(value):
+                continue
+            params = [getattr(run, 'param_' + k) for k in paramKeys]
+            if None in params:
+                continue
+            X.append(params)
+            y.append(max(value, FITNESS_FLOOR))
+        if len(X) == 0:
+            return (numpy.empty( (0, len(paramKeys)) ), numpy.empty(0))
+        return (cls.scaleParameters(X, paramKeys, paramRanges), numpy.array(y))
+
+    def generateParameterValues(self, counter=None):
+        """ Generate parameter values for a run
+
+            @param counter Integer representing the counter (e.g. iteration) to generate 
+                values for.  Candidates are generated using counters 
+                counter * oversample to counter * oversample + oversample - 1.
+
+            @return CalibrationParameters object
+        """
+        if counter is None:
+            candidates = [self.paramsProto.generateParameterValues() for i in xrange(self.oversample)]
+        else:
+            candidates = [self.paramsProto.generateParameterValues(counter * self.oversample + i) \
+                          for i in xrange(self.oversample)]
+        values = [[getattr(c, k) for k in self.paramKeys] for c in candidates]
+        X = self.scaleParameters(values, self.paramKeys, self.paramsProto.parameterRanges)
+        (mean, std) = self.surrogate.predict(X)
+        if self.criterion == SURROGATE_CRITERION_MEAN:
+            score = mean
+        else:
+            score = expectedImprovement(mean, std, self.surrogate.bestFitness)
+        return candidates[int(numpy.argmax(score))]
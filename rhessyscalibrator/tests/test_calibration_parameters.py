@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_calibration_parameters
+
+@brief Unit tests for rhessyscalibrator.calibration_parameters
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+
+from rhessyscalibrator.calibration_parameters import *
+
+class TestCalibrationParameters(unittest.TestCase):
+
+    def setUp(self):
+        self.proto = CalibrationParametersProto(s_for_sv=True, seed=1234)
+        self.proto.parseParameterString(" -s $s1[1.0, 2.0] $s2[1.0, 2.0] -sv $sv1 $sv2 -gw $gw1[0.1, 0.2] $gw2 ")
+
+    def testCounterUniform(self):
+        u = counterUniform(1234, 1, 's1')
+        self.assertEqual(u, counterUniform(1234, 1, 's1'))
+        self.assertNotEqual(u, counterUniform(1234, 2, 's1'))
+        self.assertNotEqual(u, counterUniform(1234, 1, 's2'))
+        self.assertNotEqual(u, counterUniform(4321, 1, 's1'))
+        self.assertTrue(0.0 <= u < 1.0)
+
+    def testGenerateParameterValues(self):
+        params = self.proto.generateParameterValues(3)
+        # Values for a counter are independent of the order of generation
+        self.proto.generateParameterValues(7)
+        self.assertEqual(params.toDict(), self.proto.generateParameterValues(3).toDict())
+        self.assertNotEqual(params.toDict(), self.proto.generateParameterValues(4).toDict())
+        self.assertEqual(params.s1, params.sv1)
+        self.assertTrue(1.0 <= params.s2 <= 2.0)
+        self.assertTrue(0.1 <= params.gw1 <= 0.2)
+        
+        self.proto.seed = 99
+        self.assertNotEqual(params.toDict(), self.proto.generateParameterValues(3).toDict())
+
+    def testNarrowParameterRanges(self):
+        values = {'s1': [1.2, 1.4], 's2': [1.02, 1.5], 'gw1': [0.15, 0.15], 'gw2': [0.3, 0.4]}
+        ranges = self.proto.narrowParameterRanges(values, margin=0.1)
+        self.assertAlmostEqual(ranges['s1'][0], 1.18)
+        self.assertAlmostEqual(ranges['s1'][1], 1.42)
+        # Ranges are not widened beyond their original bounds
+        self.assertEqual(ranges['s2'][0], 1.0)
+        # Parameters with a single value are given margin of their original range
+        self.assertAlmostEqual(ranges['gw1'][0], 0.14)
+        self.assertAlmostEqual(ranges['gw1'][1], 0.16)
+        self.assertEqual(self.proto.parameterRanges['s1'], ranges['s1'])
+        
+        params = self.proto.generateParameterValues(1)
+        self.assertTrue(1.18 <= params.s1 <= 1.42)
+
+    def testKernelParameterSampler(self):
+        values = {'s1': [1.2, 1.4, 1.3], 's2': [1.1, 1.5, 1.2], 'gw1': [0.15, 0.12, 0.18], 'gw2': [0.3, 0.4, 0.5]}
+        sampler = KernelParameterSampler(self.proto, values)
+        params = sampler.generateParameterValues(5)
+        self.assertEqual(params.toDict(), sampler.generateParameterValues(5).toDict())
+        for i in range(100):
+            params = sampler.generateParameterValues(i)
+            self.assertEqual(params.s1, params.sv1)
+            self.assertTrue(1.0 <= params.s1 <= 2.0)
+            self.assertTrue(0.1 <= params.gw1 <= 0.2)
+        self.assertAlmostEqual(KernelParameterSampler.reflect(2.25, 1.0, 2.0), 1.75)
+        self.assertAlmostEqual(KernelParameterSampler.reflect(0.5, 1.0, 2.0), 1.5)
+        self.assertEqual(KernelParameterSampler.reflect(0.5, 1.0, 1.0), 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_convergence
+
+@brief Unit tests for rhessyscalibrator.convergence
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy
+import pandas as pd
+
+from rhessyscalibrator.convergence import weightedQuantiles
+from rhessyscalibrator.convergence import SessionMonitor, AlignedRunReader
+from rhessyscalibrator.model_runner_db2 import ModelRun2
+from rhessyscalibrator.observed import ObservedData, OBS_HEADER_STREAMFLOW
+from rhessyscalibrator.metrics import METRIC_NSE, METRIC_NSE_LOG
+
+class TestConvergence(unittest.TestCase):
+
+    def setUp(self):
+        # Construct monitor without reading observed data
+        self.monitor = SessionMonitor.__new__(SessionMonitor)
+        self.monitor.logger = logging.getLogger('test_convergence')
+        self.monitor.stop_behavioral = None
+        self.monitor.stop_epsilon = None
+        self.monitor.stop_batches = 2
+        self.monitor.numScored = 0
+        self.monitor.numBehavioral = 0
+        self.monitor.quantileChanges = []
+        self.monitor.stopReason = None
+
+    def testWeightedQuantiles(self):
+        values = numpy.array([[3.0, 30.0], [1.0, 10.0], [2.0, 20.0], [4.0, 40.0]])
+        weights = numpy.ones(4)
+        q = weightedQuantiles(values, weights, (0.25, 0.5, 1.0))
+        self.assertEqual(q.shape, (3, 2))
+        self.assertTrue(numpy.allclose(q[:,0], [1.0, 2.0, 4.0]))
+        self.assertTrue(numpy.allclose(q[:,1], [10.0, 20.0, 40.0]))
+
+        # All likelihood on one simulation
+        weights = numpy.array([0.0, 0.0, 1.0, 0.0])
+        q = weightedQuantiles(values, weights, (0.025, 0.975))
+        self.assertTrue(numpy.allclose(q, [[2.0, 20.0], [2.0, 20.0]]))
+
+    def testStopBehavioral(self):
+        self.monitor.stop_behavioral = 10
+        self.monitor.numBehavioral = 9
+        self.assertFalse(self.monitor.isConverged())
+        self.monitor.numBehavioral = 10
+        self.assertTrue(self.monitor.isConverged())
+        self.assertTrue(self.monitor.stopReason is not None)
+
+    def testStopEpsilon(self):
+        self.monitor.stop_epsilon = 0.01
+        self.monitor.quantileChanges = [0.5, 0.005]
+        self.assertFalse(self.monitor.isConverged())
+        self.monitor.quantileChanges.append(0.001)
+        self.assertTrue(self.monitor.isConverged())
+
+
+
+class TestAlignedRunReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.run = ModelRun2()
+        self.run.id = 1
+        self.run.output_path = 'SESSION_1_world_ITR_1'
+        os.mkdir(os.path.join(self.tmpdir, self.run.output_path))
+        # Modeled output spans 2000-01-01 to 2000-01-20
+        f = open(os.path.join(self.tmpdir, self.run.output_path, 'rhessys_basin.daily'), 'w')
+        f.write("day month year streamflow\n")
+        for d in range(1, 21):
+            f.write("%d 1 2000 %f\n" % (d, d))
+        f.close()
+        self.logger = logging.getLogger('test_convergence')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def getReader(self, streamflow):
+        # Observed data span 2000-01-11 to 2000-01-30
+        index = pd.date_range('2000-01-11', periods=len(streamflow), name='datetime')
+        obs = ObservedData(pd.DataFrame({OBS_HEADER_STREAMFLOW: streamflow}, index=index))
+        return AlignedRunReader(self.tmpdir, obs, self.logger)
+
+    def testRead(self):
+        reader = self.getReader(numpy.arange(11, 31, dtype=float))
+        (obs, modeled) = reader.read(self.run)
+        self.assertEqual(len(obs), 10)
+        self.assertEqual(obs.start, pd.Timestamp('2000-01-11'))
+        self.assertTrue(numpy.allclose(modeled, numpy.arange(11, 21)))
+        fitness = AlignedRunReader.calculateFitness(obs, modeled)
+        self.assertAlmostEqual(fitness[METRIC_NSE], 1.0)
+        self.assertAlmostEqual(fitness[METRIC_NSE_LOG], 1.0)
+
+    def testMissingObserved(self):
+        streamflow = numpy.arange(11, 31, dtype=float)
+        streamflow[2] = numpy.nan
+        reader = self.getReader(streamflow)
+        fitness = AlignedRunReader.calculateFitness(*reader.read(self.run))
+        self.assertAlmostEqual(fitness[METRIC_NSE], 1.0)
+        self.assertAlmostEqual(fitness[METRIC_NSE_LOG], 1.0)
+
+    def testConstantObserved(self):
+        reader = self.getReader(numpy.ones(20))
+        fitness = AlignedRunReader.calculateFitness(*reader.read(self.run))
+        self.assertTrue(numpy.isnan(fitness[METRIC_NSE]))
+
+
+if __name__ == "__main__":
+    unittest.main()
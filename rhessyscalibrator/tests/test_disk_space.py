@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_disk_space
+
+@brief Test cases for rhessyscalibrator.disk_space
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import logging
+from datetime import datetime
+
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.disk_space import *
+
+class TestDiskSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rhessysPath = os.path.join(self.tmpdir, 'rhessys')
+        self.db = ModelRunnerDB2(os.path.join(self.tmpdir, 'test.db'))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 4, 1,
+                                               self.tmpdir, 'rhessys -pre $output_path')
+        for itr in range(1, 5):
+            outputPath = os.path.join('output', "SESSION_1_world_ITR_%d" % (itr,) )
+            os.makedirs(os.path.join(self.rhessysPath, outputPath))
+            f = open(os.path.join(self.rhessysPath, outputPath, 'rhessys_basin.daily'), 'w')
+            f.write('x' * 100000 * itr)
+            f.close()
+            runId = self.db.insertRun(self.sessionId, 'world', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                                      None, None, None, None, None,
+                                      'rhessys', outputPath, str(itr))
+            if itr <= 2:
+                self.db.updateRunEndtime(runId, datetime.utcnow(), "DONE")
+        self.logger = logging.getLogger('test_disk_space')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testGetDirectorySize(self):
+        size = getDirectorySize(os.path.join(self.rhessysPath, 'output', 'SESSION_1_world_ITR_1'))
+        self.assertTrue(size >= 100000)
+        self.assertTrue(getDirectorySize(os.path.join(self.rhessysPath, 'output')) > 4 * size)
+
+    def testCountRunsInSession(self):
+        self.assertEqual(self.db.countRunsInSession(self.sessionId), 4)
+        self.assertEqual(self.db.countRunsInSession(self.sessionId, "status='DONE'"), 2)
+
+    def testHasSpace(self):
+        monitor = DiskSpaceMonitor(self.rhessysPath, self.sessionId, self.logger, 0, 4, sample_runs=2)
+        # No runs measured yet
+        self.assertEqual(monitor.getRunSizeEstimate(), None)
+        (space, free, needed) = monitor.hasSpace(self.db, 4)
+        self.assertTrue(space)
+        self.assertEqual(len(monitor.runSizes), 2)
+        # Largest of the measured runs, times 2 runs in flight plus the next run
+        self.assertEqual(needed, 3 * monitor.getRunSizeEstimate())
+        self.assertTrue(monitor.getRunSizeEstimate() >= 200000)
+        
+        monitor.reserve_bytes = free
+        self.assertFalse(monitor.hasSpace(self.db, 4)[0])
+
+    def testWaitForSpace(self):
+        monitor = DiskSpaceMonitor(self.rhessysPath, self.sessionId, self.logger, 0, 4, sample_runs=2)
+        monitor.POLL_INTERVAL_SECS = 0
+        # No space on first check, space returns on second check
+        checks = []
+        def hasSpace(calibratorDB, num_dispatched):
+            checks.append(num_dispatched)
+            if len(checks) == 1:
+                return (False, 0, GB)
+            opts = calibratorDB.getSessionOptions(self.sessionId)
+            self.assertEqual(opts[SESSION_OPT_DISPATCH_STATUS], DISPATCH_STATUS_PAUSED)
+            return (True, 2 * GB, GB)
+        monitor.hasSpace = hasSpace
+        monitor.waitForSpace(self.db, 4)
+        self.assertEqual(len(checks), 2)
+        self.assertFalse(monitor.paused)
+        self.assertEqual(self.db.getSessionOptions(self.sessionId)[SESSION_OPT_DISPATCH_STATUS], 
+                         DISPATCH_STATUS_RUNNING)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_integrity
+
+@brief Test cases for rhessyscalibrator.integrity
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.run_output import compressFile
+from rhessyscalibrator.integrity import *
+
+def writeBasinDaily(path, days):
+    f = open(path, 'w')
+    f.write("day month year streamflow\n")
+    for d in range(1, days + 1):
+        f.write("%d 1 2000 %f\n" % (d, d * 0.1))
+    f.close()
+
+class TestIntegrity(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rhessysPath = os.path.join(self.tmpdir, 'rhessys')
+        self.db = ModelRunnerDB2(os.path.join(self.tmpdir, 'test.db'))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 4, 1,
+                                               self.tmpdir, 'rhessys -pre $output_path')
+        self.runIds = []
+        for itr in range(1, 5):
+            outputPath = os.path.join('output', "SESSION_1_world_ITR_%d" % (itr,) )
+            os.makedirs(os.path.join(self.rhessysPath, outputPath))
+            writeBasinDaily(os.path.join(self.rhessysPath, outputPath, BASIN_DAILY), 31)
+            runId = self.db.insertRun(self.sessionId, 'world', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                                      None, None, None, None, None,
+                                      'rhessys', outputPath, str(itr))
+            self.db.updateRunEndtime(runId, datetime.utcnow(), 'DONE')
+            self.runIds.append(runId)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def getOutputDir(self, itr):
+        return os.path.join(self.rhessysPath, 'output', "SESSION_1_world_ITR_%d" % (itr,) )
+
+    def recordIntegrity(self):
+        for (itr, runId) in enumerate(self.runIds, 1):
+            self.db.setRunOutputIntegrity(runId, getRunOutputIntegrity(self.getOutputDir(itr)))
+
+    def testGetOutputIntegrity(self):
+        record = getOutputIntegrity(self.getOutputDir(1), BASIN_DAILY)
+        self.assertEqual(record.lines, 32)
+        self.assertEqual(record.last_date, '2000-01-31')
+        self.assertEqual(record.size, os.path.getsize(os.path.join(self.getOutputDir(1), BASIN_DAILY)))
+        # Line count and last date are read through compression
+        compressFile(os.path.join(self.getOutputDir(1), BASIN_DAILY))
+        compressed = getOutputIntegrity(self.getOutputDir(1), BASIN_DAILY + '.gz')
+        self.assertEqual(compressed.lines, 32)
+        self.assertEqual(compressed.last_date, '2000-01-31')
+        self.assertNotEqual(compressed.checksum, record.checksum)
+
+    def testRecordIntegrity(self):
+        self.recordIntegrity()
+        # Records are replaced, not duplicated
+        self.recordIntegrity()
+        records = self.db.getOutputIntegrityForSession(self.sessionId)
+        self.assertEqual(sorted(records.keys()), self.runIds)
+        self.assertEqual([r.filename for r in records[self.runIds[0]]], [BASIN_DAILY])
+
+    def testValidateSession(self):
+        self.recordIntegrity()
+        (numRuns, problems) = validateSession(self.db, self.rhessysPath, self.sessionId, True)
+        self.assertEqual(numRuns, 4)
+        self.assertEqual(problems, {})
+
+    def testValidateChanged(self):
+        self.recordIntegrity()
+        writeBasinDaily(os.path.join(self.getOutputDir(2), BASIN_DAILY), 20)
+        os.unlink(os.path.join(self.getOutputDir(3), BASIN_DAILY))
+        (numRuns, problems) = validateSession(self.db, self.rhessysPath, self.sessionId)
+        self.assertEqual(sorted(problems.keys()), self.runIds[1:3])
+
+    def testValidateTruncated(self):
+        # Run that was truncated before its integrity was recorded
+        writeBasinDaily(os.path.join(self.getOutputDir(4), BASIN_DAILY), 15)
+        self.recordIntegrity()
+        (numRuns, problems) = validateSession(self.db, self.rhessysPath, self.sessionId)
+        self.assertEqual(problems.keys(), [self.runIds[3]])
+        self.assertEqual(len(problems[self.runIds[3]]), 2)
+
+    def testValidateWithoutRecords(self):
+        writeBasinDaily(os.path.join(self.getOutputDir(1), BASIN_DAILY), 10)
+        open(os.path.join(self.getOutputDir(2), BASIN_DAILY), 'w').close()
+        (numRuns, problems) = validateSession(self.db, self.rhessysPath, self.sessionId)
+        self.assertEqual(sorted(problems.keys()), self.runIds[:2])
+
+if __name__ == "__main__":
+    unittest.main()
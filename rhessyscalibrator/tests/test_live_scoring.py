@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_live_scoring
+
+@brief Test cases for rhessyscalibrator.live_scoring
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import logging
+import time
+from datetime import datetime
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.live_scoring import *
+from rhessyscalibrator.postprocess import getRunsToUpdate, POSTPROC_OPT_FINGERPRINT
+
+STREAMFLOW = [1.0, 2.0, 4.0, 3.0, 2.0, 1.5, 1.0]
+
+class TestLiveScoring(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        RHESSysCalibrator().createVerifyDirectoryStructure(self.basedir)
+        f = open(os.path.join(RHESSysCalibrator.getObsPath(self.basedir), 'obs.csv'), 'w')
+        f.write("datetime,streamflow_mm,precip_mm\n")
+        for (i, q) in enumerate(STREAMFLOW):
+            f.write("1/%d/2000,%f,10.0\n" % (i + 1, q))
+        f.close()
+        
+        self.db = ModelRunnerDB2(RHESSysCalibrator.getDBPath(self.basedir))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 3, 1,
+                                               self.basedir, 'rhessys -pre $output_path')
+        self.logger = logging.getLogger('test_live_scoring')
+        self.scorer = LiveScorer(self.basedir, self.sessionId, 'obs.csv', self.logger)
+        self.postprocId = self.scorer.start(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.basedir)
+
+    def addRun(self, itr, streamflow, status='DONE'):
+        outputPath = os.path.join('output', "SESSION_1_world_ITR_%d" % (itr,) )
+        outputDir = os.path.join(RHESSysCalibrator.getRhessysPath(self.basedir), outputPath)
+        os.makedirs(outputDir)
+        f = open(os.path.join(outputDir, 'rhessys_basin.daily'), 'w')
+        f.write("day month year streamflow precip\n")
+        for (i, q) in enumerate(streamflow):
+            f.write("%d 1 2000 %f 10.0\n" % (i + 1, q))
+        f.close()
+        runId = self.db.insertRun(self.sessionId, 'world', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                                  None, None, None, None, None,
+                                  'rhessys', outputPath, str(itr))
+        self.db.updateRunEndtime(runId, datetime.utcnow(), status)
+        return runId
+
+    def testStart(self):
+        postproc = self.db.getPostProcess(self.postprocId)
+        self.assertEqual(postproc.options[POSTPROC_OPT_LIVE], LIVE_STATUS_RUNNING)
+        self.assertEqual(self.db.getSessionOptions(self.sessionId)[SESSION_OPT_LIVE_POSTPROCESS],
+                         str(self.postprocId))
+
+    def testUpdate(self):
+        perfect = self.addRun(1, STREAMFLOW)
+        self.assertEqual(self.scorer.update(self.db), 1)
+        # Runs are scored only once
+        poor = self.addRun(2, [2.0] * len(STREAMFLOW))
+        self.addRun(3, STREAMFLOW, status='EXIT')
+        self.addRun(4, STREAMFLOW[:3])
+        self.assertEqual(self.scorer.update(self.db, force=True), 1)
+        self.assertEqual(self.scorer.update(self.db, force=True), 0)
+        
+        self.scorer.finish(self.db)
+        self.assertEqual(self.db.getPostProcess(self.postprocId).options[POSTPROC_OPT_LIVE],
+                         LIVE_STATUS_COMPLETE)
+        fitness = dict([(r.id, r.run_fitness) for r in self.db.getRunsInPostProcess(self.postprocId)])
+        self.assertEqual(sorted(fitness.keys()), [perfect, poor])
+        self.assertAlmostEqual(fitness[perfect].nse, 1.0)
+        self.assertAlmostEqual(fitness[perfect].nse_log, 1.0)
+        self.assertTrue(fitness[poor].nse < 1.0)
+        self.assertAlmostEqual(fitness[perfect].runoff_ratio, sum(STREAMFLOW) / 70.0)
+        self.assertAlmostEqual(fitness[perfect].pbias, 0.0)
+        self.assertAlmostEqual(fitness[perfect].rsr, 0.0)
+        self.assertAlmostEqual(float(fitness[perfect].userfitness['kge']), 1.0)
+
+    def testRunsToUpdate(self):
+        perfect = self.addRun(1, STREAMFLOW)
+        poor = self.addRun(2, [2.0] * len(STREAMFLOW))
+        self.scorer.finish(self.db)
+        postproc = self.db.getPostProcess(self.postprocId)
+        self.assertEqual(postproc.options[POSTPROC_OPT_FINGERPRINT], self.scorer.fingerprint)
+        
+        rhessysPath = RHESSysCalibrator.getRhessysPath(self.basedir)
+        def getOutputs():
+            return dict([(r.id, RHESSysCalibrator.getRunOutputFilePath(os.path.join(rhessysPath, r.output_path))) \
+                         for r in self.db.getRunsInSession(self.sessionId)])
+        self.assertEqual(getRunsToUpdate(self.db, self.postprocId, getOutputs()), [])
+        
+        # New runs, and runs whose output changed since they were scored, are to be scored
+        added = self.addRun(3, STREAMFLOW)
+        outputs = getOutputs()
+        os.utime(outputs[poor], (time.time() + 60, time.time() + 60))
+        self.assertEqual(getRunsToUpdate(self.db, self.postprocId, outputs), [poor, added])
+
+if __name__ == "__main__":
+    unittest.main()
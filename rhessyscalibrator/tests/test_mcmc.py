@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_mcmc
+
+@brief Unit tests for rhessyscalibrator.mcmc
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+
+import numpy
+
+from rhessyscalibrator.mcmc import gelmanRubin, logLikelihood, DreamSampler
+
+class TestMCMC(unittest.TestCase):
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(42)
+
+    def testGelmanRubin(self):
+        # Chains sampling the same distribution
+        samples = self.random.normal(size=(500, 4, 2))
+        rhat = gelmanRubin(samples)
+        self.assertEqual(rhat.shape, (2,))
+        self.assertTrue(numpy.all(rhat < 1.05))
+        
+        # Chains stuck in different places
+        samples[:,0,:] += 10
+        rhat = gelmanRubin(samples)
+        self.assertTrue(numpy.all(rhat > 1.2))
+
+    def testLogLikelihood(self):
+        obs = numpy.array([1.0, 2.0, 3.0, 4.0])
+        self.assertTrue(logLikelihood(obs, obs + 0.1) > logLikelihood(obs, obs + 1.0))
+        # Missing observations are ignored
+        gappy = numpy.array([1.0, numpy.nan, 3.0, 4.0])
+        modeled = numpy.array([1.1, 2.1, 3.1, 4.1])
+        self.assertAlmostEqual(logLikelihood(gappy, modeled),
+                               logLikelihood([1.0, 3.0, 4.0], [1.1, 3.1, 4.1]))
+        self.assertEqual(logLikelihood([numpy.nan], [1.0]), -numpy.inf)
+
+    def testPropose(self):
+        sampler = DreamSampler(5, 3, random_state=self.random)
+        X = self.random.uniform(size=(5, 3))
+        for generation in range(1, 11):
+            proposals = sampler.propose(X, generation)
+            self.assertEqual(proposals.shape, X.shape)
+            self.assertTrue(numpy.all(proposals >= 0) and numpy.all(proposals <= 1))
+            # Every chain moves in at least one dimension
+            self.assertTrue(numpy.all(numpy.any(proposals != X, axis=1)))
+        
+        self.assertRaises(Exception, DreamSampler, 2, 3)
+
+    def testReflect(self):
+        X = numpy.array([-0.25, 0.5, 1.25, 2.5])
+        self.assertTrue(numpy.allclose(DreamSampler.reflect(X), [0.25, 0.5, 0.75, 0.5]))
+
+    def testAccept(self):
+        sampler = DreamSampler(3, 2, random_state=self.random)
+        accepted = sampler.accept([-10.0, -numpy.inf, -10.0], [0.0, -50.0, -numpy.inf])
+        self.assertEqual(list(accepted), [True, True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
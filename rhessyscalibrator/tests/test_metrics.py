@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_metrics
+
+@brief Test cases for rhessyscalibrator.metrics
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import math
+
+import numpy
+
+from rhessyscalibrator.postprocess import RHESSysCalibratorPostprocess
+from rhessyscalibrator.metrics import *
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = numpy.array([1.0, 2.0, 4.0, 0.0, 2.0, 1.0])
+        self.sims = numpy.array([[1.0, 2.0, 4.0, 0.0, 2.0, 1.0],
+                                 [1.5, 2.0, 3.0, 1.0, 2.0, 0.5],
+                                 [2.0, 2.0, 2.0, 2.0, 2.0, 2.0]])
+
+    def testMatchesSingleRun(self):
+        metrics = calculateMetrics(self.obs, self.sims)
+        for (i, sim) in enumerate(self.sims):
+            nse = RHESSysCalibratorPostprocess.calculateNSE(self.obs, sim)
+            self.assertAlmostEqual(metrics[METRIC_NSE][i], nse)
+            (logObs, logSim) = RHESSysCalibratorPostprocess.logTransform(self.obs, sim)
+            nseLog = RHESSysCalibratorPostprocess.calculateNSE(logObs, logSim)
+            self.assertAlmostEqual(metrics[METRIC_NSE_LOG][i], nseLog)
+        self.assertTrue(numpy.allclose(calculateNSE(self.obs, self.sims), metrics[METRIC_NSE]))
+
+    def testPerfectRun(self):
+        metrics = calculateMetrics(self.obs, self.sims)
+        for (name, value) in [(METRIC_NSE, 1.0), (METRIC_NSE_LOG, 1.0), (METRIC_PBIAS, 0.0),
+                              (METRIC_RSR, 0.0), (METRIC_RMSE, 0.0), (METRIC_KGE, 1.0),
+                              (METRIC_KGE_R, 1.0), (METRIC_KGE_ALPHA, 1.0), (METRIC_KGE_BETA, 1.0)]:
+            self.assertAlmostEqual(metrics[name][0], value)
+
+    def testMetrics(self):
+        metrics = calculateMetrics(self.obs, self.sims)
+        # Constant simulation: no variance, so correlation (and KGE) is undefined
+        self.assertAlmostEqual(metrics[METRIC_PBIAS][2], -20.0)
+        self.assertAlmostEqual(metrics[METRIC_KGE_BETA][2], 1.2)
+        self.assertAlmostEqual(metrics[METRIC_KGE_ALPHA][2], 0.0)
+        self.assertTrue(numpy.isnan(metrics[METRIC_KGE][2]))
+        self.assertAlmostEqual(metrics[METRIC_RMSE][2], math.sqrt(10.0 / 6))
+        # Squared errors sum to 2.5, squared deviations of obs from their mean to 28/3
+        self.assertAlmostEqual(metrics[METRIC_RSR][1], math.sqrt(2.5 / (28.0 / 3)))
+
+    def testMissingValues(self):
+        obs = numpy.append(self.obs, numpy.nan)
+        sims = numpy.hstack([self.sims, [[5.0], [numpy.nan], [2.0]]])
+        sims[0, 0] = numpy.nan
+        metrics = calculateMetrics(obs, sims)
+        expected = calculateMetrics(self.obs[1:], self.sims[:1, 1:])
+        for name in expected.keys():
+            self.assertAlmostEqual(metrics[name][0], expected[name][0])
+        self.assertAlmostEqual(metrics[METRIC_NSE][1], calculateMetrics(self.obs, self.sims)[METRIC_NSE][1])
+
+    def testObservedTerms(self):
+        # obs has a zero, so log NSE of each run is calculated separately
+        positiveObs = self.obs + 0.5
+        for obs in [self.obs, positiveObs]:
+            terms = getObservedTerms(obs)
+            for sims in [self.sims, self.sims + 0.5]:
+                expected = calculateMetrics(obs, sims)
+                metrics = calculateMetrics(obs, sims, terms)
+                for name in expected.keys():
+                    self.assertTrue(numpy.allclose(metrics[name], expected[name], equal_nan=True))
+        self.assertTrue('log' in getObservedTerms(positiveObs))
+        self.assertEqual(getObservedTerms(numpy.append(self.obs, numpy.nan)), None)
+
+    def testRunoffRatio(self):
+        ratio = calculateRunoffRatio(self.sims, numpy.ones(self.sims.shape) * 10)
+        self.assertTrue(numpy.allclose(ratio, [10.0 / 60, 10.0 / 60, 12.0 / 60]))
+
+if __name__ == "__main__":
+    unittest.main()
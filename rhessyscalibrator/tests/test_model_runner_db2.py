@@ -37,10 +37,14 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 @author Brian Miles <brian_miles@unc.edu>
 """
 import unittest
+import os
 import tempfile
+import sqlite3
 import shutil
 from datetime import datetime
 
+import numpy
+
 from rhessyscalibrator.model_runner_db2 import *
 
 
@@ -271,5 +275,90 @@ class TestClusterCalibrator(unittest.TestCase):
         shutil.rmtree(self.dbDir)
         unittest.TestCase.tearDown(self)
 
+class TestRunFitnessBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.dbDir = tempfile.mkdtemp()
+        self.db = ModelRunnerDB2(os.path.join(self.dbDir, 'calibration.sqlite'))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 5, 1,
+                                               self.dbDir, 'rhessys')
+        self.runIds = [self.db.insertRun(self.sessionId, 'world', 
+                                         0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 
+                                         None, None, None, None, None,
+                                         'rhessys', "run_%d" % (i,), i) for i in range(5)]
+        self.postprocId = self.db.insertPostProcess(self.sessionId, 'obs.csv', 'daily')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dbDir)
+
+    def testInsertRunFitnessResultsBatch(self):
+        results = [(runId, 0.5 + i / 10.0, 0.4, -1.0, None, numpy.float32(0.25),
+                    {'kge': 0.75, 'rmse': numpy.float64(i)} if i % 2 else None) \
+                   for (i, runId) in enumerate(self.runIds)]
+        ids = self.db.insertRunFitnessResultsBatch(self.postprocId, results, checkpoint=2)
+        self.assertEqual(len(ids), 5)
+        
+        runfit = dict([(r.id, r) for r in self.db.getRunFitnessForPostProcess(self.postprocId)])
+        for (runfitId, result) in zip(ids, results):
+            self.assertEqual(runfit[runfitId].run_id, result[0])
+            self.assertAlmostEqual(runfit[runfitId].nse, result[1])
+            self.assertEqual(runfit[runfitId].rsr, None)
+            self.assertEqual(runfit[runfitId].runoff_ratio, 0.25)
+            self.assertEqual(runfit[runfitId].userfitness, result[6] or {})
+        
+        # Failed batches are not written
+        self.assertRaises(Exception, self.db.insertRunFitnessResultsBatch, self.postprocId,
+                          [(self.runIds[0], 0.5, 0.5, 0.0, 0.0, 0.0, {'kge': 'a'})])
+        self.assertEqual(len(self.db.getRunFitnessForPostProcess(self.postprocId)), 5)
+        
+        # Replace results of a run
+        [runfitId] = self.db.insertRunFitnessResultsBatch(self.postprocId, 
+                                                          [(self.runIds[1], 0.9, 0.9, 0.0, 0.0, 0.0, {'kge': 0.8})],
+                                                          replace=True)
+        runfit = self.db.getRunFitnessForPostProcess(self.postprocId)
+        self.assertEqual(len(runfit), 5)
+        replaced = [r for r in runfit if r.run_id == self.runIds[1]]
+        self.assertEqual([r.id for r in replaced], [runfitId])
+        self.assertEqual(replaced[0].userfitness, {'kge': 0.8})
+
+class TestMigrateDb(unittest.TestCase):
+
+    def setUp(self):
+        self.dbDir = tempfile.mkdtemp()
+        self.dbPath = os.path.join(self.dbDir, 'calibration.sqlite')
+        # Make a version 2.0 database: no option, MCMC or integrity tables
+        db = ModelRunnerDB2(self.dbPath)
+        self.sessionId = db.insertSession('user', 'project', 'notes', 5, 1,
+                                          self.dbDir, 'rhessys')
+        db.close()
+        conn = sqlite3.connect(self.dbPath)
+        for table in ['session_option', 'run_option', 'mcmc_sample', 
+                      'mcmc_diagnostic', 'run_output_integrity']:
+            conn.execute("DROP TABLE IF EXISTS %s" % (table,))
+        conn.execute("UPDATE rhessys_calibrator_version SET version=2.0")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dbDir)
+
+    def testMigrateFromVersion2(self):
+        self.assertEqual(ModelRunnerDB2.getDbVersion(self.dbPath), 2.0)
+        db = ModelRunnerDB2(self.dbPath)
+        self.assertEqual(ModelRunnerDB2.getDbVersion(self.dbPath), ModelRunnerDB2.DB_VERSION)
+        self.assertEqual(db.getSession(self.sessionId).id, self.sessionId)
+        db.setSessionOptions(self.sessionId, {'mcmc_chains': '4'})
+        self.assertEqual(db.getSessionOptions(self.sessionId), {'mcmc_chains': '4'})
+        db.close()
+        backups = [f for f in os.listdir(self.dbDir) if f.startswith('calibration.sqlite_backup_')]
+        self.assertEqual(len(backups), 1)
+        
+    def testOpenCurrentVersionDoesNotMigrate(self):
+        ModelRunnerDB2(self.dbPath).close()
+        before = sorted(os.listdir(self.dbDir))
+        ModelRunnerDB2(self.dbPath).close()
+        self.assertEqual(sorted(os.listdir(self.dbDir)), before)
+
 if __name__ == "__main__":
     unittest.main()
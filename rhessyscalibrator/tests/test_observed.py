@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_observed
+
+@brief Test cases for rhessyscalibrator.observed
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy
+import pandas as pd
+
+from rhessyscalibrator.observed import *
+
+class TestObserved(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.obsPath = os.path.join(self.tmpdir, 'obs.csv')
+        index = pd.date_range('2000-01-01', periods=70, name='datetime')
+        self.data = pd.DataFrame({OBS_HEADER_STREAMFLOW: numpy.arange(70, dtype=float) + 1,
+                                  OBS_HEADER_PRECIP: 10.0}, index=index)
+        self.data.to_csv(self.obsPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testReadObservedData(self):
+        obs = readObservedData(self.obsPath)
+        self.assertEqual(len(obs), 70)
+        self.assertEqual(obs.start, pd.Timestamp('2000-01-01'))
+        self.assertAlmostEqual(obs.runoffRatio, (70 * 71 / 2.0) / 700)
+        # Observed data are only read again once the file changes
+        self.assertTrue(readObservedData(self.obsPath) is obs)
+        self.data[:10].to_csv(self.obsPath)
+        os.utime(self.obsPath, (0, 0))
+        self.assertEqual(len(readObservedData(self.obsPath)), 10)
+
+    def testStreamflowOnly(self):
+        # Observed data used only to score streamflow need not include precipitation
+        self.data[[OBS_HEADER_STREAMFLOW]].to_csv(self.obsPath)
+        obs = readObservedData(self.obsPath)
+        self.assertEqual(len(obs.streamflow), 70)
+        self.assertEqual(len(obs.getWindow(pd.Timestamp('2000-01-10'), pd.Timestamp('2000-01-19'))), 10)
+        self.assertEqual(obs.getAggregate('weekly').terms['count'], 11)
+        self.assertRaises(KeyError, lambda: obs.runoffRatio)
+
+    def testWindow(self):
+        obs = readObservedData(self.obsPath)
+        window = obs.getWindow(pd.Timestamp('2000-01-10'), pd.Timestamp('2000-01-19'))
+        self.assertEqual(len(window), 10)
+        self.assertEqual(window.end, pd.Timestamp('2000-01-19'))
+        self.assertTrue(obs.getWindow(pd.Timestamp('2000-01-10'), pd.Timestamp('2000-01-19')) is window)
+
+    def testAggregate(self):
+        obs = readObservedData(self.obsPath)
+        modeled = obs.streamflow.values * 2
+        for (period, freq) in [('weekly', 'W-SUN'), ('monthly', 'M')]:
+            aggregate = obs.getAggregate(period)
+            expected = obs.streamflow.resample(freq).sum().values
+            self.assertTrue(numpy.allclose(aggregate.values, expected))
+            self.assertTrue(numpy.allclose(aggregate.aggregate(modeled), expected * 2))
+            self.assertTrue(obs.getAggregate(period) is aggregate)
+        daily = obs.getAggregate('daily')
+        self.assertTrue(daily.aggregate(modeled) is modeled)
+        self.assertEqual(daily.terms['count'], 70)
+
+if __name__ == "__main__":
+    unittest.main()
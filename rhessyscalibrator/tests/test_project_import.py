@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_project_import
+
+@brief Test cases for rhessyscalibrator.project_import
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.project_import import *
+
+def writeFile(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    f = open(path, 'w')
+    f.write(content)
+    f.close()
+
+class TestProjectImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.projectDir = os.path.join(self.tmpdir, 'workflows')
+        p = os.path.join(self.projectDir, 'rhessys')
+        writeFile(os.path.join(p, 'bin', RHESSYS_BINARY), 'rhessys')
+        os.chmod(os.path.join(p, 'bin', RHESSYS_BINARY), stat.S_IRWXU)
+        writeFile(os.path.join(p, 'worldfiles', 'world'), 'world')
+        writeFile(os.path.join(p, 'worldfiles', 'world.hdr'),
+                  "1 num_soil_files\ndefs/soil.def soil_default_filename\n" + 
+                  "1 num_base_stations\nclim/cwt.base base_station_filename\n")
+        writeFile(os.path.join(p, 'defs', 'soil.def'), 'soil')
+        writeFile(os.path.join(p, 'clim', 'cwt.base'), "101 base_station_id\nclim/cwt climate_prefix\n")
+        writeFile(os.path.join(p, 'clim', 'cwt.rain'), 'rain' * 1000)
+        writeFile(os.path.join(p, 'flow', 'world.flow'), 'flow')
+        writeFile(os.path.join(p, 'tecfiles', 'tec_daily.txt'), 'tec')
+        writeFile(os.path.join(p, 'templates', 'template'), 'template')
+        writeFile(os.path.join(p, 'src', 'Makefile'), 'all:')
+        
+        self.basedir = os.path.join(self.tmpdir, 'calibration')
+        os.mkdir(self.basedir)
+        RHESSysCalibrator().createVerifyDirectoryStructure(self.basedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def importAndVerify(self, mode):
+        (files, counts) = importProject(self.projectDir, self.basedir, mode, jobs=2)
+        self.assertEqual(sum(counts.values()), len(files))
+        self.assertEqual(verifyProject(self.basedir, files), [])
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'rhessys', 'src', 'Makefile')))
+        return (files, counts)
+
+    def testCopy(self):
+        (files, counts) = self.importAndVerify(IMPORT_COPY)
+        self.assertEqual(counts, {IMPORT_COPY: len(files)})
+        for (src, dest) in files:
+            self.assertNotEqual(os.stat(src).st_ino, os.stat(dest).st_ino)
+
+    def testHardlink(self):
+        (files, counts) = self.importAndVerify(IMPORT_HARDLINK)
+        self.assertEqual(counts, {IMPORT_HARDLINK: len(files)})
+        for (src, dest) in files:
+            self.assertEqual(os.stat(src).st_ino, os.stat(dest).st_ino)
+        # Importing again replaces existing files
+        self.importAndVerify(IMPORT_HARDLINK)
+
+    def testSymlink(self):
+        (files, counts) = self.importAndVerify(IMPORT_SYMLINK)
+        for (src, dest) in files:
+            self.assertTrue(os.path.islink(dest))
+
+    def testReflink(self):
+        # Falls back to copying where the filesystem does not support reflinks
+        (files, counts) = self.importAndVerify(IMPORT_REFLINK)
+        for (src, dest) in files:
+            f = open(dest)
+            self.assertEqual(f.read(), open(src).read())
+            f.close()
+
+    def testVerifyProblems(self):
+        (files, counts) = importProject(self.projectDir, self.basedir, IMPORT_COPY)
+        os.unlink(os.path.join(self.basedir, 'rhessys', 'flow', 'world_flow_table.dat'))
+        os.unlink(os.path.join(self.basedir, 'rhessys', 'clim', 'cwt.rain'))
+        problems = verifyProject(self.basedir, files)
+        self.assertEqual(len(problems), 3)
+        self.assertTrue("No flow table for worldfile world" in problems)
+
+    def testMissingInput(self):
+        os.unlink(os.path.join(self.projectDir, 'rhessys', 'worldfiles', 'world'))
+        self.assertRaises(Exception, importProject, self.projectDir, self.basedir)
+
+if __name__ == "__main__":
+    unittest.main()
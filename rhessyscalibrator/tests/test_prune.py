@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_prune
+
+@brief Test cases for rhessyscalibrator.prune
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import tarfile
+
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.prune import *
+
+class TestPrune(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rhessysPath = os.path.join(self.tmpdir, 'rhessys')
+        self.db = ModelRunnerDB2(os.path.join(self.tmpdir, 'test.db'))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 3, 1,
+                                               self.tmpdir, 'rhessys -pre $output_path')
+        self.postprocId = self.db.insertPostProcess(self.sessionId, 'obs.csv', 'daily')
+        self.runIds = []
+        for (itr, nse) in [(1, 0.8), (2, 0.2), (3, -1.0)]:
+            outputPath = os.path.join('output', "SESSION_1_world_ITR_%d" % (itr,) )
+            outputDir = os.path.join(self.rhessysPath, outputPath)
+            os.makedirs(outputDir)
+            for name in ['rhessys_basin.daily', 'cmd.txt']:
+                f = open(os.path.join(outputDir, name), 'w')
+                f.write(name * 1000)
+                f.close()
+            runId = self.db.insertRun(self.sessionId, 'world', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                                      None, None, None, None, None,
+                                      'rhessys', outputPath, str(itr))
+            self.db.insertRunFitnessResults(self.postprocId, runId, nse, nse, 0.0, 0.0, 0.5, None)
+            self.runIds.append(runId)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def getOutputDir(self, itr):
+        return os.path.join(self.rhessysPath, 'output', "SESSION_1_world_ITR_%d" % (itr,) )
+
+    def testGetNonBehavioralRuns(self):
+        runs = getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER)
+        self.assertEqual(sorted([r.id for r in runs]), self.runIds[1:])
+
+    def testDryRun(self):
+        runs = getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER)
+        size = pruneRuns(self.db, self.rhessysPath, runs, ModelRunnerDB2.PRUNED_DELETED, dry_run=True)
+        self.assertTrue(size >= 2 * len('rhessys_basin.daily') * 1000)
+        self.assertEqual(sorted(os.listdir(self.getOutputDir(2))), ['cmd.txt', 'rhessys_basin.daily'])
+        self.assertEqual(len(getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER)), 2)
+
+    def testDelete(self):
+        runs = getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER)
+        size = pruneRuns(self.db, self.rhessysPath, runs, ModelRunnerDB2.PRUNED_DELETED)
+        self.assertTrue(size > 0)
+        self.assertEqual(os.listdir(self.getOutputDir(2)), ['cmd.txt'])
+        self.assertEqual(sorted(os.listdir(self.getOutputDir(1))), ['cmd.txt', 'rhessys_basin.daily'])
+        self.assertEqual(self.db.getRunOptions(self.runIds[1])[ModelRunnerDB2.RUN_OPT_PRUNED], 
+                         ModelRunnerDB2.PRUNED_DELETED)
+        # Pruned runs are skipped
+        self.assertEqual(getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER), [])
+        self.assertEqual([r.id for r in self.db.getRunsInSession(self.sessionId, 
+                                                                 where_clause=ModelRunnerDB2.WHERE_NOT_PRUNED)],
+                         self.runIds[:1])
+
+    def testArchive(self):
+        runs = getNonBehavioralRuns(self.db, self.postprocId, DEFAULT_BEHAVIORAL_FILTER)
+        pruneRuns(self.db, self.rhessysPath, runs, ModelRunnerDB2.PRUNED_ARCHIVED)
+        self.assertEqual(sorted(os.listdir(self.getOutputDir(3))), ['cmd.txt', PRUNE_ARCHIVE_NAME])
+        tar = tarfile.open(os.path.join(self.getOutputDir(3), PRUNE_ARCHIVE_NAME))
+        self.assertEqual(tar.extractfile('rhessys_basin.daily').read(), 'rhessys_basin.daily' * 1000)
+        tar.close()
+
+if __name__ == "__main__":
+    unittest.main()
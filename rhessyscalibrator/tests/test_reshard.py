@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_reshard
+
+@brief Test cases for rhessyscalibrator.reshard
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator, OUTPUT_LAYOUT_FLAT, \
+    OUTPUT_LAYOUT_SHARDED, SESSION_OPT_OUTPUT_LAYOUT
+from rhessyscalibrator.model_runner_db2 import ModelRunnerDB2
+from rhessyscalibrator.reshard import *
+
+class TestReshard(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rhessysPath = os.path.join(self.tmpdir, 'rhessys')
+        self.db = ModelRunnerDB2(os.path.join(self.tmpdir, 'test.db'))
+        self.sessionId = self.db.insertSession('user', 'project', 'notes', 2, 1,
+                                               self.tmpdir, 'rhessys -pre $output_path')
+        for itr in [1, 1500]:
+            outputPath = RHESSysCalibrator.getRunOutputPath(self.sessionId, 'world', itr)
+            os.makedirs(os.path.join(self.rhessysPath, outputPath))
+            open(os.path.join(self.rhessysPath, outputPath, 'rhessys_basin.daily'), 'w').close()
+            self.db.insertRun(self.sessionId, 'world', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                              None, None, None, None, None,
+                              'rhessys -pre ' + os.path.join(outputPath, 'rhessys'), outputPath, str(itr))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testGetOutputPath(self):
+        self.assertEqual(RHESSysCalibrator.getRunOutputPath(1, 'world', 1234, OUTPUT_LAYOUT_FLAT),
+                         os.path.join('output', 'SESSION_1_world_ITR_1234'))
+        self.assertEqual(RHESSysCalibrator.getRunOutputPath(1, 'world', 1234, OUTPUT_LAYOUT_SHARDED),
+                         os.path.join('output', 'SESSION_1', 'world', '001000', 'SESSION_1_world_ITR_1234'))
+        self.assertEqual(RHESSysCalibrator.getIterationFromOutputPath(
+                            RHESSysCalibrator.getRunOutputPath(1, 'world', 1234, OUTPUT_LAYOUT_SHARDED)), 1234)
+        self.assertEqual(getReshardedOutputPath(os.path.join('output', 'SESSION_1_my_world_ITR_7'), OUTPUT_LAYOUT_SHARDED),
+                         os.path.join('output', 'SESSION_1', 'my_world', '000000', 'SESSION_1_my_world_ITR_7'))
+        self.assertEqual(getReshardedOutputPath('output/other', OUTPUT_LAYOUT_SHARDED), None)
+
+    def testDryRun(self):
+        moved = reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_SHARDED, dry_run=True)
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.rhessysPath, 'output'))),
+                         ['SESSION_1_world_ITR_1', 'SESSION_1_world_ITR_1500'])
+
+    def testReshardSession(self):
+        moved = reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_SHARDED)
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(os.listdir(os.path.join(self.rhessysPath, 'output')), ['SESSION_1'])
+        for run in self.db.getRunsInSession(self.sessionId):
+            self.assertTrue(os.path.exists(os.path.join(self.rhessysPath, run.output_path, 'rhessys_basin.daily')))
+            self.assertEqual(run.cmd_raw, 'rhessys -pre ' + os.path.join(run.output_path, 'rhessys'))
+        self.assertEqual(self.db.getSessionOptions(self.sessionId)[SESSION_OPT_OUTPUT_LAYOUT], OUTPUT_LAYOUT_SHARDED)
+        # Already sharded
+        self.assertEqual(reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_SHARDED), [])
+        
+        # Back to flat, removing empty shards
+        moved = reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_FLAT)
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.rhessysPath, 'output'))),
+                         ['SESSION_1_world_ITR_1', 'SESSION_1_world_ITR_1500'])
+
+    def testOtherSessionsUntouched(self):
+        # Output directory of a run of another session not yet started
+        pending = os.path.join(self.rhessysPath, 
+                               RHESSysCalibrator.getRunOutputPath(2, 'world', 3, OUTPUT_LAYOUT_SHARDED))
+        os.makedirs(pending)
+        reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_SHARDED)
+        reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_FLAT)
+        self.assertTrue(os.path.isdir(pending))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.rhessysPath, 'output'))),
+                         ['SESSION_1_world_ITR_1', 'SESSION_1_world_ITR_1500', 'SESSION_2'])
+
+    def testInterruptedReshard(self):
+        # Output of first run moved, but DB not updated
+        src = os.path.join(self.rhessysPath, 'output', 'SESSION_1_world_ITR_1')
+        dest = os.path.join(self.rhessysPath, RHESSysCalibrator.getRunOutputPath(1, 'world', 1, OUTPUT_LAYOUT_SHARDED))
+        os.renames(src, dest)
+        moved = reshardSession(self.db, self.rhessysPath, self.sessionId, OUTPUT_LAYOUT_SHARDED)
+        self.assertEqual(len(moved), 2)
+        for run in self.db.getRunsInSession(self.sessionId):
+            self.assertTrue(os.path.exists(os.path.join(self.rhessysPath, run.output_path, 'rhessys_basin.daily')))
+
+if __name__ == "__main__":
+    unittest.main()
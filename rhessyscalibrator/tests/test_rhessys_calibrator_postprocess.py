@@ -39,8 +39,14 @@ import os
 from subprocess import *
 import re
 import string
+import shutil
+import tempfile
+from datetime import datetime
 
-from rhessyscalibrator.postprocess import RHESSysCalibratorPostprocess
+import pandas as pd
+
+from rhessyscalibrator.postprocess import *
+from rhessyscalibrator.observed import ObservedData
 
 class TestClusterCalibratorPostProcess(unittest.TestCase):
 
@@ -67,5 +73,118 @@ class TestClusterCalibratorPostProcess(unittest.TestCase):
         self.assertTrue(4 == log_list1[2] and 4 == log_list2[2])
         
 
+class TestFitnessFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.obsPath = os.path.join(self.tmpdir, 'obs.csv')
+        f = open(self.obsPath, 'w')
+        f.write("datetime,streamflow_mm,precip_mm\n1/1/2000,1.0,10.0\n1/2/2000,2.0,10.0\n")
+        f.close()
+        self.args = ['daily', datetime(2000, 1, 1), datetime(2000, 1, 2), False]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testFingerprint(self):
+        fingerprint = getFitnessFingerprint(self.obsPath, *self.args)
+        self.assertEqual(getFitnessFingerprint(self.obsPath, *self.args), fingerprint)
+        for (i, value) in [(0, 'weekly'), (2, datetime(2000, 1, 3)), (3, True)]:
+            args = list(self.args)
+            args[i] = value
+            self.assertNotEqual(getFitnessFingerprint(self.obsPath, *args), fingerprint)
+        f = open(self.obsPath, 'a')
+        f.write("1/3/2000,3.0,10.0\n")
+        f.close()
+        self.assertNotEqual(getFitnessFingerprint(self.obsPath, *self.args), fingerprint)
+
+class TestCalculateFitnessOfRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        index = pd.date_range('2000-01-01', periods=10)
+        obs = pd.Series([1.0, 2.0, 4.0, 3.0, 2.0, 1.5, 1.0, 0.8, 0.6, 0.5], index=index)
+        self.obs = ObservedData(pd.DataFrame({OBS_HEADER_STREAMFLOW: obs, 
+                                              OBS_HEADER_PRECIP: 10.0}))
+        self.spec = {'name': formatFitnessSpec(index[0], index[-1], 'daily'),
+                     'obs': self.obs,
+                     'startdate': index[0],
+                     'enddate': index[-1],
+                     'period': 'daily'}
+        self.context = {'specs': [self.spec],
+                        'add_streamflow_and_gw': False}
+        self.tasks = []
+        for runId in range(1, 41):
+            path = os.path.join(self.tmpdir, "rhessys_basin_%d.daily" % (runId,) )
+            f = open(path, 'w')
+            f.write("day month year streamflow precip\n")
+            for (i, q) in enumerate(obs):
+                f.write("%d 1 2000 %f 10.0\n" % (i + 1, q * (1 + runId / 100.0)))
+            f.close()
+            self.tasks.append( (runId, path) )
+        self.tasks.append( (41, os.path.join(self.tmpdir, 'missing')) )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testParallel(self):
+        serial = list(calculateFitnessOfRuns(self.tasks, self.context))
+        parallel = list(calculateFitnessOfRuns(self.tasks, self.context, jobs=3))
+        self.assertEqual(serial, parallel)
+        self.assertEqual([r[0] for r in parallel], range(1, 42))
+        self.assertEqual(parallel[-1][1], FITNESS_MISSING_OUTPUT)
+        self.assertEqual(parallel[0][1], FITNESS_OK)
+        [metrics] = parallel[0][2]
+        self.assertTrue(0.99 < metrics['nse'] < 1.0)
+        self.assertAlmostEqual(metrics['pbias'], -1.0)
+        self.assertAlmostEqual(metrics['kge_r'], 1.0)
+        self.assertAlmostEqual(metrics['runoff_ratio'], sum(self.obs.streamflow) * 1.01 / 100.0)
+
+    def testWeekly(self):
+        self.spec['period'] = 'weekly'
+        [(runId, status, [result])] = list(calculateFitnessOfRuns(self.tasks[:1], self.context))
+        obsTs = self.obs.streamflow.resample('W-SUN').sum()
+        expected = RHESSysCalibratorPostprocess.calculateNSE(obsTs, obsTs * 1.01)
+        self.assertEqual(status, FITNESS_OK)
+        self.assertAlmostEqual(result['nse'], expected)
+
+    def testMultipleSpecs(self):
+        start = self.obs.index[1]
+        end = self.obs.index[9]
+        specs = [self.spec,
+                 {'name': formatFitnessSpec(start, end, 'weekly'),
+                  'obs': self.obs.getWindow(start, end),
+                  'startdate': start,
+                  'enddate': end,
+                  'period': 'weekly'}]
+        self.context['specs'] = specs
+        results = list(calculateFitnessOfRuns(self.tasks[:3], self.context))
+        for spec in specs:
+            self.context['specs'] = [spec]
+            expected = list(calculateFitnessOfRuns(self.tasks[:3], self.context))
+            for ((runId, status, result), (expRunId, expStatus, [expResult])) in zip(results, expected):
+                self.assertEqual(runId, expRunId)
+                self.assertEqual(len(result), 2)
+                self.assertEqual(result[specs.index(spec)], expResult)
+        self.assertTrue(0.9 < results[0][2][1]['nse'] < 1.0)
+        self.assertNotEqual(results[0][2][0]['nse'], results[0][2][1]['nse'])
+
+    def testMisaligned(self):
+        self.spec['obs'] = self.obs.getWindow(self.obs.index[1], self.obs.end)
+        [(runId, status, result)] = list(calculateFitnessOfRuns(self.tasks[:1], self.context))
+        self.assertEqual(status, FITNESS_MISALIGNED)
+
+class TestFitnessSpec(unittest.TestCase):
+
+    def testParseFitnessSpec(self):
+        self.assertEqual(parseFitnessSpec('2005-10-01,2008-09-30,monthly'),
+                         (datetime(2005, 10, 1), datetime(2008, 9, 30), 'monthly'))
+        self.assertEqual(parseFitnessSpec(',,daily'), (None, None, 'daily'))
+        self.assertEqual(formatFitnessSpec(datetime(2005, 10, 1), datetime(2008, 9, 30), 'monthly'),
+                         '2005-10-01,2008-09-30,monthly')
+        for spec in ['2005-10-01,monthly', '2005-10-01,2008-09-30,yearly', '10/1/2005,,daily']:
+            self.assertRaises(ValueError, parseFitnessSpec, spec)
+
+
 if __name__ == "__main__":
     unittest.main()
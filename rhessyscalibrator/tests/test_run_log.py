@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_run_log
+
+@brief Test cases for rhessyscalibrator.run_log
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+
+from rhessyscalibrator.run_log import *
+
+class TestRunLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logPath = getRunLogPath(self.tmpdir, 1)
+        os.mkdir(os.path.dirname(self.logPath))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testAppendRunLog(self):
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "run 1 output\n")
+        appendRunLog(self.logPath, 2, STREAM_STDOUT, "run 2 output")
+        appendRunLog(self.logPath, 1, STREAM_STDERR, "")
+        # Restarted run
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "restarted\n")
+        self.assertEqual(len(list(iterRunLog(self.logPath))), 4)
+        self.assertEqual(getRunLog(self.logPath, 1), "run 1 output\nrestarted\n")
+        self.assertEqual(getRunLog(self.logPath, 2), "run 2 output")
+        self.assertEqual(getRunLog(self.logPath, 1, STREAM_STDERR), "")
+        self.assertEqual(getRunLog(self.logPath, 2, STREAM_STDERR), None)
+        self.assertEqual(getRunLog(self.logPath, 3), None)
+
+    def testTruncatedRecord(self):
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "complete")
+        f = open(self.logPath, 'ab')
+        f.write("2 stdout 100\npartial")
+        f.close()
+        self.assertEqual(list(iterRunLog(self.logPath)), [(1, STREAM_STDOUT, "complete")])
+
+    def testArchiveRunFiles(self):
+        script = os.path.join(self.tmpdir, 'pbs.script')
+        f = open(script, 'w')
+        f.write("#!/bin/bash\nrhessys\n")
+        f.close()
+        archived = archiveRunFiles(self.logPath, 7, {STREAM_SCRIPT: script,
+                                                     STREAM_STDOUT: os.path.join(self.tmpdir, 'pbs.out')})
+        self.assertEqual(archived, [script])
+        self.assertFalse(os.path.exists(script))
+        self.assertEqual(getRunLog(self.logPath, 7, STREAM_SCRIPT), "#!/bin/bash\nrhessys\n")
+
+    def testIndex(self):
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "run 1 output\n")
+        appendRunLog(self.logPath, 2, STREAM_SCRIPT, "script")
+        index = indexRunLog(self.logPath)
+        self.assertEqual(index, [(1, STREAM_STDOUT, 0, 13), (2, STREAM_SCRIPT, 26, 6)])
+        f = open(self.logPath, 'rb')
+        f.seek(index[1][2])
+        self.assertEqual(f.readline(), "2 script 6\n")
+        f.close()
+
+    def testUnindexedLog(self):
+        # Log written without an index
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "first")
+        os.unlink(getRunLogIndexPath(self.logPath))
+        appendRunLog(self.logPath, 2, STREAM_STDOUT, "second")
+        self.assertFalse(os.path.exists(getRunLogIndexPath(self.logPath)))
+        self.assertEqual(getRunLog(self.logPath, 2), "second")
+        self.assertEqual(len(indexRunLog(self.logPath)), 2)
+        # Records appended once the log is indexed are indexed as they are written
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, " again")
+        f = open(getRunLogIndexPath(self.logPath), 'rb')
+        self.assertEqual(len(f.readlines()), 3)
+        f.close()
+        self.assertEqual(getRunLog(self.logPath, 1), "first again")
+
+    def testIncompleteIndex(self):
+        appendRunLog(self.logPath, 1, STREAM_STDOUT, "first")
+        f = open(getRunLogIndexPath(self.logPath), 'ab')
+        f.write("2 std")
+        f.close()
+        appendRunLog(self.logPath, 2, STREAM_STDOUT, "second")
+        self.assertEqual(getRunLog(self.logPath, 2), "second")
+        self.assertEqual(len(indexRunLog(self.logPath)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_run_output
+
+@brief Test cases for rhessyscalibrator.run_output
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+
+from rhessyscalibrator.run_output import *
+
+BASIN_DAILY = "day month year basinID streamflow\n" + \
+              "1 1 2000 1 0.5\n" + \
+              "2 1 2000 1 0.25\n" + \
+              "3 1 2000 1 0.125\n"
+
+class TestRunOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outputPath = os.path.join(self.tmpdir, 'SESSION_1_world_ITR_1')
+        os.mkdir(self.outputPath)
+        for name in ['rhessys_basin.daily', 'rhessys_hillslope.daily']:
+            f = open(os.path.join(self.outputPath, name), 'w')
+            f.write(BASIN_DAILY)
+            f.close()
+        self.basinDaily = os.path.join(self.outputPath, 'rhessys_basin.daily')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testCompressFile(self):
+        dest = compressFile(self.basinDaily, COMPRESSION_GZIP)
+        self.assertEqual(dest, self.basinDaily + '.gz')
+        self.assertFalse(os.path.exists(self.basinDaily))
+        self.assertEqual(findOutputFile(self.basinDaily), dest)
+        f = openOutputFile(dest)
+        self.assertEqual(f.read(), BASIN_DAILY)
+        f.close()
+
+    def testCompressFileToDir(self):
+        destDir = os.path.join(self.tmpdir, 'dest')
+        os.mkdir(destDir)
+        dest = compressFile(self.basinDaily, COMPRESSION_GZIP, dest_dir=destDir)
+        self.assertEqual(dest, os.path.join(destDir, 'rhessys_basin.daily.gz'))
+        self.assertTrue(os.path.exists(self.basinDaily))
+
+    def testCompressRunOutputs(self):
+        compressed = compressRunOutputs(self.outputPath, 'rhessys', COMPRESSION_GZIP)
+        self.assertEqual(len(compressed), 2)
+        self.assertEqual(sorted(os.listdir(self.outputPath)),
+                         ['rhessys_basin.daily.gz', 'rhessys_hillslope.daily.gz'])
+        # Already compressed outputs are left alone
+        self.assertEqual(compressRunOutputs(self.outputPath, 'rhessys', COMPRESSION_GZIP), [])
+
+    def testFindOutputFile(self):
+        self.assertEqual(findOutputFile(self.basinDaily), self.basinDaily)
+        missing = os.path.join(self.outputPath, 'rhessys_patch.daily')
+        self.assertEqual(findOutputFile(missing), missing)
+
+    def testReadBasinDaily(self):
+        plain = readBasinDaily(self.basinDaily)
+        compressed = readBasinDaily(compressFile(self.basinDaily, COMPRESSION_GZIP))
+        self.assertEqual(list(compressed.streamflow), [0.5, 0.25, 0.125])
+        self.assertTrue((plain.index == compressed.index).all())
+
+    def testColumnarOutput(self):
+        text = readBasinDaily(self.basinDaily)
+        columnarPath = writeColumnarOutput(self.basinDaily)
+        self.assertEqual(columnarPath, self.basinDaily + '.npz')
+        columnar = readColumnarOutput(columnarPath)
+        self.assertEqual(list(columnar.columns), list(text.columns))
+        self.assertTrue((columnar.index == text.index).all())
+        self.assertTrue((columnar == text).all().all())
+        
+        # Columnar output is found for compressed output
+        compressed = compressFile(self.basinDaily, COMPRESSION_GZIP)
+        self.assertEqual(getColumnarOutputPath(compressed), columnarPath)
+
+    def testStaleColumnarOutput(self):
+        columnarPath = writeColumnarOutput(self.basinDaily)
+        f = open(self.basinDaily, 'w')
+        f.write(BASIN_DAILY.replace('0.5', '0.75'))
+        f.close()
+        os.utime(columnarPath, (0, 0))
+        self.assertEqual(readBasinDaily(self.basinDaily).streamflow[0], 0.75)
+
+    def testBasinDailyReader(self):
+        reader = BasinDailyReader(['streamflow'])
+        (index, values) = reader.read(self.basinDaily)
+        text = readBasinDaily(self.basinDaily)
+        self.assertTrue((index == text.index).all())
+        self.assertEqual(list(values.keys()), ['streamflow'])
+        self.assertEqual(list(values['streamflow']), [0.5, 0.25, 0.125])
+        
+        # Outputs spanning the same period share a date index
+        (compressedIndex, compressed) = reader.read(compressFile(self.basinDaily, COMPRESSION_GZIP))
+        self.assertTrue(compressedIndex is index)
+        self.assertEqual(list(compressed['streamflow']), [0.5, 0.25, 0.125])
+
+    def testBasinDailyReaderColumnar(self):
+        writeColumnarOutput(self.basinDaily)
+        os.unlink(self.basinDaily)
+        reader = BasinDailyReader(['streamflow', 'basinID'])
+        (index, values) = reader.read(self.basinDaily)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index[0], pd.Timestamp('2000-01-01'))
+        self.assertEqual(list(values['basinID']), [1.0, 1.0, 1.0])
+
+    def testBasinDailyReaderGap(self):
+        f = open(self.basinDaily, 'w')
+        f.write(BASIN_DAILY.replace('3 1 2000', '5 1 2000'))
+        f.close()
+        (index, values) = BasinDailyReader(['streamflow']).read(self.basinDaily)
+        self.assertEqual(list(index), [pd.Timestamp('2000-01-01'), pd.Timestamp('2000-01-02'),
+                                       pd.Timestamp('2000-01-05')])
+
+    def testBasinDailyReaderMissingColumn(self):
+        reader = BasinDailyReader(['streamflow', 'gw.Qout'])
+        self.assertRaises(ValueError, reader.read, self.basinDaily)
+
+    def testUnsupportedMethod(self):
+        for method in COMPRESSION_METHODS:
+            if method not in getAvailableCompressionMethods():
+                self.assertRaises(IOError, compressFile, self.basinDaily, method)
+                self.assertTrue(os.path.exists(self.basinDaily))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_run_wrapper
+
+@brief Unit tests for rhessyscalibrator.run_wrapper
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import pipes
+from subprocess import call
+
+from rhessyscalibrator.calibration_runner import RunnerOptions
+from rhessyscalibrator.run_wrapper import *
+from rhessyscalibrator.integrity import readIntegrityRecords, INTEGRITY_RECORD_FILE
+
+# Stand-in for RHESSys: writes basin and patch output using the output prefix
+FAKE_RHESSYS = sys.executable + \
+    """ -c "import sys; open(sys.argv[2] + '_basin.daily', 'w').write('basin'); open(sys.argv[2] + '_patch.daily', 'w').write('patch')" """
+
+class TestRunWrapper(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.scratchDir = os.path.join(self.tmpdir, 'scratch')
+        os.mkdir(self.scratchDir)
+        self.outputPath = os.path.join(self.tmpdir, 'output', 'SESSION_1_world_ITR_1')
+        os.makedirs(self.outputPath)
+        self.cmd = FAKE_RHESSYS + "-pre " + os.path.join(self.outputPath, 'rhessys') + " -st 2000 1 1 1"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testRunInScratch(self):
+        wrapper = RunWrapper()
+        ret = wrapper.runInScratch(self.cmd, self.scratchDir, ['rhessys_basin.daily'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(os.listdir(self.outputPath), ['rhessys_basin.daily'])
+        self.assertEqual(open(os.path.join(self.outputPath, 'rhessys_basin.daily')).read(), 'basin')
+        # Scratch directory is removed
+        self.assertEqual(os.listdir(self.scratchDir), [])
+
+    def testRunInScratchFailure(self):
+        wrapper = RunWrapper()
+        ret = wrapper.runInScratch("exit 3; " + self.cmd, self.scratchDir, ['*.daily'])
+        self.assertEqual(ret, 3)
+        self.assertEqual(os.listdir(self.outputPath), [])
+        self.assertEqual(os.listdir(self.scratchDir), [])
+
+    def testRunCompressed(self):
+        wrapper = RunWrapper()
+        ret = wrapper.run(self.cmd, 'gzip')
+        self.assertEqual(ret, 0)
+        self.assertEqual(sorted(os.listdir(self.outputPath)), ['rhessys_basin.daily.gz', 'rhessys_patch.daily.gz'])
+        
+        shutil.rmtree(self.outputPath)
+        os.mkdir(self.outputPath)
+        ret = wrapper.runInScratch(self.cmd, self.scratchDir, ['rhessys_basin.daily'], 'gzip')
+        self.assertEqual(ret, 0)
+        self.assertEqual(os.listdir(self.outputPath), ['rhessys_basin.daily.gz'])
+
+    def testIntegrity(self):
+        wrapper = RunWrapper()
+        ret = wrapper.runInScratch(self.cmd, self.scratchDir, ['rhessys_basin.daily'], integrity=True)
+        self.assertEqual(ret, 0)
+        self.assertEqual(sorted(os.listdir(self.outputPath)), [INTEGRITY_RECORD_FILE, 'rhessys_basin.daily'])
+        # Only outputs copied back are recorded
+        records = readIntegrityRecords(self.outputPath)
+        self.assertEqual([r.filename for r in records], ['rhessys_basin.daily'])
+        self.assertEqual(records[0].size, 5)
+        self.assertEqual(records[0].checksum, fileChecksum(os.path.join(self.outputPath, 'rhessys_basin.daily')))
+        
+        shutil.rmtree(self.outputPath)
+        os.mkdir(self.outputPath)
+        self.assertEqual(readIntegrityRecords(self.outputPath), None)
+        ret = wrapper.run(self.cmd, 'gzip', integrity=True)
+        self.assertEqual(ret, 0)
+        records = readIntegrityRecords(self.outputPath)
+        self.assertEqual([r.filename for r in records], ['rhessys_basin.daily.gz', 'rhessys_patch.daily.gz'])
+
+    def testRunnerOptions(self):
+        opts = RunnerOptions()
+        self.assertEqual(opts.getJobCmd(self.cmd), self.cmd)
+        
+        opts = RunnerOptions(scratch=True, scratch_dir=self.scratchDir,
+                             scratch_keep=['rhessys_basin.daily', 'rhessys_patch.*'])
+        restored = RunnerOptions.fromSessionOptions(opts.toSessionOptions())
+        self.assertEqual(restored.__dict__, opts.__dict__)
+        self.assertEqual(RunnerOptions.fromSessionOptions({}).__dict__, RunnerOptions().__dict__)
+        
+        wrapped = opts.getJobCmd(self.cmd)
+        self.assertTrue(wrapped.startswith(sys.executable + ' -m rhessyscalibrator.run_wrapper --scratch'))
+        # Run wrapped command as a runner would
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        ret = call(wrapped, shell=True, env=env)
+        self.assertEqual(ret, 0)
+        self.assertEqual(sorted(os.listdir(self.outputPath)), ['rhessys_basin.daily', 'rhessys_patch.daily'])
+        
+        opts = RunnerOptions(integrity=True)
+        self.assertTrue(opts.getJobCmd(self.cmd).endswith('--integrity -- ' + pipes.quote(self.cmd)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_screening
+
+@brief Unit tests for rhessyscalibrator.screening
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.screening import RunScreener
+from rhessyscalibrator.model_runner_db2 import ModelRun2, RunFitness2
+
+class TestScreening(unittest.TestCase):
+
+    def _makeRun(self, run_id, nse):
+        run = ModelRun2()
+        run.id = run_id
+        run.run_fitness = RunFitness2()
+        run.run_fitness.nse = nse
+        return run
+
+    def testSimulationPeriod(self):
+        cmd_proto = "$rhessys -st 2000 1 1 1 -ed 2010 10 1 1 -b -t $tecfile -w $worldfile"
+        (st, ed) = RHESSysCalibrator.getSimulationPeriodFromCmdProto(cmd_proto)
+        self.assertEqual(st, "2000 1 1 1")
+        self.assertEqual(ed, "2010 10 1 1")
+
+        screen = RHESSysCalibrator.setSimulationPeriodInCmdProto(cmd_proto, "2000 1 1 1", "2002 1 1 1")
+        self.assertEqual(screen, "$rhessys -st 2000 1 1 1 -ed 2002 1 1 1 -b -t $tecfile -w $worldfile")
+        full = RHESSysCalibrator.setSimulationPeriodInCmdProto(screen, st, ed)
+        self.assertEqual(full, cmd_proto)
+
+        self.assertEqual(RHESSysCalibrator.getSimulationPeriodFromCmdProto("$rhessys -b"), (None, None))
+
+    def testSelectRunsToPromote(self):
+        runs = [self._makeRun(1, 0.1), self._makeRun(2, 0.7), 
+                self._makeRun(3, float('nan')), self._makeRun(4, 0.4)]
+        promoted = RunScreener.selectRunsToPromote(runs, 4)
+        self.assertEqual([r.id for r in promoted], [2, 4, 1])
+
+        promoted = RunScreener.selectRunsToPromote(runs, 4, fraction=0.5)
+        self.assertEqual([r.id for r in promoted], [2, 4])
+
+        # Fraction is of all screened runs, rounded up
+        promoted = RunScreener.selectRunsToPromote(runs, 10, fraction=0.15)
+        self.assertEqual([r.id for r in promoted], [2, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
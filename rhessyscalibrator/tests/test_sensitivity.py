@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_sensitivity
+
+@brief Unit tests for rhessyscalibrator.sensitivity
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+
+import numpy
+
+from rhessyscalibrator.model_runner_db2 import ModelRun2, RunFitness2
+from rhessyscalibrator.sensitivity import *
+
+class TestSensitivity(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.X = numpy.random.uniform(size=(1000, 3))
+        # Score is most sensitive to the first parameter, and insensitive to the third
+        self.y = 10.0 * self.X[:, 0] + 2.0 * self.X[:, 1] + numpy.random.normal(scale=0.1, size=1000)
+
+    def testRegionalSensitivity(self):
+        behavioral = self.y > numpy.percentile(self.y, 90)
+        (d, p) = regionalSensitivity(self.X, behavioral)
+        self.assertTrue(d[0] > d[1] > d[2])
+        self.assertTrue(p[0] < 0.01)
+        self.assertTrue(p[2] > 0.01)
+
+    def testStandardizedRegressionCoefficients(self):
+        (src, r2) = standardizedRegressionCoefficients(self.X, self.y)
+        self.assertTrue(src[0] > src[1] > abs(src[2]))
+        self.assertTrue(r2 > 0.99)
+        
+        # Parameter that does not vary
+        X = self.X.copy()
+        X[:, 2] = 0.5
+        (src, r2) = standardizedRegressionCoefficients(X, self.y)
+        self.assertTrue(numpy.isnan(src[2]))
+        self.assertTrue(src[0] > src[1] > 0)
+        self.assertTrue(r2 > 0.99)
+
+    def testFirstOrderSobol(self):
+        s1 = firstOrderSobol(self.X, self.y)
+        # Analytical values are 100/104 and 4/104
+        self.assertAlmostEqual(s1[0], 100.0/104.0, places=1)
+        self.assertAlmostEqual(s1[1], 4.0/104.0, places=1)
+        self.assertTrue(s1[2] < 0.05)
+        self.assertTrue(numpy.all(numpy.isnan(firstOrderSobol(self.X[:10], self.y[:10]))))
+
+    def testMorrisElementaryEffects(self):
+        # Randomly sampled runs do not support Morris screening
+        (muStar, sigma, numEffects) = morrisElementaryEffects(self.X, self.y)
+        self.assertTrue(numpy.all(numEffects == 0))
+        self.assertTrue(numpy.all(numpy.isnan(muStar)))
+        
+        # One-at-a-time trajectory
+        X = numpy.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.5, 0.5], [0.0, 1.0, 1.0]])
+        y = 10.0 * X[:, 0] + 2.0 * X[:, 1]
+        (muStar, sigma, numEffects) = morrisElementaryEffects(X, y)
+        self.assertEqual(list(numEffects), [1, 1, 1])
+        self.assertAlmostEqual(muStar[0], 5.0)
+        self.assertAlmostEqual(muStar[1], 2.0)
+        self.assertAlmostEqual(muStar[2], 0.0)
+
+    def testComputeSensitivity(self):
+        runs = []
+        for (i, (x, y)) in enumerate(zip(self.X, self.y)):
+            run = ModelRun2()
+            run.id = i + 1
+            (run.param_s1, run.param_s2, run.param_gw1) = x
+            run.param_gw2 = 0.5
+            run.run_fitness = RunFitness2()
+            run.run_fitness.nse = y
+            run.run_fitness.rsr = -y
+            runs.append(run)
+        (paramKeys, X, scores) = getSensitivityData(runs)
+        # Constant parameters are excluded
+        self.assertEqual(paramKeys, ['s1', 's2', 'gw1'])
+        self.assertTrue(numpy.allclose(scores['rsr'], scores['nse']))
+        self.assertTrue(numpy.all(numpy.isnan(scores['nse_log'])))
+        
+        results = computeSensitivity(paramKeys, X, scores)
+        self.assertEqual(len(results), 2 * len(paramKeys))
+        s1 = [r for r in results if r['metric'] == 'nse' and r['parameter'] == 's1'][0]
+        self.assertEqual(s1['runs'], 1000)
+        self.assertTrue(s1['ks_d'] > 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
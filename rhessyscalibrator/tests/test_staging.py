@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_staging
+
+@brief Unit tests for rhessyscalibrator.staging
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+import os
+import shutil
+import tempfile
+
+from rhessyscalibrator.staging import *
+
+def writeFile(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    f = open(path, 'w')
+    f.write(content)
+    f.close()
+
+class TestStaging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.runPath = os.path.join(self.tmpdir, 'rhessys')
+        self.cacheDir = os.path.join(self.tmpdir, 'cache')
+        writeFile(os.path.join(self.runPath, 'worldfiles', 'active', 'world'), 'world')
+        writeFile(os.path.join(self.runPath, 'worldfiles', 'active', 'world.hdr'),
+                  "1 num_soil_files\ndefs/soil.def soil_default_filename\n" + 
+                  "1 num_base_stations\nclim/cwt.base base_station_filename\n")
+        writeFile(os.path.join(self.runPath, 'defs', 'soil.def'), 'soil')
+        writeFile(os.path.join(self.runPath, 'clim', 'cwt.base'), "101 base_station_id\nclim/cwt climate_prefix\n")
+        writeFile(os.path.join(self.runPath, 'clim', 'cwt.rain'), 'rain')
+        writeFile(os.path.join(self.runPath, 'clim', 'cwt.tmax'), 'tmax')
+        writeFile(os.path.join(self.runPath, 'flow', 'world_flow_table.dat'), 'flow')
+        writeFile(os.path.join(self.runPath, 'tecfiles', 'active', 'tec'), 'tec')
+        self.manifest = buildStageManifest(self.runPath, ['worldfiles/active/world'],
+                                           ['flow/world_flow_table.dat'], ['tecfiles/active/tec'])
+        self.cmd = "rhessys/bin/rhessys -st 2000 1 1 1 -t tecfiles/active/tec -w worldfiles/active/world -r flow/world_flow_table.dat -pre output/rhessys"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testBuildStageManifest(self):
+        self.assertEqual(sorted(self.manifest['files'].keys()),
+                         ['clim/cwt.base', 'clim/cwt.rain', 'clim/cwt.tmax', 'defs/soil.def',
+                          'flow/world_flow_table.dat', 'tecfiles/active/tec',
+                          'worldfiles/active/world', 'worldfiles/active/world.hdr'])
+        manifestPath = os.path.join(self.tmpdir, 'manifest.json')
+        writeStageManifest(self.manifest, manifestPath)
+        self.assertEqual(readStageManifest(manifestPath), self.manifest)
+
+    def testStageCmd(self):
+        cache = StageCache(self.cacheDir, self.runPath, self.manifest)
+        cmd = cache.stageCmd(self.cmd)
+        tokens = cmd.split()
+        worldfile = tokens[tokens.index('-w') + 1]
+        self.assertTrue(worldfile.startswith(self.cacheDir))
+        self.assertEqual(open(worldfile).read(), 'world')
+        self.assertTrue(tokens[tokens.index('-r') + 1].startswith(self.cacheDir))
+        self.assertTrue(tokens[tokens.index('-t') + 1].startswith(self.cacheDir))
+        self.assertTrue(cmd.endswith('-pre output/rhessys'))
+        
+        # Header and base station file refer to staged copies
+        header = open(worldfile + '.hdr').read().split()
+        soil = header[header.index('soil_default_filename') - 1]
+        self.assertEqual(open(soil).read(), 'soil')
+        base = header[header.index('base_station_filename') - 1]
+        baseStation = open(base).read().split()
+        prefix = baseStation[baseStation.index('climate_prefix') - 1]
+        self.assertEqual(open(prefix + '.rain').read(), 'rain')
+        
+        # Staging again re-uses cache
+        self.assertEqual(StageCache(self.cacheDir, self.runPath, self.manifest).stageCmd(self.cmd), cmd)
+
+    def testStageModifiedInput(self):
+        writeFile(os.path.join(self.runPath, 'defs', 'soil.def'), 'modified')
+        cache = StageCache(self.cacheDir, self.runPath, self.manifest)
+        self.assertRaises(IOError, cache.stageCmd, self.cmd)
+        # Failed entries are not left in the cache
+        self.assertEqual(cache.stageFile('tecfiles/active/tec'), cache.stageFile('tecfiles/active/tec'))
+        self.assertEqual([e for e in os.listdir(self.cacheDir) if e.startswith('.')], [])
+
+if __name__ == "__main__":
+    unittest.main()
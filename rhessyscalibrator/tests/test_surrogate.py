@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""@package rhessyscalibrator.tests.test_surrogate
+
+@brief Unit tests for rhessyscalibrator.surrogate
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import unittest
+
+import numpy
+
+from rhessyscalibrator.calibration_parameters import CalibrationParametersProto
+from rhessyscalibrator.model_runner_db2 import ModelRun2, RunFitness2
+from rhessyscalibrator.surrogate import *
+
+class TestSurrogate(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.X = numpy.random.uniform(size=(200, 2))
+        # Fitness peaks at (0.8, 0.2)
+        self.y = 1.0 - numpy.sum((self.X - [0.8, 0.2])**2, axis=1)
+
+    def testGaussianProcess(self):
+        surrogate = GaussianProcessSurrogate(noise=0.01)
+        surrogate.fit(self.X, self.y)
+        (mean, std) = surrogate.predict([[0.8, 0.2], [0.1, 0.9]])
+        self.assertTrue(mean[0] > mean[1])
+        self.assertAlmostEqual(mean[0], 1.0, places=1)
+        self.assertTrue(numpy.all(std > 0))
+
+    def testExpectedImprovement(self):
+        ei = expectedImprovement(numpy.array([0.5, 0.9, 0.5]), 
+                                 numpy.array([0.1, 0.1, 0.3]), 0.8)
+        self.assertTrue(ei[1] > ei[0])
+        self.assertTrue(ei[2] > ei[0])
+
+    def testSampler(self):
+        proto = CalibrationParametersProto()
+        proto.s1 = True
+        proto.s2 = True
+        proto.parameterRanges['s1'] = [0.0, 1.0]
+        proto.parameterRanges['s2'] = [0.0, 1.0]
+        self.assertEqual(proto.getSampledParameterKeys(), ['s1', 's2'])
+        
+        runs = []
+        for (x, y) in zip(self.X, self.y):
+            run = ModelRun2()
+            run.param_s1 = x[0]
+            run.param_s2 = x[1]
+            run.run_fitness = RunFitness2()
+            run.run_fitness.nse = y
+            run.run_fitness.nse_log = y + 0.1
+            runs.append(run)
+        (X, y) = SurrogateSampler.getTrainingData(runs, ['s1', 's2'], proto.parameterRanges)
+        self.assertEqual(X.shape, (200, 2))
+        self.assertTrue(numpy.allclose(y, self.y))
+        
+        surrogate = GaussianProcessSurrogate(noise=0.01)
+        surrogate.fit(X, y)
+        sampler = SurrogateSampler(proto, surrogate, oversample=50, 
+                                   criterion=SURROGATE_CRITERION_MEAN)
+        params = sampler.generateParameterValues()
+        self.assertTrue(abs(params.s1 - 0.8) < 0.3 and abs(params.s2 - 0.2) < 0.3)
+
+
+if __name__ == "__main__":
+    unittest.main()
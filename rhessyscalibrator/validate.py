@@ -0,0 +1,99 @@
+"""@package rhessyscalibrator.validate
+
+@brief Tool for validating the outputs of the runs of a calibration session 
+before postprocessing.  Runs whose outputs are missing, have changed since they
+were recorded (see rhessyscalibrator.integrity), or end earlier than those of 
+most runs in the session are reported so that they can be excluded or re-run.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013-2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+"""
+import os
+import sys
+import argparse
+import csv
+
+from rhessyscalibrator.calibrator import RHESSysCalibrator
+from rhessyscalibrator.model_runner_db2 import *
+from rhessyscalibrator.integrity import validateSession
+
+class RHESSysCalibratorValidate(object):
+    def main(self, args):
+        # Set up command line options
+        parser = argparse.ArgumentParser(description="Tool for validating the outputs of the runs of a calibration session, to find runs with missing or truncated outputs before postprocessing")
+        parser.add_argument("-b", "--basedir", action="store", 
+                            dest="basedir", required=True,
+                            help="Base directory for the calibration session")
+        parser.add_argument("-s", "--session", action="store", type=int,
+                            dest="session_id", required=True,
+                            help="Session whose run outputs are to be validated")
+        parser.add_argument("-f", "--outfile", 
+                            help="Name of the file to write the IDs of runs with problems, and the problems found, to (contents will be overwritten)")
+        parser.add_argument("--checksum", action="store_true", default=False,
+                            help="Verify checksums of outputs with integrity records.  This reads every output file in full.")
+        
+        options = parser.parse_args(args[1:])
+        
+        outfile = None
+        if options.outfile:
+            outfile = os.path.abspath(options.outfile)
+            if not os.access(os.path.dirname(outfile), os.W_OK):
+                sys.exit("Unable to write to directory {0}".format(outfile))
+        
+        try:
+            calibratorDB = \
+                ModelRunnerDB2(RHESSysCalibrator.getDBPath(
+                    options.basedir))
+            if calibratorDB.getSession(options.session_id) is None:
+                sys.exit("Session %d was not found" % (options.session_id,) )
+            (numRuns, problems) = validateSession(calibratorDB, 
+                                                  RHESSysCalibrator.getRhessysPath(options.basedir),
+                                                  options.session_id, options.checksum)
+        finally:
+            calibratorDB = None
+        
+        for runId in sorted(problems.keys()):
+            print("Run %d: %s" % (runId, '; '.join(problems[runId])) )
+        print("%d of %d completed runs of session %d have problems" % \
+              (len(problems), numRuns, options.session_id) )
+        
+        if outfile:
+            of = open(outfile, 'w')
+            writer = csv.writer(of)
+            writer.writerow(['run_id', 'problem'])
+            for runId in sorted(problems.keys()):
+                for problem in problems[runId]:
+                    writer.writerow([runId, problem])
+            of.close()
+        
+        if len(problems) > 0:
+            return 1
+        return 0
@@ -31,6 +31,7 @@ setup(name='rhessyscalibrator',
       scripts=['bin/lsf-sim/bjobs.py',
                'bin/lsf-sim/bsub.py',
                'bin/rhessys_calibrator_behavioral.py',
+               'bin/rhessys_calibrator_mcmc.py',
                'bin/rhessys_calibrator_postprocess_behavioral.py',
                'bin/rhessys_calibrator_postprocess_behavioral_compare.py',
                'bin/rhessys_calibrator_postprocess_export.py',
@@ -39,6 +40,11 @@ setup(name='rhessyscalibrator',
                'bin/rhessys_calibrator_postprocess.py',
                'bin/rhessys_calibrator_restart.py',
                'bin/rhessys_calibrator_results.py',
+               'bin/rhessys_calibrator_sensitivity.py',
+               'bin/rhessys_calibrator_reshard.py',
+               'bin/rhessys_calibrator_run_log.py',
+               'bin/rhessys_calibrator_prune.py',
+               'bin/rhessys_calibrator_validate.py',
                'bin/rw2rc.py'
       ],
       zip_safe=False)